@@ -0,0 +1,140 @@
+"""
+Endpoints administrativos (protegidos por ADMIN_TOKEN): profiling, diagnóstico e evidências
+"""
+import os
+import asyncio
+import secrets
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, Response
+from app.utils.drain import drain_controller
+from app.utils.evidence import evidence_archive
+from app.utils.profiling import cpu_profiler, dump_tasks, profile_directory, slow_checks
+from app.utils.logger import logger, log_with_context
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Exige o header X-Admin-Token igual a ADMIN_TOKEN (endpoints desabilitados sem token configurado)
+
+    Raises:
+        HTTPException: 403 se o token não confere ou não está configurado
+    """
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected or not x_admin_token or not secrets.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail={"error": "Acesso administrativo negado"})
+
+
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+
+@admin_router.post("/profile/cpu")
+async def profile_cpu(seconds: float = Query(default=10, gt=0)) -> dict:
+    """
+    Amostra a CPU do processo por alguns segundos
+
+    Args:
+        seconds: Duração da amostragem
+
+    Returns:
+        Funções mais frequentes e arquivo "collapsed" para flamegraph
+    """
+    log_with_context(logger, "INFO", "Profiling de CPU iniciado", seconds=seconds)
+    try:
+        return await cpu_profiler.run(seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail={"error": str(e)})
+
+
+@admin_router.get("/tasks")
+async def list_tasks(limit: int = Query(default=20, ge=1, le=200)) -> dict:
+    """
+    Pilhas das tasks asyncio em execução
+
+    Args:
+        limit: Quadros por task
+
+    Returns:
+        Tasks e suas pilhas
+    """
+    tasks = dump_tasks(limit)
+    return {"total": len(tasks), "tasks": tasks}
+
+
+@admin_router.get("/profiles")
+async def list_profiles() -> dict:
+    """
+    Arquivos de profiling, traces e consultas lentas disponíveis
+
+    Returns:
+        Arquivos (mais recentes primeiro) e configuração da captura de consultas lentas
+    """
+    return {"files": profile_directory.listing(), "slow_checks": slow_checks.stats()}
+
+
+@admin_router.get("/profiles/{name}")
+async def download_profile(name: str) -> FileResponse:
+    """
+    Download de um arquivo do diretório de profiling
+
+    Args:
+        name: Nome do arquivo
+
+    Returns:
+        Conteúdo do arquivo
+    """
+    path = profile_directory.resolve(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail={"error": "Arquivo não encontrado"})
+    return FileResponse(path, filename=path.name)
+
+
+@admin_router.post("/drain")
+async def start_drain() -> dict:
+    """
+    Inicia a drenagem antes do SIGTERM (hook de pre-stop): novos webhooks recebem 503 e o /ready sai do ar
+
+    Returns:
+        Estado da drenagem
+    """
+    drain_controller.begin()
+    return drain_controller.snapshot()
+
+
+@admin_router.get("/evidence")
+async def list_evidence(
+    numero_carteirinha: str = Query(..., min_length=1),
+    plan_name: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=200)
+) -> dict:
+    """
+    Páginas capturadas nas consultas de uma carteirinha (contestações)
+
+    Args:
+        numero_carteirinha: Número da carteirinha
+        plan_name: Plano (opcional)
+        limit: Quantidade máxima
+
+    Returns:
+        Capturas (mais recentes primeiro) com os nomes dos conteúdos
+    """
+    captures = await asyncio.to_thread(evidence_archive.find, numero_carteirinha.strip(), plan_name, limit)
+    return {"total": len(captures), "captures": captures}
+
+
+@admin_router.get("/evidence/{name}")
+async def download_evidence(name: str) -> Response:
+    """
+    Conteúdo de uma evidência (HTML, texto ou screenshot), descomprimido
+
+    Args:
+        name: Nome do conteúdo
+
+    Returns:
+        Conteúdo original
+    """
+    content = await asyncio.to_thread(evidence_archive.read, name)
+    if content is None:
+        raise HTTPException(status_code=404, detail={"error": "Evidência não encontrada"})
+    data, media_type = content
+    return Response(content=data, media_type=media_type)
@@ -0,0 +1,71 @@
+"""
+Analytics do histórico de consultas (protegidos por ADMIN_TOKEN): latência, taxa de elegíveis e erros
+"""
+import asyncio
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, Query
+from app.admin import require_admin
+from app.utils.history import history_store
+
+
+analytics_router = APIRouter(prefix="/analytics", dependencies=[Depends(require_admin)])
+
+
+@analytics_router.get("/latency")
+async def latency_percentiles(
+    hours: float = Query(default=24, gt=0, le=24 * 400),
+    plan: Optional[str] = None,
+    source: Optional[Literal["portal", "cache", "invalid_card", "error"]] = None
+) -> dict:
+    """
+    Percentis de latência da consulta por plano
+
+    Args:
+        hours: Janela em horas
+        plan: Plano (opcional)
+        source: Origem do resultado (opcional; "portal" isola as consultas ao portal)
+
+    Returns:
+        count, p50, p90, p95 e p99 (ms) por plano
+    """
+    return await asyncio.to_thread(history_store.latency, hours, plan, source)
+
+
+@analytics_router.get("/eligibility")
+async def eligibility_trend(
+    hours: float = Query(default=24 * 7, gt=0, le=24 * 400),
+    interval: Literal["hour", "day"] = "day",
+    plan: Optional[str] = None
+) -> dict:
+    """
+    Tendência da taxa de elegíveis por plano
+
+    Args:
+        hours: Janela em horas
+        interval: Intervalo de cada ponto ("hour" ou "day")
+        plan: Plano (opcional)
+
+    Returns:
+        Série por plano
+    """
+    return await asyncio.to_thread(history_store.eligibility, hours, interval, plan)
+
+
+@analytics_router.get("/errors")
+async def error_breakdown(
+    hours: float = Query(default=24, gt=0, le=24 * 400),
+    plan: Optional[str] = None,
+    top_reasons: int = Query(default=10, ge=0, le=100)
+) -> dict:
+    """
+    Erros por plano e tipo, carteirinhas inválidas, callbacks falhos e motivos mais comuns
+
+    Args:
+        hours: Janela em horas
+        plan: Plano (opcional)
+        top_reasons: Quantidade de motivos por plano
+
+    Returns:
+        Resumo por plano
+    """
+    return await asyncio.to_thread(history_store.errors, hours, plan, top_reasons)
@@ -0,0 +1,122 @@
+"""
+Endpoints de importação em lote (protegidos por ADMIN_TOKEN): upload, progresso e resultados
+"""
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.admin import require_admin
+from app.utils.bulk_import import BulkImportError, BulkImportTooLarge, BulkJob, bulk_imports
+from app.utils.drain import drain_controller
+
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+bulk_router = APIRouter(prefix="/bulk", dependencies=[Depends(require_admin)])
+
+
+def _job_or_404(job_id: str) -> BulkJob:
+    job = bulk_imports.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Importação não encontrada"})
+    return job
+
+
+@bulk_router.post("/imports", status_code=202)
+async def create_import(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = Query(default=None),
+    plan_name: Optional[str] = Query(default=None)
+) -> dict:
+    """
+    Recebe um arquivo de carteirinhas no corpo da requisição (lido em streaming)
+
+    CSV com cabeçalho (numero_carterinha, plan_name, numero) ou NDJSON com os mesmos campos.
+
+    Args:
+        request: Requisição (corpo = arquivo)
+        format: "csv" ou "ndjson" (padrão: deduzido do Content-Type)
+        plan_name: Plano das linhas sem a coluna plan_name
+
+    Returns:
+        Importação criada (processamento em background)
+    """
+    if not drain_controller.admitting:
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "Serviço em desligamento, tente novamente"},
+            headers={"Retry-After": str(drain_controller.retry_after)}
+        )
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = format or CONTENT_TYPES.get(content_type)
+    if fmt is None:
+        raise HTTPException(
+            status_code=415,
+            detail={"error": "Informe format=csv|ndjson ou um Content-Type de CSV/NDJSON"}
+        )
+    try:
+        job = await bulk_imports.create(request.stream(), fmt, plan_name)
+    except BulkImportTooLarge as e:
+        raise HTTPException(status_code=413, detail={"error": str(e)})
+    except BulkImportError as e:
+        raise HTTPException(status_code=400, detail={"error": str(e)})
+    return job.snapshot()
+
+
+@bulk_router.get("/imports")
+async def list_imports() -> dict:
+    """
+    Importações conhecidas (mais recentes primeiro)
+
+    Returns:
+        Progresso de cada importação
+    """
+    jobs = bulk_imports.listing()
+    return {"total": len(jobs), "imports": jobs}
+
+
+@bulk_router.get("/imports/{job_id}")
+async def get_import(job_id: str) -> dict:
+    """
+    Progresso de uma importação
+
+    Args:
+        job_id: Identificador da importação
+
+    Returns:
+        Estado, linhas lidas/processadas e contagem por resultado
+    """
+    return _job_or_404(job_id).snapshot()
+
+
+@bulk_router.get("/imports/{job_id}/results")
+async def download_results(
+    job_id: str,
+    format: Literal["csv", "ndjson"] = Query(default="csv")
+) -> StreamingResponse:
+    """
+    Download dos resultados (parciais enquanto a importação roda)
+
+    Args:
+        job_id: Identificador da importação
+        format: "csv" ou "ndjson"
+
+    Returns:
+        Arquivo de resultados em streaming
+    """
+    job = _job_or_404(job_id)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        bulk_imports.iter_results(job, format),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="bulk-{job.id}.{format}"',
+            "X-Import-Status": job.status,
+        }
+    )
@@ -1,36 +1,299 @@
 """
 Sistema de dispatch para handlers de diferentes planos de saúde
 """
-from typing import Dict, Callable, Awaitable, Literal
-from app.handlers.amil import amil_handler
-from app.handlers.generic import generic_handler
+import os
+import time
+import asyncio
+import importlib
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Callable, Awaitable, List, Literal, Optional, Tuple
+from app.plugins import HandlerManifest, discover_manifests
+from app.utils.cache import ResultCache
+from app.utils.card_validators import CardValidationError, normalize_card_number, validate_card
+from app.utils.history import annotate_check, check_context, history_store
+from app.utils.metrics import metrics
+from app.utils.plan_index import PlanIndex, load_alias_table
+from app.utils.popularity import HotCard, PopularityTracker
+from app.utils.state import StateBackendError, state_backend
 from app.utils.logger import logger, log_with_context
+from app.utils.startup import startup_report
+
+
+HandlerFunc = Callable[[str], Awaitable[Literal["elegivel", "nao_elegivel"]]]
+
+# Handler genérico, carregado sob demanda como os demais
+GENERIC_HANDLER_TARGET = "app.handlers.generic:generic_handler"
 
 
 class HandlerRegistry:
     """Registry para handlers de diferentes planos"""
     
     def __init__(self):
-        self._handlers: Dict[str, Callable[[str], Awaitable[Literal["elegivel", "nao_elegivel"]]]] = {}
+        self._handlers: Dict[str, HandlerFunc] = {}
+        # Handlers registrados por nome ("modulo:atributo"), importados no primeiro uso
+        self._lazy_handlers: Dict[str, str] = {}
+        self._manifests: Dict[str, HandlerManifest] = {}
+        self._limiters: Dict[str, asyncio.Semaphore] = {}
+        self._generic_handler: Any = None
+        self._generic_manifest = HandlerManifest(name="generico", target=GENERIC_HANDLER_TARGET)
+        self._load_lock = threading.Lock()
+        self._cache = ResultCache(backend=state_backend)
+        # Demanda por carteirinha, usada pelo refresh antecipado do cache
+        self._popularity = PopularityTracker()
+        # Índice nome livre -> plano, reconstruído sob demanda quando o registro muda
+        self._index = PlanIndex()
+        self._index_dirty = True
+        self._generic_wrappers: Dict[str, HandlerFunc] = {}
+        # Detecção automática do plano: nomes que a ativam ("" = plan_name vazio)
+        self.auto_names = {name.strip().lower() for name in os.getenv("PLAN_AUTO_NAMES", "auto,").split(",")}
+        # Também para nomes que não resolvem para nenhum plano (em vez do handler genérico)
+        self.auto_unmatched = os.getenv("PLAN_AUTO_DETECT_UNMATCHED", "false").lower() == "true"
+        self.auto_parallel = int(os.getenv("PLAN_AUTO_MAX_PARALLEL", "3"))
+        self.auto_max_candidates = int(os.getenv("PLAN_AUTO_MAX_CANDIDATES", "5"))
+        self.auto_timeout = float(os.getenv("PLAN_AUTO_TIMEOUT_S", "90"))
+        self.auto_memory_ttl = float(os.getenv("PLAN_AUTO_MEMORY_TTL", str(30 * 86400)))
+        self._auto_stats = {"detected": 0, "inconclusive": 0, "remembered": 0, "memory_errors": 0}
         self._register_handlers()
     
     def _register_handlers(self) -> None:
         """Registra todos os handlers disponíveis"""
-        # Registrar handler do Amil (específico)
-        self.register_handler("amil", amil_handler.check_eligibility)
+        # Handlers descobertos por manifest (embutidos, diretório de plugins e entry points);
+        # o módulo do handler (e o Playwright) só é carregado no primeiro uso
+        for manifest in discover_manifests().values():
+            self.register_lazy_handler(manifest.name, manifest.target, manifest)
         
         log_with_context(
             logger,
             "INFO",
             "Handlers registrados",
-            registered_plans=list(self._handlers.keys()),
+            registered_plans=self._plan_names(),
             generic_fallback=True
         )
     
+    def _plan_names(self) -> list[str]:
+        return list(self._handlers.keys()) + [
+            name for name in self._lazy_handlers if name not in self._handlers
+        ]
+    
+    def register_lazy_handler(
+        self,
+        plan_name: str,
+        target: Optional[str],
+        manifest: Optional[HandlerManifest] = None
+    ) -> None:
+        """
+        Registra um handler pelo caminho de import, sem importá-lo
+        
+        Args:
+            plan_name: Nome do plano (ex: "amil", "unimed")
+            target: Caminho "modulo:atributo"; o atributo pode ser uma instância com
+                check_eligibility ou a própria função async (None se o manifest usa receita)
+            manifest: Limites de concorrência, sessão, cache e receita do handler
+        """
+        plan_key = plan_name.lower()
+        self._lazy_handlers[plan_key] = target
+        self._manifests[plan_key] = manifest or HandlerManifest(name=plan_key, target=target)
+        self._limiters.pop(plan_key, None)
+        self._index_dirty = True
+        log_with_context(
+            logger,
+            "INFO",
+            f"Handler registrado para plano: {plan_name}",
+            plan_name=plan_name,
+            target=target,
+            lazy=True
+        )
+    
+    @staticmethod
+    def _import_target(target: str) -> Any:
+        module_name, _, attr = target.partition(":")
+        module = importlib.import_module(module_name)
+        return getattr(module, attr) if attr else module
+    
+    @staticmethod
+    def _build_recipe_handler(manifest: HandlerManifest) -> Any:
+        """Cria um handler a partir da receita declarada no manifest (sem código específico)"""
+        from app.handlers.recipe import RecipeHandler
+        return RecipeHandler.from_recipe(Path(manifest.recipe), env_prefix=manifest.name.upper())
+    
+    def _load_handler(self, plan_key: str) -> HandlerFunc:
+        """Importa e instancia um handler lazy (thread-safe)"""
+        with self._load_lock:
+            if plan_key in self._handlers:
+                return self._handlers[plan_key]
+            
+            target = self._lazy_handlers[plan_key]
+            manifest = self._manifests[plan_key]
+            started = time.perf_counter()
+            if manifest.recipe:
+                obj = self._build_recipe_handler(manifest)
+            else:
+                obj = self._import_target(target)
+            handler = getattr(obj, "check_eligibility", obj)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            
+            self._handlers[plan_key] = handler
+            startup_report.record_handler(plan_key, elapsed_ms)
+            log_with_context(
+                logger,
+                "INFO",
+                f"Handler carregado: {plan_key}",
+                plan_name=plan_key,
+                target=target,
+                load_ms=round(elapsed_ms, 1)
+            )
+            return handler
+    
+    def _get_generic_handler(self) -> Any:
+        if self._generic_handler is None:
+            with self._load_lock:
+                if self._generic_handler is None:
+                    started = time.perf_counter()
+                    self._generic_handler = self._import_target(GENERIC_HANDLER_TARGET)
+                    startup_report.record_handler("generico", (time.perf_counter() - started) * 1000)
+        return self._generic_handler
+    
+    def pending_handlers(self, session_only: bool = False) -> list[str]:
+        """
+        Lista os planos cujos handlers ainda não foram carregados
+        
+        Args:
+            session_only: Considerar apenas handlers que exigem sessão aquecida
+        
+        Returns:
+            Nomes dos planos pendentes
+        """
+        return [
+            name for name in self._lazy_handlers
+            if name not in self._handlers
+            and (not session_only or self._manifests[name].requires_session)
+        ]
+    
+    def get_manifest(self, plan_name: str) -> HandlerManifest:
+        """
+        Retorna o manifest do plano (ou o do handler genérico)
+        
+        Args:
+            plan_name: Nome do plano
+            
+        Returns:
+            Manifest do handler
+        """
+        plan_key = self.resolve_plan(plan_name)
+        return self._manifests[plan_key] if plan_key else self._generic_manifest
+    
+    def resolve_plan(self, plan_name: str) -> Optional[str]:
+        """
+        Resolve o nome livre recebido para um plano registrado
+        
+        Ex: "AMIL S750", "Amil 400 QC" e "amil-saude" resolvem para "amil".
+        
+        Args:
+            plan_name: Nome do plano recebido
+            
+        Returns:
+            Nome do plano registrado ou None (handler genérico)
+        """
+        if self._index_dirty:
+            self._index.build(
+                ((name, self._manifests[name].aliases) for name in self._plan_names()),
+                load_alias_table()
+            )
+            self._index_dirty = False
+        return self._index.resolve(plan_name)
+    
+    def unmatched_plans(self) -> list[dict]:
+        """
+        Nomes de plano recebidos que não resolveram para nenhum handler específico
+        
+        Returns:
+            Lista com nome e quantidade, do mais frequente para o menos
+        """
+        return self._index.unmatched()
+    
+    def validate_card(self, plan_name: str, numero_carteirinha: str) -> str:
+        """
+        Valida o número da carteirinha com o formato declarado no manifest do plano
+        
+        Args:
+            plan_name: Nome do plano
+            numero_carteirinha: Número recebido
+            
+        Returns:
+            Número normalizado (sem separadores); inalterado se o plano não declara formato
+            
+        Raises:
+            CardValidationError: Se o número é inválido para o plano (contabilizado em métricas)
+        """
+        manifest = self.get_manifest(plan_name)
+        if manifest.card_format is None:
+            return numero_carteirinha
+        
+        try:
+            return validate_card(numero_carteirinha, manifest.card_format)
+        except CardValidationError as e:
+            metrics.inc("cards_short_circuited")
+            metrics.inc(f"cards_short_circuited_{manifest.name.lower()}_{e.reason}")
+            log_with_context(
+                logger,
+                "WARNING",
+                "Número de carteirinha inválido, consulta ao portal evitada",
+                plan_name=plan_name,
+                numero_carteirinha=numero_carteirinha,
+                reason=e.reason,
+                on_invalid=e.on_invalid
+            )
+            raise
+    
+    def describe_plans(self) -> list[dict]:
+        """
+        Descreve os manifests registrados e se o handler já foi carregado
+        
+        Returns:
+            Lista de manifests serializados
+        """
+        return [
+            {**manifest.model_dump(), "loaded": name in self._handlers}
+            for name, manifest in self._manifests.items()
+        ]
+    
+    def _limiter(self, plan_key: str, manifest: HandlerManifest) -> Optional[asyncio.Semaphore]:
+        if manifest.max_concurrency is None:
+            return None
+        if plan_key not in self._limiters:
+            self._limiters[plan_key] = asyncio.Semaphore(manifest.max_concurrency)
+        return self._limiters[plan_key]
+    
+    async def prewarm(self) -> None:
+        """Carrega em background (thread) os handlers que exigem sessão aquecida"""
+        started = time.perf_counter()
+        for plan_key in self.pending_handlers(session_only=True):
+            try:
+                await asyncio.to_thread(self._load_handler, plan_key)
+            except Exception as e:
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Erro ao pré-carregar handler: {str(e)}",
+                    plan_name=plan_key,
+                    error_type=type(e).__name__
+                )
+        await asyncio.to_thread(self._get_generic_handler)
+        
+        log_with_context(
+            logger,
+            "INFO",
+            "Handlers pré-carregados",
+            loaded_plans=list(self._handlers.keys()),
+            prewarm_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+    
     def register_handler(
         self, 
         plan_name: str, 
-        handler: Callable[[str], Awaitable[Literal["elegivel", "nao_elegivel"]]]
+        handler: HandlerFunc
     ) -> None:
         """
         Registra um handler para um plano específico
@@ -39,7 +302,13 @@ class HandlerRegistry:
             plan_name: Nome do plano (ex: "amil", "unimed")
             handler: Função async que verifica elegibilidade
         """
-        self._handlers[plan_name.lower()] = handler
+        plan_key = plan_name.lower()
+        self._handlers[plan_key] = handler
+        self._manifests.setdefault(
+            plan_key,
+            HandlerManifest(name=plan_key, target=getattr(handler, "__qualname__", repr(handler)))
+        )
+        self._index_dirty = True
         log_with_context(
             logger,
             "INFO",
@@ -47,7 +316,7 @@ class HandlerRegistry:
             plan_name=plan_name
         )
     
-    def get_handler(self, plan_name: str) -> Callable[[str], Awaitable[Literal["elegivel", "nao_elegivel"]]]:
+    def get_handler(self, plan_name: str) -> HandlerFunc:
         """
         Retorna o handler para um plano específico
         
@@ -57,20 +326,24 @@ class HandlerRegistry:
         Returns:
             Handler function (específico ou genérico)
         """
-        plan_key = plan_name.lower()
+        plan_key = self.resolve_plan(plan_name)
         
-        # Se existe handler específico, usar ele
-        if plan_key in self._handlers:
+        # Se existe handler específico, usar ele (carregando no primeiro uso)
+        if plan_key is not None:
             log_with_context(
                 logger,
                 "INFO",
                 f"Usando handler específico para: {plan_name}",
                 plan_name=plan_name,
+                resolved_plan=plan_key,
                 handler_type="específico"
             )
-            return self._handlers[plan_key]
+            if plan_key in self._handlers:
+                return self._handlers[plan_key]
+            return self._load_handler(plan_key)
         
         # Caso contrário, usar handler genérico
+        self._index.record_unmatched(plan_name)
         log_with_context(
             logger,
             "INFO",
@@ -79,11 +352,35 @@ class HandlerRegistry:
             handler_type="genérico"
         )
         
-        # Retornar uma função wrapper que passa o plan_name para o handler genérico
-        async def generic_wrapper(numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
-            return await generic_handler.check_eligibility(numero_carteirinha, plan_name)
+        # Wrapper que passa o plan_name para o handler genérico, reaproveitado por nome
+        wrapper = self._generic_wrappers.get(plan_name)
+        if wrapper is None:
+            if len(self._generic_wrappers) >= 1024:
+                self._generic_wrappers.clear()
+            wrapper = partial(self._get_generic_handler().check_eligibility, plan_name=plan_name)
+            self._generic_wrappers[plan_name] = wrapper
+        return wrapper
+    
+    async def load_handler(self, plan_name: str) -> HandlerFunc:
+        """
+        Retorna o handler do plano importando-o numa thread na primeira vez
+        
+        A importação (e o Playwright que ela puxa) e a espera pelo prewarm, que segura
+        _load_lock numa thread, ficam fora do event loop; get_handler serve o caso já carregado.
         
-        return generic_wrapper
+        Args:
+            plan_name: Nome do plano
+            
+        Returns:
+            Handler function (específico ou genérico)
+        """
+        plan_key = self.resolve_plan(plan_name)
+        if plan_key is not None:
+            if plan_key not in self._handlers:
+                await asyncio.to_thread(self._load_handler, plan_key)
+        elif self._generic_handler is None:
+            await asyncio.to_thread(self._get_generic_handler)
+        return self.get_handler(plan_name)
     
     def list_supported_plans(self) -> list[str]:
         """
@@ -92,7 +389,7 @@ class HandlerRegistry:
         Returns:
             Lista de nomes dos planos suportados (sempre inclui "qualquer plano")
         """
-        specific_plans = list(self._handlers.keys())
+        specific_plans = self._plan_names()
         return specific_plans + ["qualquer_plano_via_handler_generico"]
     
     async def process_eligibility(self, plan_name: str, numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
@@ -114,9 +411,37 @@ class HandlerRegistry:
             numero_carteirinha=numero_carteirinha
         )
         
+        if self.is_auto(plan_name):
+            return await self._process_auto(plan_name, numero_carteirinha)
+        
         try:
-            handler = self.get_handler(plan_name)
-            result = await handler(numero_carteirinha)
+            plan_key = self.resolve_plan(plan_name) or plan_name.lower()
+            manifest = self.get_manifest(plan_name)
+            annotate_check(plan=plan_key)
+            
+            try:
+                numero_carteirinha = self.validate_card(plan_name, numero_carteirinha)
+            except CardValidationError as e:
+                annotate_check(source="invalid_card", reason=e.reason)
+                return "nao_elegivel"
+            
+            if manifest.cacheable:
+                cached = await self._cache.get(plan_key, numero_carteirinha)
+                if cached is not None:
+                    annotate_check(source="cache")
+                    self._popularity.record(plan_key, numero_carteirinha, cached)
+                    log_with_context(
+                        logger,
+                        "INFO",
+                        "Resultado de elegibilidade servido do cache",
+                        plan_name=plan_name,
+                        numero_carteirinha=numero_carteirinha,
+                        result=cached
+                    )
+                    return cached
+            
+            result = await self._check(plan_name, plan_key, manifest, numero_carteirinha)
+            self._popularity.record(plan_key, numero_carteirinha, result)
             
             log_with_context(
                 logger,
@@ -139,9 +464,322 @@ class HandlerRegistry:
                 error_type=type(e).__name__,
                 error_message=str(e)
             )
+            annotate_check(source="error", error_type=type(e).__name__)
             # Retornar não elegível por segurança
             return "nao_elegivel"
 
 
+    async def _check(
+        self,
+        plan_name: str,
+        plan_key: str,
+        manifest: HandlerManifest,
+        numero_carteirinha: str
+    ) -> Literal["elegivel", "nao_elegivel"]:
+        """Consulta o handler (respeitando o limite do plano) e grava o resultado em cache"""
+        handler = await self.load_handler(plan_name)
+        limiter = self._limiter(plan_key, manifest)
+        if limiter is None:
+            result = await handler(numero_carteirinha)
+        else:
+            async with limiter:
+                result = await handler(numero_carteirinha)
+        
+        if manifest.cacheable:
+            ttl = manifest.cache_ttl if result == "elegivel" else manifest.negative_cache_ttl
+            if ttl > 0:
+                await self._cache.set(plan_key, numero_carteirinha, result, ttl)
+        return result
+    
+    def is_auto(self, plan_name: str) -> bool:
+        """
+        Se o plano deve ser detectado pela carteirinha
+        
+        Args:
+            plan_name: Nome do plano recebido
+            
+        Returns:
+            True para os nomes de PLAN_AUTO_NAMES (e, com PLAN_AUTO_DETECT_UNMATCHED, nomes sem plano)
+        """
+        name = plan_name.strip().lower()
+        if name in self.auto_names:
+            return True
+        return self.auto_unmatched and self.resolve_plan(plan_name) is None
+    
+    def auto_candidates(self, numero_carteirinha: str) -> List[str]:
+        """
+        Planos candidatos para a carteirinha, pelos formatos declarados nos manifests
+        
+        Planos cujo formato aceita o número vêm primeiro; planos sem formato declarado, depois;
+        planos cujo formato recusa o número ficam de fora.
+        
+        Args:
+            numero_carteirinha: Número recebido
+            
+        Returns:
+            Planos a consultar, no máximo PLAN_AUTO_MAX_CANDIDATES
+        """
+        matching, unknown = [], []
+        for name in self._plan_names():
+            manifest = self._manifests[name]
+            if not manifest.auto_detect:
+                continue
+            if manifest.card_format is None:
+                unknown.append(name)
+                continue
+            try:
+                validate_card(numero_carteirinha, manifest.card_format)
+            except CardValidationError:
+                continue
+            matching.append(name)
+        return (matching + unknown)[:self.auto_max_candidates]
+    
+    def _memory_key(self, numero_carteirinha: str) -> str:
+        return f"plan_for:{history_store.card_hash(normalize_card_number(numero_carteirinha))}"
+    
+    def check_memory_key(self) -> bool:
+        """
+        Confere se a memória carteirinha -> plano vale entre réplicas e deploys
+        
+        A chave da memória é o hash da carteirinha: sem HISTORY_HASH_KEY, cada host gera a
+        própria chave (e um disco efêmero gera outra a cada deploy), então o backend
+        compartilhado guarda entradas que nenhuma outra réplica encontra.
+        
+        Returns:
+            False se o backend é compartilhado e HISTORY_HASH_KEY não foi definida
+        """
+        if not state_backend.shared or history_store.hash_key_configured:
+            return True
+        log_with_context(
+            logger,
+            "ERROR",
+            "HISTORY_HASH_KEY ausente com backend de estado compartilhado: o plano lembrado "
+            "para cada carteirinha não é compartilhado entre réplicas e se perde a cada deploy",
+            state_backend=type(state_backend).__name__
+        )
+        return False
+    
+    async def remembered_plan(self, numero_carteirinha: str) -> Optional[str]:
+        """
+        Plano detectado antes para a carteirinha (compartilhado entre réplicas com STATE_BACKEND_URL e a mesma HISTORY_HASH_KEY)
+        
+        Args:
+            numero_carteirinha: Número recebido
+            
+        Returns:
+            Plano registrado ou None
+        """
+        try:
+            plan_key = await state_backend.get(self._memory_key(numero_carteirinha))
+        except StateBackendError:
+            self._auto_stats["memory_errors"] += 1
+            return None
+        return plan_key if plan_key in self._manifests else None
+    
+    async def _remember_plan(self, numero_carteirinha: str, plan_key: str) -> None:
+        try:
+            await state_backend.set(self._memory_key(numero_carteirinha), plan_key, self.auto_memory_ttl)
+        except StateBackendError:
+            self._auto_stats["memory_errors"] += 1
+    
+    async def _attempt(self, plan_key: str, numero_carteirinha: str) -> Tuple[str, str, Dict[str, Any]]:
+        """Consulta um candidato (respeitando o limite do plano) sem gravar em cache"""
+        manifest = self._manifests[plan_key]
+        with check_context() as check:
+            numero = numero_carteirinha if manifest.card_format is None else validate_card(numero_carteirinha, manifest.card_format)
+            handler = self._handlers.get(plan_key) or await asyncio.to_thread(self._load_handler, plan_key)
+            limiter = self._limiter(plan_key, manifest)
+            if limiter is None:
+                result = await handler(numero)
+            else:
+                async with limiter:
+                    result = await handler(numero)
+        return plan_key, result, check
+    
+    async def _detect(self, candidates: List[str], numero_carteirinha: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Consulta os candidatos em paralelo (até PLAN_AUTO_MAX_PARALLEL); o primeiro "elegivel" vence
+        
+        Um "nao_elegivel" não é conclusivo: o portal errado também não encontra a carteirinha.
+        
+        Returns:
+            (plano vencedor ou None, campos anotados pelo handler vencedor)
+        """
+        semaphore = asyncio.Semaphore(self.auto_parallel)
+        
+        async def bounded(plan_key: str) -> Tuple[str, str, Dict[str, Any]]:
+            async with semaphore:
+                return await self._attempt(plan_key, numero_carteirinha)
+        
+        tasks = [asyncio.create_task(bounded(plan_key), name=f"auto-{plan_key}") for plan_key in candidates]
+        pending = set(tasks)
+        deadline = time.monotonic() + self.auto_timeout
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, deadline - time.monotonic()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    log_with_context(logger, "WARNING", "Detecção automática sem resposta no prazo", candidates=candidates)
+                    break
+                for task in done:
+                    if task.exception() is not None:
+                        log_with_context(
+                            logger,
+                            "WARNING",
+                            f"Candidato da detecção automática falhou: {str(task.exception())}",
+                            candidate=task.get_name(),
+                            error_type=type(task.exception()).__name__
+                        )
+                        continue
+                    plan_key, result, check = task.result()
+                    if result == "elegivel":
+                        return plan_key, check
+        finally:
+            # Os demais candidatos são cancelados assim que há um vencedor (ou no fim do prazo)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return None, {}
+    
+    async def _process_auto(self, plan_name: str, numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
+        """
+        Detecta o plano pela carteirinha: plano lembrado, ou consulta paralela aos candidatos
+        
+        Args:
+            plan_name: Nome do plano recebido ("auto", vazio ou sem correspondência)
+            numero_carteirinha: Número da carteirinha
+            
+        Returns:
+            Status da elegibilidade
+        """
+        remembered = await self.remembered_plan(numero_carteirinha)
+        if remembered is not None:
+            self._auto_stats["remembered"] += 1
+            return await self.process_eligibility(remembered, numero_carteirinha)
+        
+        candidates = self.auto_candidates(numero_carteirinha)
+        if not candidates:
+            annotate_check(plan="auto", source="invalid_card", reason="nenhum_plano_compativel")
+            log_with_context(
+                logger,
+                "WARNING",
+                "Nenhum plano compatível com a carteirinha",
+                plan_name=plan_name,
+                numero_carteirinha=numero_carteirinha
+            )
+            return "nao_elegivel"
+        
+        started = time.perf_counter()
+        try:
+            winner, check = await self._detect(candidates, numero_carteirinha)
+        except Exception as e:
+            log_with_context(
+                logger,
+                "ERROR",
+                f"Erro na detecção automática do plano: {str(e)}",
+                plan_name=plan_name,
+                numero_carteirinha=numero_carteirinha,
+                error_type=type(e).__name__
+            )
+            annotate_check(plan="auto", source="error", error_type=type(e).__name__)
+            return "nao_elegivel"
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        
+        if winner is None:
+            self._auto_stats["inconclusive"] += 1
+            annotate_check(plan="auto")
+            log_with_context(
+                logger,
+                "INFO",
+                "Detecção automática inconclusiva: nenhum portal confirmou a carteirinha",
+                numero_carteirinha=numero_carteirinha,
+                candidates=candidates,
+                elapsed_ms=elapsed_ms
+            )
+            return "nao_elegivel"
+        
+        self._auto_stats["detected"] += 1
+        annotate_check(**{**check, "plan": winner})
+        await self._remember_plan(numero_carteirinha, winner)
+        manifest = self._manifests[winner]
+        numero = numero_carteirinha if manifest.card_format is None else validate_card(numero_carteirinha, manifest.card_format)
+        self._popularity.record(winner, numero, "elegivel")
+        if manifest.cacheable and manifest.cache_ttl > 0:
+            await self._cache.set(winner, numero, "elegivel", manifest.cache_ttl)
+        log_with_context(
+            logger,
+            "INFO",
+            "Plano detectado automaticamente",
+            numero_carteirinha=numero_carteirinha,
+            detected_plan=winner,
+            candidates=candidates,
+            elapsed_ms=elapsed_ms
+        )
+        return "elegivel"
+    
+    async def refresh_candidates(self, lead_s: float, min_score: float, limit: int) -> list[HotCard]:
+        """
+        Carteirinhas quentes cujo resultado em cache falta ou vence em breve
+        
+        Só entram planos com cache e resultados que seriam gravados (TTL > 0). A antecedência
+        é limitada à metade do TTL, para que um resultado recém-renovado não seja renovado de novo.
+        
+        Args:
+            lead_s: Antecedência (s) em relação ao vencimento
+            min_score: Popularidade mínima
+            limit: Quantidade máxima
+            
+        Returns:
+            Carteirinhas a renovar, mais populares primeiro
+        """
+        candidates = []
+        for card in self._popularity.top(limit * 4, min_score):
+            manifest = self._manifests.get(card.plan_key)
+            if manifest is None or not manifest.cacheable:
+                continue
+            ttl = manifest.cache_ttl if card.last_status == "elegivel" else manifest.negative_cache_ttl
+            if ttl <= 0:
+                continue
+            remaining = await self._cache.expires_in(card.plan_key, card.numero_carteirinha)
+            if remaining is not None and remaining > min(lead_s, ttl / 2):
+                continue
+            candidates.append(card)
+            if len(candidates) >= limit:
+                break
+        return candidates
+    
+    def plan_busy(self, plan_key: str) -> bool:
+        """Se todas as vagas de consulta simultânea do plano estão ocupadas"""
+        limiter = self._limiters.get(plan_key)
+        return limiter is not None and limiter.locked()
+    
+    async def refresh(self, plan_key: str, numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
+        """
+        Consulta o portal ignorando o cache e renova o resultado (não conta como demanda)
+        
+        Args:
+            plan_key: Plano resolvido
+            numero_carteirinha: Número da carteirinha normalizado
+            
+        Returns:
+            Status da elegibilidade
+        """
+        return await self._check(plan_key, plan_key, self._manifests[plan_key], numero_carteirinha)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded_handlers": list(self._handlers.keys()),
+            "pending_handlers": self.pending_handlers(),
+            "cache": self._cache.stats(),
+            "plan_index": self._index.stats(),
+            "popularity": self._popularity.stats(),
+            "auto_detect": dict(self._auto_stats),
+        }
+
+
 # Instância global do registry
-handler_registry = HandlerRegistry() 
\ No newline at end of file
+handler_registry = HandlerRegistry()
+metrics.register_collector("dispatch", handler_registry.stats) 
\ No newline at end of file
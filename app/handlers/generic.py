@@ -1,120 +1,175 @@
 """
 Handler genérico para verificação de elegibilidade em qualquer plano de saúde
+
+Simula a consulta a um portal: o resultado é estável por carteirinha (o mesmo em qualquer
+processo) e a latência/falhas seguem distribuições configuráveis, inclusive latência zero
+para testes de carga da fila, do dispatch e dos callbacks.
 """
 import os
 import random
+import hashlib
 import asyncio
-from typing import Literal
+from typing import Callable, Literal, Optional
+from app.utils.events import report_progress
+from app.utils.history import annotate_check
 from app.utils.logger import logger, log_with_context
 
 
+# Passos simulados, fração da latência total gasta em cada um e evento de progresso
+SIMULATED_STEPS = [
+    ("Navegando para página de login", 0.1, "logging_in"),
+    ("Login realizado com sucesso", 0.1, "logging_in"),
+    ("Navegando para aba de elegibilidade", 0.1, "consulting"),
+    ("Consultando carteirinha", 0.3, "consulting"),
+    ("Aguardando resultado da consulta...", 0.4, "consulting"),
+]
+
+
+class SimulatedFailure(Exception):
+    """Falha injetada pelo simulador"""
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """
+    Cria o amostrador de latência (segundos) a partir de uma especificação
+
+    Formatos: "zero", "fixed:<s>", "uniform:<min>:<max>", "normal:<média>:<desvio>",
+    "lognormal:<mu>:<sigma>" e "exponential:<média>". Valores negativos viram zero.
+
+    Args:
+        spec: Especificação da distribuição
+        rng: Gerador aleatório da instância
+
+    Returns:
+        Função sem argumentos que sorteia uma latência
+
+    Raises:
+        ValueError: Se a especificação for inválida
+    """
+    kind, *params = spec.strip().lower().split(":")
+    values = [float(param) for param in params]
+
+    if kind in ("zero", "0", "none"):
+        return lambda: 0.0
+    if kind == "fixed" and len(values) == 1:
+        return lambda: max(values[0], 0.0)
+    if kind == "uniform" and len(values) == 2:
+        return lambda: max(rng.uniform(values[0], values[1]), 0.0)
+    if kind == "normal" and len(values) == 2:
+        return lambda: max(rng.gauss(values[0], values[1]), 0.0)
+    if kind == "lognormal" and len(values) == 2:
+        return lambda: rng.lognormvariate(values[0], values[1])
+    if kind == "exponential" and len(values) == 1:
+        return lambda: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Distribuição de latência inválida: {spec}")
+
+
+def stable_fraction(numero_carteirinha: str, salt: str = "") -> float:
+    """
+    Número em [0, 1) derivado da carteirinha, igual em qualquer processo
+
+    Usa hashlib em vez de hash(), que muda a cada processo (PYTHONHASHSEED).
+
+    Args:
+        numero_carteirinha: Número da carteirinha
+        salt: Diferencia sorteios independentes para a mesma carteirinha
+
+    Returns:
+        Fração determinística
+    """
+    digest = hashlib.blake2b(f"{salt}:{numero_carteirinha}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
 class GenericHandler:
-    """Handler genérico para verificação de elegibilidade"""
-    
-    def __init__(self):
+    """Handler genérico para verificação de elegibilidade (simulador)"""
+
+    def __init__(
+        self,
+        latency: Optional[str] = None,
+        eligible_rate: Optional[float] = None,
+        failure_rate: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
         # Carteirinhas que sempre retornam elegível
         self.always_eligible = {
             "086955681",  # Carteirinha especial solicitada
             # Adicione mais carteirinhas aqui se necessário
         }
+        seed_env = os.getenv("GENERIC_SEED")
+        # RNG próprio: tarefas concorrentes não mexem no estado global do módulo random
+        self._rng = random.Random(seed if seed is not None else (int(seed_env) if seed_env else None))
+        self.latency_spec = latency or os.getenv("GENERIC_LATENCY", "uniform:6:11")
+        self._sample_latency = parse_latency(self.latency_spec, self._rng)
+        self.eligible_rate = eligible_rate if eligible_rate is not None else float(os.getenv("GENERIC_ELIGIBLE_RATE", "0.7"))
+        self.failure_rate = failure_rate if failure_rate is not None else float(os.getenv("GENERIC_FAILURE_RATE", "0"))
+        # fallback = falha é tratada aqui (resultado estável); raise = propaga para o dispatch
+        self.failure_mode = os.getenv("GENERIC_FAILURE_MODE", "fallback").lower()
+        # Logs dos passos simulados (desligar em testes de carga)
+        self.verbose = os.getenv("GENERIC_VERBOSE", "true").lower() == "true"
+
+    def _outcome(self, numero_carteirinha: str, eligible_rate: float) -> Literal["elegivel", "nao_elegivel"]:
+        """Resultado estável por carteirinha (70% elegível por padrão)"""
+        if numero_carteirinha in self.always_eligible:
+            return "elegivel"
+        return "elegivel" if stable_fraction(numero_carteirinha, "resultado") < eligible_rate else "nao_elegivel"
 
     async def check_eligibility(self, numero_carteirinha: str, plan_name: str = "generico") -> Literal["elegivel", "nao_elegivel"]:
         """
         Verifica elegibilidade da carteirinha para qualquer plano
-        
+
         Args:
             numero_carteirinha: Número da carteirinha a ser verificada
             plan_name: Nome do plano (usado apenas para logs)
-            
+
         Returns:
-            Status da elegibilidade (com resultados aleatórios para simulação)
+            Status da elegibilidade (simulado, estável por carteirinha)
         """
-        log_with_context(
-            logger,
-            "INFO",
-            f"Iniciando verificação de elegibilidade {plan_name.title()}",
-            numero_carteirinha=numero_carteirinha,
-            plan_name=plan_name
-        )
-        
-        try:
-            # Simular um tempo de processamento realista (3-8 segundos)
-            processing_time = random.uniform(3.0, 8.0)
+        if self.verbose:
             log_with_context(
                 logger,
                 "INFO",
-                f"Simulando processamento por {processing_time:.1f} segundos",
+                f"Iniciando verificação de elegibilidade {plan_name.title()}",
                 numero_carteirinha=numero_carteirinha,
                 plan_name=plan_name
             )
-            
-            await asyncio.sleep(processing_time)
-            
-            # Verificar se é uma carteirinha especial que sempre deve ser elegível
-            if numero_carteirinha in self.always_eligible:
-                is_eligible = "elegivel"
-                log_with_context(
-                    logger,
-                    "INFO",
-                    "Carteirinha especial detectada - sempre elegível",
-                    numero_carteirinha=numero_carteirinha,
-                    plan_name=plan_name
-                )
-            else:
-                # Gerar resultado aleatório com peso para elegível (70% elegível, 30% não elegível)
-                # Usa hash do número da carteirinha para resultados consistentes por carteirinha
-                random.seed(hash(numero_carteirinha) % 1000)  
-                is_eligible = random.choices(
-                    ["elegivel", "nao_elegivel"], 
-                    weights=[70, 30],  # 70% elegível, 30% não elegível
-                    k=1
-                )[0]
-            
-            # Simular alguns logs do processo
-            log_with_context(logger, "INFO", f"Navegando para página de login do {plan_name.title()}", plan_name=plan_name)
-            await asyncio.sleep(0.5)
-            
-            log_with_context(logger, "INFO", "Login realizado com sucesso", plan_name=plan_name)
-            await asyncio.sleep(0.5)
-            
-            log_with_context(logger, "INFO", "Navegando para aba de elegibilidade", plan_name=plan_name)
-            await asyncio.sleep(0.5)
-            
-            log_with_context(logger, "INFO", "Consultando carteirinha", numero_carteirinha=numero_carteirinha, plan_name=plan_name)
-            await asyncio.sleep(0.5)
-            
-            log_with_context(logger, "INFO", "Aguardando resultado da consulta...", plan_name=plan_name)
-            await asyncio.sleep(1.0)
-            
-            # Log do resultado
-            if is_eligible == "elegivel":
+
+        try:
+            processing_time = self._sample_latency()
+            if self.verbose:
                 log_with_context(
                     logger,
                     "INFO",
-                    "Carteirinha elegível",
+                    f"Simulando processamento por {processing_time:.1f} segundos",
                     numero_carteirinha=numero_carteirinha,
                     plan_name=plan_name
                 )
-            else:
+
+            is_eligible = self._outcome(numero_carteirinha, self.eligible_rate)
+
+            # Latência distribuída entre os passos simulados
+            for message, fraction, event in SIMULATED_STEPS:
+                report_progress(event, portal=plan_name)
+                if self.verbose:
+                    log_with_context(logger, "INFO", message, numero_carteirinha=numero_carteirinha, plan_name=plan_name)
+                if processing_time > 0:
+                    await asyncio.sleep(processing_time * fraction)
+
+            if self.failure_rate > 0 and self._rng.random() < self.failure_rate:
+                raise SimulatedFailure("Falha simulada do portal")
+
+            if self.verbose:
                 log_with_context(
                     logger,
                     "INFO",
-                    "Carteirinha não elegível",
+                    "Verificação concluída",
                     numero_carteirinha=numero_carteirinha,
+                    status=is_eligible,
                     plan_name=plan_name
                 )
-            
-            log_with_context(
-                logger,
-                "INFO",
-                "Verificação concluída",
-                numero_carteirinha=numero_carteirinha,
-                status=is_eligible,
-                plan_name=plan_name
-            )
-            
+
             return is_eligible
-                    
+
         except Exception as e:
             log_with_context(
                 logger,
@@ -125,12 +180,12 @@ class GenericHandler:
                 error_type=type(e).__name__,
                 error_message=str(e)
             )
-            # Em caso de erro real, verificar se é carteirinha especial
-            if numero_carteirinha in self.always_eligible:
-                return "elegivel"
-            # Para outras carteirinhas, retornar resultado aleatório também
-            return random.choices(["elegivel", "nao_elegivel"], weights=[60, 40], k=1)[0]
+            annotate_check(error_type=type(e).__name__)
+            if isinstance(e, SimulatedFailure) and self.failure_mode == "raise":
+                raise
+            # Em caso de erro, resultado estável com peso menor para elegível
+            return self._outcome(numero_carteirinha, 0.6)
 
 
 # Instância global do handler genérico
-generic_handler = GenericHandler() 
\ No newline at end of file
+generic_handler = GenericHandler()
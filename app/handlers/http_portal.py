@@ -0,0 +1,185 @@
+"""
+Base para handlers de portais renderizados no servidor, usando a engine HTTP sem browser
+"""
+import os
+import json
+import time
+from abc import ABC, abstractmethod
+from typing import Literal, Optional
+from app.utils.scraper import HttpSession, ScraperEngine, scraper_engine
+from app.utils.events import report_progress
+from app.utils.history import annotate_check
+from app.utils.state import StateBackend, StateBackendError, state_backend
+from app.utils.logger import logger, log_with_context
+
+
+class SessionExpiredError(Exception):
+    """O portal devolveu a tela de login no meio de uma consulta"""
+
+
+class HttpPortalHandler(ABC):
+    """
+    Handler de elegibilidade sem Playwright
+
+    Subclasses definem `portal` e implementam `fazer_login` e `consultar`; a base cuida
+    da sessão da conta (cookie jar próprio), do login sob demanda, do re-login quando a
+    sessão expira e do tratamento de erros. Com um backend de estado compartilhado, os
+    cookies de um login valem para todas as réplicas (uma réplica loga, as outras reaproveitam).
+    """
+
+    portal: str = "http"
+
+    def __init__(
+        self,
+        login: str,
+        password: str,
+        engine: Optional[ScraperEngine] = None,
+        state: Optional[StateBackend] = None
+    ):
+        self.login = login
+        self.password = password
+        self.engine = engine or scraper_engine
+        self.session_ttl = int(os.getenv("HTTP_SESSION_TTL", "1200"))
+        state = state if state is not None else state_backend
+        self._shared = state if state.shared else None
+        # Login publicado por esta réplica (para não apagar o de outra ao invalidar)
+        self._published_id: Optional[str] = None
+
+    @property
+    def _shared_key(self) -> str:
+        return f"session:{self.portal}:{self.login}"
+
+    async def _adopt_shared(self, session: HttpSession) -> bool:
+        """Carrega na sessão os cookies de um login ainda válido feito por outra réplica"""
+        try:
+            raw = await self._shared.get(self._shared_key)
+        except StateBackendError:
+            return False
+        if raw is None:
+            return False
+        shared = json.loads(raw)
+        age = time.time() - shared["logged_in_at"]
+        if age >= self.session_ttl:
+            return False
+        for name, value, domain, path in shared["cookies"]:
+            session.cookies.set(name, value, domain=domain, path=path)
+        session.mark_logged_in(True)
+        # Idade do login original: o re-login acontece no mesmo prazo em todas as réplicas
+        session.logged_in_at = time.monotonic() - age
+        self._published_id = shared["id"]
+        log_with_context(logger, "INFO", "Sessão HTTP reaproveitada de outra réplica", portal=self.portal, session_id=session.id)
+        return True
+
+    async def _publish_shared(self, session: HttpSession) -> None:
+        cookies = [[cookie.name, cookie.value, cookie.domain, cookie.path] for cookie in session.cookies.jar]
+        payload = {"id": session.id, "logged_in_at": time.time(), "cookies": cookies}
+        try:
+            await self._shared.set(self._shared_key, json.dumps(payload), self.session_ttl)
+            self._published_id = session.id
+        except StateBackendError:
+            pass
+
+    async def _invalidate_shared(self) -> None:
+        """Remove o login compartilhado que o portal recusou (se ainda for o mesmo)"""
+        try:
+            raw = await self._shared.get(self._shared_key)
+            if raw is not None and json.loads(raw)["id"] == self._published_id:
+                await self._shared.delete(self._shared_key)
+        except StateBackendError:
+            pass
+
+    @property
+    def session(self) -> HttpSession:
+        """Sessão da conta configurada neste portal"""
+        return self.engine.session(self.portal, self.login)
+
+    @abstractmethod
+    async def fazer_login(self, session: HttpSession) -> bool:
+        """
+        Faz login na sessão (ex: via engine.submit_form)
+
+        Args:
+            session: Sessão da conta
+
+        Returns:
+            True se logado
+        """
+
+    @abstractmethod
+    async def consultar(self, session: HttpSession, numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
+        """
+        Consulta a carteirinha com a sessão já logada
+
+        Args:
+            session: Sessão logada
+            numero_carteirinha: Número da carteirinha
+
+        Returns:
+            Status da elegibilidade
+
+        Raises:
+            SessionExpiredError: Se o portal pediu login novamente
+        """
+
+    async def _garantir_login(self, session: HttpSession) -> None:
+        async with session.lock:
+            expired = (
+                session.logged_in_at is not None
+                and time.monotonic() - session.logged_in_at > self.session_ttl
+            )
+            if session.logged_in and not expired:
+                return
+            session.reset()
+            if self._shared is not None and await self._adopt_shared(session):
+                return
+            report_progress("logging_in", portal=self.portal)
+            session.mark_logged_in(await self.fazer_login(session))
+            if not session.logged_in:
+                raise RuntimeError(f"Falha no login do portal {self.portal}")
+            log_with_context(logger, "INFO", "Login HTTP realizado", portal=self.portal, session_id=session.id)
+            if self._shared is not None:
+                await self._publish_shared(session)
+
+    async def check_eligibility(self, numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
+        """
+        Verifica elegibilidade sem browser, com um re-login se a sessão tiver expirado
+
+        Args:
+            numero_carteirinha: Número da carteirinha
+
+        Returns:
+            Status da elegibilidade
+        """
+        session = self.session
+        annotate_check(account=self.login)
+        try:
+            for attempt in (1, 2):
+                await self._garantir_login(session)
+                try:
+                    report_progress("consulting", portal=self.portal)
+                    return await self.consultar(session, numero_carteirinha)
+                except SessionExpiredError:
+                    log_with_context(
+                        logger,
+                        "WARNING",
+                        "Sessão HTTP expirada durante consulta",
+                        portal=self.portal,
+                        session_id=session.id,
+                        attempt=attempt
+                    )
+                    session.mark_logged_in(False)
+                    if self._shared is not None:
+                        await self._invalidate_shared()
+            annotate_check(error_type="SessionExpiredError")
+            return "nao_elegivel"
+        except Exception as e:
+            log_with_context(
+                logger,
+                "ERROR",
+                f"Erro durante verificação HTTP de elegibilidade: {str(e)}",
+                portal=self.portal,
+                numero_carteirinha=numero_carteirinha,
+                error_type=type(e).__name__
+            )
+            annotate_check(error_type=type(e).__name__)
+            return "nao_elegivel"
@@ -0,0 +1,246 @@
+"""
+Handler genérico dirigido por receita: login, consulta e classificação vêm da receita do portal
+"""
+import os
+from pathlib import Path
+from typing import Literal, Optional
+from app.recipes import Classification, RecipePlan, load_recipe
+from app.utils.browser_pool import BrowserSession, browser_manager
+from app.utils.traffic import traffic
+from app.utils.events import report_progress
+from app.utils.evidence import evidence_archive
+from app.utils.history import annotate_check
+from app.utils.profiling import CheckTracker, slow_checks
+from app.utils.logger import logger, log_with_context
+
+
+# Receitas embutidas
+RECIPES_DIR = Path(__file__).parent / "recipes"
+
+
+class RecipeHandler:
+    """Verificação de elegibilidade executando uma receita compilada em sessões do pool"""
+
+    def __init__(
+        self,
+        plan: RecipePlan,
+        login: str,
+        password: str,
+        min_sessions: int = 1,
+        max_sessions: int = 3,
+        timeout_ms: Optional[int] = None
+    ):
+        if not login or not password:
+            raise ValueError(f"Credenciais do portal {plan.name} não configuradas")
+
+        self.plan = plan
+        self.login = login
+        self.password = password
+        self.timeout = timeout_ms or plan.timeout_ms
+        self.pool = browser_manager.create_pool(
+            plan.name,
+            setup=self._preparar_sessao,
+            validate=self._validar_sessao,
+            min_sessions=min_sessions,
+            max_sessions=max_sessions
+        )
+
+    @classmethod
+    def from_recipe(cls, path: Path, env_prefix: Optional[str] = None) -> "RecipeHandler":
+        """
+        Cria o handler a partir de um arquivo de receita, com credenciais e limites do ambiente
+
+        Lê <PREFIXO>_LOGIN, <PREFIXO>_PASSWORD, <PREFIXO>_MIN_SESSIONS, <PREFIXO>_MAX_SESSIONS e
+        <PREFIXO>_TIMEOUT, onde o prefixo padrão é o nome da receita em maiúsculas.
+
+        Args:
+            path: Arquivo JSON da receita
+            env_prefix: Prefixo das variáveis de ambiente
+
+        Returns:
+            Handler pronto (sessões criadas sob demanda pelo pool)
+        """
+        plan = load_recipe(Path(path))
+        prefix = env_prefix or plan.name.upper()
+        return cls(
+            plan,
+            os.getenv(f"{prefix}_LOGIN", ""),
+            os.getenv(f"{prefix}_PASSWORD", ""),
+            min_sessions=int(os.getenv(f"{prefix}_MIN_SESSIONS", "1")),
+            max_sessions=int(os.getenv(f"{prefix}_MAX_SESSIONS", "3")),
+            timeout_ms=int(os.getenv(f"{prefix}_TIMEOUT", "0")) or None
+        )
+
+    @property
+    def session_ativa(self) -> bool:
+        """Indica se existe alguma sessão logada no pool"""
+        return any(session.logged_in for session in self.pool.sessions)
+
+    async def _preparar_sessao(self, session: BrowserSession) -> bool:
+        """Prepara uma nova sessão do pool executando o login da receita"""
+        log_with_context(logger, "INFO", f"Fazendo login no portal {self.plan.name}", session_id=session.id)
+        report_progress("logging_in", portal=self.plan.name)
+        session.page.set_default_timeout(self.timeout)
+        try:
+            # Gravação/reprodução do tráfego (PORTAL_TRAFFIC_MODE) antes da primeira navegação
+            traffic.add_secret(self.plan.name, self.login, "login")
+            traffic.add_secret(self.plan.name, self.password, "password")
+            await traffic.attach(session.page, self.plan.name)
+            session.logged_in = await self.plan.login(session.page, self.login, self.password)
+        except Exception as e:
+            log_with_context(
+                logger, "ERROR",
+                f"Erro durante login: {str(e)}",
+                portal=self.plan.name,
+                error_type=type(e).__name__
+            )
+            session.logged_in = False
+
+        if session.logged_in:
+            log_with_context(logger, "INFO", "Login realizado com sucesso", portal=self.plan.name)
+        else:
+            log_with_context(
+                logger, "ERROR",
+                f"Falha no login - URL atual: {session.page.url}",
+                portal=self.plan.name
+            )
+        return session.logged_in
+
+    async def _validar_sessao(self, session: BrowserSession) -> bool:
+        """Ping barato definido em session_check da receita"""
+        valida = await self.plan.session_valid(session.page)
+        if not valida:
+            session.logged_in = False
+            log_with_context(
+                logger, "WARNING",
+                f"Sessão do portal {self.plan.name} expirada",
+                session_id=session.id
+            )
+        return valida
+
+    async def _consultar_carteirinha(
+        self,
+        session: BrowserSession,
+        numero_carteirinha: str,
+        tracker: Optional[CheckTracker] = None
+    ) -> Literal["elegivel", "nao_elegivel"]:
+        """Executa a consulta da receita e converte a classificação em status"""
+        try:
+            log_with_context(logger, "INFO", f"Navegando para consulta: {numero_carteirinha}", portal=self.plan.name)
+            report_progress("consulting", portal=self.plan.name)
+            traffic.add_secret(self.plan.name, numero_carteirinha, "card")
+            classificacao = await self.plan.consultar(
+                session.page, numero_carteirinha, tracker.mark if tracker else None
+            )
+        except Exception as e:
+            log_with_context(
+                logger, "ERROR",
+                f"Erro na consulta da carteirinha: {str(e)}",
+                portal=self.plan.name,
+                numero_carteirinha=numero_carteirinha,
+                error_type=type(e).__name__
+            )
+            # Página em estado desconhecido: sessão será reciclada ao ser devolvida
+            session.healthy = False
+            annotate_check(error_type=type(e).__name__)
+            return "nao_elegivel"
+
+        # Motivo, regra e região ficam no log para auditoria da decisão
+        auditoria = {
+            "portal": self.plan.name,
+            "numero_carteirinha": numero_carteirinha,
+            "motivo": classificacao.motivo,
+            "regra": classificacao.regra,
+            "regiao": classificacao.regiao,
+        }
+        annotate_check(reason=classificacao.motivo)
+        # Página guardada para contestações (leitura aqui, gravação fora da consulta)
+        desfecho = {True: "elegivel", False: "nao_elegivel"}.get(classificacao.elegivel, "indeterminado")
+        if evidence_archive.wants(desfecho):
+            await self._guardar_evidencia(session, numero_carteirinha, classificacao, desfecho, tracker)
+        if classificacao.elegivel is True:
+            log_with_context(logger, "INFO", f"Carteirinha ELEGÍVEL: {numero_carteirinha}", **auditoria)
+            return "elegivel"
+        if classificacao.elegivel is False:
+            log_with_context(logger, "INFO", f"Carteirinha NÃO ELEGÍVEL: {numero_carteirinha}", **auditoria)
+            return "nao_elegivel"
+
+        log_with_context(logger, "WARNING", f"Status indeterminado para carteirinha: {numero_carteirinha}", **auditoria)
+        # Em caso de indeterminado, assumir não elegível por segurança
+        return "nao_elegivel"
+
+    async def _guardar_evidencia(
+        self,
+        session: BrowserSession,
+        numero_carteirinha: str,
+        classificacao: Classification,
+        desfecho: str,
+        tracker: Optional[CheckTracker] = None
+    ) -> None:
+        """Lê a página ainda emprestada e a entrega ao arquivo de evidências (falha não afeta a consulta)"""
+        try:
+            snapshot = await evidence_archive.snapshot_page(session.page, classificacao.regiao)
+        except Exception as e:
+            log_with_context(
+                logger, "WARNING",
+                f"Falha ao capturar evidência: {str(e)}",
+                portal=self.plan.name,
+                error_type=type(e).__name__
+            )
+            return
+        finally:
+            if tracker:
+                tracker.mark("evidencia")
+        evidence_archive.submit(
+            self.plan.name, numero_carteirinha, desfecho, snapshot, classificacao.motivo, classificacao.regra
+        )
+
+    async def check_eligibility(self, numero_carteirinha: str) -> Literal["elegivel", "nao_elegivel"]:
+        """
+        Verifica elegibilidade da carteirinha usando uma sessão logada do pool
+
+        Args:
+            numero_carteirinha: Número da carteirinha a ser verificada
+
+        Returns:
+            Status da elegibilidade
+        """
+        log_with_context(
+            logger, "INFO",
+            f"Iniciando verificação de elegibilidade {self.plan.name}",
+            numero_carteirinha=numero_carteirinha
+        )
+
+        # Tempos dos passos (e trace Playwright) gravados se a consulta passar do limite
+        tracker = slow_checks.track(self.plan.name)
+        annotate_check(account=self.login)
+        try:
+            # Login só ocorre ao criar sessão nova no pool
+            async with self.pool.lease() as session:
+                tracker.mark("lease")
+                await tracker.begin_trace(session)
+                try:
+                    resultado = await self._consultar_carteirinha(session, numero_carteirinha, tracker)
+                finally:
+                    annotate_check(steps=tracker.steps)
+                    await tracker.finish()
+
+            log_with_context(
+                logger, "INFO",
+                "Verificação concluída com sucesso",
+                portal=self.plan.name,
+                numero_carteirinha=numero_carteirinha,
+                status=resultado
+            )
+            return resultado
+
+        except Exception as e:
+            log_with_context(
+                logger, "ERROR",
+                f"Erro durante verificação de elegibilidade: {str(e)}",
+                portal=self.plan.name,
+                numero_carteirinha=numero_carteirinha,
+                error_type=type(e).__name__
+            )
+            annotate_check(error_type=type(e).__name__)
+            return "nao_elegivel"
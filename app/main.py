@@ -1,19 +1,43 @@
 """
 Aplicação FastAPI principal do micro-serviço de elegibilidade
 """
+from app.utils.startup import startup_report
 from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente (antes dos módulos que leem os.getenv no import)
 load_dotenv()
+
 import os
+import time
+import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-from app.router import router
+from app.router import router, resume_job
+from app.admin import admin_router
+from app.bulk import bulk_router
+from app.streams import stream_router
+from app.analytics import analytics_router
+from app.dispatch import handler_registry
+from app.utils.browser_pool import browser_manager
+from app.utils.memory import memory_watchdog
+from app.utils.autoscaler import pool_autoscaler
+from app.utils.session_keeper import session_keeper
+from app.utils.scraper import scraper_engine
+from app.utils.http import http_client
+from app.utils.traffic import traffic
+from app.utils.loop_monitor import loop_monitor
+from app.utils.idempotency import idempotency_store
+from app.utils.bulk_import import bulk_imports
+from app.utils.refresh_ahead import refresh_ahead
+from app.utils.drain import drain_controller
+from app.utils.history import history_store
+from app.utils.evidence import evidence_archive
+from app.utils.metrics import metrics
 from app.utils.logger import logger, log_with_context
 
 
-# Carregar variáveis de ambiente
-load_dotenv()
+startup_report.mark("imports")
 
 
 @asynccontextmanager
@@ -43,22 +67,79 @@ async def lifespan(app: FastAPI):
         )
         raise Exception(f"Variáveis de ambiente faltando: {missing_vars}")
     
+    # Plano lembrado por carteirinha só é compartilhado com a mesma HISTORY_HASH_KEY em todas as réplicas
+    handler_registry.check_memory_key()
+    
+    # Watchdog de memória, autoscaler e keep-alive das sessões de browser
+    loop_monitor.start()
+    memory_watchdog.start()
+    pool_autoscaler.start()
+    session_keeper.start()
+    refresh_ahead.start()
+    history_store.start()
+    evidence_archive.start()
+    
+    # Importações em lote interrompidas por um restart continuam de onde pararam
+    await bulk_imports.start()
+    
+    # Jobs guardados pela drenagem do último desligamento
+    drain_controller.resume(resume_job)
+    
+    # Handlers são carregados em background enquanto a API já atende
+    prewarm_task = None
+    if os.getenv("HANDLER_PREWARM", "true").lower() == "true":
+        prewarm_task = asyncio.create_task(handler_registry.prewarm())
+    
+    startup_report.mark("lifespan_ready")
     log_with_context(
         logger,
         "INFO",
         "Micro-serviço iniciado com sucesso",
-        status="ready"
+        status="ready",
+        **startup_report.snapshot()
     )
     
     yield
     
     # Shutdown
+    shutdown_started = time.perf_counter()
     log_with_context(
         logger,
         "INFO",
         "Encerrando micro-serviço",
-        status="shutdown"
+        status="shutdown",
+        in_flight=drain_controller.in_flight()
     )
+    if prewarm_task and not prewarm_task.done():
+        prewarm_task.cancel()
+    # Jobs em andamento terminam no prazo; os demais têm o callback enviado ou ficam para o próximo start
+    await drain_controller.drain()
+    await bulk_imports.stop()
+    # Depois da drenagem e do lote: as últimas consultas entram no histórico
+    await history_store.stop()
+    await evidence_archive.stop()
+    await refresh_ahead.stop()
+    await session_keeper.stop()
+    await pool_autoscaler.stop()
+    await memory_watchdog.stop()
+    await loop_monitor.stop()
+    await browser_manager.shutdown()
+    await scraper_engine.close()
+    await http_client.close()
+    traffic.save()
+    idempotency_store.close()
+    history_store.close()
+    evidence_archive.close()
+    log_with_context(
+        logger,
+        "INFO",
+        "Micro-serviço encerrado",
+        status="stopped",
+        shutdown_s=round(time.perf_counter() - shutdown_started, 3),
+        drain=drain_controller.last_report
+    )
+    for handler in logger.handlers:
+        handler.flush()
 
 
 # Criar aplicação FastAPI
@@ -70,6 +151,7 @@ app = FastAPI(
     redoc_url="/redoc",
     lifespan=lifespan
 )
+startup_report.mark("app_created")
 
 # Configurar CORS
 app.add_middleware(
@@ -80,8 +162,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    """Histograma de latência por endpoint (exposto em /metrics)"""
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    path = getattr(route, "path", "nao_roteado")
+    metrics.observe(f"http_latency_ms {request.method} {path}", (time.perf_counter() - started) * 1000)
+    return response
+
 # Incluir routers
 app.include_router(router, prefix="", tags=["webhook"])
+app.include_router(admin_router, tags=["admin"])
+app.include_router(bulk_router, tags=["bulk"])
+app.include_router(stream_router, tags=["events"])
+app.include_router(analytics_router, tags=["analytics"])
 
 
 @app.get("/")
@@ -97,6 +193,8 @@ async def root():
         "endpoints": {
             "webhook": "/webhook/in",
             "health": "/health",
+            "ready": "/ready",
+            "metrics": "/metrics",
             "plans": "/plans",
             "docs": "/docs"
         }
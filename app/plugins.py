@@ -0,0 +1,156 @@
+"""
+Descoberta de handlers como plugins (entry points e diretório de manifests)
+"""
+import os
+import sys
+import json
+from pathlib import Path
+from importlib.metadata import entry_points
+from typing import Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from app.utils.logger import logger, log_with_context
+
+
+# Grupo de entry points: cada entrada aponta para um manifest (dict ou HandlerManifest)
+ENTRY_POINT_GROUP = "robo_veia.handlers"
+
+# Manifests dos handlers embutidos
+BUILTIN_MANIFEST_DIR = Path(__file__).parent / "handlers" / "manifests"
+
+
+class CardFormat(BaseModel):
+    """Formato esperado do número da carteirinha de um plano"""
+    min_length: int = Field(default=1, ge=1, description="Tamanho mínimo após normalização")
+    max_length: Optional[int] = Field(default=None, ge=1, description="Tamanho máximo após normalização")
+    charset: Literal["digits", "alphanumeric"] = Field(default="digits", description="Caracteres permitidos")
+    check_digit: Literal["none", "luhn", "mod11"] = Field(default="none", description="Regra de dígito verificador")
+    separators: str = Field(default=" .-/", description="Separadores removidos antes da validação")
+    on_invalid: Literal["reject", "nao_elegivel"] = Field(
+        default="reject",
+        description="reject = 422 no webhook; nao_elegivel = resultado imediato sem consultar o portal"
+    )
+
+
+class HandlerManifest(BaseModel):
+    """Manifest de um handler de plano, lido sem importar o handler"""
+    name: str = Field(..., description="Nome do plano (ex: amil)")
+    target: Optional[str] = Field(default=None, description="Caminho de import 'modulo:atributo' do handler")
+    recipe: Optional[str] = Field(default=None, description="Arquivo de receita do portal (alternativa ao target)")
+    aliases: List[str] = Field(default_factory=list, description="Outros nomes que resolvem para este plano")
+    max_concurrency: Optional[int] = Field(default=None, ge=1, description="Consultas simultâneas (None = ilimitado)")
+    requires_session: bool = Field(default=False, description="Precisa de sessão logada aquecida antes de atender")
+    cacheable: bool = Field(default=False, description="Resultados podem ser reaproveitados do cache")
+    cache_ttl: int = Field(default=0, ge=0, description="TTL (s) de resultados elegíveis em cache")
+    negative_cache_ttl: int = Field(default=0, ge=0, description="TTL (s) de resultados não elegíveis em cache")
+    card_format: Optional[CardFormat] = Field(default=None, description="Validação do número da carteirinha")
+    auto_detect: bool = Field(default=True, description="Consultado na detecção automática do plano (plan_name \"auto\")")
+    source: str = Field(default="builtin", description="Origem do manifest")
+
+    @model_validator(mode="after")
+    def check_target_or_recipe(self) -> "HandlerManifest":
+        if not self.target and not self.recipe:
+            raise ValueError("Manifest precisa de target ou recipe")
+        return self
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "name": "amil",
+                "target": "app.handlers.amil:amil_handler",
+                "aliases": ["amil saude"],
+                "max_concurrency": 3,
+                "requires_session": True,
+                "cacheable": True,
+                "cache_ttl": 1800,
+                "negative_cache_ttl": 0,
+                "card_format": {"min_length": 8, "max_length": 12, "charset": "digits"}
+            }
+        }
+
+
+def load_directory_manifests(directory: Path, source: str) -> List[HandlerManifest]:
+    """
+    Lê manifests JSON de um diretório de handlers
+
+    O diretório é adicionado ao sys.path para que módulos de handler colocados ao lado
+    dos manifests possam ser importados (apenas no primeiro uso).
+
+    Args:
+        directory: Diretório com arquivos *.json
+        source: Origem registrada no manifest
+
+    Returns:
+        Manifests válidos encontrados
+    """
+    manifests: List[HandlerManifest] = []
+    if not directory.is_dir():
+        return manifests
+
+    if source != "builtin" and str(directory) not in sys.path:
+        sys.path.append(str(directory))
+
+    for path in sorted(directory.glob("*.json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            if data.get("recipe"):
+                # Receitas são relativas ao diretório do manifest
+                data["recipe"] = str(directory / data["recipe"])
+            manifests.append(HandlerManifest(**{**data, "source": source}))
+        except (OSError, ValueError, ValidationError) as e:
+            log_with_context(
+                logger,
+                "ERROR",
+                f"Manifest de handler inválido: {path.name}",
+                path=str(path),
+                error_type=type(e).__name__,
+                error_message=str(e)
+            )
+    return manifests
+
+
+def load_entry_point_manifests() -> List[HandlerManifest]:
+    """
+    Lê manifests publicados por pacotes instalados no grupo robo_veia.handlers
+
+    Returns:
+        Manifests válidos encontrados
+    """
+    manifests: List[HandlerManifest] = []
+    for ep in entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            obj = ep.load()
+            if isinstance(obj, HandlerManifest):
+                manifest = obj.model_copy(update={"source": f"entry_point:{ep.name}"})
+            else:
+                manifest = HandlerManifest(**{"name": ep.name, **dict(obj), "source": f"entry_point:{ep.name}"})
+            manifests.append(manifest)
+        except Exception as e:
+            log_with_context(
+                logger,
+                "ERROR",
+                f"Falha ao carregar manifest do entry point {ep.name}",
+                entry_point=ep.value,
+                error_type=type(e).__name__,
+                error_message=str(e)
+            )
+    return manifests
+
+
+def discover_manifests() -> Dict[str, HandlerManifest]:
+    """
+    Descobre todos os manifests: embutidos, diretório de plugins e entry points
+
+    Em caso de nomes repetidos vale a ordem: embutido < diretório < entry point.
+
+    Returns:
+        Manifests indexados pelo nome do plano (minúsculo)
+    """
+    manifests = load_directory_manifests(BUILTIN_MANIFEST_DIR, "builtin")
+
+    plugin_dir = os.getenv("HANDLERS_PLUGIN_DIR")
+    if plugin_dir:
+        manifests += load_directory_manifests(Path(plugin_dir), "directory")
+
+    manifests += load_entry_point_manifests()
+
+    return {manifest.name.lower(): manifest for manifest in manifests}
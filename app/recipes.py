@@ -0,0 +1,345 @@
+"""
+Receitas declarativas de portais: passos de login, consulta e indicadores de elegibilidade
+
+Uma receita (JSON) é validada e compilada uma vez no carregamento em um RecipePlan, que
+executa os passos em páginas do pool de sessões com as mesmas esperas e timeouts para
+todos os portais.
+"""
+import json
+import string
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Literal, NamedTuple, Optional, Tuple
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from app.utils.matcher import AhoCorasick
+from app.utils.logger import logger, log_with_context
+
+
+class RecipeError(Exception):
+    """Receita inválida (formato ou placeholders)"""
+
+
+class RecipeStep(BaseModel):
+    """Um passo executado na página"""
+    action: Literal["goto", "click", "fill", "press", "wait_for_selector", "wait_for_load", "sleep"]
+    selector: Optional[str] = Field(default=None, description="Seletor do elemento")
+    value: Optional[str] = Field(default=None, description="Valor (aceita {login} e {password})")
+    url: Optional[str] = Field(default=None, description="URL absoluta ou relativa ao base_url")
+    state: Optional[str] = Field(default=None, description="Estado de carregamento (load, domcontentloaded, networkidle)")
+    timeout_ms: Optional[int] = Field(default=None, ge=0, description="Timeout do passo")
+    optional: bool = Field(default=False, description="Falha do passo é ignorada (ex: banner de cookies)")
+
+    @model_validator(mode="after")
+    def check_required_fields(self) -> "RecipeStep":
+        required = {
+            "goto": ["url"],
+            "click": ["selector"],
+            "fill": ["selector", "value"],
+            "press": ["selector", "value"],
+            "wait_for_selector": ["selector"],
+            "wait_for_load": [],
+            "sleep": ["timeout_ms"],
+        }[self.action]
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"Passo {self.action} sem {', '.join(missing)}")
+        return self
+
+
+class LoginRecipe(BaseModel):
+    """Fluxo de login"""
+    url: str = Field(default="/", description="Página de login")
+    wait_until: str = Field(default="networkidle", description="Estado de carregamento da página de login")
+    steps: List[RecipeStep] = Field(..., min_length=1)
+    success_url_contains: List[str] = Field(default_factory=list, description="Trechos de URL após login bem-sucedido")
+    failure_url_contains: List[str] = Field(default_factory=lambda: ["/login"], description="Trechos de URL de login falho")
+
+
+class SessionCheckRecipe(BaseModel):
+    """Ping barato para saber se a sessão continua logada"""
+    url: str
+    wait_until: str = "domcontentloaded"
+    expired_url_contains: List[str] = Field(default_factory=lambda: ["/login"])
+
+
+class ConsultaRecipe(BaseModel):
+    """Consulta de uma carteirinha"""
+    url_template: str = Field(..., description="URL com o placeholder {card}")
+    wait_until: str = "networkidle"
+    settle_ms: int = Field(default=0, ge=0, description="Espera extra após o carregamento")
+    result_selectors: List[str] = Field(
+        default_factory=list,
+        description="Regiões do resultado, em ordem de preferência; só o texto da primeira encontrada é lido"
+    )
+    fallback_to_body: bool = Field(
+        default=True,
+        description="Lê o body inteiro se a região não permitir classificar"
+    )
+
+
+class IndicatorsRecipe(BaseModel):
+    """Indicadores de elegibilidade (texto em minúsculas e seletores visuais)"""
+    eligible: List[str] = Field(default_factory=list)
+    not_eligible: List[str] = Field(default_factory=list)
+    eligible_selectors: List[str] = Field(default_factory=list)
+    not_eligible_selectors: List[str] = Field(default_factory=list)
+
+
+class PortalRecipe(BaseModel):
+    """Receita completa de um portal"""
+    name: str
+    base_url: str
+    timeout_ms: int = Field(default=30000, ge=1)
+    login: LoginRecipe
+    session_check: Optional[SessionCheckRecipe] = None
+    consulta: ConsultaRecipe
+    indicators: IndicatorsRecipe
+
+
+class Classification(NamedTuple):
+    """Resultado da classificação com a regra que decidiu, para auditoria"""
+    elegivel: Optional[bool]
+    motivo: str
+    regra: str = ""
+    regiao: str = ""
+
+
+def _placeholders(template: str) -> List[str]:
+    return [field for _, field, _, _ in string.Formatter().parse(template) if field is not None]
+
+
+StepFunc = Callable[[Any, Dict[str, str]], Awaitable[None]]
+
+
+def _compile_step(step: RecipeStep, base_url: str) -> StepFunc:
+    """Transforma um passo declarativo em uma corrotina page -> None"""
+    # Sem timeout no passo vale o timeout padrão da página (timeout_ms da receita)
+    timeout = step.timeout_ms
+    url = step.url if step.url is None or "://" in step.url else base_url + step.url
+
+    async def run(page: Any, values: Dict[str, str]) -> None:
+        if step.action == "goto":
+            await page.goto(url, wait_until=step.state or "domcontentloaded", timeout=timeout)
+        elif step.action == "click":
+            await page.click(step.selector, timeout=timeout)
+        elif step.action == "fill":
+            await page.fill(step.selector, step.value.format(**values), timeout=timeout)
+        elif step.action == "press":
+            await page.press(step.selector, step.value, timeout=timeout)
+        elif step.action == "wait_for_selector":
+            await page.wait_for_selector(step.selector, timeout=timeout)
+        elif step.action == "wait_for_load":
+            await page.wait_for_load_state(step.state or "networkidle", timeout=timeout)
+        else:
+            await page.wait_for_timeout(timeout)
+
+    async def run_step(page: Any, values: Dict[str, str]) -> None:
+        try:
+            await run(page, values)
+        except Exception as e:
+            if not step.optional:
+                raise
+            log_with_context(
+                logger,
+                "DEBUG",
+                f"Passo opcional ignorado: {step.action}",
+                selector=step.selector,
+                error_type=type(e).__name__
+            )
+
+    return run_step
+
+
+class RecipePlan:
+    """Receita compilada: passos prontos para executar e indicadores pré-processados"""
+
+    def __init__(self, recipe: PortalRecipe):
+        self.recipe = recipe
+        self.name = recipe.name
+        self.base_url = recipe.base_url.rstrip("/")
+        self.timeout_ms = recipe.timeout_ms
+
+        for step in recipe.login.steps:
+            if step.value is not None and not set(_placeholders(step.value)) <= {"login", "password"}:
+                raise RecipeError(f"Placeholder inválido no passo {step.action}: {step.value}")
+        if _placeholders(recipe.consulta.url_template) != ["card"]:
+            raise RecipeError("consulta.url_template deve conter exatamente um {card}")
+
+        self.login_url = self._absolute(recipe.login.url)
+        self.login_steps = [_compile_step(step, self.base_url) for step in recipe.login.steps]
+        self.consulta_template = self._absolute(recipe.consulta.url_template)
+        self.session_check_url = self._absolute(recipe.session_check.url) if recipe.session_check else None
+
+        indicators = recipe.indicators
+        # Indicadores compilados uma vez; rótulo (grupo, ordem) preserva a prioridade:
+        # elegível antes de não elegível e, dentro do grupo, a ordem da receita
+        self.matcher = AhoCorasick(
+            [(text.lower(), (0, index)) for index, text in enumerate(indicators.eligible)]
+            + [(text.lower(), (1, index)) for index, text in enumerate(indicators.not_eligible)]
+        )
+        # Uma chamada ao browser por página: texto só da região do resultado + seletores visuais
+        self.probe_script = (
+            "(args) => {"
+            "let region = null, selector = 'body';"
+            "for (const s of args.regions) {"
+            "const el = document.querySelector(s);"
+            "if (el) { region = el; selector = s; break; }"
+            "}"
+            "const root = region || document.body;"
+            "return {"
+            "text: root ? root.innerText : '',"
+            "region: selector,"
+            "found: args.selectors.filter(s => document.querySelector(s) !== null)"
+            "};"
+            "}"
+        )
+        self.body_script = "() => document.body ? document.body.innerText : ''"
+        self.probe_args = {
+            "regions": list(recipe.consulta.result_selectors),
+            "selectors": [*indicators.eligible_selectors, *indicators.not_eligible_selectors],
+        }
+        self.eligible_selectors = tuple(indicators.eligible_selectors)
+        self.not_eligible_selectors = tuple(indicators.not_eligible_selectors)
+
+    def _absolute(self, url: str) -> str:
+        return url if "://" in url else self.base_url + url
+
+    def consulta_url(self, numero_carteirinha: str) -> str:
+        return self.consulta_template.replace("{card}", numero_carteirinha)
+
+    async def login(self, page: Any, login: str, password: str) -> bool:
+        """
+        Executa o login da receita
+
+        Args:
+            page: Página do Playwright (timeout padrão já configurado)
+            login: Usuário
+            password: Senha
+
+        Returns:
+            True se a URL final indica sucesso
+        """
+        await page.goto(self.login_url, wait_until=self.recipe.login.wait_until)
+        values = {"login": login, "password": password}
+        for run_step in self.login_steps:
+            await run_step(page, values)
+
+        current_url = page.url
+        if any(part in current_url for part in self.recipe.login.failure_url_contains):
+            return False
+        success = self.recipe.login.success_url_contains
+        return not success or any(part in current_url for part in success)
+
+    async def session_valid(self, page: Any) -> bool:
+        """
+        Ping da sessão: abre a área logada e verifica redirecionamento para login
+
+        Args:
+            page: Página do Playwright
+
+        Returns:
+            True se a sessão continua logada (ou se a receita não define ping)
+        """
+        if self.session_check_url is None:
+            return True
+        await page.goto(self.session_check_url, wait_until=self.recipe.session_check.wait_until)
+        return not any(part in page.url for part in self.recipe.session_check.expired_url_contains)
+
+    async def consultar(
+        self,
+        page: Any,
+        numero_carteirinha: str,
+        on_step: Optional[Callable[[str], None]] = None
+    ) -> Classification:
+        """
+        Abre a consulta da carteirinha e classifica a região do resultado
+
+        Args:
+            page: Página do Playwright (sessão logada)
+            numero_carteirinha: Número da carteirinha
+            on_step: Chamado ao fim de cada passo com o nome do passo (medição de tempos)
+
+        Returns:
+            Classificação (elegível True/False/None se indeterminado, motivo, regra e região)
+        """
+        mark = on_step or (lambda step: None)
+        consulta = self.recipe.consulta
+        await page.goto(self.consulta_url(numero_carteirinha), wait_until=consulta.wait_until)
+        mark("navegacao")
+        if consulta.settle_ms:
+            await page.wait_for_timeout(consulta.settle_ms)
+            mark("espera")
+
+        probe = await page.evaluate(self.probe_script, self.probe_args)
+        mark("extracao")
+        result = self.classify(probe["text"], probe["found"], probe["region"])
+        if result.elegivel is None and probe["region"] != "body" and consulta.fallback_to_body:
+            result = self.classify(await page.evaluate(self.body_script), probe["found"], "body")
+            mark("extracao_body")
+        mark("classificacao")
+        return result
+
+    def classify(self, text: str, found_selectors: List[str], region: str = "body") -> Classification:
+        """
+        Classifica o texto em uma passada pelo autômato (texto tem prioridade sobre seletores)
+
+        Args:
+            text: Texto visível da região
+            found_selectors: Seletores visuais presentes na página
+            region: Região de onde o texto foi lido
+
+        Returns:
+            Classificação com a regra que decidiu
+        """
+        labels = self.matcher.labels(text.lower())
+        if labels:
+            group, index = min(labels)
+            indicator = labels[(group, index)]
+            kind = "elegivel" if group == 0 else "nao_elegivel"
+            return Classification(group == 0, f'Encontrado indicador: "{indicator}"', f"{kind}:texto:{indicator}", region)
+
+        found = set(found_selectors)
+        for selector in self.eligible_selectors:
+            if selector in found:
+                return Classification(True, f"Elemento visual de elegível detectado: {selector}", f"elegivel:seletor:{selector}", region)
+        for selector in self.not_eligible_selectors:
+            if selector in found:
+                return Classification(False, f"Elemento visual de não elegível detectado: {selector}", f"nao_elegivel:seletor:{selector}", region)
+        return Classification(None, "Nenhum indicador encontrado", "", region)
+
+
+_compiled: Dict[Tuple[str, float], RecipePlan] = {}
+
+
+def load_recipe(path: Path) -> RecipePlan:
+    """
+    Lê, valida e compila uma receita JSON (compilada uma vez por versão do arquivo)
+
+    Args:
+        path: Caminho do arquivo
+
+    Returns:
+        Receita compilada
+
+    Raises:
+        RecipeError: Se a receita for inválida
+    """
+    key = (str(path), path.stat().st_mtime)
+    if key in _compiled:
+        return _compiled[key]
+
+    try:
+        recipe = PortalRecipe(**json.loads(path.read_text(encoding="utf-8")))
+    except (ValueError, ValidationError) as e:
+        raise RecipeError(f"Receita inválida {path.name}: {e}") from e
+
+    plan = RecipePlan(recipe)
+    _compiled[key] = plan
+    log_with_context(
+        logger,
+        "INFO",
+        f"Receita compilada: {recipe.name}",
+        path=str(path),
+        login_steps=len(plan.login_steps),
+        indicators=plan.matcher.size
+    )
+    return plan
@@ -1,11 +1,24 @@
 """
 Router principal para endpoints do micro-serviço
 """
+import time
+import uuid
 import asyncio
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+from typing import Optional
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header
+from fastapi.responses import JSONResponse
 from app.schemas import WebhookInRequest, WebhookResponse
 from app.dispatch import handler_registry
-from app.utils.http import send_callback
+from app.utils.card_validators import CardValidationError
+from app.utils.http import CallbackDestinationError, http_client, send_callback
+from app.utils.events import event_hub, job_context
+from app.utils.drain import PendingJob, drain_controller
+from app.utils.history import check_context, history_store
+from app.utils.idempotency import IdempotencyConflict, IdempotencyRecord, idempotency_store, request_fingerprint
+from app.utils.browser_pool import browser_manager
+from app.utils.memory import memory_watchdog
+from app.utils.metrics import metrics
+from app.utils.session_keeper import session_keeper
 from app.utils.logger import logger, log_with_context
 
 
@@ -15,7 +28,8 @@ router = APIRouter()
 @router.post("/webhook/in", response_model=WebhookResponse)
 async def webhook_in(
     request: WebhookInRequest,
-    background_tasks: BackgroundTasks
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(default=None, max_length=255)
 ) -> WebhookResponse:
     """
     Endpoint principal para recebimento de webhooks de verificação de elegibilidade
@@ -23,10 +37,19 @@ async def webhook_in(
     Args:
         request: Dados da requisição
         background_tasks: Tarefas em background do FastAPI
+        idempotency_key: Header Idempotency-Key (sem ele, a chave deriva do payload e da janela de tempo)
         
     Returns:
-        Resposta imediata confirmando recebimento
+        Resposta imediata confirmando recebimento (ou o job original, se for repetição)
     """
+    # Em drenagem (deploy): o cliente repete o pedido e outra réplica atende
+    if not drain_controller.admitting:
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "Serviço em desligamento, tente novamente"},
+            headers={"Retry-After": str(drain_controller.retry_after)}
+        )
+    
     log_with_context(
         logger,
         "INFO",
@@ -36,6 +59,66 @@ async def webhook_in(
         numero=request.numero
     )
     
+    # Destino do callback da requisição (allowlist) antes de qualquer trabalho
+    try:
+        callback_url = http_client.resolve_destination(request.callback_url)
+    except CallbackDestinationError as e:
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "error": "URL de callback não permitida",
+                "reason": str(e)
+            }
+        )
+    
+    # Formato da carteirinha validado antes de qualquer trabalho no portal
+    invalid_reason = None
+    try:
+        numero_carteirinha = handler_registry.validate_card(request.plan_name, request.numero_carterinha)
+    except CardValidationError as e:
+        if e.on_invalid == "reject":
+            raise HTTPException(
+                status_code=422,
+                detail={
+                    "error": "Número de carteirinha inválido",
+                    "reason": e.reason,
+                    "plan_name": request.plan_name
+                }
+            )
+        numero_carteirinha = request.numero_carterinha
+        invalid_reason = e.reason
+    
+    # Repetições do mesmo pedido devolvem o job original
+    key = None
+    if idempotency_store.enabled:
+        fingerprint = request_fingerprint(request.plan_name, numero_carteirinha, request.numero, callback_url)
+        try:
+            record, created = await idempotency_store.claim(
+                idempotency_store.keys_for(idempotency_key, fingerprint),
+                fingerprint
+            )
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=409, detail={"error": str(e)})
+        if not created:
+            return duplicate_response(record, request.numero, background_tasks, callback_url)
+        key = record.key
+        job_id = record.job_id
+    else:
+        job_id = uuid.uuid4().hex[:16]
+    event_hub.publish(job_id, request.numero, "queued", plan_name=request.plan_name)
+    
+    if invalid_reason is not None:
+        # Resultado imediato: não elegível, sem abrir sessão no portal
+        background_tasks.add_task(
+            deliver_result, request.numero, "nao_elegivel", key, job_id, callback_url,
+            {"plan_name": request.plan_name, "numero_carteirinha": numero_carteirinha, "reason": invalid_reason}
+        )
+        return WebhookResponse(
+            success=True,
+            message=f"Carteirinha inválida ({invalid_reason}): resultado enviado",
+            job_id=job_id
+        )
+    
     # Não há mais validação de planos - aceita qualquer plano via handler genérico
     log_with_context(
         logger,
@@ -48,9 +131,12 @@ async def webhook_in(
     # Adicionar processamento às tarefas em background
     background_tasks.add_task(
         process_eligibility_background,
-        request.numero_carterinha,
+        numero_carteirinha,
         request.plan_name,
-        request.numero
+        request.numero,
+        key,
+        job_id,
+        callback_url
     )
     
     log_with_context(
@@ -58,19 +144,160 @@ async def webhook_in(
         "INFO",
         "Processamento iniciado em background",
         numero_carteirinha=request.numero_carterinha,
-        plan_name=request.plan_name
+        plan_name=request.plan_name,
+        job_id=job_id
+    )
+    
+    return WebhookResponse(
+        success=True,
+        message="Processamento iniciado",
+        job_id=job_id
     )
+
+
+def duplicate_response(
+    record: IdempotencyRecord,
+    numero: str,
+    background_tasks: BackgroundTasks,
+    callback_url: Optional[str] = None
+) -> WebhookResponse:
+    """
+    Resposta para uma repetição: job original e, se já concluído, o resultado
+    
+    Se o resultado existe mas o callback não foi entregue, só o callback é reenviado (por
+    uma repetição só, ver resend_result).
     
+    Args:
+        record: Job original
+        numero: Número para callback
+        background_tasks: Tarefas em background do FastAPI
+        callback_url: Destino do callback (None = padrão)
+        
+    Returns:
+        Resposta com o job original
+    """
+    log_with_context(
+        logger,
+        "INFO",
+        "Webhook repetido: job original reaproveitado",
+        job_id=record.job_id,
+        status=record.status,
+        callback_sent=record.callback_sent
+    )
+    if record.status is not None and not record.callback_sent:
+        background_tasks.add_task(resend_result, numero, record.status, record.key, callback_url)
     return WebhookResponse(
         success=True,
-        message="Processamento iniciado"
+        message="Processamento iniciado (requisição repetida)",
+        job_id=record.job_id,
+        status=record.status,
+        duplicate=True
+    )
+
+
+async def resend_result(numero: str, status: str, idempotency_key: str, callback_url: Optional[str] = None) -> None:
+    """
+    Reenvia o callback de um job concluído se esta repetição reservar o reenvio
+    
+    Args:
+        numero: Número para callback
+        status: Status da elegibilidade
+        idempotency_key: Chave do job
+        callback_url: Destino do callback (None = padrão)
+    """
+    if not await idempotency_store.claim_resend(idempotency_key):
+        log_with_context(logger, "INFO", "Reenvio do callback já feito por outra repetição", numero=numero)
+        return
+    await deliver_result(numero, status, idempotency_key, None, callback_url)
+
+
+async def deliver_result(
+    numero: str,
+    status: str,
+    idempotency_key: Optional[str] = None,
+    job_id: Optional[str] = None,
+    callback_url: Optional[str] = None,
+    invalid_card: Optional[dict] = None
+) -> bool:
+    """
+    Envia o callback de um resultado já conhecido e o registra no job
+    
+    Args:
+        numero: Número para callback
+        status: Status da elegibilidade
+        idempotency_key: Chave do job (opcional)
+        job_id: Job que recebe o evento "done" (opcional)
+        callback_url: Destino do callback (None = padrão)
+        invalid_card: plan_name, numero_carteirinha e reason de uma carteirinha recusada
+            pelo formato (a consulta entra no histórico); None para reenvios
+        
+    Returns:
+        True se o callback foi entregue
+    """
+    if job_id is not None:
+        event_hub.publish(job_id, numero, "done", status=status)
+    started = time.perf_counter()
+    with drain_controller.track(PendingJob(job_id, "", None, numero, idempotency_key, callback_url, status)):
+        callback_success = await send_callback(numero, status, callback_url=callback_url)
+    if invalid_card is not None:
+        history_store.record(
+            invalid_card["plan_name"],
+            invalid_card["numero_carteirinha"],
+            status,
+            0.0,
+            {"source": "invalid_card", "reason": invalid_card["reason"]},
+            (time.perf_counter() - started) * 1000,
+            callback_success
+        )
+    if idempotency_key is not None:
+        await idempotency_store.complete(idempotency_key, status, callback_success)
+    return callback_success
+
+
+async def resume_job(job: PendingJob) -> None:
+    """
+    Retoma um job guardado pela drenagem do último desligamento
+    
+    Se uma repetição do webhook já foi atendida (aqui ou em outra réplica), o job é descartado.
+    
+    Args:
+        job: Job interrompido
+    """
+    key = job.idempotency_key
+    if job.status is not None:
+        record = await idempotency_store.get(key) if key is not None else None
+        if record is not None and record.callback_sent:
+            return
+        await deliver_result(job.numero, job.status, key, job.job_id, job.callback_url)
+        return
+    
+    if key is not None and idempotency_store.enabled:
+        fingerprint = request_fingerprint(job.plan_name, job.numero_carteirinha, job.numero, job.callback_url)
+        try:
+            record, created = await idempotency_store.claim((key,), fingerprint)
+        except IdempotencyConflict:
+            created = False
+        if not created:
+            log_with_context(logger, "INFO", "Job retomado já atendido por uma repetição", job_id=job.job_id)
+            return
+        key = record.key
+    await process_eligibility_background(
+        job.numero_carteirinha,
+        job.plan_name,
+        job.numero,
+        key,
+        job.job_id,
+        job.callback_url
     )
 
 
 async def process_eligibility_background(
     numero_carteirinha: str,
     plan_name: str,
-    numero: str
+    numero: str,
+    idempotency_key: Optional[str] = None,
+    job_id: Optional[str] = None,
+    callback_url: Optional[str] = None
 ) -> None:
     """
     Processa verificação de elegibilidade em background
@@ -79,67 +306,104 @@ async def process_eligibility_background(
         numero_carteirinha: Número da carteirinha
         plan_name: Nome do plano
         numero: Número para callback
+        idempotency_key: Chave do job, que recebe o resultado (opcional)
+        job_id: Job dos eventos de progresso (opcional)
+        callback_url: Destino do callback (None = padrão)
     """
-    try:
-        log_with_context(
-            logger,
-            "INFO",
-            "Iniciando processamento em background",
-            numero_carteirinha=numero_carteirinha,
-            plan_name=plan_name,
-            numero=numero
-        )
-        
-        # Verificar elegibilidade
-        status = await handler_registry.process_eligibility(plan_name, numero_carteirinha)
-        
-        # Enviar callback
-        callback_success = await send_callback(numero, status)
-        
-        if callback_success:
+    job = PendingJob(job_id, numero_carteirinha, plan_name, numero, idempotency_key, callback_url)
+    with drain_controller.track(job):
+        started = time.perf_counter()
+        check: dict = {}
+        try:
             log_with_context(
                 logger,
                 "INFO",
-                "Processamento completo com sucesso",
+                "Iniciando processamento em background",
                 numero_carteirinha=numero_carteirinha,
                 plan_name=plan_name,
-                numero=numero,
-                status=status
+                numero=numero
             )
-        else:
-            log_with_context(
-                logger,
-                "WARNING",
-                "Processamento concluído mas callback falhou",
-                numero_carteirinha=numero_carteirinha,
-                plan_name=plan_name,
-                numero=numero,
-                status=status
+        
+            # Verificar elegibilidade
+            with job_context(job_id, numero), check_context() as check:
+                status = await handler_registry.process_eligibility(plan_name, numero_carteirinha)
+            job.status = status
+            checked = time.perf_counter()
+            metrics.observe("eligibility_latency_ms", (checked - started) * 1000)
+        
+            # Assinantes (SSE/WebSocket) recebem o resultado antes do callback HTTP
+            if job_id is not None:
+                event_hub.publish(job_id, numero, "done", status=status)
+        
+            # Enviar callback
+            callback_success = await send_callback(numero, status, callback_url=callback_url)
+            callback_ms = (time.perf_counter() - checked) * 1000
+            metrics.observe("callback_latency_ms", callback_ms)
+            history_store.record(
+                plan_name, numero_carteirinha, status, (checked - started) * 1000, check, callback_ms, callback_success
             )
-            
-    except Exception as e:
-        log_with_context(
-            logger,
-            "ERROR",
-            f"Erro no processamento em background: {str(e)}",
-            numero_carteirinha=numero_carteirinha,
-            plan_name=plan_name,
-            numero=numero,
-            error_type=type(e).__name__,
-            error_message=str(e)
-        )
+            if idempotency_key is not None:
+                await idempotency_store.complete(idempotency_key, status, callback_success)
         
-        # Tentar enviar callback com status de erro
-        try:
-            await send_callback(numero, "nao_elegivel")
-        except Exception as callback_error:
+            if callback_success:
+                log_with_context(
+                    logger,
+                    "INFO",
+                    "Processamento completo com sucesso",
+                    numero_carteirinha=numero_carteirinha,
+                    plan_name=plan_name,
+                    numero=numero,
+                    status=status
+                )
+            else:
+                log_with_context(
+                    logger,
+                    "WARNING",
+                    "Processamento concluído mas callback falhou",
+                    numero_carteirinha=numero_carteirinha,
+                    plan_name=plan_name,
+                    numero=numero,
+                    status=status
+                )
+            
+        except Exception as e:
             log_with_context(
                 logger,
                 "ERROR",
-                f"Falha também no envio do callback de erro: {str(callback_error)}",
+                f"Erro no processamento em background: {str(e)}",
                 numero_carteirinha=numero_carteirinha,
+                plan_name=plan_name,
                 numero=numero,
-                callback_error=str(callback_error)
+                error_type=type(e).__name__,
+                error_message=str(e)
+            )
+        
+            # Sem resultado: a próxima repetição do pedido processa de novo
+            if idempotency_key is not None:
+                await idempotency_store.release(idempotency_key)
+            if job_id is not None:
+                event_hub.publish(job_id, numero, "done", status="nao_elegivel", error=type(e).__name__)
+        
+            # Tentar enviar callback com status de erro
+            callback_success = None
+            try:
+                callback_success = await send_callback(numero, "nao_elegivel", callback_url=callback_url)
+            except Exception as callback_error:
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Falha também no envio do callback de erro: {str(callback_error)}",
+                    numero_carteirinha=numero_carteirinha,
+                    numero=numero,
+                    callback_error=str(callback_error)
+                )
+            history_store.record(
+                plan_name,
+                numero_carteirinha,
+                "nao_elegivel",
+                (time.perf_counter() - started) * 1000,
+                {**check, "source": "error", "error_type": type(e).__name__},
+                callback_sent=callback_success
             )
 
 
@@ -156,10 +420,50 @@ async def health_check() -> dict:
     return {
         "status": "healthy",
         "service": "robo_veia",
-        "supported_plans": supported_plans
+        "supported_plans": supported_plans,
+        "memory": memory_watchdog.snapshot(),
+        "browser": browser_manager.stats()
     }
 
 
+@router.get("/ready")
+async def readiness_check() -> JSONResponse:
+    """
+    Endpoint de readiness: pronto somente com handlers carregados e sessão aquecida em cada plano
+    
+    Returns:
+        200 quando pronto, 503 caso contrário
+    """
+    readiness = session_keeper.readiness()
+    pending_handlers = handler_registry.pending_handlers(session_only=True)
+    ready = readiness["ready"] and not pending_handlers and drain_controller.admitting
+    if not drain_controller.admitting:
+        status = "draining"
+    else:
+        status = "ready" if ready else "warming_up"
+    
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": status,
+            "service": "robo_veia",
+            "warm_sessions": readiness["warm_sessions"],
+            "pending_handlers": pending_handlers
+        }
+    )
+
+
+@router.get("/metrics")
+async def get_metrics() -> dict:
+    """
+    Endpoint de métricas internas (memória, sessões de browser, contadores)
+    
+    Returns:
+        Snapshot das métricas
+    """
+    return metrics.snapshot()
+
+
 @router.get("/plans")
 async def list_supported_plans() -> dict:
     """
@@ -179,5 +483,7 @@ async def list_supported_plans() -> dict:
     
     return {
         "supported_plans": supported_plans,
-        "total": len(supported_plans)
+        "total": len(supported_plans),
+        "manifests": handler_registry.describe_plans(),
+        "unmatched_plan_names": handler_registry.unmatched_plans()
     } 
\ No newline at end of file
@@ -1,8 +1,8 @@
 """
 Schemas Pydantic para validação de dados de entrada e saída
 """
-from pydantic import BaseModel, Field
-from typing import Literal
+from pydantic import BaseModel, Field, field_validator
+from typing import Literal, Optional
 
 
 class WebhookInRequest(BaseModel):
@@ -10,6 +10,20 @@ class WebhookInRequest(BaseModel):
     numero_carterinha: str = Field(..., description="Número da carteirinha do plano de saúde")
     plan_name: str = Field(..., description="Nome do plano de saúde")
     numero: str = Field(..., description="Número para callback (formato WhatsApp)")
+    callback_url: Optional[str] = Field(
+        default=None,
+        max_length=2048,
+        description="Destino do callback (host na allowlist); sem ele, WEBHOOK_CALLBACK_URL"
+    )
+
+    @field_validator("numero_carterinha")
+    @classmethod
+    def strip_numero_carterinha(cls, value: str) -> str:
+        """Remove espaços nas pontas; o formato específico de cada plano é validado no dispatch"""
+        value = value.strip()
+        if not value:
+            raise ValueError("Número da carteirinha vazio")
+        return value
 
     class Config:
         json_schema_extra = {
@@ -39,11 +53,20 @@ class WebhookResponse(BaseModel):
     """Schema para resposta do webhook"""
     success: bool = Field(default=True, description="Indica se a requisição foi processada com sucesso")
     message: str = Field(default="Processamento iniciado", description="Mensagem de status")
+    job_id: Optional[str] = Field(default=None, description="Identificador do job (o mesmo nas repetições)")
+    status: Optional[Literal["elegivel", "nao_elegivel"]] = Field(
+        default=None,
+        description="Resultado, quando a requisição repete um job já concluído"
+    )
+    duplicate: bool = Field(default=False, description="Requisição repetida (nenhum novo processamento)")
 
     class Config:
         json_schema_extra = {
             "example": {
                 "success": True,
-                "message": "Processamento iniciado"
+                "message": "Processamento iniciado",
+                "job_id": "3f2b9c1d7e6a4b05",
+                "status": None,
+                "duplicate": False
             }
         } 
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Assinatura de eventos de jobs por SSE e WebSocket (alternativa ao callback HTTP)
+
+O job_id é aleatório e funciona como credencial do próprio job. O número de callback não
+é segredo (telefone do paciente), então assinar por número exige EVENTS_TOKEN.
+"""
+import os
+import json
+import secrets
+from typing import Any, AsyncIterator, Dict, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from app.utils.events import TERMINAL_EVENTS, Subscription, event_hub
+
+
+stream_router = APIRouter()
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Proxies (nginx) não devem segurar os eventos em buffer
+    "X-Accel-Buffering": "no",
+}
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def numero_token_valid(token: Optional[str]) -> bool:
+    """
+    Confere o token das assinaturas por número (EVENTS_TOKEN ou ADMIN_TOKEN)
+
+    Args:
+        token: Token recebido (header X-Events-Token ou parâmetro token)
+
+    Returns:
+        True se confere; sem token configurado, as assinaturas por número ficam desabilitadas
+    """
+    if not token:
+        return False
+    expected = [value for value in (os.getenv("EVENTS_TOKEN"), os.getenv("ADMIN_TOKEN")) if value]
+    return any(secrets.compare_digest(token, value) for value in expected)
+
+
+async def _event_stream(subscription: Subscription, until_done: bool) -> AsyncIterator[str]:
+    """Eventos no formato SSE, com comentários de keep-alive enquanto nada acontece"""
+    try:
+        # Indica ao EventSource o intervalo de reconexão (ms)
+        yield "retry: 3000\n\n"
+        while True:
+            event = await subscription.next(event_hub.keepalive)
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield _sse(event)
+            if until_done and event["event"] in TERMINAL_EVENTS:
+                return
+    finally:
+        event_hub.unsubscribe(subscription)
+
+
+@stream_router.get("/events/jobs/{job_id}")
+async def stream_job(job_id: str) -> StreamingResponse:
+    """
+    Eventos de um job por SSE (encerra após "done")
+
+    Args:
+        job_id: Identificador devolvido pelo /webhook/in
+
+    Returns:
+        Stream text/event-stream (eventos anteriores do job são reenviados)
+    """
+    subscription = event_hub.subscribe(job_id=job_id)
+    return StreamingResponse(_event_stream(subscription, True), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@stream_router.get("/events/numeros/{numero}")
+async def stream_numero(
+    numero: str,
+    token: Optional[str] = Query(default=None),
+    x_events_token: Optional[str] = Header(default=None)
+) -> StreamingResponse:
+    """
+    Eventos de todos os jobs de um número de callback por SSE (conexão fica aberta)
+
+    Args:
+        numero: Número para callback usado no /webhook/in
+        token: EVENTS_TOKEN (parâmetro, para EventSource que não envia headers)
+        x_events_token: EVENTS_TOKEN no header X-Events-Token
+
+    Returns:
+        Stream text/event-stream
+
+    Raises:
+        HTTPException: 403 se o token não confere ou não está configurado
+    """
+    if not numero_token_valid(x_events_token or token):
+        raise HTTPException(status_code=403, detail={"error": "Assinatura por número exige EVENTS_TOKEN"})
+    subscription = event_hub.subscribe(numero=numero)
+    return StreamingResponse(_event_stream(subscription, False), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@stream_router.websocket("/ws/events")
+async def websocket_events(
+    websocket: WebSocket,
+    job_id: Optional[str] = Query(default=None),
+    numero: Optional[str] = Query(default=None),
+    token: Optional[str] = Query(default=None)
+) -> None:
+    """
+    Eventos por WebSocket de um job (fecha após "done") ou de um número (fica aberto)
+
+    Args:
+        websocket: Conexão
+        job_id: Identificador do job
+        numero: Número para callback (exige token)
+        token: EVENTS_TOKEN (parâmetro ou header X-Events-Token)
+    """
+    if not job_id and not numero:
+        await websocket.close(code=1008, reason="Informe job_id ou numero")
+        return
+    if numero and not numero_token_valid(websocket.headers.get("x-events-token") or token):
+        await websocket.close(code=1008, reason="Assinatura por número exige EVENTS_TOKEN")
+        return
+    await websocket.accept()
+    subscription = event_hub.subscribe(job_id=job_id, numero=numero)
+    try:
+        while True:
+            event = await subscription.next(event_hub.keepalive)
+            if event is None:
+                await websocket.send_json({"event": "keep-alive"})
+                continue
+            await websocket.send_json(event)
+            if job_id and not numero and event["event"] in TERMINAL_EVENTS:
+                await websocket.close()
+                return
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_hub.unsubscribe(subscription)
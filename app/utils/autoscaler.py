@@ -0,0 +1,179 @@
+"""
+Autoscaler dos pools de sessões de browser (fila de espera, latência e memória livre)
+"""
+import os
+import math
+import time
+import asyncio
+from typing import Any, Dict, Optional, Set
+from app.utils.browser_pool import BrowserManager, BrowserPool, browser_manager
+from app.utils.memory import MemoryWatchdog, memory_watchdog
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+class PoolAutoscaler:
+    """Ajusta a capacidade de cada pool entre min e max com histerese na redução"""
+
+    def __init__(self, manager: BrowserManager = browser_manager, watchdog: MemoryWatchdog = memory_watchdog):
+        self.manager = manager
+        self.watchdog = watchdog
+        self.interval = float(os.getenv("POOL_AUTOSCALE_INTERVAL", "5"))
+        self.scale_down_delay = float(os.getenv("POOL_SCALE_DOWN_DELAY", "300"))
+        self.session_memory_mb = float(os.getenv("BROWSER_SESSION_MEMORY_MB", "150"))
+        self._last_leases: Dict[str, int] = {}
+        self._last_tick: Optional[float] = None
+        self._below_since: Dict[str, float] = {}
+        self._desired: Dict[str, int] = {}
+        self._prewarm_tasks: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def memory_headroom_mb(self) -> float:
+        """
+        Memória livre dentro do orçamento segundo a última amostra do watchdog
+
+        Returns:
+            Headroom em MB (infinito se ainda não houve amostra)
+        """
+        sample = self.watchdog.last_sample
+        if not sample:
+            return math.inf
+        return min(
+            self.watchdog.total_budget_mb - sample.get("total_rss_mb", 0),
+            self.watchdog.browser_limit_mb - sample.get("browser_rss_mb", 0),
+        )
+
+    def desired_size(self, pool: BrowserPool, elapsed: float) -> int:
+        """
+        Calcula a capacidade desejada de um pool
+
+        Combina a demanda imediata (consultas em andamento + aguardando sessão) com a
+        lei de Little (taxa de consultas x latência média) e limita pelo headroom de memória.
+
+        Args:
+            pool: Pool avaliado
+            elapsed: Segundos desde a última avaliação
+
+        Returns:
+            Capacidade desejada entre min_sessions e max_sessions
+        """
+        leases = pool.leases_total - self._last_leases.get(pool.name, pool.leases_total)
+        rate = leases / elapsed if elapsed > 0 else 0.0
+        littles = math.ceil(rate * pool.latency_ewma)
+        demand = len(pool._leased) + pool.waiting
+
+        desired = max(pool.min_sessions, littles, demand)
+
+        if desired > pool.size:
+            if self.manager.over_budget:
+                desired = pool.size
+            else:
+                headroom = self.memory_headroom_mb()
+                if headroom != math.inf:
+                    affordable = max(int(headroom // self.session_memory_mb), 0)
+                    desired = min(desired, pool.size + affordable)
+
+        return max(min(desired, pool.max_sessions), pool.min_sessions)
+
+    async def tick(self) -> None:
+        """Executa uma rodada de ajuste em todos os pools"""
+        now = time.monotonic()
+        elapsed = now - self._last_tick if self._last_tick is not None else self.interval
+        self._last_tick = now
+
+        for pool in list(self.manager.pools.values()):
+            desired = self.desired_size(pool, elapsed)
+            self._last_leases[pool.name] = pool.leases_total
+            self._desired[pool.name] = desired
+            # Capacidade nunca fica abaixo de 1: sessões ainda podem ser criadas sob demanda
+            target_capacity = max(desired, 1)
+
+            if target_capacity > pool.capacity:
+                # Escala para cima imediatamente
+                self._below_since.pop(pool.name, None)
+                log_with_context(
+                    logger,
+                    "INFO",
+                    "Aumentando capacidade do pool",
+                    pool=pool.name,
+                    capacity=pool.capacity,
+                    desired=desired,
+                    waiting=pool.waiting
+                )
+                pool.capacity = target_capacity
+            elif target_capacity < pool.capacity:
+                # Escala para baixo só após demanda baixa sustentada, uma sessão por vez
+                since = self._below_since.setdefault(pool.name, now)
+                if now - since >= self.scale_down_delay:
+                    pool.capacity -= 1
+                    self._below_since[pool.name] = now
+                    closed = await pool.shrink()
+                    log_with_context(
+                        logger,
+                        "INFO",
+                        "Reduzindo capacidade do pool",
+                        pool=pool.name,
+                        capacity=pool.capacity,
+                        desired=desired,
+                        closed=closed
+                    )
+            else:
+                self._below_since.pop(pool.name, None)
+
+            # Pré-aquece (login antecipado) até a capacidade desejada
+            missing = min(pool.capacity, desired) - pool.size
+            if missing > 0 and not self.manager.over_budget:
+                task = asyncio.create_task(pool.prewarm(missing))
+                self._prewarm_tasks.add(task)
+                task.add_done_callback(self._prewarm_tasks.discard)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Erro no autoscaler de sessões: {str(e)}",
+                    error_type=type(e).__name__
+                )
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Inicia o autoscaler em background no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Interrompe o autoscaler e os pré-aquecimentos pendentes"""
+        tasks = list(self._prewarm_tasks)
+        if self._task:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "capacity": pool.capacity,
+                "desired": self._desired.get(name, pool.capacity),
+                "size": pool.size,
+                "waiting": pool.waiting,
+                "latency_ewma_seconds": round(pool.latency_ewma, 3),
+            }
+            for name, pool in self.manager.pools.items()
+        }
+
+
+# Instância global do autoscaler
+pool_autoscaler = PoolAutoscaler()
+metrics.register_collector("autoscaler", pool_autoscaler.snapshot)
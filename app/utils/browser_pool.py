@@ -0,0 +1,578 @@
+"""
+Pool de sessões de browser (contextos Playwright) compartilhando um único Chromium
+"""
+import os
+import time
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from app.utils.logger import logger, log_with_context
+
+
+class LeaseRefusedError(Exception):
+    """Levantada quando não é possível ceder uma sessão (memória acima do orçamento)"""
+
+
+class SessionSetupError(Exception):
+    """Levantada quando a preparação da sessão (ex: login) falha"""
+
+
+class BrowserSession:
+    """Contexto + página do browser reutilizáveis entre verificações"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, pool_name: str, context: Any, page: Any):
+        self.id = next(self._ids)
+        self.pool_name = pool_name
+        self.context = context
+        self.page = page
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.uses = 0
+        self.logged_in = False
+        self.logged_in_at = self.created_at
+        self.validated_at = self.created_at
+        self.healthy = True
+        self.js_heap_mb = 0.0
+        # Tracing do Playwright iniciado no contexto (captura de consultas lentas)
+        self.tracing = False
+
+    @property
+    def age(self) -> float:
+        """Idade da sessão em segundos"""
+        return time.monotonic() - self.created_at
+
+    async def sample_heap(self) -> float:
+        """
+        Lê o heap JS usado pela página (Chromium expõe performance.memory)
+
+        Returns:
+            Heap usado em MB (0 se indisponível)
+        """
+        try:
+            used = await self.page.evaluate(
+                "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+            )
+            self.js_heap_mb = round(float(used or 0) / (1024 * 1024), 1)
+        except Exception:
+            self.js_heap_mb = 0.0
+        return self.js_heap_mb
+
+    async def close(self) -> None:
+        """Fecha página e contexto ignorando erros"""
+        for resource in (self.page, self.context):
+            try:
+                if resource:
+                    await resource.close()
+            except Exception:
+                pass
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "age_seconds": round(self.age, 1),
+            "uses": self.uses,
+            "logged_in": self.logged_in,
+            "login_age_seconds": round(time.monotonic() - self.logged_in_at, 1),
+            "js_heap_mb": self.js_heap_mb,
+        }
+
+
+class BrowserPool:
+    """Pool de sessões de um plano, com limites de idade, uso e heap"""
+
+    def __init__(
+        self,
+        manager: "BrowserManager",
+        name: str,
+        setup: Optional[Callable[[BrowserSession], Awaitable[bool]]] = None,
+        max_sessions: int = 1,
+        min_sessions: int = 0,
+        validate: Optional[Callable[[BrowserSession], Awaitable[bool]]] = None,
+    ):
+        self.manager = manager
+        self.name = name
+        self.setup = setup
+        self.validate = validate
+        self.min_sessions = min_sessions
+        self.max_sessions = max(max_sessions, min_sessions, 1)
+        # Capacidade atual, ajustada pelo autoscaler entre min e max
+        self.capacity = max(min_sessions, 1)
+        self.max_age = float(os.getenv("BROWSER_SESSION_MAX_AGE", "1800"))
+        self.max_uses = int(os.getenv("BROWSER_SESSION_MAX_USES", "200"))
+        self.max_heap_mb = float(os.getenv("BROWSER_SESSION_MAX_HEAP_MB", "256"))
+        self.lease_timeout = float(os.getenv("BROWSER_LEASE_TIMEOUT", "30"))
+
+        self._idle: List[BrowserSession] = []
+        self._leased: Dict[int, BrowserSession] = {}
+        self._maintaining: Dict[int, BrowserSession] = {}
+        self._creating = 0
+        self._cond = asyncio.Condition()
+        self.waiting = 0
+        self.recycled = 0
+        self.refused = 0
+        self.leases_total = 0
+        self.latency_ewma = 0.0
+
+    @property
+    def size(self) -> int:
+        """Quantidade de sessões vivas (ociosas + em uso + em manutenção + sendo criadas)"""
+        return len(self._idle) + len(self._leased) + len(self._maintaining) + self._creating
+
+    @property
+    def busy(self) -> int:
+        """Quantidade de sessões ocupadas (em uso, em manutenção ou sendo criadas)"""
+        return len(self._leased) + len(self._maintaining) + self._creating
+
+    @property
+    def sessions(self) -> List[BrowserSession]:
+        return self._idle + list(self._leased.values()) + list(self._maintaining.values())
+
+    @property
+    def warm_sessions(self) -> int:
+        """Quantidade de sessões logadas e saudáveis"""
+        return sum(1 for s in self.sessions if s.logged_in and s.healthy)
+
+    def should_recycle(self, session: BrowserSession) -> bool:
+        """
+        Indica se a sessão ultrapassou algum dos limites configurados
+
+        Args:
+            session: Sessão a ser avaliada
+
+        Returns:
+            True se a sessão deve ser descartada
+        """
+        return (
+            not session.healthy
+            or session.age > self.max_age
+            or session.uses >= self.max_uses
+            or session.js_heap_mb > self.max_heap_mb
+        )
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[BrowserSession]:
+        """
+        Cede uma sessão pronta para uso e a devolve ao pool no final
+
+        Raises:
+            LeaseRefusedError: Se a memória continuar acima do orçamento até o timeout
+            SessionSetupError: Se a preparação de uma nova sessão falhar
+        """
+        session = await self._acquire()
+        started = time.monotonic()
+        try:
+            yield session
+        except BaseException:
+            session.healthy = False
+            raise
+        finally:
+            self._observe_latency(time.monotonic() - started)
+            await self._release(session)
+
+    def _observe_latency(self, elapsed: float) -> None:
+        self.leases_total += 1
+        # Média móvel exponencial da duração das consultas
+        if self.latency_ewma == 0.0:
+            self.latency_ewma = elapsed
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * elapsed
+
+    async def _acquire(self) -> BrowserSession:
+        deadline = time.monotonic() + self.lease_timeout
+
+        async with self._cond:
+            self.waiting += 1
+            try:
+                session = await self._wait_for_slot(deadline)
+            finally:
+                self.waiting -= 1
+            if session is not None:
+                return session
+
+        # Criação fora do lock: login pode levar vários segundos
+        try:
+            session = await self._create_session()
+        except BaseException:
+            async with self._cond:
+                self._creating -= 1
+                self._cond.notify_all()
+            raise
+
+        async with self._cond:
+            self._creating -= 1
+            self._leased[session.id] = session
+        return session
+
+    async def _wait_for_slot(self, deadline: float) -> Optional[BrowserSession]:
+        """Aguarda (com o lock) uma sessão ociosa ou vaga para criar uma nova (retorna None)"""
+        while True:
+            remaining = deadline - time.monotonic()
+
+            if self.manager.over_budget:
+                if remaining <= 0:
+                    self.refused += 1
+                    log_with_context(
+                        logger,
+                        "WARNING",
+                        "Sessão recusada: memória acima do orçamento",
+                        pool=self.name
+                    )
+                    raise LeaseRefusedError(f"Memória acima do orçamento para o pool {self.name}")
+            elif self._idle:
+                session = self._idle.pop()
+                if self.should_recycle(session):
+                    await self._discard(session, reason="limite_atingido")
+                    continue
+                self._leased[session.id] = session
+                return session
+            elif self.size < self.capacity:
+                self._creating += 1
+                return None
+            elif remaining <= 0:
+                self.refused += 1
+                raise LeaseRefusedError(f"Timeout aguardando sessão do pool {self.name}")
+
+            try:
+                await asyncio.wait_for(self._cond.wait(), timeout=max(min(remaining, 1.0), 0.01))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _create_session(self) -> BrowserSession:
+        session = await self.manager.new_session(self.name)
+        if self.setup:
+            try:
+                ok = await self.setup(session)
+            except Exception as e:
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Erro ao preparar sessão: {str(e)}",
+                    pool=self.name,
+                    error_type=type(e).__name__
+                )
+                ok = False
+            if not ok:
+                await session.close()
+                raise SessionSetupError(f"Falha ao preparar sessão do pool {self.name}")
+            session.logged_in_at = session.validated_at = time.monotonic()
+        log_with_context(logger, "INFO", "Sessão de browser criada", pool=self.name, session_id=session.id)
+        return session
+
+    async def _release(self, session: BrowserSession) -> None:
+        session.uses += 1
+        session.last_used_at = time.monotonic()
+        async with self._cond:
+            self._leased.pop(session.id, None)
+            if self.should_recycle(session) or self.manager.over_budget:
+                await self._discard(session, reason="limite_atingido")
+            elif self.size >= self.capacity:
+                await self._discard(session, reason="capacidade_reduzida")
+            else:
+                self._idle.append(session)
+            self._cond.notify_all()
+
+    async def _discard(self, session: BrowserSession, reason: str) -> None:
+        self.recycled += 1
+        log_with_context(
+            logger,
+            "INFO",
+            "Reciclando sessão de browser",
+            pool=self.name,
+            reason=reason,
+            **session.to_dict()
+        )
+        await session.close()
+
+    async def sample_idle_heaps(self) -> None:
+        """Atualiza o heap JS das sessões ociosas"""
+        for session in list(self._idle):
+            await session.sample_heap()
+
+    async def recycle_idle(self, predicate: Optional[Callable[[BrowserSession], bool]] = None, reason: str = "limite_atingido") -> int:
+        """
+        Fecha sessões ociosas que satisfazem o predicado
+
+        Args:
+            predicate: Critério de descarte (padrão: limites do pool)
+            reason: Motivo registrado no log
+
+        Returns:
+            Quantidade de sessões recicladas
+        """
+        predicate = predicate or self.should_recycle
+        async with self._cond:
+            to_close = [s for s in self._idle if predicate(s)]
+            self._idle = [s for s in self._idle if s not in to_close]
+            for session in to_close:
+                await self._discard(session, reason=reason)
+            if to_close:
+                self._cond.notify_all()
+        return len(to_close)
+
+    async def prewarm(self, count: int) -> int:
+        """
+        Cria sessões ociosas antecipadamente (login antes da demanda chegar)
+
+        Args:
+            count: Quantidade máxima de sessões a criar
+
+        Returns:
+            Quantidade de sessões criadas
+        """
+        created = 0
+        for _ in range(count):
+            async with self._cond:
+                if self.size >= self.capacity or self.manager.over_budget:
+                    break
+                self._creating += 1
+            try:
+                session = await self._create_session()
+            except BaseException as e:
+                async with self._cond:
+                    self._creating -= 1
+                    self._cond.notify_all()
+                if not isinstance(e, Exception):
+                    raise
+                break
+            async with self._cond:
+                self._creating -= 1
+                self._idle.append(session)
+                self._cond.notify_all()
+            created += 1
+        return created
+
+    async def keepalive(self, relogin_after: float, ping_after: float) -> Dict[str, int]:
+        """
+        Valida sessões ociosas e refaz o login antes da expiração do portal
+
+        Sessões com login mais antigo que relogin_after são substituídas por uma nova
+        (login em contexto novo, sem interromper consultas); as demais são validadas
+        com o ping barato do handler quando não foram verificadas há ping_after segundos.
+
+        Args:
+            relogin_after: Idade máxima do login (s) antes do re-login proativo
+            ping_after: Intervalo mínimo entre validações (s)
+
+        Returns:
+            Contadores de pings, falhas de ping, re-logins e sessões descartadas
+        """
+        now = time.monotonic()
+        counters = {"pings": 0, "ping_failures": 0, "relogins": 0, "discarded": 0}
+
+        async with self._cond:
+            due = [
+                s for s in self._idle
+                if now - s.logged_in_at >= relogin_after or now - s.validated_at >= ping_after
+            ]
+            for session in due:
+                self._idle.remove(session)
+                self._maintaining[session.id] = session
+
+        for session in due:
+            keep = session
+            needs_login = now - session.logged_in_at >= relogin_after
+
+            if not needs_login and self.validate:
+                counters["pings"] += 1
+                try:
+                    valid = await self.validate(session)
+                except Exception:
+                    valid = False
+                if valid:
+                    session.validated_at = time.monotonic()
+                else:
+                    counters["ping_failures"] += 1
+                    needs_login = True
+            elif not needs_login:
+                session.validated_at = time.monotonic()
+
+            if needs_login:
+                try:
+                    keep = await self._create_session()
+                    counters["relogins"] += 1
+                except Exception:
+                    keep = None
+
+            async with self._cond:
+                self._maintaining.pop(session.id, None)
+                if keep is None:
+                    counters["discarded"] += 1
+                    await self._discard(session, reason="sessao_expirada")
+                elif keep is not session:
+                    await self._discard(session, reason="relogin")
+                if keep is not None:
+                    self._idle.append(keep)
+                self._cond.notify_all()
+
+        return counters
+
+    async def shrink(self) -> int:
+        """
+        Fecha sessões ociosas excedentes à capacidade atual (as menos usadas recentemente)
+
+        Returns:
+            Quantidade de sessões fechadas
+        """
+        excess = self.size - self.capacity
+        if excess <= 0:
+            return 0
+        victims = sorted(self._idle, key=lambda s: s.last_used_at)[:excess]
+        ids = {s.id for s in victims}
+        return await self.recycle_idle(lambda s: s.id in ids, reason="capacidade_reduzida")
+
+    async def close(self) -> None:
+        """Fecha todas as sessões ociosas do pool"""
+        await self.recycle_idle(lambda s: True, reason="shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "min_sessions": self.min_sessions,
+            "max_sessions": self.max_sessions,
+            "capacity": self.capacity,
+            "warm": self.warm_sessions,
+            "waiting": self.waiting,
+            "latency_ewma_seconds": round(self.latency_ewma, 3),
+            "idle": len(self._idle),
+            "leased": len(self._leased),
+            "creating": self._creating,
+            "recycled": self.recycled,
+            "refused": self.refused,
+            "sessions": [s.to_dict() for s in self.sessions],
+        }
+
+
+class BrowserManager:
+    """Gerencia o processo Chromium compartilhado e os pools de sessões"""
+
+    def __init__(self):
+        self.timeout = int(os.getenv("BROWSER_PAGE_TIMEOUT", "30000"))
+        self.pools: Dict[str, BrowserPool] = {}
+        self.over_budget = False
+        self._playwright = None
+        self._browser = None
+        self._lock = asyncio.Lock()
+
+    def create_pool(
+        self,
+        name: str,
+        setup: Optional[Callable[[BrowserSession], Awaitable[bool]]] = None,
+        max_sessions: int = 1,
+        min_sessions: int = 0,
+        validate: Optional[Callable[[BrowserSession], Awaitable[bool]]] = None,
+    ) -> BrowserPool:
+        """
+        Cria (ou retorna) o pool de sessões de um plano
+
+        Args:
+            name: Nome do pool (normalmente o plano)
+            setup: Função async que prepara a sessão (ex: login)
+            max_sessions: Número máximo de contextos simultâneos
+            min_sessions: Número mínimo de contextos mantidos pelo autoscaler
+            validate: Função async barata que confirma se a sessão segue logada
+
+        Returns:
+            Pool registrado
+        """
+        if name not in self.pools:
+            self.pools[name] = BrowserPool(
+                self, name, setup=setup, max_sessions=max_sessions,
+                min_sessions=min_sessions, validate=validate
+            )
+        return self.pools[name]
+
+    @property
+    def browser_running(self) -> bool:
+        return self._browser is not None
+
+    @property
+    def leased_count(self) -> int:
+        return sum(len(pool._leased) for pool in self.pools.values())
+
+    @property
+    def busy_count(self) -> int:
+        """Sessões em uso, em manutenção (keep-alive) ou sendo criadas (login em andamento)"""
+        return sum(pool.busy for pool in self.pools.values())
+
+    async def _get_browser(self) -> Any:
+        async with self._lock:
+            if self._browser is None:
+                from playwright.async_api import async_playwright
+
+                log_with_context(logger, "INFO", "Iniciando browser Playwright")
+                self._playwright = await async_playwright().start()
+                # Configura browser para ambiente Railway
+                self._browser = await self._playwright.chromium.launch(
+                    headless=True,  # Sempre headless em produção
+                    args=[
+                        '--no-sandbox',
+                        '--disable-setuid-sandbox',
+                        '--disable-dev-shm-usage',
+                        '--disable-accelerated-2d-canvas',
+                        '--no-first-run',
+                        '--no-zygote',
+                        '--disable-gpu'
+                    ]
+                )
+                log_with_context(logger, "INFO", "Browser iniciado com sucesso")
+            return self._browser
+
+    async def new_session(self, pool_name: str) -> BrowserSession:
+        """
+        Cria um novo contexto + página no Chromium compartilhado
+
+        Args:
+            pool_name: Pool dono da sessão
+
+        Returns:
+            Sessão criada
+        """
+        browser = await self._get_browser()
+        # Cria contexto com user-agent realista
+        context = await browser.new_context(
+            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            viewport={'width': 1366, 'height': 768},
+            locale='pt-BR',
+            timezone_id='America/Sao_Paulo'
+        )
+        page = await context.new_page()
+        page.set_default_timeout(self.timeout)
+        return BrowserSession(pool_name, context, page)
+
+    async def close_browser(self) -> None:
+        """Fecha o Chromium (e o driver Playwright) liberando toda a memória"""
+        async with self._lock:
+            try:
+                if self._browser:
+                    await self._browser.close()
+                if self._playwright:
+                    await self._playwright.stop()
+                log_with_context(logger, "INFO", "Browser fechado com sucesso")
+            except Exception as e:
+                log_with_context(
+                    logger, "ERROR",
+                    f"Erro ao fechar browser: {str(e)}",
+                    error_type=type(e).__name__
+                )
+            finally:
+                self._browser = None
+                self._playwright = None
+
+    async def shutdown(self) -> None:
+        """Fecha todos os pools e o browser"""
+        for pool in self.pools.values():
+            await pool.close()
+        await self.close_browser()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "browser_running": self.browser_running,
+            "over_budget": self.over_budget,
+            "pools": {name: pool.stats() for name, pool in self.pools.items()},
+        }
+
+
+# Instância global do gerenciador de browser
+browser_manager = BrowserManager()
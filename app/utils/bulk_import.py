@@ -0,0 +1,465 @@
+"""
+Importação em lote de carteirinhas (CSV ou NDJSON) para revalidação mensal
+
+O arquivo é gravado em disco à medida que chega e lido linha a linha: nunca fica inteiro
+em memória. As linhas válidas entram numa fila limitada (o leitor espera quando ela
+enche) consumida por poucos workers, e cada resultado é anexado ao arquivo de resultados.
+Esse arquivo também é o ponto de retomada: depois de um restart, as linhas que já têm
+resultado são puladas.
+"""
+import io
+import os
+import csv
+import json
+import time
+import uuid
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple, Union
+from pydantic import ValidationError
+from app.dispatch import handler_registry
+from app.schemas import WebhookInRequest
+from app.utils.card_validators import CardValidationError
+from app.utils.history import check_context, history_store
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+FORMATS = ("csv", "ndjson")
+
+# Colunas aceitas para a carteirinha (o schema do webhook usa a grafia "carterinha")
+CARD_COLUMNS = ("numero_carterinha", "numero_carteirinha", "carteirinha")
+
+RESULT_FIELDS = ["row", "numero_carterinha", "plan_name", "numero", "status", "error"]
+
+
+class BulkImportError(Exception):
+    """Upload inválido (formato desconhecido ou arquivo vazio)"""
+
+
+class BulkImportTooLarge(BulkImportError):
+    """Upload acima de BULK_MAX_MB"""
+
+
+def iter_rows(path: Path, fmt: str) -> Iterator[Tuple[int, Union[Dict[str, Any], ValueError]]]:
+    """
+    Lê as linhas do arquivo sem carregá-lo inteiro
+
+    Args:
+        path: Arquivo de entrada
+        fmt: "csv" (separador "," ou ";", com cabeçalho) ou "ndjson"
+
+    Returns:
+        Iterador de (índice da linha, dados ou erro de parsing); o índice é estável entre execuções
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if fmt == "csv":
+            header = f.readline()
+            delimiter = ";" if header.count(";") > header.count(",") else ","
+            reader = csv.DictReader(itertools.chain([header], f), delimiter=delimiter)
+            for index, row in enumerate(reader):
+                yield index, {key.strip(): (value or "").strip() for key, value in row.items() if key}
+        else:
+            for index, line in enumerate(f):
+                if not line.strip():
+                    continue
+                try:
+                    data = json.loads(line)
+                    yield index, data if isinstance(data, dict) else ValueError("Linha não é um objeto JSON")
+                except ValueError as e:
+                    yield index, ValueError(f"JSON inválido: {e}")
+
+
+class BulkJob:
+    """Uma importação: arquivos no diretório próprio e contadores de progresso"""
+
+    def __init__(self, directory: Path, job_id: str, fmt: str, plan_name: Optional[str] = None):
+        self.id = job_id
+        self.directory = directory
+        self.format = fmt
+        self.plan_name = plan_name
+        self.status = "uploading"
+        self.error: Optional[str] = None
+        self.created_at = datetime.now(timezone.utc).isoformat()
+        self.finished_at: Optional[str] = None
+        self.input_bytes = 0
+        self.estimated_rows = 0
+        self.rows_read = 0
+        self.processed = 0
+        self.results: Counter = Counter()
+
+    @property
+    def input_path(self) -> Path:
+        return self.directory / f"input.{self.format}"
+
+    @property
+    def results_path(self) -> Path:
+        return self.directory / "results.ndjson"
+
+    @property
+    def state_path(self) -> Path:
+        return self.directory / "state.json"
+
+    def save(self) -> None:
+        """Grava o estado (troca atômica do arquivo)"""
+        state = {
+            "id": self.id,
+            "format": self.format,
+            "plan_name": self.plan_name,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "input_bytes": self.input_bytes,
+            "estimated_rows": self.estimated_rows,
+        }
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state), encoding="utf-8")
+        tmp.replace(self.state_path)
+
+    @classmethod
+    def load(cls, directory: Path) -> "BulkJob":
+        """
+        Carrega uma importação do disco
+
+        Args:
+            directory: Diretório da importação
+
+        Returns:
+            Importação com o estado gravado
+        """
+        state = json.loads((directory / "state.json").read_text(encoding="utf-8"))
+        job = cls(directory, state["id"], state["format"], state.get("plan_name"))
+        job.status = state["status"]
+        job.error = state.get("error")
+        job.created_at = state["created_at"]
+        job.finished_at = state.get("finished_at")
+        job.input_bytes = state.get("input_bytes", 0)
+        job.estimated_rows = state.get("estimated_rows", 0)
+        return job
+
+    def completed_rows(self) -> Set[int]:
+        """
+        Linhas que já têm resultado (recalcula os contadores a partir do arquivo de resultados)
+
+        Returns:
+            Índices das linhas concluídas
+        """
+        done: Set[int] = set()
+        self.results = Counter()
+        if not self.results_path.exists():
+            return done
+        with open(self.results_path, "rb+") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    # Linha cortada por um restart no meio da escrita
+                    continue
+                done.add(result["row"])
+                self.results[result["status"]] += 1
+            # Garante que o próximo resultado comece numa linha nova
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+        self.processed = len(done)
+        return done
+
+    def snapshot(self) -> Dict[str, Any]:
+        total = max(self.estimated_rows, self.rows_read)
+        return {
+            "id": self.id,
+            "status": self.status,
+            "format": self.format,
+            "plan_name": self.plan_name,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "input_bytes": self.input_bytes,
+            "estimated_rows": self.estimated_rows,
+            "rows_read": self.rows_read,
+            "processed": self.processed,
+            "progress": round(self.processed / total, 4) if total else 0.0,
+            "results": dict(self.results),
+        }
+
+
+class BulkImportManager:
+    """Recebe, processa (com backpressure) e retoma importações em lote"""
+
+    def __init__(self):
+        self.directory = Path(os.getenv("BULK_DIR", "data/bulk"))
+        self.concurrency = int(os.getenv("BULK_CONCURRENCY", "4"))
+        # Linhas válidas aguardando um worker; o leitor do arquivo espera quando a fila enche
+        self.queue_size = int(os.getenv("BULK_QUEUE_SIZE", "100"))
+        self.max_bytes = int(float(os.getenv("BULK_MAX_MB", "100")) * 1024 * 1024)
+        self.jobs: Dict[str, BulkJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def create(
+        self,
+        chunks: AsyncIterator[bytes],
+        fmt: str,
+        plan_name: Optional[str] = None
+    ) -> BulkJob:
+        """
+        Grava o upload em disco (em streaming) e agenda o processamento
+
+        Args:
+            chunks: Corpo da requisição em pedaços
+            fmt: "csv" ou "ndjson"
+            plan_name: Plano padrão para linhas sem a coluna plan_name
+
+        Returns:
+            Importação criada
+
+        Raises:
+            BulkImportError: Formato desconhecido ou arquivo vazio
+            BulkImportTooLarge: Arquivo acima de BULK_MAX_MB
+        """
+        if fmt not in FORMATS:
+            raise BulkImportError(f"Formato não suportado: {fmt}")
+        job_id = uuid.uuid4().hex[:12]
+        job = BulkJob(self.directory / job_id, job_id, fmt, plan_name)
+        job.directory.mkdir(parents=True, exist_ok=True)
+        newlines = 0
+        last = b"\n"
+
+        try:
+            with open(job.input_path, "wb") as f:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    job.input_bytes += len(chunk)
+                    if job.input_bytes > self.max_bytes:
+                        raise BulkImportTooLarge(f"Arquivo acima do limite de {self.max_bytes // (1024 * 1024)} MB")
+                    newlines += chunk.count(b"\n")
+                    last = chunk[-1:]
+                    f.write(chunk)
+            if not job.input_bytes:
+                raise BulkImportError("Arquivo vazio")
+        except BaseException:
+            for path in job.directory.iterdir():
+                path.unlink()
+            job.directory.rmdir()
+            raise
+
+        lines = newlines + (last != b"\n")
+        job.estimated_rows = max(lines - 1, 0) if fmt == "csv" else lines
+        job.status = "queued"
+        job.save()
+        self.jobs[job_id] = job
+        metrics.inc("bulk_imports_created")
+        log_with_context(
+            logger,
+            "INFO",
+            "Importação em lote recebida",
+            job_id=job_id,
+            format=fmt,
+            input_bytes=job.input_bytes,
+            estimated_rows=job.estimated_rows
+        )
+        self._schedule(job)
+        return job
+
+    def _schedule(self, job: BulkJob) -> None:
+        self._tasks[job.id] = asyncio.create_task(self._process(job), name=f"bulk-{job.id}")
+
+    def _prepare(self, job: BulkJob, row: Union[Dict[str, Any], ValueError]) -> Tuple[Optional[WebhookInRequest], Optional[Dict[str, Any]]]:
+        """Valida a linha: retorna a requisição a consultar ou o resultado imediato"""
+        if isinstance(row, ValueError):
+            return None, {"status": "invalido", "error": str(row)}
+
+        card = next((str(row[column]) for column in CARD_COLUMNS if row.get(column) not in (None, "")), "")
+        data = {
+            "numero_carterinha": card,
+            "plan_name": str(row.get("plan_name") or job.plan_name or ""),
+            "numero": str(row.get("numero") or ""),
+        }
+        base = {"numero_carterinha": card, "plan_name": data["plan_name"], "numero": data["numero"]}
+        if not data["plan_name"]:
+            return None, {**base, "status": "invalido", "error": "plan_name ausente"}
+        try:
+            request = WebhookInRequest.model_validate(data)
+        except ValidationError as e:
+            return None, {**base, "status": "invalido", "error": "; ".join(err["msg"] for err in e.errors())}
+        try:
+            card = handler_registry.validate_card(request.plan_name, request.numero_carterinha)
+        except CardValidationError as e:
+            status = "invalido" if e.on_invalid == "reject" else "nao_elegivel"
+            return None, {**base, "status": status, "error": e.reason}
+        return request.model_copy(update={"numero_carterinha": card}), None
+
+    def _write(self, job: BulkJob, out: Any, index: int, result: Dict[str, Any]) -> None:
+        record = {field: result.get(field) for field in RESULT_FIELDS}
+        record["row"] = index
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        job.processed += 1
+        job.results[record["status"]] += 1
+        metrics.inc("bulk_rows_processed")
+
+    async def _worker(self, job: BulkJob, queue: asyncio.Queue, out: Any) -> None:
+        while True:
+            index, request = await queue.get()
+            base = {
+                "numero_carterinha": request.numero_carterinha,
+                "plan_name": request.plan_name,
+                "numero": request.numero,
+            }
+            try:
+                started = time.perf_counter()
+                with check_context() as check:
+                    status = await handler_registry.process_eligibility(request.plan_name, request.numero_carterinha)
+                history_store.record(
+                    request.plan_name,
+                    request.numero_carterinha,
+                    status,
+                    (time.perf_counter() - started) * 1000,
+                    check,
+                    origin="bulk"
+                )
+                self._write(job, out, index, {**base, "status": status})
+            except Exception as e:
+                self._write(job, out, index, {**base, "status": "erro", "error": str(e)})
+            finally:
+                queue.task_done()
+
+    async def _process(self, job: BulkJob) -> None:
+        """Lê o arquivo, alimenta a fila e grava os resultados (retomando de onde parou)"""
+        started = time.perf_counter()
+        done = job.completed_rows()
+        job.rows_read = 0
+        job.status = "running"
+        job.save()
+        log_with_context(logger, "INFO", "Importação em lote iniciada", job_id=job.id, already_done=len(done))
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        # Uma linha por resultado, gravada assim que sai (buffer de linha)
+        with open(job.results_path, "a", encoding="utf-8", buffering=1) as out:
+            workers = [
+                asyncio.create_task(self._worker(job, queue, out), name=f"bulk-{job.id}-{n}")
+                for n in range(self.concurrency)
+            ]
+            try:
+                for index, row in iter_rows(job.input_path, job.format):
+                    job.rows_read += 1
+                    if index in done:
+                        continue
+                    request, result = self._prepare(job, row)
+                    if result is not None:
+                        self._write(job, out, index, result)
+                        if job.rows_read % 100 == 0:
+                            await asyncio.sleep(0)
+                        continue
+                    await queue.put((index, request))
+                await queue.join()
+                job.status = "done"
+            except asyncio.CancelledError:
+                # Parada do serviço: o estado continua "running" e a importação é retomada
+                raise
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Falha na importação em lote: {str(e)}",
+                    job_id=job.id,
+                    error_type=type(e).__name__
+                )
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        job.finished_at = datetime.now(timezone.utc).isoformat()
+        job.save()
+        self._tasks.pop(job.id, None)
+        log_with_context(
+            logger,
+            "INFO",
+            "Importação em lote finalizada",
+            job_id=job.id,
+            status=job.status,
+            processed=job.processed,
+            results=dict(job.results),
+            duration_s=round(time.perf_counter() - started, 1)
+        )
+
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        return self.jobs.get(job_id)
+
+    def iter_results(self, job: BulkJob, fmt: str) -> Iterator[str]:
+        """
+        Resultados para download, lidos do disco em streaming
+
+        Args:
+            job: Importação
+            fmt: "ndjson" ou "csv"
+
+        Returns:
+            Iterador de linhas de texto
+        """
+        if fmt == "csv":
+            yield ",".join(RESULT_FIELDS) + "\r\n"
+        if not job.results_path.exists():
+            return
+        with open(job.results_path, encoding="utf-8") as f:
+            for line in f:
+                if fmt != "csv":
+                    yield line
+                    continue
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                buffer = io.StringIO()
+                csv.writer(buffer).writerow(["" if result.get(field) is None else result[field] for field in RESULT_FIELDS])
+                yield buffer.getvalue()
+
+    async def start(self) -> None:
+        """Carrega as importações do disco e retoma as interrompidas"""
+        if not self.directory.is_dir():
+            return
+        for directory in sorted(self.directory.iterdir()):
+            if not (directory / "state.json").is_file() or directory.name in self.jobs:
+                continue
+            try:
+                job = BulkJob.load(directory)
+            except (ValueError, KeyError) as e:
+                log_with_context(logger, "WARNING", f"Importação ilegível ignorada: {str(e)}", path=str(directory))
+                continue
+            self.jobs[job.id] = job
+            if job.status in ("queued", "running"):
+                log_with_context(logger, "INFO", "Retomando importação em lote", job_id=job.id)
+                self._schedule(job)
+            else:
+                job.completed_rows()
+
+    async def stop(self) -> None:
+        """Interrompe as importações em andamento (retomadas no próximo start)"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def listing(self) -> List[Dict[str, Any]]:
+        return [job.snapshot() for job in sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "jobs": len(self.jobs),
+            "running": len(self._tasks),
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+        }
+
+
+# Instância global das importações em lote
+bulk_imports = BulkImportManager()
+metrics.register_collector("bulk_imports", bulk_imports.stats)
@@ -0,0 +1,130 @@
+"""
+Cache em memória (LRU com TTL) de resultados de elegibilidade
+
+Com um backend de estado compartilhado, o cache local vira o primeiro nível: uma falta
+local consulta o backend, então um resultado obtido por qualquer réplica serve a todas.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from app.utils.state import StateBackend, StateBackendError
+from app.utils.logger import logger, log_with_context
+
+
+class ResultCache:
+    """Cache LRU limitado com expiração por entrada"""
+
+    def __init__(self, max_entries: Optional[int] = None, backend: Optional[StateBackend] = None):
+        self.max_entries = max_entries or int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        # Segundo nível, só quando outros processos enxergam o mesmo estado
+        self._shared = backend if backend is not None and backend.shared else None
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    @staticmethod
+    def _shared_key(plan_name: str, numero_carteirinha: str) -> str:
+        return f"cache:{plan_name}:{numero_carteirinha}"
+
+    async def _shared_get(self, plan_name: str, numero_carteirinha: str) -> Optional[Tuple[float, str]]:
+        """(segundos restantes, status) no backend compartilhado, copiado para o nível local"""
+        try:
+            raw = await self._shared.get(self._shared_key(plan_name, numero_carteirinha))
+        except StateBackendError as e:
+            # Backend fora do ar: segue só com o cache local
+            self.shared_errors += 1
+            log_with_context(logger, "WARNING", f"Cache compartilhado indisponível: {str(e)}")
+            return None
+        if raw is None:
+            return None
+        status, expires_at = raw.split("|", 1)
+        remaining = float(expires_at) - time.time()
+        if remaining <= 0:
+            return None
+        self._store((plan_name, numero_carteirinha), status, remaining)
+        return remaining, status
+
+    def _store(self, key: Tuple[str, str], status: str, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, status)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get(self, plan_name: str, numero_carteirinha: str) -> Optional[str]:
+        """
+        Retorna o resultado em cache se ainda válido
+
+        Args:
+            plan_name: Nome do plano
+            numero_carteirinha: Número da carteirinha
+
+        Returns:
+            Status em cache ou None
+        """
+        key = (plan_name, numero_carteirinha)
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            shared = await self._shared_get(plan_name, numero_carteirinha) if self._shared is not None else None
+            if shared is not None:
+                self.hits += 1
+                self.shared_hits += 1
+                return shared[1]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, plan_name: str, numero_carteirinha: str, status: str, ttl: float) -> None:
+        """
+        Armazena um resultado por ttl segundos
+
+        Args:
+            plan_name: Nome do plano
+            numero_carteirinha: Número da carteirinha
+            status: Status da elegibilidade
+            ttl: Tempo de vida em segundos
+        """
+        self._store((plan_name, numero_carteirinha), status, ttl)
+        if self._shared is not None:
+            try:
+                # Expiração absoluta junto do valor: quem lê sabe quanto resta sem outra consulta
+                await self._shared.set(self._shared_key(plan_name, numero_carteirinha), f"{status}|{time.time() + ttl}", ttl)
+            except StateBackendError as e:
+                self.shared_errors += 1
+                log_with_context(logger, "WARNING", f"Cache compartilhado indisponível: {str(e)}")
+
+    async def expires_in(self, plan_name: str, numero_carteirinha: str) -> Optional[float]:
+        """
+        Segundos até o resultado em cache expirar (não conta como acesso)
+
+        Args:
+            plan_name: Nome do plano
+            numero_carteirinha: Número da carteirinha
+
+        Returns:
+            Segundos restantes ou None se não houver resultado válido
+        """
+        entry = self._data.get((plan_name, numero_carteirinha))
+        remaining = entry[0] - time.monotonic() if entry is not None else 0.0
+        if remaining > 0:
+            return remaining
+        # Outra réplica pode ter renovado o resultado
+        shared = await self._shared_get(plan_name, numero_carteirinha) if self._shared is not None else None
+        return shared[0] if shared is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self._shared is not None,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+        }
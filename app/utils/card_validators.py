@@ -0,0 +1,108 @@
+"""
+Validação do número da carteirinha por plano (tamanho, caracteres e dígito verificador)
+"""
+from typing import Callable, Dict
+from app.plugins import CardFormat
+
+
+class CardValidationError(ValueError):
+    """Número de carteirinha inválido para o formato do plano"""
+
+    def __init__(self, reason: str, card_format: CardFormat):
+        super().__init__(reason)
+        self.reason = reason
+        self.on_invalid = card_format.on_invalid
+
+
+def luhn_valid(numero: str) -> bool:
+    """
+    Dígito verificador pelo algoritmo de Luhn (módulo 10)
+
+    Args:
+        numero: Número só com dígitos
+
+    Returns:
+        True se o último dígito confere
+    """
+    total = 0
+    for position, char in enumerate(reversed(numero)):
+        digit = int(char)
+        if position % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def mod11_valid(numero: str) -> bool:
+    """
+    Dígito verificador módulo 11 com pesos 2..9 da direita para a esquerda
+
+    Restos 0 e 1 geram dígito 0.
+
+    Args:
+        numero: Número só com dígitos
+
+    Returns:
+        True se o último dígito confere
+    """
+    body, check = numero[:-1], int(numero[-1])
+    total = sum(int(char) * (2 + i % 8) for i, char in enumerate(reversed(body)))
+    remainder = total % 11
+    return check == (0 if remainder < 2 else 11 - remainder)
+
+
+# Regras de dígito verificador disponíveis para o campo check_digit dos manifests
+CHECK_DIGIT_RULES: Dict[str, Callable[[str], bool]] = {
+    "luhn": luhn_valid,
+    "mod11": mod11_valid,
+}
+
+
+def normalize_card_number(numero: str, separators: str = " .-/") -> str:
+    """
+    Remove separadores do número da carteirinha
+
+    Args:
+        numero: Número recebido (ex: "0869.5568-1")
+        separators: Caracteres removidos
+
+    Returns:
+        Número normalizado
+    """
+    return numero.strip().translate({ord(char): None for char in separators}).upper()
+
+
+def validate_card(numero: str, card_format: CardFormat) -> str:
+    """
+    Normaliza e valida o número da carteirinha conforme o formato do plano
+
+    Args:
+        numero: Número recebido
+        card_format: Formato declarado no manifest do plano
+
+    Returns:
+        Número normalizado
+
+    Raises:
+        CardValidationError: Se o número não respeita o formato
+    """
+    normalized = normalize_card_number(numero, card_format.separators)
+
+    if card_format.charset == "digits" and not normalized.isdigit():
+        raise CardValidationError("caracteres_invalidos", card_format)
+    if card_format.charset == "alphanumeric" and not (normalized.isascii() and normalized.isalnum()):
+        raise CardValidationError("caracteres_invalidos", card_format)
+    if len(normalized) < card_format.min_length:
+        raise CardValidationError("muito_curto", card_format)
+    if card_format.max_length is not None and len(normalized) > card_format.max_length:
+        raise CardValidationError("muito_longo", card_format)
+
+    if card_format.check_digit != "none":
+        # Regras desconhecidas são recusadas pelo CardFormat ao carregar o manifest
+        rule = CHECK_DIGIT_RULES[card_format.check_digit]
+        if not normalized.isdigit() or not rule(normalized):
+            raise CardValidationError("digito_verificador_invalido", card_format)
+
+    return normalized
@@ -0,0 +1,239 @@
+"""
+Drenagem no desligamento: nenhum job aceito fica sem callback
+
+Sequência no deploy (SIGTERM):
+
+1. O uvicorn para de aceitar conexões e espera as requisições em andamento (e suas
+   background tasks) por `--timeout-graceful-shutdown` segundos; o que passar disso é
+   cancelado. Um hook de pre-stop pode antecipar a drenagem com POST /admin/drain:
+   novos webhooks recebem 503 + Retry-After e o /ready passa a 503.
+2. No shutdown do lifespan, os jobs que ainda rodam têm DRAIN_TIMEOUT_S para terminar.
+3. Jobs interrompidos com resultado conhecido têm o callback enviado na hora; os demais
+   são gravados em DRAIN_PENDING_FILE e retomados no próximo start. Sem resultado, a chave
+   de idempotência é liberada: uma repetição do webhook em outra réplica é processada
+   normalmente (e a retomada é descartada). Com resultado, a chave guarda o status e a
+   repetição só reenvia o callback.
+"""
+import os
+import json
+import time
+import asyncio
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+from app.utils.http import send_callback
+from app.utils.idempotency import idempotency_store
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+class PendingJob:
+    """Job de elegibilidade aceito e ainda sem callback entregue"""
+
+    def __init__(
+        self,
+        job_id: Optional[str],
+        numero_carteirinha: str,
+        plan_name: Optional[str],
+        numero: str,
+        idempotency_key: Optional[str] = None,
+        callback_url: Optional[str] = None,
+        status: Optional[str] = None
+    ):
+        self.job_id = job_id
+        self.numero_carteirinha = numero_carteirinha
+        self.plan_name = plan_name
+        self.numero = numero
+        self.idempotency_key = idempotency_key
+        self.callback_url = callback_url
+        # Resultado já obtido (falta só o callback)
+        self.status = status
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "numero_carteirinha": self.numero_carteirinha,
+            "plan_name": self.plan_name,
+            "numero": self.numero,
+            "idempotency_key": self.idempotency_key,
+            "callback_url": self.callback_url,
+            "status": self.status,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PendingJob":
+        return cls(**data)
+
+
+class DrainController:
+    """Admissão de trabalho novo e destino dos jobs em andamento no desligamento"""
+
+    def __init__(self, pending_file: Optional[str] = None):
+        self.pending_file = Path(pending_file or os.getenv("DRAIN_PENDING_FILE", "data/pending_jobs.ndjson"))
+        self.timeout = float(os.getenv("DRAIN_TIMEOUT_S", "10"))
+        self.callback_timeout = float(os.getenv("DRAIN_CALLBACK_TIMEOUT_S", "5"))
+        self.retry_after = int(os.getenv("DRAIN_RETRY_AFTER_S", "5"))
+        self.draining = False
+        self.started_at: Optional[float] = None
+        self._in_flight: Dict[asyncio.Task, PendingJob] = {}
+        self._interrupted: List[PendingJob] = []
+        self._resumed: Set[asyncio.Task] = set()
+        self.completed_during_drain = 0
+        self.last_report: Optional[Dict[str, Any]] = None
+
+    @property
+    def admitting(self) -> bool:
+        return not self.draining
+
+    def begin(self) -> None:
+        """Para de admitir trabalho novo (idempotente)"""
+        if self.draining:
+            return
+        self.draining = True
+        self.started_at = time.monotonic()
+        log_with_context(logger, "INFO", "Drenagem iniciada", in_flight=len(self._in_flight))
+
+    @contextmanager
+    def track(self, job: PendingJob) -> Iterator[PendingJob]:
+        """
+        Acompanha um job na task atual; se a task for cancelada, o job fica para a drenagem
+
+        Args:
+            job: Job aceito
+
+        Returns:
+            O próprio job (preencher status quando o resultado sair)
+        """
+        task = asyncio.current_task()
+        self._in_flight[task] = job
+        try:
+            yield job
+        except asyncio.CancelledError:
+            self._interrupted.append(job)
+            metrics.inc("jobs_interrupted")
+            raise
+        else:
+            if self.draining:
+                self.completed_during_drain += 1
+        finally:
+            self._in_flight.pop(task, None)
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def _wait_in_flight(self, deadline: float) -> None:
+        while self._in_flight and time.monotonic() < deadline:
+            await asyncio.wait(list(self._in_flight), timeout=max(0.0, deadline - time.monotonic()))
+        tasks = list(self._in_flight)
+        for task in tasks:
+            task.cancel()
+        # Cancelamento entregue: o track de cada task registra o job interrompido
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _flush_callback(self, job: PendingJob) -> bool:
+        try:
+            return await asyncio.wait_for(
+                send_callback(job.numero, job.status, callback_url=job.callback_url),
+                self.callback_timeout
+            )
+        except Exception as e:
+            log_with_context(
+                logger,
+                "WARNING",
+                f"Callback não enviado na drenagem: {str(e)}",
+                job_id=job.job_id,
+                error_type=type(e).__name__
+            )
+            return False
+
+    async def drain(self) -> Dict[str, Any]:
+        """
+        Drena os jobs em andamento: espera o prazo, envia callbacks com resultado e guarda o resto
+
+        Returns:
+            Relatório da drenagem
+        """
+        self.begin()
+        await self._wait_in_flight(time.monotonic() + self.timeout)
+
+        interrupted, self._interrupted = self._interrupted, []
+        flushed = 0
+        pending = []
+        for job in interrupted:
+            delivered = job.status is not None and await self._flush_callback(job)
+            if job.idempotency_key is not None:
+                if job.status is None:
+                    await idempotency_store.release(job.idempotency_key)
+                else:
+                    await idempotency_store.complete(job.idempotency_key, job.status, delivered)
+            if delivered:
+                flushed += 1
+            else:
+                pending.append(job)
+        if pending:
+            self.pending_file.parent.mkdir(parents=True, exist_ok=True)
+            with self.pending_file.open("a", encoding="utf-8") as file:
+                for job in pending:
+                    file.write(json.dumps(job.to_dict(), ensure_ascii=False) + "\n")
+
+        duration = time.monotonic() - (self.started_at or time.monotonic())
+        metrics.set_gauge("drain_duration_s", round(duration, 3))
+        self.last_report = {
+            "duration_s": round(duration, 3),
+            "completed": self.completed_during_drain,
+            "interrupted": len(interrupted),
+            "callbacks_flushed": flushed,
+            "persisted": len(pending),
+            "pending_file": str(self.pending_file) if pending else None,
+        }
+        log_with_context(logger, "INFO", "Drenagem concluída", **self.last_report)
+        return self.last_report
+
+    def load_pending(self) -> List[PendingJob]:
+        """
+        Lê e remove os jobs guardados pela última drenagem
+
+        Returns:
+            Jobs a retomar
+        """
+        if not self.pending_file.exists():
+            return []
+        jobs = []
+        with self.pending_file.open(encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    jobs.append(PendingJob.from_dict(json.loads(line)))
+        self.pending_file.unlink()
+        return jobs
+
+    def resume(self, runner: Callable[[PendingJob], Awaitable[None]]) -> int:
+        """
+        Retoma em background os jobs guardados pela última drenagem
+
+        Args:
+            runner: Processamento de um job retomado
+
+        Returns:
+            Quantidade de jobs retomados
+        """
+        jobs = self.load_pending()
+        for job in jobs:
+            task = asyncio.create_task(runner(job), name=f"resume-{job.job_id}")
+            self._resumed.add(task)
+            task.add_done_callback(self._resumed.discard)
+        if jobs:
+            log_with_context(logger, "INFO", "Jobs da última drenagem retomados", jobs=len(jobs))
+        return len(jobs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "in_flight": len(self._in_flight),
+            "timeout_s": self.timeout,
+            "last_report": self.last_report,
+        }
+
+
+# Instância global da drenagem
+drain_controller = DrainController()
+metrics.register_collector("drain", drain_controller.snapshot)
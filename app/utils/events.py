@@ -0,0 +1,178 @@
+"""
+Eventos de progresso dos jobs para assinantes SSE/WebSocket
+
+Cada job publica "queued", "logging_in", "consulting" e "done" (com o status final). Os
+handlers não conhecem o job: o job atual fica numa ContextVar definida pelo processamento
+em background, e `report_progress` publica para ele. Assinantes esperam em filas pequenas
+e limitadas (nenhuma task por conexão ociosa); eventos recentes de cada job ficam guardados
+para quem assina depois que o job começou (ou terminou).
+"""
+import os
+import time
+import asyncio
+import itertools
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from app.utils.metrics import metrics
+
+
+TERMINAL_EVENTS = frozenset({"done"})
+
+# (job_id, numero) do job em processamento nesta task
+current_job: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_job", default=None)
+
+
+class Subscription:
+    """Assinatura de um job e/ou de um número de callback"""
+
+    def __init__(self, topics: List[str], queue_size: int):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def deliver(self, event: Dict[str, Any]) -> None:
+        # Assinante lento perde os eventos mais antigos, nunca o publicador espera
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def next(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        Próximo evento
+
+        Args:
+            timeout: Espera máxima (s)
+
+        Returns:
+            Evento ou None se o tempo acabou (hora de mandar keep-alive)
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """Distribui eventos por tópico ("job:<id>" e "numero:<numero>")"""
+
+    def __init__(self):
+        self.queue_size = int(os.getenv("EVENTS_QUEUE_SIZE", "32"))
+        self.history_jobs = int(os.getenv("EVENTS_HISTORY_JOBS", "2000"))
+        self.keepalive = float(os.getenv("EVENTS_KEEPALIVE_S", "15"))
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self._history: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self.published = 0
+
+    def publish(self, job_id: str, numero: str, event: str, **data: Any) -> Dict[str, Any]:
+        """
+        Publica um evento de um job
+
+        Args:
+            job_id: Identificador do job
+            numero: Número de callback do job
+            event: Tipo ("queued", "logging_in", "consulting", "done")
+            **data: Campos extras (ex: status)
+
+        Returns:
+            Evento publicado
+        """
+        payload = {"id": next(self._ids), "job_id": job_id, "numero": numero, "event": event, "timestamp": time.time(), **data}
+        history = self._history.setdefault(job_id, [])
+        history.append(payload)
+        self._history.move_to_end(job_id)
+        while len(self._history) > self.history_jobs:
+            self._history.popitem(last=False)
+
+        for topic in (f"job:{job_id}", f"numero:{numero}"):
+            for subscription in self._subscribers.get(topic, ()):
+                subscription.deliver(payload)
+        self.published += 1
+        return payload
+
+    def subscribe(self, job_id: Optional[str] = None, numero: Optional[str] = None) -> Subscription:
+        """
+        Assina os eventos de um job e/ou de um número (eventos já publicados do job são reenviados)
+
+        Args:
+            job_id: Identificador do job
+            numero: Número de callback
+
+        Returns:
+            Assinatura (cancelar com unsubscribe)
+        """
+        topics = []
+        if job_id:
+            topics.append(f"job:{job_id}")
+        if numero:
+            topics.append(f"numero:{numero}")
+        subscription = Subscription(topics, self.queue_size)
+        for topic in topics:
+            self._subscribers.setdefault(topic, set()).add(subscription)
+        for event in self._history.get(job_id, []) if job_id else []:
+            subscription.deliver(event)
+        metrics.inc("event_subscriptions")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Remove a assinatura"""
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def last_event(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Último evento guardado do job"""
+        history = self._history.get(job_id)
+        return history[-1] if history else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len({id(sub) for subs in self._subscribers.values() for sub in subs}),
+            "topics": len(self._subscribers),
+            "jobs_in_history": len(self._history),
+            "published": self.published,
+        }
+
+
+@contextmanager
+def job_context(job_id: Optional[str], numero: str) -> Iterator[None]:
+    """
+    Define o job atual da task (lido por report_progress)
+
+    Args:
+        job_id: Identificador do job (None = sem eventos)
+        numero: Número de callback
+    """
+    token = current_job.set((job_id, numero) if job_id else None)
+    try:
+        yield
+    finally:
+        current_job.reset(token)
+
+
+def report_progress(event: str, **data: Any) -> None:
+    """
+    Publica um evento para o job atual (nada acontece fora de um job; repetições seguidas
+    do mesmo tipo, como vários passos de consulta, viram um evento só)
+
+    Args:
+        event: Tipo do evento
+        **data: Campos extras
+    """
+    job = current_job.get()
+    if job is None:
+        return
+    last = event_hub.last_event(job[0])
+    if last is None or last["event"] != event:
+        event_hub.publish(job[0], job[1], event, **data)
+
+
+# Instância global dos eventos de jobs
+event_hub = EventHub()
+metrics.register_collector("events", event_hub.stats)
@@ -0,0 +1,371 @@
+"""
+Evidências das consultas: página vista pelo robô guardada para auditoria (contestações)
+
+Depois da classificação, o handler lê a página numa única chamada ao browser (HTML, texto
+da região do resultado e, opcionalmente, screenshot) e entrega a captura a uma fila. Hash,
+compressão e gravação acontecem numa task própria, fora da consulta. Cada conteúdo é
+gravado uma vez só, endereçado pelo SHA-256 (páginas de erro idênticas viram um arquivo);
+um índice SQLite liga cada captura (plano, hash da carteirinha, resultado, motivo) aos
+conteúdos, com contagem de referências. Acima de EVIDENCE_MAX_MB, as capturas mais antigas
+saem e os conteúdos sem referência são apagados.
+"""
+import os
+import gzip
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.history import history_store
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    plan TEXT NOT NULL,
+    card_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    motivo TEXT,
+    regra TEXT,
+    url TEXT,
+    html TEXT,
+    text TEXT,
+    screenshot TEXT
+);
+CREATE INDEX IF NOT EXISTS captures_card ON captures (card_hash, ts);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Partes de uma captura: (coluna, extensão no disco, compressão)
+PARTS = (("html", ".html.gz", True), ("text", ".txt.gz", True), ("screenshot", ".png", False))
+
+MEDIA_TYPES = {".html.gz": "text/html; charset=utf-8", ".txt.gz": "text/plain; charset=utf-8", ".png": "image/png"}
+
+# HTML da página e texto da região usada na classificação, numa chamada só
+SNAPSHOT_SCRIPT = (
+    "(region) => {"
+    "const root = (region && region !== 'body' && document.querySelector(region)) || document.body;"
+    "return {html: document.documentElement.outerHTML, text: root ? root.innerText : ''};"
+    "}"
+)
+
+
+class EvidenceArchive:
+    """Arquivo de páginas por conteúdo (SHA-256 + gzip) com índice e limite de tamanho"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or os.getenv("EVIDENCE_DIR", "data/evidence"))
+        self.enabled = os.getenv("EVIDENCE_ENABLED", "false").lower() == "true"
+        # Resultados capturados: elegivel, nao_elegivel e/ou indeterminado
+        self.capture = {
+            item.strip() for item in os.getenv("EVIDENCE_CAPTURE", "nao_elegivel,indeterminado").split(",") if item.strip()
+        }
+        self.screenshot = os.getenv("EVIDENCE_SCREENSHOT", "false").lower() == "true"
+        self.max_bytes = int(float(os.getenv("EVIDENCE_MAX_MB", "500")) * 1024 * 1024)
+        self.max_part_bytes = int(os.getenv("EVIDENCE_MAX_PART_KB", "2048")) * 1024
+        self.compress_level = int(os.getenv("EVIDENCE_COMPRESS_LEVEL", "6"))
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv("EVIDENCE_QUEUE_SIZE", "200")))
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+        self.captured = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.failed = 0
+        self.pruned = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path / "index.db"), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def wants(self, outcome: str) -> bool:
+        """
+        Se a consulta com esse desfecho deve ser capturada
+
+        Args:
+            outcome: "elegivel", "nao_elegivel" ou "indeterminado"
+
+        Returns:
+            True se o arquivo está ligado e o desfecho está em EVIDENCE_CAPTURE
+        """
+        return self.enabled and outcome in self.capture
+
+    async def snapshot_page(self, page: Any, region: str = "body") -> Dict[str, Any]:
+        """
+        Lê a página atual (chamar com a sessão ainda emprestada)
+
+        Args:
+            page: Página do Playwright
+            region: Seletor da região do resultado (texto lido dela)
+
+        Returns:
+            url, html, text e screenshot (bytes ou None)
+        """
+        content = await page.evaluate(SNAPSHOT_SCRIPT, region)
+        screenshot = await page.screenshot(type="png", full_page=True) if self.screenshot else None
+        return {"url": page.url, "html": content["html"], "text": content["text"], "screenshot": screenshot}
+
+    def submit(
+        self,
+        plan_name: str,
+        numero_carteirinha: str,
+        result: str,
+        snapshot: Dict[str, Any],
+        motivo: Optional[str] = None,
+        regra: Optional[str] = None
+    ) -> bool:
+        """
+        Enfileira uma captura para gravação (não bloqueia)
+
+        Args:
+            plan_name: Plano
+            numero_carteirinha: Número da carteirinha (só o hash vai para o índice)
+            result: Desfecho da classificação
+            snapshot: Conteúdo lido por snapshot_page
+            motivo: Motivo da classificação
+            regra: Regra que decidiu
+
+        Returns:
+            False se a fila estava cheia (captura descartada)
+        """
+        try:
+            self._queue.put_nowait((
+                time.time(),
+                plan_name,
+                history_store.card_hash(numero_carteirinha),
+                result,
+                motivo,
+                regra,
+                snapshot,
+            ))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            metrics.inc("evidence_dropped")
+            return False
+        return True
+
+    def _encode(self, value: Any, compress: bool) -> Optional[bytes]:
+        if not value:
+            return None
+        data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        if compress:
+            data = data[:self.max_part_bytes]
+        return data
+
+    def _blob_path(self, digest: str, suffix: str) -> Path:
+        return self.path / "objects" / digest[:2] / f"{digest}{suffix}"
+
+    def _store_blob(self, conn: sqlite3.Connection, data: bytes, suffix: str, compress: bool, written: List[Path]) -> str:
+        """Grava o conteúdo se ainda não existir e incrementa a referência (arquivos novos vão para written)"""
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{digest}{suffix}"
+        if conn.execute("UPDATE blobs SET refs = refs + 1 WHERE hash = ?", (name,)).rowcount:
+            self.deduplicated += 1
+            return name
+        path = self._blob_path(digest, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        payload = gzip.compress(data, self.compress_level, mtime=0) if compress else data
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(payload)
+        tmp.replace(path)
+        written.append(path)
+        conn.execute("INSERT INTO blobs (hash, size, refs) VALUES (?, ?, 1)", (name, len(payload)))
+        self._total_bytes += len(payload)
+        return name
+
+    def _write(self, capture: Tuple) -> None:
+        ts, plan_name, card_hash, result, motivo, regra, snapshot = capture
+        with self._lock:
+            conn = self._connection()
+            written: List[Path] = []
+            conn.execute("BEGIN")
+            try:
+                names = {}
+                for column, suffix, compress in PARTS:
+                    data = self._encode(snapshot.get(column), compress)
+                    names[column] = self._store_blob(conn, data, suffix, compress, written) if data else None
+                conn.execute(
+                    "INSERT INTO captures (ts, plan, card_hash, result, motivo, regra, url, html, text, screenshot) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (ts, plan_name, card_hash, result, motivo, regra, snapshot.get("url"),
+                     names["html"], names["text"], names["screenshot"])
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn)
+                # Conteúdos gravados nesta transação não têm mais linha em blobs
+                for path in written:
+                    path.unlink(missing_ok=True)
+                raise
+            self.captured += 1
+            self._prune(conn)
+
+    def _rollback(self, conn: sqlite3.Connection) -> None:
+        """Desfaz a transação aberta e recalcula o total a partir do índice"""
+        conn.execute("ROLLBACK")
+        self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _prune(self, conn: sqlite3.Connection) -> None:
+        """Remove as capturas mais antigas (e conteúdos sem referência) até caber no limite"""
+        while self._total_bytes > self.max_bytes:
+            oldest = conn.execute("SELECT id, html, text, screenshot FROM captures ORDER BY id LIMIT 50").fetchall()
+            if not oldest:
+                return
+            orphans = []
+            removed = 0
+            conn.execute("BEGIN")
+            try:
+                for capture_id, *names in oldest:
+                    conn.execute("DELETE FROM captures WHERE id = ?", (capture_id,))
+                    for name in filter(None, names):
+                        size = conn.execute(
+                            "UPDATE blobs SET refs = refs - 1 WHERE hash = ? RETURNING CASE WHEN refs <= 0 THEN size END",
+                            (name,)
+                        ).fetchone()
+                        if size and size[0] is not None:
+                            orphans.append(name)
+                            self._total_bytes -= size[0]
+                    removed += 1
+                    if self._total_bytes <= self.max_bytes:
+                        break
+                conn.executemany("DELETE FROM blobs WHERE hash = ?", [(name,) for name in orphans])
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn)
+                raise
+            self.pruned += removed
+            for name in orphans:
+                digest, _, _ = name.partition(".")
+                self._blob_path(digest, name[len(digest):]).unlink(missing_ok=True)
+
+    async def _run(self) -> None:
+        while True:
+            capture = await self._queue.get()
+            try:
+                await asyncio.to_thread(self._write, capture)
+            except Exception as e:
+                self.failed += 1
+                metrics.inc("evidence_failed")
+                log_with_context(
+                    logger,
+                    "WARNING",
+                    f"Falha ao gravar evidência: {str(e)}",
+                    plan_name=capture[1],
+                    error_type=type(e).__name__
+                )
+            finally:
+                self._queue.task_done()
+
+    def start(self) -> None:
+        """Inicia a gravação em background (chamar dentro do event loop)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="evidence-writer")
+
+    async def flush(self) -> None:
+        """Espera a gravação do que está na fila"""
+        if self._task is not None:
+            await self._queue.join()
+            return
+        while not self._queue.empty():
+            await asyncio.to_thread(self._write, self._queue.get_nowait())
+            self._queue.task_done()
+
+    async def stop(self) -> None:
+        """Grava o que ficou na fila e para a task"""
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def close(self) -> None:
+        """Fecha a conexão com o índice"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def find(self, numero_carteirinha: str, plan_name: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Capturas de uma carteirinha, mais recentes primeiro
+
+        Args:
+            numero_carteirinha: Número da carteirinha
+            plan_name: Plano (opcional)
+            limit: Quantidade máxima
+
+        Returns:
+            Capturas com os nomes dos conteúdos
+        """
+        sql = "SELECT ts, plan, result, motivo, regra, url, html, text, screenshot FROM captures WHERE card_hash = ?"
+        params: List[Any] = [history_store.card_hash(numero_carteirinha)]
+        if plan_name:
+            sql += " AND plan = ?"
+            params.append(plan_name)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._connection().execute(sql, params).fetchall()
+        keys = ("ts", "plan", "result", "motivo", "regra", "url", "html", "text", "screenshot")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def read(self, name: str) -> Optional[Tuple[bytes, str]]:
+        """
+        Conteúdo de uma evidência, descomprimido
+
+        Args:
+            name: Nome do conteúdo (ex: "<sha256>.html.gz")
+
+        Returns:
+            (bytes, media type) ou None se o nome for inválido ou não existir
+        """
+        digest, _, _ = name.partition(".")
+        suffix = name[len(digest):]
+        if suffix not in MEDIA_TYPES or len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        path = self._blob_path(digest, suffix)
+        if not path.is_file():
+            return None
+        data = path.read_bytes()
+        return (gzip.decompress(data) if suffix.endswith(".gz") else data), MEDIA_TYPES[suffix]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "capture": sorted(self.capture),
+            "queued": self._queue.qsize(),
+            "captured": self.captured,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "pruned": self.pruned,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+# Instância global do arquivo de evidências
+evidence_archive = EvidenceArchive()
+metrics.register_collector("evidence", evidence_archive.stats)
@@ -0,0 +1,498 @@
+"""
+Histórico de consultas em SQLite local, gravado em lotes fora do caminho do webhook
+
+Cada consulta (plano, hash da carteirinha, resultado, origem do resultado, motivo, tempos
+dos passos, conta do portal e desfecho do callback) entra numa fila em memória; uma task
+grava a fila em lotes numa única transação. A mesma transação atualiza agregados por
+hora (contagens por resultado/erro e histograma de latência), e é deles que saem os
+endpoints de /analytics: percentis, taxa de elegíveis e erros custam algumas centenas de
+linhas agregadas por plano, não uma varredura nos milhões de linhas do histórico.
+"""
+import os
+import json
+import time
+import bisect
+import asyncio
+import hashlib
+import secrets
+import sqlite3
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checks (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    plan TEXT NOT NULL,
+    card_hash TEXT NOT NULL,
+    result TEXT NOT NULL,
+    source TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    reason TEXT,
+    error_type TEXT,
+    account TEXT,
+    duration_ms REAL NOT NULL,
+    callback_ms REAL,
+    callback_sent INTEGER,
+    steps TEXT
+);
+CREATE INDEX IF NOT EXISTS checks_ts ON checks (ts);
+CREATE INDEX IF NOT EXISTS checks_plan_ts ON checks (plan, ts);
+CREATE TABLE IF NOT EXISTS checks_hourly (
+    hour INTEGER NOT NULL,
+    plan TEXT NOT NULL,
+    result TEXT NOT NULL,
+    source TEXT NOT NULL,
+    error_type TEXT NOT NULL,
+    n INTEGER NOT NULL,
+    callback_failed INTEGER NOT NULL,
+    PRIMARY KEY (hour, plan, result, source, error_type)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latency_hourly (
+    hour INTEGER NOT NULL,
+    plan TEXT NOT NULL,
+    source TEXT NOT NULL,
+    bin INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (hour, plan, source, bin)
+) WITHOUT ROWID;
+"""
+
+# Limites (ms) do histograma agregado: progressão de 15% entre 10 ms e 10 min
+LATENCY_BINS_MS = tuple(round(10 * 1.15 ** i, 1) for i in range(80))
+
+# Consulta em andamento nesta task (preenchida por dispatch e handlers)
+current_check: ContextVar[Optional[Dict[str, Any]]] = ContextVar("current_check", default=None)
+
+
+@contextmanager
+def check_context() -> Iterator[Dict[str, Any]]:
+    """
+    Abre o registro da consulta da task atual (lido por annotate_check)
+
+    Returns:
+        Campos anotados durante a consulta
+    """
+    check: Dict[str, Any] = {}
+    token = current_check.set(check)
+    try:
+        yield check
+    finally:
+        current_check.reset(token)
+
+
+def annotate_check(**fields: Any) -> None:
+    """
+    Anota campos na consulta atual (nada acontece fora de check_context)
+
+    Args:
+        **fields: plan, source, reason, error_type, account ou steps
+    """
+    check = current_check.get()
+    if check is not None:
+        check.update(fields)
+
+
+def _hour(ts: float) -> int:
+    return int(ts // 3600) * 3600
+
+
+def _quantile(counts: Dict[int, int], total: int, q: float) -> float:
+    """Limite superior do bin que contém o quantil (como Histogram.quantile)"""
+    target = q * total
+    seen = 0
+    for index in sorted(counts):
+        seen += counts[index]
+        if seen >= target:
+            return LATENCY_BINS_MS[min(index, len(LATENCY_BINS_MS) - 1)]
+    return LATENCY_BINS_MS[-1]
+
+
+class HistoryStore:
+    """Histórico de consultas com gravação assíncrona em lotes e agregados por hora"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv("HISTORY_DB", "data/history.db")
+        self.enabled = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+        self.batch_size = int(os.getenv("HISTORY_BATCH_SIZE", "500"))
+        self.flush_interval = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2"))
+        # Fila limitada: com o disco lento, o histórico perde linhas em vez de segurar memória
+        self.queue_size = int(os.getenv("HISTORY_QUEUE_SIZE", "20000"))
+        self.retention_days = float(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+        self.rollup_retention_days = float(os.getenv("HISTORY_ROLLUP_RETENTION_DAYS", "400"))
+        # Sem HISTORY_HASH_KEY, a chave é gerada no primeiro uso e guardada neste arquivo
+        self._hash_key: Optional[bytes] = os.getenv("HISTORY_HASH_KEY", "").encode()[:64] or None
+        self.hash_key_configured = self._hash_key is not None
+        default_key_file = str(Path(self.path).with_name("history.key")) if self.path != ":memory:" else ""
+        self.hash_key_file = os.getenv("HISTORY_HASH_KEY_FILE", default_key_file)
+        self._key_lock = threading.Lock()
+        self._pending: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.batches = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _load_hash_key(self) -> bytes:
+        """
+        Lê a chave de hash_key_file ou gera uma aleatória e a grava (0600)
+
+        Sem chave, o hash de uma carteirinha de 6 a 12 dígitos seria revertido por força
+        bruta em minutos. Sem arquivo (HISTORY_DB=:memory:), a chave vale só para o processo.
+
+        Returns:
+            Chave do blake2b
+        """
+        if not self.hash_key_file:
+            log_with_context(logger, "WARNING", "HISTORY_HASH_KEY ausente: usando chave temporária (hashes mudam a cada início)")
+            return secrets.token_bytes(32)
+        path = Path(self.hash_key_file)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Grava num temporário e liga no nome final: quem lê nunca vê o arquivo pela metade
+            tmp = path.with_name(f".{path.name}.{secrets.token_hex(4)}")
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            try:
+                os.link(tmp, path)
+                log_with_context(
+                    logger, "WARNING",
+                    f"HISTORY_HASH_KEY ausente: chave do hash da carteirinha gerada em {path} "
+                    "(réplicas em outros hosts precisam da mesma HISTORY_HASH_KEY)"
+                )
+            except FileExistsError:
+                # Outro processo gerou a chave ao mesmo tempo: vale a dele
+                pass
+            finally:
+                tmp.unlink()
+        key = path.read_text().strip().encode()[:64]
+        if not key:
+            raise RuntimeError(f"Arquivo de chave vazio: {path}")
+        return key
+
+    def card_hash(self, numero_carteirinha: str) -> str:
+        """Hash estável da carteirinha com chave (não reversível por dicionário)"""
+        if self._hash_key is None:
+            with self._key_lock:
+                if self._hash_key is None:
+                    self._hash_key = self._load_hash_key()
+        return hashlib.blake2b(numero_carteirinha.encode(), digest_size=10, key=self._hash_key).hexdigest()
+
+    def record(
+        self,
+        plan_name: str,
+        numero_carteirinha: str,
+        result: str,
+        duration_ms: float,
+        check: Optional[Dict[str, Any]] = None,
+        callback_ms: Optional[float] = None,
+        callback_sent: Optional[bool] = None,
+        origin: str = "webhook"
+    ) -> None:
+        """
+        Enfileira uma consulta para gravação (não bloqueia)
+
+        Args:
+            plan_name: Nome do plano recebido (substituído pelo plano resolvido, se anotado)
+            numero_carteirinha: Número da carteirinha (só o hash é gravado)
+            result: Status devolvido
+            duration_ms: Duração da consulta
+            check: Campos anotados durante a consulta (ver check_context)
+            callback_ms: Duração do callback (None = sem callback)
+            callback_sent: Se o callback foi entregue (None = sem callback)
+            origin: Entrada da consulta ("webhook" ou "bulk")
+        """
+        if not self.enabled:
+            return
+        if len(self._pending) >= self.queue_size:
+            self.dropped += 1
+            metrics.inc("history_dropped")
+            return
+        check = check or {}
+        steps = check.get("steps")
+        self._pending.append((
+            time.time(),
+            check.get("plan") or plan_name.strip().lower(),
+            self.card_hash(numero_carteirinha),
+            result,
+            check.get("source", "portal"),
+            origin,
+            check.get("reason"),
+            check.get("error_type"),
+            check.get("account"),
+            round(duration_ms, 1),
+            round(callback_ms, 1) if callback_ms is not None else None,
+            int(callback_sent) if callback_sent is not None else None,
+            json.dumps(steps) if steps else None,
+        ))
+        self.recorded += 1
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _write(self, rows: List[Tuple]) -> None:
+        counts: Counter = Counter()
+        failed: Counter = Counter()
+        latency: Counter = Counter()
+        for ts, plan, _, result, source, _, _, error_type, _, duration_ms, _, callback_sent, _ in rows:
+            key = (_hour(ts), plan, result, source, error_type or "")
+            counts[key] += 1
+            if callback_sent == 0:
+                failed[key] += 1
+            latency[(_hour(ts), plan, source, bisect.bisect_left(LATENCY_BINS_MS, duration_ms))] += 1
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                conn.executemany(
+                    "INSERT INTO checks (ts, plan, card_hash, result, source, origin, reason, error_type, "
+                    "account, duration_ms, callback_ms, callback_sent, steps) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.executemany(
+                    "INSERT INTO checks_hourly (hour, plan, result, source, error_type, n, callback_failed) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (hour, plan, result, source, error_type) DO UPDATE SET "
+                    "n = n + excluded.n, callback_failed = callback_failed + excluded.callback_failed",
+                    [(*key, n, failed[key]) for key, n in counts.items()]
+                )
+                conn.executemany(
+                    "INSERT INTO latency_hourly (hour, plan, source, bin, n) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (hour, plan, source, bin) DO UPDATE SET n = n + excluded.n",
+                    [(*key, n) for key, n in latency.items()]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._purge(conn)
+
+    def _purge(self, conn: sqlite3.Connection) -> None:
+        # Retenção aplicada no máximo uma vez por hora (DELETE pelo índice de ts)
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        conn.execute("DELETE FROM checks WHERE ts < ?", (now - self.retention_days * 86400,))
+        cutoff = _hour(now - self.rollup_retention_days * 86400)
+        conn.execute("DELETE FROM checks_hourly WHERE hour < ?", (cutoff,))
+        conn.execute("DELETE FROM latency_hourly WHERE hour < ?", (cutoff,))
+
+    async def flush(self) -> int:
+        """
+        Grava o que está na fila, em lotes de HISTORY_BATCH_SIZE
+
+        Returns:
+            Linhas gravadas
+        """
+        written = 0
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                self.write_errors += 1
+                metrics.inc("history_write_errors")
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Falha ao gravar histórico: {str(e)}",
+                    rows=len(batch),
+                    error_type=type(e).__name__
+                )
+                return written
+            written += len(batch)
+            self.written += len(batch)
+            self.batches += 1
+        return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        """Inicia a gravação em background (chamar dentro do event loop)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name="history-writer")
+
+    async def stop(self) -> None:
+        """Para a gravação e grava o que ficou na fila"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def close(self) -> None:
+        """Fecha a conexão com o SQLite"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql: str, params: Tuple) -> List[Tuple]:
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @staticmethod
+    def _filters(since: float, plan: Optional[str], source: Optional[str] = None) -> Tuple[str, Tuple]:
+        clauses = ["hour >= ?"]
+        params: List[Any] = [_hour(since)]
+        if plan:
+            clauses.append("plan = ?")
+            params.append(plan.strip().lower())
+        if source:
+            clauses.append("source = ?")
+            params.append(source)
+        return " AND ".join(clauses), tuple(params)
+
+    def latency(self, hours: float, plan: Optional[str] = None, source: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Percentis de latência por plano (histograma agregado, precisão de ~15%)
+
+        Args:
+            hours: Janela (horas cheias até agora)
+            plan: Plano (opcional)
+            source: Origem do resultado (ex: "portal", "cache"; opcional)
+
+        Returns:
+            count, p50, p90, p95 e p99 (ms) por plano
+        """
+        where, params = self._filters(time.time() - hours * 3600, plan, source)
+        rows = self._query(f"SELECT plan, bin, SUM(n) FROM latency_hourly WHERE {where} GROUP BY plan, bin", params)
+        bins: Dict[str, Dict[int, int]] = {}
+        for plan_name, index, n in rows:
+            bins.setdefault(plan_name, {})[index] = n
+        plans = {}
+        for plan_name, counts in sorted(bins.items()):
+            total = sum(counts.values())
+            plans[plan_name] = {
+                "count": total,
+                **{f"p{int(q * 100)}": _quantile(counts, total, q) for q in (0.5, 0.9, 0.95, 0.99)},
+            }
+        return {"hours": hours, "source": source, "plans": plans}
+
+    def eligibility(self, hours: float, interval: str = "hour", plan: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Série da taxa de elegíveis por plano
+
+        Args:
+            hours: Janela (horas cheias até agora)
+            interval: "hour" ou "day" (dias UTC)
+            plan: Plano (opcional)
+
+        Returns:
+            Pontos (início do intervalo, total, elegíveis, taxa) por plano
+        """
+        step = 86400 if interval == "day" else 3600
+        where, params = self._filters(time.time() - hours * 3600, plan)
+        rows = self._query(
+            f"SELECT (hour / {step}) * {step} AS bucket, plan, SUM(n), "
+            f"SUM(CASE WHEN result = 'elegivel' THEN n ELSE 0 END) "
+            f"FROM checks_hourly WHERE {where} GROUP BY bucket, plan ORDER BY bucket",
+            params
+        )
+        plans: Dict[str, List[Dict[str, Any]]] = {}
+        for bucket, plan_name, total, eligible in rows:
+            plans.setdefault(plan_name, []).append({
+                "start": int(bucket),
+                "total": total,
+                "elegivel": eligible,
+                "rate": round(eligible / total, 4) if total else 0.0,
+            })
+        return {"hours": hours, "interval": interval, "plans": plans}
+
+    def errors(self, hours: float, plan: Optional[str] = None, top_reasons: int = 10) -> Dict[str, Any]:
+        """
+        Erros por plano: tipos de erro, carteirinhas inválidas, callbacks falhos e motivos mais comuns
+
+        Args:
+            hours: Janela (horas cheias até agora)
+            plan: Plano (opcional)
+            top_reasons: Motivos de não elegibilidade mais comuns por plano (lidos do histórico bruto)
+
+        Returns:
+            Resumo por plano
+        """
+        since = time.time() - hours * 3600
+        where, params = self._filters(since, plan)
+        rows = self._query(
+            f"SELECT plan, source, error_type, SUM(n), SUM(callback_failed) "
+            f"FROM checks_hourly WHERE {where} GROUP BY plan, source, error_type",
+            params
+        )
+        plans: Dict[str, Dict[str, Any]] = {}
+        for plan_name, source, error_type, n, callback_failed in rows:
+            entry = plans.setdefault(plan_name, {
+                "total": 0, "errors": 0, "by_type": {}, "invalid_card": 0, "callback_failed": 0, "reasons": {},
+            })
+            entry["total"] += n
+            entry["callback_failed"] += callback_failed
+            if source == "invalid_card":
+                entry["invalid_card"] += n
+            if error_type:
+                entry["errors"] += n
+                entry["by_type"][error_type] = entry["by_type"].get(error_type, 0) + n
+        for entry in plans.values():
+            entry["error_rate"] = round(entry["errors"] / entry["total"], 4) if entry["total"] else 0.0
+
+        # Motivos: texto livre (alta cardinalidade), agrupados só na janela pedida pelo índice (plan, ts)
+        for plan_name, entry in plans.items():
+            reasons = self._query(
+                "SELECT reason, COUNT(*) AS n FROM checks WHERE plan = ? AND ts >= ? AND reason IS NOT NULL "
+                "GROUP BY reason ORDER BY n DESC LIMIT ?",
+                (plan_name, since, top_reasons)
+            )
+            entry["reasons"] = dict(reasons)
+        return {"hours": hours, "plans": plans}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "queued": len(self._pending),
+            "recorded": self.recorded,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+        }
+
+
+# Instância global do histórico
+history_store = HistoryStore()
+metrics.register_collector("history", history_store.stats)
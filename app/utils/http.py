@@ -1,73 +1,283 @@
 """
 Cliente HTTP para envio de callbacks com retry e timeout
+
+Cada requisição pode trazer o próprio destino do callback (validado contra a allowlist),
+então uma instância atende várias clínicas. Cada host de destino tem um cliente keep-alive
+próprio, limite de envios simultâneos e saúde própria: os callbacks de um destino fora do
+ar esperam a pausa dele sem ocupar conexões nem atrasar os callbacks dos outros.
 """
 import asyncio
 import os
-from typing import Dict, Any
+import time
+import fnmatch
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
 import httpx
+from app.utils.metrics import metrics
 from app.utils.logger import logger, log_with_context
 from app.schemas import CallbackResponse
 
 
+class CallbackDestinationError(ValueError):
+    """URL de callback recusada (formato, esquema ou host fora da allowlist)"""
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}".lower()
+
+
+class CallbackHost:
+    """Cliente keep-alive, limite de concorrência e saúde de um host de destino"""
+
+    def __init__(
+        self,
+        origin: str,
+        concurrency: int,
+        max_keepalive: int,
+        keepalive_expiry: float,
+        timeout: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.origin = origin
+        self.client = httpx.AsyncClient(
+            transport=transport,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            headers={"Content-Type": "application/json"}
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.in_flight = 0
+        # Envios em andamento, inclusive entre tentativas (o cliente não pode ser fechado)
+        self.senders = 0
+        self.sent = 0
+        self.failed = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_error: Optional[str] = None
+        self.last_used = time.monotonic()
+
+    @property
+    def healthy(self) -> bool:
+        return self.open_until <= time.monotonic()
+
+    def record(self, success: bool, threshold: int, cooldown: float, error: Optional[str] = None) -> None:
+        """
+        Registra o resultado de uma tentativa
+
+        Args:
+            success: Se o destino respondeu 200
+            threshold: Falhas seguidas que tiram o host de uso
+            cooldown: Tempo (s) fora de uso
+            error: Descrição da falha
+        """
+        if success:
+            self.sent += 1
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            return
+        self.failed += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.consecutive_failures >= threshold and self.healthy:
+            self.open_until = time.monotonic() + cooldown
+            metrics.inc("callback_hosts_opened")
+            log_with_context(
+                logger,
+                "WARNING",
+                "Destino de callback marcado como indisponível",
+                callback_host=self.origin,
+                consecutive_failures=self.consecutive_failures,
+                cooldown_s=cooldown
+            )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "senders": self.senders,
+            "sent": self.sent,
+            "failed": self.failed,
+            "consecutive_failures": self.consecutive_failures,
+            "retry_in_s": round(max(0.0, self.open_until - time.monotonic()), 1),
+            "last_error": self.last_error,
+        }
+
+
 class HTTPCallbackClient:
     """Cliente HTTP para envio de callbacks"""
-    
-    def __init__(self):
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.callback_url = os.getenv(
-            "WEBHOOK_CALLBACK_URL", 
+            "WEBHOOK_CALLBACK_URL",
             "https://web-hook.imca.app.br/webhook/a4c4db28-1c03-4233-959d-6f89630daae4"
         )
         self.timeout = int(os.getenv("WEBHOOK_TIMEOUT", "10"))
         self.max_retries = int(os.getenv("WEBHOOK_MAX_RETRIES", "3"))
-    
-    async def send_callback(self, payload: CallbackResponse) -> bool:
+        # Hosts aceitos em callback_url (padrões fnmatch, ex: "*.clinica.com.br"; o host padrão sempre vale)
+        self.allowlist = [
+            pattern.strip().lower()
+            for pattern in os.getenv("WEBHOOK_CALLBACK_ALLOWLIST", "").split(",")
+            if pattern.strip()
+        ]
+        self.allow_http = os.getenv("WEBHOOK_CALLBACK_ALLOW_HTTP", "false").lower() == "true"
+        self.max_hosts = int(os.getenv("CALLBACK_MAX_HOSTS", "32"))
+        self.host_concurrency = int(os.getenv("CALLBACK_HOST_CONCURRENCY", "10"))
+        self.host_max_keepalive = int(os.getenv("CALLBACK_HOST_MAX_KEEPALIVE", "5"))
+        self.keepalive_expiry = float(os.getenv("CALLBACK_KEEPALIVE_EXPIRY", "30"))
+        self.failure_threshold = int(os.getenv("CALLBACK_HOST_FAILURE_THRESHOLD", "5"))
+        self.cooldown = float(os.getenv("CALLBACK_HOST_COOLDOWN_S", "30"))
+        self._transport = transport
+        self._hosts: "OrderedDict[str, CallbackHost]" = OrderedDict()
+        self.evicted = 0
+
+    def _host_allowed(self, hostname: str, port: Optional[int]) -> bool:
+        candidates = [hostname] if port is None else [hostname, f"{hostname}:{port}"]
+        return any(
+            fnmatch.fnmatchcase(candidate, pattern)
+            for pattern in self.allowlist
+            for candidate in candidates
+        )
+
+    def resolve_destination(self, callback_url: Optional[str]) -> Optional[str]:
+        """
+        Valida a URL de callback de uma requisição
+
+        Args:
+            callback_url: URL informada (None = destino padrão)
+
+        Returns:
+            URL aceita ou None para o destino padrão
+
+        Raises:
+            CallbackDestinationError: Se a URL for inválida ou o host não estiver na allowlist
+        """
+        if callback_url is None:
+            return None
+        callback_url = callback_url.strip()
+        try:
+            parts = urlsplit(callback_url)
+            port = parts.port
+        except ValueError:
+            raise CallbackDestinationError("URL de callback inválida")
+        if parts.scheme not in ("https", "http") or not parts.hostname:
+            raise CallbackDestinationError("URL de callback deve ser http(s) absoluta")
+        if parts.scheme == "http" and not self.allow_http:
+            raise CallbackDestinationError("URL de callback deve usar https")
+        if parts.username or parts.password:
+            raise CallbackDestinationError("URL de callback não pode conter credenciais")
+        if _origin(callback_url) == _origin(self.callback_url):
+            return callback_url
+        if not self._host_allowed(parts.hostname.lower(), port):
+            raise CallbackDestinationError(f"Host de callback não permitido: {parts.hostname}")
+        return callback_url
+
+    async def _host(self, origin: str) -> CallbackHost:
+        """Host do destino, já contado como em uso pelo chamador (devolver com host.senders -= 1)"""
+        host = self._hosts.get(origin)
+        if host is not None:
+            self._hosts.move_to_end(origin)
+            host.senders += 1
+            return host
+        host = CallbackHost(
+            origin,
+            self.host_concurrency,
+            self.host_max_keepalive,
+            self.keepalive_expiry,
+            self.timeout,
+            self._transport
+        )
+        self._hosts[origin] = host
+        host.senders += 1
+        # Pool limitado: fecha o host sem envios (nem retries aguardando) usado há mais tempo
+        while len(self._hosts) > self.max_hosts:
+            idle = next((key for key, item in self._hosts.items() if item.senders == 0 and key != origin), None)
+            if idle is None:
+                break
+            await self._hosts.pop(idle).client.aclose()
+            self.evicted += 1
+        return host
+
+    async def send_callback(self, payload: CallbackResponse, callback_url: Optional[str] = None) -> bool:
         """
         Envia callback com retry exponencial
-        
+
         Args:
             payload: Dados para envio
-            
+            callback_url: Destino já validado por resolve_destination (None = destino padrão)
+
         Returns:
             True se sucesso, False caso contrário
         """
+        url = callback_url or self.callback_url
+        host = await self._host(_origin(url))
+        try:
+            return await self._send(host, url, payload)
+        finally:
+            host.senders -= 1
+
+    async def _send(self, host: CallbackHost, url: str, payload: CallbackResponse) -> bool:
+        body = payload.model_dump()
         log_with_context(
-            logger, 
-            "INFO", 
+            logger,
+            "INFO",
             "Iniciando envio de callback",
-            callback_url=self.callback_url,
-            payload=payload.dict()
+            callback_url=url,
+            payload=body
         )
-        
+
         for attempt in range(1, self.max_retries + 1):
+            if not host.healthy:
+                # Destino fora do ar: espera o fim da pausa e tenta (cada tentativa espera no máximo uma pausa)
+                wait_time = max(0.0, host.open_until - time.monotonic())
+                metrics.inc("callbacks_deferred")
+                log_with_context(
+                    logger,
+                    "WARNING",
+                    f"Destino de callback indisponível: aguardando {wait_time:.1f}s",
+                    callback_host=host.origin,
+                    attempt=attempt
+                )
+                await asyncio.sleep(wait_time)
+
             try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(
-                        self.callback_url,
-                        json=payload.dict(),
-                        headers={"Content-Type": "application/json"}
+                async with host.semaphore:
+                    host.in_flight += 1
+                    host.last_used = time.monotonic()
+                    try:
+                        response = await host.client.post(url, json=body)
+                    finally:
+                        host.in_flight -= 1
+
+                if response.status_code == 200:
+                    host.record(True, self.failure_threshold, self.cooldown)
+                    log_with_context(
+                        logger,
+                        "INFO",
+                        "Callback enviado com sucesso",
+                        attempt=attempt,
+                        status_code=response.status_code,
+                        response_text=response.text[:500]  # Limitar tamanho do log
+                    )
+                    return True
+                else:
+                    host.record(False, self.failure_threshold, self.cooldown, f"HTTP {response.status_code}")
+                    log_with_context(
+                        logger,
+                        "WARNING",
+                        f"Callback falhou com status {response.status_code}",
+                        attempt=attempt,
+                        status_code=response.status_code,
+                        response_text=response.text[:500]
                     )
-                    
-                    if response.status_code == 200:
-                        log_with_context(
-                            logger,
-                            "INFO",
-                            "Callback enviado com sucesso",
-                            attempt=attempt,
-                            status_code=response.status_code,
-                            response_text=response.text[:500]  # Limitar tamanho do log
-                        )
-                        return True
-                    else:
-                        log_with_context(
-                            logger,
-                            "WARNING",
-                            f"Callback falhou com status {response.status_code}",
-                            attempt=attempt,
-                            status_code=response.status_code,
-                            response_text=response.text[:500]
-                        )
-                        
+
             except Exception as e:
+                host.record(False, self.failure_threshold, self.cooldown, type(e).__name__)
                 log_with_context(
                     logger,
                     "ERROR",
@@ -76,7 +286,7 @@ class HTTPCallbackClient:
                     error_type=type(e).__name__,
                     error_message=str(e)
                 )
-            
+
             # Retry com backoff exponencial (exceto na última tentativa)
             if attempt < self.max_retries:
                 wait_time = 2 ** attempt  # 2, 4, 8 segundos
@@ -88,7 +298,7 @@ class HTTPCallbackClient:
                     wait_time=wait_time
                 )
                 await asyncio.sleep(wait_time)
-        
+
         log_with_context(
             logger,
             "ERROR",
@@ -97,21 +307,39 @@ class HTTPCallbackClient:
         )
         return False
 
+    async def close(self) -> None:
+        """Fecha os clientes de todos os hosts"""
+        hosts: List[CallbackHost] = list(self._hosts.values())
+        self._hosts.clear()
+        for host in hosts:
+            await host.client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_hosts": self.max_hosts,
+            "host_concurrency": self.host_concurrency,
+            "allowlist": self.allowlist,
+            "evicted": self.evicted,
+            "hosts": {origin: host.to_dict() for origin, host in self._hosts.items()},
+        }
+
 
 # Instância global do cliente
 http_client = HTTPCallbackClient()
+metrics.register_collector("callbacks", http_client.stats)
 
 
-async def send_callback(numero: str, status: str) -> bool:
+async def send_callback(numero: str, status: str, callback_url: Optional[str] = None) -> bool:
     """
     Função helper para envio de callback
-    
+
     Args:
         numero: Número para callback
         status: Status da elegibilidade
-        
+        callback_url: Destino da requisição (None = WEBHOOK_CALLBACK_URL)
+
     Returns:
         True se sucesso, False caso contrário
     """
     payload = CallbackResponse(numero=numero, status=status)
-    return await http_client.send_callback(payload) 
\ No newline at end of file
+    return await http_client.send_callback(payload, callback_url)
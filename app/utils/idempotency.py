@@ -0,0 +1,373 @@
+"""
+Chaves de idempotência do /webhook/in persistidas em SQLite local (com TTL)
+
+O chatbot reenvia o webhook quando o próprio timeout expira. Cada chave guarda o job
+original e, depois de concluído, o resultado: repetições custam uma consulta no SQLite
+em vez de uma nova sessão no portal e um callback duplicado. As operações no SQLite
+rodam em threads (asyncio.to_thread), fora do event loop do webhook.
+
+Com um backend de estado compartilhado (STATE_BACKEND_URL), as chaves ficam nele e a
+deduplicação vale entre réplicas.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+from app.utils.metrics import metrics
+from app.utils.state import StateBackend, StateBackendError, state_backend
+from app.utils.logger import logger, log_with_context
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    status TEXT,
+    callback_sent INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+
+class IdempotencyConflict(Exception):
+    """Chave informada pelo cliente reutilizada com outro payload"""
+
+
+class IdempotencyRecord(NamedTuple):
+    """Job registrado para uma chave"""
+    key: str
+    fingerprint: str
+    job_id: str
+    status: Optional[str]
+    callback_sent: bool
+    created_at: float
+    expires_at: float
+
+
+def _digest(value: str) -> str:
+    # Chaves de tamanho fixo: o cliente controla o header e o payload
+    return hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+
+def request_fingerprint(
+    plan_name: str,
+    numero_carteirinha: str,
+    numero: str,
+    callback_url: Optional[str] = None
+) -> str:
+    """
+    Identidade do pedido (plano, carteirinha normalizada, número e destino do callback)
+
+    Args:
+        plan_name: Nome do plano
+        numero_carteirinha: Número da carteirinha já normalizado
+        numero: Número para callback
+        callback_url: Destino do callback (None = padrão)
+
+    Returns:
+        Digest do pedido
+    """
+    identity = f"{plan_name.strip().lower()}|{numero_carteirinha}|{numero.strip()}"
+    if callback_url:
+        identity += f"|{callback_url}"
+    return _digest(identity)
+
+
+class IdempotencyStore:
+    """Registro de jobs por chave de idempotência em SQLite (WAL, aberto no primeiro uso) ou no backend compartilhado"""
+
+    def __init__(self, path: Optional[str] = None, backend: Optional[StateBackend] = None):
+        self.path = path or os.getenv("IDEMPOTENCY_DB", "data/idempotency.db")
+        backend = backend if backend is not None else state_backend
+        self._backend = backend if backend.shared else None
+        self.enabled = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+        self.ttl = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+        # Sem header, pedidos iguais dentro da mesma janela (ou da anterior) são repetições
+        self.window = float(os.getenv("IDEMPOTENCY_WINDOW", "300"))
+        self.purge_every = int(os.getenv("IDEMPOTENCY_PURGE_EVERY", "500"))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._claim_lock = asyncio.Lock()
+        self._claims_since_purge = 0
+        self.hits = 0
+        self.claims = 0
+        self.conflicts = 0
+        self.backend_errors = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def keys_for(self, idempotency_key: Optional[str], fingerprint: str, now: Optional[float] = None) -> Tuple[str, ...]:
+        """
+        Chaves a consultar para o pedido
+
+        Com header, a chave é a informada pelo cliente. Sem header, a chave deriva do
+        pedido e da janela de tempo atual; a janela anterior também é consultada para que
+        repetições logo após a virada da janela sejam reconhecidas.
+
+        Args:
+            idempotency_key: Header Idempotency-Key (opcional)
+            fingerprint: Identidade do pedido
+            now: Instante de referência (testes)
+
+        Returns:
+            Chave a registrar seguida das alternativas
+        """
+        if idempotency_key:
+            return (_digest(f"header|{idempotency_key}"),)
+        bucket = int((now if now is not None else time.time()) // self.window)
+        return (_digest(f"{fingerprint}|{bucket}"), _digest(f"{fingerprint}|{bucket - 1}"))
+
+    def _select(self, key: str, now: float) -> Optional[IdempotencyRecord]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT key, fingerprint, job_id, status, callback_sent, created_at, expires_at "
+                "FROM idempotency WHERE key = ? AND expires_at > ?",
+                (key, now)
+            ).fetchone()
+        return IdempotencyRecord(row[0], row[1], row[2], row[3], bool(row[4]), row[5], row[6]) if row else None
+
+    def _insert_local(self, record: IdempotencyRecord) -> None:
+        with self._lock:
+            # Chave expirada (ainda não removida) é substituída
+            self._connection().execute(
+                "INSERT OR REPLACE INTO idempotency "
+                "(key, fingerprint, job_id, status, callback_sent, created_at, expires_at) "
+                "VALUES (?, ?, ?, NULL, 0, ?, ?)",
+                (record.key, record.fingerprint, record.job_id, record.created_at, record.expires_at)
+            )
+
+    def _update_local(self, key: str, fields: Dict[str, Any]) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = [int(value) if isinstance(value, bool) else value for value in fields.values()]
+        with self._lock:
+            self._connection().execute(f"UPDATE idempotency SET {assignments} WHERE key = ?", (*values, key))
+
+    def _claim_resend_local(self, key: str, now: float) -> bool:
+        with self._lock:
+            return self._connection().execute(
+                "UPDATE idempotency SET callback_sent = 1 "
+                "WHERE key = ? AND status IS NOT NULL AND callback_sent = 0 AND expires_at > ?",
+                (key, now)
+            ).rowcount == 1
+
+    def _delete_local(self, key: str) -> None:
+        with self._lock:
+            self._connection().execute("DELETE FROM idempotency WHERE key = ?", (key,))
+
+    async def _row(self, key: str, now: float) -> Optional[IdempotencyRecord]:
+        if self._backend is not None:
+            raw = await self._backend.get(f"idempotency:{key}")
+            return IdempotencyRecord(*json.loads(raw)) if raw is not None else None
+        # SQLite fora do event loop (fsync e disputa do WAL entre processos)
+        return await asyncio.to_thread(self._select, key, now)
+
+    async def _insert(self, record: IdempotencyRecord) -> bool:
+        if self._backend is not None:
+            # Atômico entre réplicas: só uma registra o job
+            return await self._backend.add(f"idempotency:{record.key}", json.dumps(record), self.ttl)
+        await asyncio.to_thread(self._insert_local, record)
+        return True
+
+    async def _update(self, key: str, **fields: Any) -> None:
+        if self._backend is None:
+            await asyncio.to_thread(self._update_local, key, fields)
+            return
+        now = time.time()
+        record = await self._row(key, now)
+        if record is not None:
+            record = record._replace(**fields)
+            await self._backend.set(f"idempotency:{key}", json.dumps(record), max(1.0, record.expires_at - now))
+
+    async def claim(self, keys: Sequence[str], fingerprint: str) -> Tuple[IdempotencyRecord, bool]:
+        """
+        Registra um novo job ou retorna o job original
+
+        Args:
+            keys: Chave a registrar seguida das alternativas (ver keys_for)
+            fingerprint: Identidade do pedido
+
+        Returns:
+            (registro, True se o job é novo)
+
+        Raises:
+            IdempotencyConflict: Se a chave já pertence a outro pedido
+        """
+        now = time.time()
+        # Leitura e registro sem outra repetição no meio (o SQLite roda em threads)
+        async with self._claim_lock:
+            record = IdempotencyRecord(keys[0], fingerprint, uuid.uuid4().hex[:16], None, False, now, now + self.ttl)
+            try:
+                # Segunda volta só se outra réplica registrou a chave entre a leitura e a escrita
+                for _ in (1, 2):
+                    existing = await self._existing(keys, fingerprint, now)
+                    if existing is not None:
+                        return existing, False
+                    if await self._insert(record):
+                        break
+            except StateBackendError as e:
+                # Sem o backend, o pedido é processado (sem deduplicação) em vez de recusado
+                self.backend_errors += 1
+                log_with_context(logger, "WARNING", f"Idempotência indisponível: {str(e)}", job_id=record.job_id)
+                return record, True
+            self.claims += 1
+            self._claims_since_purge += 1
+            if self._claims_since_purge >= self.purge_every:
+                self._claims_since_purge = 0
+                await asyncio.to_thread(self._purge, now)
+            return record, True
+
+    async def _existing(self, keys: Sequence[str], fingerprint: str, now: float) -> Optional[IdempotencyRecord]:
+        for key in keys:
+            existing = await self._row(key, now)
+            if existing is None:
+                continue
+            if existing.fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyConflict("Idempotency-Key já usada com outro payload")
+            self.hits += 1
+            metrics.inc("webhook_duplicates")
+            return existing
+        return None
+
+    async def _write(self, key: str, **fields: Any) -> None:
+        try:
+            await self._update(key, **fields)
+        except StateBackendError as e:
+            self.backend_errors += 1
+            log_with_context(logger, "WARNING", f"Idempotência indisponível: {str(e)}")
+
+    async def get(self, key: str) -> Optional[IdempotencyRecord]:
+        """
+        Job registrado para a chave
+
+        Args:
+            key: Chave registrada
+
+        Returns:
+            Registro ou None se ausente/expirado
+        """
+        try:
+            return await self._row(key, time.time())
+        except StateBackendError as e:
+            self.backend_errors += 1
+            log_with_context(logger, "WARNING", f"Idempotência indisponível: {str(e)}")
+            return None
+
+    async def complete(self, key: str, status: str, callback_sent: bool) -> None:
+        """
+        Grava o resultado do job
+
+        Args:
+            key: Chave registrada
+            status: Status da elegibilidade
+            callback_sent: Se o callback foi entregue (False libera o reenvio por outra repetição)
+        """
+        await self._write(key, status=status, callback_sent=callback_sent)
+        if self._backend is not None and not callback_sent:
+            try:
+                await self._backend.delete(f"idempotency_resend:{key}")
+            except StateBackendError as e:
+                self.backend_errors += 1
+                log_with_context(logger, "WARNING", f"Idempotência indisponível: {str(e)}")
+
+    async def claim_resend(self, key: str) -> bool:
+        """
+        Reserva o reenvio do callback de um job concluído sem entrega
+
+        Repetições simultâneas veem o mesmo registro sem callback; só a que reserva reenvia.
+        A reserva vale até complete gravar o desfecho do reenvio.
+
+        Args:
+            key: Chave registrada
+
+        Returns:
+            True se esta repetição deve reenviar o callback
+        """
+        if self._backend is None:
+            return await asyncio.to_thread(self._claim_resend_local, key, time.time())
+        try:
+            record = await self._row(key, time.time())
+            if record is None or record.status is None or record.callback_sent:
+                return False
+            return await self._backend.add(f"idempotency_resend:{key}", "1", self.ttl)
+        except StateBackendError as e:
+            # Sem o backend, o callback é reenviado (duplicado em vez de perdido)
+            self.backend_errors += 1
+            log_with_context(logger, "WARNING", f"Idempotência indisponível: {str(e)}")
+            return True
+
+    async def release(self, key: str) -> None:
+        """
+        Libera a chave (job falhou antes de ter resultado): a próxima repetição roda de novo
+
+        Args:
+            key: Chave registrada
+        """
+        if self._backend is None:
+            await asyncio.to_thread(self._delete_local, key)
+            return
+        try:
+            await self._backend.delete(f"idempotency:{key}")
+        except StateBackendError as e:
+            self.backend_errors += 1
+            log_with_context(logger, "WARNING", f"Idempotência indisponível: {str(e)}")
+
+    def _purge(self, now: float) -> int:
+        if self._backend is not None:
+            # O backend expira as chaves sozinho
+            return 0
+        with self._lock:
+            removed = self._connection().execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,)).rowcount
+        if removed:
+            log_with_context(logger, "INFO", "Chaves de idempotência expiradas removidas", removed=removed)
+        return removed
+
+    def purge(self) -> int:
+        """
+        Remove as chaves expiradas
+
+        Returns:
+            Quantidade removida
+        """
+        return self._purge(time.time())
+
+    def close(self) -> None:
+        """Fecha a conexão com o SQLite"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "ttl_s": self.ttl,
+            "window_s": self.window,
+            "claims": self.claims,
+            "duplicates": self.hits,
+            "conflicts": self.conflicts,
+            "backend": self._backend.name if self._backend is not None else "sqlite",
+            "backend_errors": self.backend_errors,
+        }
+
+
+# Instância global do registro de idempotência
+idempotency_store = IdempotencyStore()
+metrics.register_collector("idempotency", idempotency_store.stats)
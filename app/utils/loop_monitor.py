@@ -0,0 +1,139 @@
+"""
+Monitor do event loop: atraso (lag) contínuo e detecção de chamadas bloqueantes com a pilha
+"""
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+# Buckets (ms) do histograma de lag: o interesse está nos atrasos pequenos
+LAG_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+class LoopMonitor:
+    """
+    Mede o lag do event loop e denuncia bloqueios
+
+    Uma task acorda a cada LOOP_MONITOR_INTERVAL_MS e registra quanto atrasou. Um thread
+    vigia o último batimento da task: se o loop ficar parado mais que LOOP_BLOCK_THRESHOLD_MS,
+    a pilha do thread do loop é capturada enquanto o bloqueio ainda acontece.
+    """
+
+    def __init__(self):
+        self.interval = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000
+        self.block_threshold = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250")) / 1000
+        self.enabled = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+        self.blocks: Deque[Dict[str, Any]] = deque(maxlen=int(os.getenv("LOOP_BLOCK_HISTORY", "20")))
+        self.blocked_total = 0
+        self.last_lag_ms = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def record_lag(self, lag_ms: float) -> None:
+        """
+        Registra um atraso medido
+
+        Args:
+            lag_ms: Atraso do loop em ms
+        """
+        self.last_lag_ms = lag_ms
+        metrics.observe("event_loop_lag_ms", lag_ms, LAG_BUCKETS_MS)
+        metrics.set_gauge("event_loop_lag_ms", round(lag_ms, 2))
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record_lag(max(now - expected, 0.0) * 1000)
+
+    def capture_stack(self) -> List[str]:
+        """Pilha atual do thread do event loop (do quadro mais externo para o mais interno)"""
+        frame = sys._current_frames().get(self._loop_thread_id) if self._loop_thread_id else None
+        if frame is None:
+            return []
+        return [line.rstrip() for line in traceback.format_stack(frame)]
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stop.wait(self.block_threshold / 2):
+            blocked_for = time.monotonic() - self._heartbeat - self.interval
+            # Um relatório por episódio de bloqueio (mesmo batimento)
+            if blocked_for >= self.block_threshold and reported_heartbeat != self._heartbeat:
+                reported_heartbeat = self._heartbeat
+                self.report_block(blocked_for * 1000, self.capture_stack())
+
+    def report_block(self, blocked_ms: float, stack: List[str]) -> None:
+        """
+        Registra um bloqueio do loop com a pilha de quem o segurava
+
+        Args:
+            blocked_ms: Tempo bloqueado até a detecção
+            stack: Pilha do thread do loop
+        """
+        self.blocked_total += 1
+        metrics.inc("event_loop_blocked")
+        block = {
+            "detected_at": time.time(),
+            "blocked_ms": round(blocked_ms, 1),
+            "stack": stack[-15:],
+        }
+        self.blocks.append(block)
+        log_with_context(
+            logger,
+            "WARNING",
+            "Event loop bloqueado",
+            blocked_ms=block["blocked_ms"],
+            stack="".join(block["stack"])
+        )
+
+    def start(self) -> None:
+        """Inicia a medição (chamar dentro do event loop)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run(), name="loop-monitor")
+        self._watcher = threading.Thread(target=self._watch, name="loop-block-watcher", daemon=True)
+        self._watcher.start()
+
+    async def stop(self) -> None:
+        """Para a medição"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watcher is not None:
+            await asyncio.to_thread(self._watcher.join)
+            self._watcher = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_ms": self.interval * 1000,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "blocked_total": self.blocked_total,
+            "recent_blocks": list(self.blocks),
+        }
+
+
+# Instância global do monitor do event loop
+loop_monitor = LoopMonitor()
+metrics.register_collector("event_loop", loop_monitor.snapshot)
@@ -0,0 +1,88 @@
+"""
+Busca de vários padrões em uma única passada pelo texto (autômato de Aho-Corasick)
+"""
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class AhoCorasick:
+    """Autômato compilado uma vez a partir dos padrões; cada busca é O(tamanho do texto + matches)"""
+
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        """
+        Args:
+            patterns: Pares (padrão, rótulo); padrões vazios são ignorados
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[str, Any]]] = [[]]
+        self.size = 0
+
+        for pattern, label in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = next_state
+            self._out[state].append((pattern, label))
+            self.size += 1
+
+        # Links de falha em largura; saídas dos sufixos são herdadas
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                candidate = self._goto[fail].get(char, 0)
+                self._fail[next_state] = candidate if candidate != next_state else 0
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, str, Any]]:
+        """
+        Percorre o texto uma vez produzindo cada ocorrência
+
+        Args:
+            text: Texto já normalizado (ex: minúsculo)
+
+        Yields:
+            Tuplas (posição inicial, padrão, rótulo)
+        """
+        state = 0
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern, label in out[state]:
+                yield index - len(pattern) + 1, pattern, label
+
+    def labels(self, text: str) -> Dict[Any, str]:
+        """
+        Rótulos encontrados no texto, cada um com o primeiro padrão que casou
+
+        Args:
+            text: Texto já normalizado
+
+        Returns:
+            Mapa rótulo -> padrão
+        """
+        found: Dict[Any, str] = {}
+        for _, pattern, label in self.finditer(text):
+            found.setdefault(label, pattern)
+        return found
+
+    def first(self, text: str) -> Optional[Tuple[int, str, Any]]:
+        """Primeira ocorrência no texto (ou None)"""
+        return next(self.finditer(text), None)
@@ -0,0 +1,193 @@
+"""
+Watchdog de memória: amostra o RSS do processo Python e do Chromium e recicla sessões
+"""
+import os
+import asyncio
+import resource
+from typing import Any, Dict, List, Optional
+from app.utils.browser_pool import BrowserManager, browser_manager
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_MB = 1024 * 1024
+
+
+def _read_rss_bytes(pid: int) -> int:
+    """Lê o RSS atual de um processo via /proc (0 se indisponível)"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _descendants(pid: int) -> List[int]:
+    """Lista os processos descendentes (driver Playwright e processos do Chromium)"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                data = f.read()
+            # O nome do processo pode conter espaços; o ppid vem logo após o estado
+            ppid = int(data.rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    result: List[int] = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        result.append(child)
+        stack.extend(children.get(child, []))
+    return result
+
+
+def sample_process_memory(pid: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Amostra o uso de memória do processo e de seus filhos
+
+    Args:
+        pid: Processo raiz (padrão: processo atual)
+
+    Returns:
+        RSS do Python, RSS somado dos processos filhos (browser) e total em MB
+    """
+    pid = pid or os.getpid()
+    python_rss = _read_rss_bytes(pid)
+    if not python_rss:
+        # Fallback sem /proc: pico de RSS (ru_maxrss em KB no Linux)
+        python_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    browser_pids = _descendants(pid)
+    browser_rss = sum(_read_rss_bytes(child) for child in browser_pids)
+
+    return {
+        "python_rss_mb": round(python_rss / _MB, 1),
+        "browser_rss_mb": round(browser_rss / _MB, 1),
+        "browser_processes": len(browser_pids),
+        "total_rss_mb": round((python_rss + browser_rss) / _MB, 1),
+    }
+
+
+class MemoryWatchdog:
+    """Amostra memória periodicamente e recicla sessões de browser acima dos limites"""
+
+    def __init__(self, manager: BrowserManager = browser_manager):
+        self.manager = manager
+        self.interval = float(os.getenv("MEMORY_WATCHDOG_INTERVAL", "15"))
+        self.total_budget_mb = float(os.getenv("MEMORY_BUDGET_MB", "1536"))
+        self.browser_limit_mb = float(os.getenv("BROWSER_MEMORY_LIMIT_MB", "1024"))
+        self.last_sample: Dict[str, Any] = {}
+        self.recycled_total = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def is_over_budget(self, sample: Dict[str, Any]) -> bool:
+        """
+        Verifica se a amostra ultrapassa o orçamento total ou o limite do browser
+
+        Args:
+            sample: Resultado de sample_process_memory
+
+        Returns:
+            True se acima do orçamento
+        """
+        return (
+            sample.get("total_rss_mb", 0) > self.total_budget_mb
+            or sample.get("browser_rss_mb", 0) > self.browser_limit_mb
+        )
+
+    async def check(self) -> Dict[str, Any]:
+        """
+        Executa uma rodada do watchdog: amostra, recicla e atualiza o estado de orçamento
+
+        Returns:
+            Amostra de memória utilizada na decisão
+        """
+        sample = await asyncio.to_thread(sample_process_memory)
+        over_budget = self.is_over_budget(sample)
+
+        if over_budget != self.manager.over_budget:
+            log_with_context(
+                logger,
+                "WARNING" if over_budget else "INFO",
+                "Memória acima do orçamento: novas sessões suspensas" if over_budget
+                else "Memória normalizada: novas sessões liberadas",
+                **sample
+            )
+        self.manager.over_budget = over_budget
+
+        recycled = 0
+        for pool in list(self.manager.pools.values()):
+            await pool.sample_idle_heaps()
+            if over_budget:
+                recycled += await pool.recycle_idle(lambda s: True, reason="memoria_acima_do_orcamento")
+            else:
+                recycled += await pool.recycle_idle(reason="limite_atingido")
+
+        # Sem sessões em uso, em manutenção ou sendo criadas: reiniciar o Chromium é a forma
+        # garantida de devolver memória (fechar antes derrubaria um login em andamento)
+        if over_budget and self.manager.browser_running and self.manager.busy_count == 0:
+            await self.manager.close_browser()
+
+        self.recycled_total += recycled
+        self.last_sample = sample
+        metrics.set_gauge("memory_python_rss_mb", sample["python_rss_mb"])
+        metrics.set_gauge("memory_browser_rss_mb", sample["browser_rss_mb"])
+        metrics.set_gauge("memory_over_budget", int(over_budget))
+        if recycled:
+            metrics.inc("browser_sessions_recycled", recycled)
+        return sample
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Erro no watchdog de memória: {str(e)}",
+                    error_type=type(e).__name__
+                )
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Inicia o watchdog em background no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Interrompe o watchdog"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.last_sample,
+            "total_budget_mb": self.total_budget_mb,
+            "browser_limit_mb": self.browser_limit_mb,
+            "over_budget": self.manager.over_budget,
+            "recycled_total": self.recycled_total,
+        }
+
+
+# Instância global do watchdog
+memory_watchdog = MemoryWatchdog()
+metrics.register_collector("memory", memory_watchdog.snapshot)
@@ -0,0 +1,153 @@
+"""
+Registro simples de métricas em memória exposto em /metrics
+"""
+import bisect
+from typing import Any, Callable, Dict, Optional, Sequence
+from app.utils.logger import logger, log_with_context
+
+
+# Limites (ms) padrão dos histogramas de latência
+DEFAULT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class Histogram:
+    """Histograma de buckets fixos (observação O(log n), sem guardar amostras)"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Registra uma observação
+
+        Args:
+            value: Valor observado (ex: latência em ms)
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Quantil aproximado (limite superior do bucket que o contém)
+
+        Args:
+            q: Quantil entre 0 e 1
+
+        Returns:
+            Valor aproximado (máximo observado se cair no último bucket)
+        """
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target and count:
+                return float(self.buckets[index]) if index < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 1),
+            "avg": round(self.sum / self.count, 1) if self.count else 0.0,
+            "max": round(self.max, 1),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class MetricsRegistry:
+    """Registro de contadores, gauges e coletores de métricas"""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def inc(self, name: str, value: float = 1) -> None:
+        """
+        Incrementa um contador
+
+        Args:
+            name: Nome do contador
+            value: Valor a ser somado
+        """
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """
+        Define o valor atual de um gauge
+
+        Args:
+            name: Nome do gauge
+            value: Valor atual
+        """
+        self._gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: Optional[Sequence[float]] = None) -> None:
+        """
+        Registra uma observação em um histograma (criado no primeiro uso)
+
+        Args:
+            name: Nome do histograma (ex: "eligibility_latency_ms")
+            value: Valor observado
+            buckets: Limites dos buckets na criação (padrão: latências em ms)
+        """
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = Histogram(buckets or DEFAULT_BUCKETS_MS)
+        histogram.observe(value)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Registra uma função que gera métricas no momento da leitura
+
+        Args:
+            name: Nome da seção no snapshot
+            collector: Função sem argumentos que retorna um dicionário
+        """
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Retorna todas as métricas atuais
+
+        Returns:
+            Dicionário com contadores, gauges e seções dos coletores
+        """
+        data: Dict[str, Any] = {
+            "counters": dict(self._counters),
+            "gauges": dict(self._gauges),
+            "histograms": {name: histogram.snapshot() for name, histogram in self._histograms.items()},
+        }
+        for name, collector in self._collectors.items():
+            try:
+                data[name] = collector()
+            except Exception as e:
+                log_with_context(
+                    logger,
+                    "WARNING",
+                    f"Falha ao coletar métricas de {name}: {str(e)}",
+                    collector=name,
+                    error_type=type(e).__name__
+                )
+        return data
+
+
+# Instância global de métricas
+metrics = MetricsRegistry()
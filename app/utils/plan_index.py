@@ -0,0 +1,184 @@
+"""
+Índice de normalização de nomes de plano (acentos, tokens, aliases e fuzzy matching)
+"""
+import os
+import re
+import json
+import difflib
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.utils.logger import logger, log_with_context
+
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_plan_name(plan_name: str) -> str:
+    """
+    Normaliza um nome de plano: sem acentos, minúsculo e tokens separados por espaço
+
+    Ex: "Amil-Saúde S750" -> "amil saude s750"
+
+    Args:
+        plan_name: Nome recebido
+
+    Returns:
+        Nome normalizado
+    """
+    decomposed = unicodedata.normalize("NFKD", plan_name)
+    without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", without_accents.lower()).strip()
+
+
+def load_alias_table() -> Dict[str, str]:
+    """
+    Lê a tabela de aliases configurável (PLAN_ALIASES_FILE e/ou PLAN_ALIASES em JSON)
+
+    Returns:
+        Mapa alias -> plano
+    """
+    aliases: Dict[str, str] = {}
+    path = os.getenv("PLAN_ALIASES_FILE")
+    try:
+        if path:
+            with open(path, encoding="utf-8") as f:
+                aliases.update(json.load(f))
+        if os.getenv("PLAN_ALIASES"):
+            aliases.update(json.loads(os.getenv("PLAN_ALIASES", "{}")))
+    except (OSError, ValueError) as e:
+        log_with_context(
+            logger,
+            "ERROR",
+            "Tabela de aliases de planos inválida",
+            path=path,
+            error_type=type(e).__name__,
+            error_message=str(e)
+        )
+    return aliases
+
+
+class PlanIndex:
+    """Resolve nomes de plano livres para o plano registrado, com cache de resoluções"""
+
+    def __init__(self, fuzzy_cutoff: Optional[float] = None, cache_size: Optional[int] = None):
+        self.fuzzy_cutoff = fuzzy_cutoff if fuzzy_cutoff is not None else float(os.getenv("PLAN_FUZZY_CUTOFF", "0.85"))
+        self.cache_size = cache_size or int(os.getenv("PLAN_INDEX_CACHE_SIZE", "4096"))
+        self._phrases: Dict[str, str] = {}
+        self._max_ngram = 1
+        self._cache: "OrderedDict[str, Optional[str]]" = OrderedDict()
+        self._unmatched: Counter = Counter()
+
+    def build(self, plans: Iterable[Tuple[str, Iterable[str]]], alias_table: Optional[Dict[str, str]] = None) -> None:
+        """
+        (Re)constrói o índice a partir dos planos, aliases dos manifests e tabela de aliases
+
+        Args:
+            plans: Pares (plano, aliases do plano)
+            alias_table: Mapa alias -> plano adicional
+        """
+        phrases: Dict[str, str] = {}
+        known = set()
+        for plan, aliases in plans:
+            known.add(plan)
+            for phrase in [plan, *aliases]:
+                self._add_phrase(phrases, phrase, plan)
+
+        for alias, plan in (alias_table or {}).items():
+            plan_key = plan.lower()
+            if plan_key not in known:
+                log_with_context(
+                    logger,
+                    "WARNING",
+                    "Alias aponta para plano não registrado",
+                    alias=alias,
+                    plan_name=plan
+                )
+                continue
+            self._add_phrase(phrases, alias, plan_key)
+
+        self._phrases = phrases
+        self._max_ngram = max((len(p.split()) for p in phrases), default=1)
+        self._cache.clear()
+
+    @staticmethod
+    def _add_phrase(phrases: Dict[str, str], phrase: str, plan: str) -> None:
+        normalized = normalize_plan_name(phrase)
+        if normalized:
+            phrases.setdefault(normalized, plan)
+            phrases.setdefault(normalized.replace(" ", ""), plan)
+
+    def resolve(self, plan_name: str) -> Optional[str]:
+        """
+        Resolve um nome de plano livre
+
+        Args:
+            plan_name: Nome recebido (ex: "AMIL S750", "amil-saude")
+
+        Returns:
+            Nome do plano registrado ou None (handler genérico)
+        """
+        if plan_name in self._cache:
+            self._cache.move_to_end(plan_name)
+            return self._cache[plan_name]
+
+        resolved = self._match(normalize_plan_name(plan_name))
+        self._cache[plan_name] = resolved
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return resolved
+
+    def _match(self, normalized: str) -> Optional[str]:
+        if not normalized:
+            return None
+        if normalized in self._phrases:
+            return self._phrases[normalized]
+
+        tokens = normalized.split()
+        # N-gramas contíguos, do maior para o menor (ex: "sul america saude" -> "sul america")
+        for size in range(min(self._max_ngram, len(tokens)), 0, -1):
+            for start in range(len(tokens) - size + 1):
+                gram = tokens[start:start + size]
+                for candidate in (" ".join(gram), "".join(gram)):
+                    if candidate in self._phrases:
+                        return self._phrases[candidate]
+
+        # Fuzzy apenas em cache miss: letra repetida ou a mais como "amill"; transposições em
+        # nomes curtos ("amli") ficam abaixo do corte padrão e caem no handler genérico
+        candidates = [normalized, *tokens]
+        for candidate in candidates:
+            matches = difflib.get_close_matches(candidate, self._phrases.keys(), n=1, cutoff=self.fuzzy_cutoff)
+            if matches:
+                return self._phrases[matches[0]]
+        return None
+
+    def record_unmatched(self, plan_name: str) -> None:
+        """
+        Contabiliza um nome de plano não reconhecido (limitado a 1000 nomes distintos)
+
+        Args:
+            plan_name: Nome recebido
+        """
+        if len(self._unmatched) < 1000 or plan_name in self._unmatched:
+            self._unmatched[plan_name] += 1
+        else:
+            self._unmatched["__outros__"] += 1
+
+    def unmatched(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Nomes de plano que não foram reconhecidos (caíram no handler genérico)
+
+        Args:
+            limit: Quantidade máxima de nomes retornados
+
+        Returns:
+            Lista com nome e quantidade de ocorrências
+        """
+        return [{"plan_name": name, "count": count} for name, count in self._unmatched.most_common(limit)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "phrases": len(self._phrases),
+            "cache_entries": len(self._cache),
+            "unmatched": self.unmatched(),
+        }
@@ -0,0 +1,94 @@
+"""
+Popularidade das carteirinhas consultadas (contagem com decaimento exponencial)
+"""
+import os
+import time
+import heapq
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+
+class HotCard(NamedTuple):
+    """Carteirinha frequente e o último resultado visto"""
+    plan_key: str
+    numero_carteirinha: str
+    score: float
+    last_status: Optional[str]
+
+
+class PopularityTracker:
+    """
+    Pontuação por (plano, carteirinha): cada consulta soma 1 e a pontuação cai pela metade a
+    cada POPULARITY_HALF_LIFE_H horas, então cartões consultados toda semana continuam quentes
+    e os esporádicos esfriam sozinhos
+    """
+
+    def __init__(self, half_life_s: Optional[float] = None, max_entries: Optional[int] = None):
+        self.half_life = half_life_s or float(os.getenv("POPULARITY_HALF_LIFE_H", "72")) * 3600
+        self.max_entries = max_entries or int(os.getenv("POPULARITY_MAX_ENTRIES", "5000"))
+        # chave -> [pontuação, instante da pontuação, último resultado]
+        self._entries: Dict[Tuple[str, str], list] = {}
+
+    def _decayed(self, entry: list, now: float) -> float:
+        return entry[0] * 0.5 ** ((now - entry[1]) / self.half_life)
+
+    def record(self, plan_key: str, numero_carteirinha: str, status: Optional[str] = None, now: Optional[float] = None) -> None:
+        """
+        Registra uma consulta
+
+        Args:
+            plan_key: Plano resolvido
+            numero_carteirinha: Número da carteirinha normalizado
+            status: Resultado devolvido ao cliente
+            now: Instante (testes)
+        """
+        now = time.monotonic() if now is None else now
+        key = (plan_key, numero_carteirinha)
+        entry = self._entries.get(key)
+        if entry is None:
+            if len(self._entries) >= self.max_entries:
+                self._evict(now)
+            self._entries[key] = [1.0, now, status]
+            return
+        entry[0] = self._decayed(entry, now) + 1
+        entry[1] = now
+        if status is not None:
+            entry[2] = status
+
+    def _evict(self, now: float) -> None:
+        # Remove os 10% mais frios de uma vez (evita ordenar a cada inserção)
+        count = max(1, self.max_entries // 10)
+        coldest = heapq.nsmallest(count, self._entries.items(), key=lambda item: self._decayed(item[1], now))
+        for key, _ in coldest:
+            del self._entries[key]
+
+    def score(self, plan_key: str, numero_carteirinha: str, now: Optional[float] = None) -> float:
+        entry = self._entries.get((plan_key, numero_carteirinha))
+        if entry is None:
+            return 0.0
+        return self._decayed(entry, time.monotonic() if now is None else now)
+
+    def top(self, limit: int, min_score: float = 0.0, now: Optional[float] = None) -> List[HotCard]:
+        """
+        Carteirinhas mais quentes
+
+        Args:
+            limit: Quantidade máxima
+            min_score: Pontuação mínima
+            now: Instante (testes)
+
+        Returns:
+            Carteirinhas em ordem decrescente de pontuação
+        """
+        now = time.monotonic() if now is None else now
+        scored = (
+            HotCard(key[0], key[1], self._decayed(entry, now), entry[2])
+            for key, entry in self._entries.items()
+        )
+        return heapq.nlargest(limit, (card for card in scored if card.score >= min_score), key=lambda card: card.score)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tracked": len(self._entries),
+            "max_entries": self.max_entries,
+            "half_life_h": round(self.half_life / 3600, 1),
+        }
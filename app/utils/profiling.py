@@ -0,0 +1,320 @@
+"""
+Profiling sob demanda: amostragem de CPU, pilhas das tasks asyncio e captura de consultas lentas
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+class ProfileDirectory:
+    """Diretório local limitado (tamanho e quantidade) para perfis, traces e timings"""
+
+    def __init__(self):
+        self.path = Path(os.getenv("PROFILE_DIR", "profiles"))
+        self.max_bytes = int(float(os.getenv("PROFILE_DIR_MAX_MB", "200")) * 1024 * 1024)
+        self.max_files = int(os.getenv("PROFILE_DIR_MAX_FILES", "200"))
+
+    def new_path(self, prefix: str, suffix: str) -> Path:
+        """
+        Caminho para um novo arquivo (diretório criado sob demanda)
+
+        Args:
+            prefix: Tipo do arquivo (ex: "cpu", "slow-amil")
+            suffix: Extensão (ex: ".json")
+
+        Returns:
+            Caminho único
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        return self.path / f"{prefix}-{stamp}-{uuid.uuid4().hex[:6]}{suffix}"
+
+    def files(self) -> List[Path]:
+        """Arquivos do diretório, do mais antigo para o mais novo"""
+        if not self.path.is_dir():
+            return []
+        return sorted((p for p in self.path.iterdir() if p.is_file()), key=lambda p: p.stat().st_mtime)
+
+    def prune(self) -> int:
+        """
+        Remove os arquivos mais antigos até respeitar os limites
+
+        Returns:
+            Quantidade de arquivos removidos
+        """
+        files = self.files()
+        total = sum(p.stat().st_size for p in files)
+        removed = 0
+        while files and (total > self.max_bytes or len(files) > self.max_files):
+            oldest = files.pop(0)
+            total -= oldest.stat().st_size
+            oldest.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def resolve(self, name: str) -> Optional[Path]:
+        """
+        Arquivo do diretório pelo nome (sem permitir sair do diretório)
+
+        Args:
+            name: Nome do arquivo
+
+        Returns:
+            Caminho ou None se não existir/for inválido
+        """
+        if not name or "/" in name or "\\" in name or name.startswith("."):
+            return None
+        path = self.path / name
+        return path if path.is_file() else None
+
+    def listing(self) -> List[Dict[str, Any]]:
+        return [
+            {"name": p.name, "size_bytes": p.stat().st_size, "modified": p.stat().st_mtime}
+            for p in reversed(self.files())
+        ]
+
+
+class SamplingProfiler:
+    """Profiler de CPU por amostragem das pilhas do thread do event loop (sem dependências)"""
+
+    def __init__(self, directory: ProfileDirectory):
+        self.directory = directory
+        self.interval = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+        self.max_seconds = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+        self.running = False
+
+    def _sample(self, thread_id: int, stop: threading.Event, stacks: Counter) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                stacks[";".join(reversed(stack))] += 1
+
+    async def run(self, seconds: float) -> Dict[str, Any]:
+        """
+        Amostra o thread do event loop por alguns segundos
+
+        Grava as pilhas no formato "collapsed" (compatível com flamegraph.pl e speedscope).
+
+        Args:
+            seconds: Duração (limitada por PROFILE_MAX_SECONDS)
+
+        Returns:
+            Resumo: amostras, funções mais frequentes e arquivo gravado
+
+        Raises:
+            RuntimeError: Se já houver um profiling em andamento
+        """
+        if self.running:
+            raise RuntimeError("Profiling de CPU já em andamento")
+        seconds = max(0.1, min(seconds, self.max_seconds))
+        stacks: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample,
+            args=(threading.get_ident(), stop, stacks),
+            name="cpu-profiler",
+            daemon=True
+        )
+        self.running = True
+        try:
+            sampler.start()
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+            self.running = False
+
+        path = self.directory.new_path("cpu", ".collapsed.txt")
+        path.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()), encoding="utf-8")
+        self.directory.prune()
+
+        own: Counter = Counter()
+        for stack, count in stacks.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        total = sum(stacks.values())
+        return {
+            "seconds": seconds,
+            "samples": total,
+            "top": [
+                {"function": name, "samples": count, "percent": round(100 * count / total, 1)}
+                for name, count in own.most_common(20)
+            ] if total else [],
+            "file": path.name,
+        }
+
+
+def dump_tasks(limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Pilhas de todas as tasks asyncio do loop atual
+
+    Args:
+        limit: Quadros por task
+
+    Returns:
+        Lista com nome, corrotina, estado e pilha de cada task
+    """
+    tasks = []
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        stack = [
+            f"{Path(frame.f_code.co_filename).name}:{frame.f_lineno} {frame.f_code.co_name}"
+            for frame in task.get_stack(limit=limit)
+        ]
+        tasks.append({
+            "name": task.get_name(),
+            "coro": getattr(coro, "__qualname__", repr(coro)),
+            "done": task.done(),
+            "cancelled": task.cancelled(),
+            "stack": stack,
+        })
+    return sorted(tasks, key=lambda item: item["name"])
+
+
+class CheckTracker:
+    """Tempos dos passos de uma consulta e trace Playwright em andamento"""
+
+    def __init__(self, capture: "SlowCheckCapture", portal: str):
+        self.capture = capture
+        self.portal = portal
+        self.id = uuid.uuid4().hex[:8]
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.steps: Dict[str, float] = {}
+        self._context: Any = None
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def mark(self, step: str) -> None:
+        """
+        Registra o tempo desde a marca anterior
+
+        Args:
+            step: Nome do passo concluído (ex: "lease", "navegacao", "extracao")
+        """
+        now = time.perf_counter()
+        self.steps[step] = round(self.steps.get(step, 0) + (now - self._last) * 1000, 1)
+        self._last = now
+
+    async def begin_trace(self, session: Any) -> None:
+        """
+        Inicia um trecho de trace Playwright na sessão (descartado se a consulta for rápida)
+
+        Args:
+            session: BrowserSession emprestada do pool
+        """
+        if not self.capture.trace_enabled:
+            return
+        try:
+            tracing = session.context.tracing
+            if not getattr(session, "tracing", False):
+                await tracing.start(screenshots=True, snapshots=True)
+                session.tracing = True
+            await tracing.start_chunk()
+            self._context = session.context
+        except Exception as e:
+            log_with_context(logger, "WARNING", f"Falha ao iniciar trace: {str(e)}", portal=self.portal)
+
+    async def finish(self) -> Optional[Dict[str, Any]]:
+        """
+        Encerra o acompanhamento; grava timings e trace se passou do limite
+
+        Returns:
+            Resumo gravado (ou None se a consulta foi rápida)
+        """
+        elapsed_ms = self.elapsed_ms
+        slow = elapsed_ms >= self.capture.threshold_ms
+        trace_file = None
+
+        if self._context is not None:
+            try:
+                if slow:
+                    trace_path = await asyncio.to_thread(
+                        self.capture.directory.new_path, f"slow-{self.portal}-{self.id}", ".trace.zip"
+                    )
+                    await self._context.tracing.stop_chunk(path=str(trace_path))
+                    trace_file = trace_path.name
+                else:
+                    await self._context.tracing.stop_chunk()
+            except Exception as e:
+                log_with_context(logger, "WARNING", f"Falha ao encerrar trace: {str(e)}", portal=self.portal)
+
+        if not slow:
+            return None
+
+        summary = {
+            "portal": self.portal,
+            "check_id": self.id,
+            "elapsed_ms": round(elapsed_ms, 1),
+            "threshold_ms": self.capture.threshold_ms,
+            "steps_ms": self.steps,
+            "trace_file": trace_file,
+            "captured_at": datetime.now(timezone.utc).isoformat(),
+        }
+        # Arquivo e limpeza do diretório fora do event loop
+        path = await asyncio.to_thread(self._save, summary)
+        self.capture.captured += 1
+        metrics.inc("slow_checks_captured")
+        log_with_context(logger, "WARNING", "Consulta lenta capturada", file=path.name, **summary)
+        return summary
+
+
+    def _save(self, summary: Dict[str, Any]) -> Path:
+        path = self.capture.directory.new_path(f"slow-{self.portal}-{self.id}", ".json")
+        path.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        self.capture.directory.prune()
+        return path
+
+
+class SlowCheckCapture:
+    """Captura automática de consultas acima de SLOW_CHECK_THRESHOLD_MS"""
+
+    def __init__(self, directory: ProfileDirectory):
+        self.directory = directory
+        self.threshold_ms = float(os.getenv("SLOW_CHECK_THRESHOLD_MS", "20000"))
+        # Trace Playwright em trechos por consulta: só é gravado quando a consulta é lenta, mas
+        # screenshots e snapshots custam em todas (desligado por padrão; os tempos sempre são gravados)
+        self.trace_enabled = os.getenv("SLOW_CHECK_TRACE", "false").lower() == "true"
+        self.captured = 0
+
+    def track(self, portal: str) -> CheckTracker:
+        """
+        Começa a acompanhar uma consulta
+
+        Args:
+            portal: Nome do portal
+
+        Returns:
+            Tracker da consulta
+        """
+        return CheckTracker(self, portal)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "trace_enabled": self.trace_enabled,
+            "captured": self.captured,
+        }
+
+
+# Instâncias globais
+profile_directory = ProfileDirectory()
+cpu_profiler = SamplingProfiler(profile_directory)
+slow_checks = SlowCheckCapture(profile_directory)
+metrics.register_collector("slow_checks", slow_checks.stats)
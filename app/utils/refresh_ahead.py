@@ -0,0 +1,200 @@
+"""
+Renovação antecipada do cache das carteirinhas mais consultadas
+
+Fora do horário de pico, as carteirinhas quentes cujo resultado em cache falta ou vence em
+breve são consultadas de novo, dentro de um orçamento de consultas por hora ao portal: no
+pico, essas carteirinhas saem do cache em vez de pagar o caminho lento do portal.
+
+Com um backend de estado compartilhado, o orçamento por hora vale para o conjunto das
+réplicas, e cada carteirinha é renovada por uma réplica só.
+"""
+import os
+import time
+import asyncio
+from datetime import datetime, time as dt_time
+from typing import Any, Dict, List, Optional, Tuple
+from app.dispatch import handler_registry
+from app.utils.metrics import metrics
+from app.utils.state import StateBackend, StateBackendError, state_backend
+from app.utils.logger import logger, log_with_context
+
+
+def parse_windows(spec: str) -> List[Tuple[dt_time, dt_time]]:
+    """
+    Janelas de horário no formato "HH:MM-HH:MM,HH:MM-HH:MM" (podem cruzar a meia-noite)
+
+    Args:
+        spec: Especificação (vazia = sem restrição de horário)
+
+    Returns:
+        Lista de (início, fim)
+
+    Raises:
+        ValueError: Se a especificação for inválida
+    """
+    windows = []
+    for part in filter(None, (item.strip() for item in spec.split(","))):
+        start, end = part.split("-")
+        windows.append((dt_time.fromisoformat(start.strip()), dt_time.fromisoformat(end.strip())))
+    return windows
+
+
+def in_windows(windows: List[Tuple[dt_time, dt_time]], moment: dt_time) -> bool:
+    """Se o horário cai em alguma janela (sem janelas, sempre)"""
+    if not windows:
+        return True
+    for start, end in windows:
+        if start <= end and start <= moment < end:
+            return True
+        if start > end and (moment >= start or moment < end):
+            return True
+    return False
+
+
+class RefreshAheadScheduler:
+    """Renova em background o cache das carteirinhas quentes, com orçamento de carga no portal"""
+
+    def __init__(self, registry: Any = None, backend: Optional[StateBackend] = None):
+        self.registry = registry or handler_registry
+        backend = backend if backend is not None else state_backend
+        self._shared = backend if backend.shared else None
+        self.enabled = os.getenv("REFRESH_AHEAD_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("REFRESH_AHEAD_INTERVAL", "60"))
+        # Horário local do servidor
+        self.windows = parse_windows(os.getenv("REFRESH_AHEAD_WINDOWS", "01:00-06:00,13:00-14:00"))
+        self.budget_per_hour = float(os.getenv("REFRESH_AHEAD_BUDGET_PER_HOUR", "30"))
+        self.lead = float(os.getenv("REFRESH_AHEAD_LEAD_S", "900"))
+        self.min_score = float(os.getenv("REFRESH_AHEAD_MIN_SCORE", "3"))
+        self.concurrency = int(os.getenv("REFRESH_AHEAD_CONCURRENCY", "1"))
+        self._tokens = self.budget_per_hour
+        self._tokens_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.refreshed = 0
+        self.failed = 0
+        self.skipped_busy = 0
+        self.skipped_shared = 0
+        self.last_run: Optional[str] = None
+
+    def _refill(self) -> None:
+        # Balde de fichas: no máximo budget_per_hour consultas em qualquer hora
+        now = time.monotonic()
+        self._tokens = min(self.budget_per_hour, self._tokens + (now - self._tokens_at) * self.budget_per_hour / 3600)
+        self._tokens_at = now
+
+    async def _claim_shared(self, plan_key: str, numero_carteirinha: str) -> bool:
+        """Reserva a carteirinha nesta rodada e uma ficha do orçamento comum às réplicas"""
+        if self._shared is None:
+            return True
+        try:
+            if not await self._shared.add(f"refresh_ahead:card:{plan_key}:{numero_carteirinha}", "1", self.interval):
+                return False
+            spent = await self._shared.incr(f"refresh_ahead:budget:{int(time.time() // 3600)}", 3600)
+            return spent <= self.budget_per_hour
+        except StateBackendError as e:
+            # Sem coordenação não há como respeitar o orçamento comum: a rodada é pulada
+            log_with_context(logger, "WARNING", f"Refresh antecipado sem backend de estado: {str(e)}")
+            return False
+
+    async def _refresh_one(self, plan_key: str, numero_carteirinha: str, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            try:
+                status = await self.registry.refresh(plan_key, numero_carteirinha)
+                self.refreshed += 1
+                metrics.inc("refresh_ahead_checks")
+                log_with_context(
+                    logger,
+                    "INFO",
+                    "Cache renovado antecipadamente",
+                    plan_name=plan_key,
+                    numero_carteirinha=numero_carteirinha,
+                    result=status
+                )
+            except Exception as e:
+                self.failed += 1
+                metrics.inc("refresh_ahead_failures")
+                log_with_context(
+                    logger,
+                    "WARNING",
+                    f"Falha na renovação antecipada: {str(e)}",
+                    plan_name=plan_key,
+                    numero_carteirinha=numero_carteirinha,
+                    error_type=type(e).__name__
+                )
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """
+        Uma rodada: renova as carteirinhas elegíveis dentro do orçamento disponível
+
+        Args:
+            now: Horário de referência (testes)
+
+        Returns:
+            Quantidade de consultas disparadas
+        """
+        moment = (now or datetime.now()).time()
+        if not in_windows(self.windows, moment):
+            return 0
+        self._refill()
+        available = int(self._tokens)
+        if available < 1:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        for card in await self.registry.refresh_candidates(self.lead, self.min_score, available):
+            # Tráfego ao vivo tem prioridade: plano sem vaga livre fica para a próxima rodada
+            if self.registry.plan_busy(card.plan_key):
+                self.skipped_busy += 1
+                continue
+            if not await self._claim_shared(card.plan_key, card.numero_carteirinha):
+                self.skipped_shared += 1
+                continue
+            self._tokens -= 1
+            tasks.append(self._refresh_one(card.plan_key, card.numero_carteirinha, semaphore))
+        await asyncio.gather(*tasks)
+        self.last_run = datetime.now().isoformat(timespec="seconds")
+        return len(tasks)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                log_with_context(logger, "ERROR", f"Erro no refresh antecipado: {str(e)}", error_type=type(e).__name__)
+
+    def start(self) -> None:
+        """Inicia o agendador (chamar dentro do event loop)"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run(), name="refresh-ahead")
+
+    async def stop(self) -> None:
+        """Para o agendador"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._refill()
+        return {
+            "enabled": self.enabled,
+            "windows": [f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}" for start, end in self.windows],
+            "budget_per_hour": self.budget_per_hour,
+            "budget_available": round(self._tokens, 1),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "skipped_busy": self.skipped_busy,
+            "skipped_shared": self.skipped_shared,
+            "last_run": self.last_run,
+        }
+
+
+# Instância global do refresh antecipado
+refresh_ahead = RefreshAheadScheduler()
+metrics.register_collector("refresh_ahead", refresh_ahead.snapshot)
@@ -0,0 +1,346 @@
+"""
+Engine de scraping HTTP sem browser para portais renderizados no servidor
+
+Um único cliente httpx com pool de conexões é compartilhado por todos os portais; cada
+conta tem seu próprio cookie jar, então sessões logadas não se misturam. O HTML é
+analisado com lxml (seletores CSS compilados uma vez e reaproveitados).
+"""
+import os
+import time
+import asyncio
+import uuid
+from functools import lru_cache
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+class FormNotFoundError(Exception):
+    """Formulário de login não encontrado na página"""
+
+
+@lru_cache(maxsize=512)
+def _compile_css(selector: str) -> Any:
+    from lxml.cssselect import CSSSelector
+    return CSSSelector(selector)
+
+
+@lru_cache(maxsize=512)
+def _compile_xpath(expression: str) -> Any:
+    from lxml.etree import XPath
+    return XPath(expression)
+
+
+class HtmlDocument:
+    """Página HTML analisada, com extração por seletor CSS ou XPath"""
+
+    def __init__(self, text: str, url: str = ""):
+        from lxml import html as lxml_html
+        self.url = url
+        self.root = lxml_html.fromstring(text or "<html></html>", base_url=url or None)
+
+    def css(self, selector: str) -> List[Any]:
+        """
+        Elementos que casam com o seletor CSS
+
+        Args:
+            selector: Seletor CSS (ex: "div.alert-success")
+
+        Returns:
+            Lista de elementos lxml
+        """
+        return _compile_css(selector)(self.root)
+
+    def xpath(self, expression: str) -> List[Any]:
+        """
+        Resultado de uma expressão XPath
+
+        Args:
+            expression: Expressão XPath (ex: "//table//td[2]/text()")
+
+        Returns:
+            Elementos, textos ou atributos encontrados
+        """
+        return _compile_xpath(expression)(self.root)
+
+    def text(self, selector: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        Texto do primeiro elemento que casa com o seletor CSS
+
+        Args:
+            selector: Seletor CSS
+            default: Valor se nada for encontrado
+
+        Returns:
+            Texto sem espaços nas pontas ou default
+        """
+        elements = self.css(selector)
+        return elements[0].text_content().strip() if elements else default
+
+    def texts(self, selector: str) -> List[str]:
+        """
+        Textos de todos os elementos que casam com o seletor CSS
+
+        Args:
+            selector: Seletor CSS
+
+        Returns:
+            Lista de textos
+        """
+        return [element.text_content().strip() for element in self.css(selector)]
+
+    def attr(self, selector: str, name: str, default: Optional[str] = None) -> Optional[str]:
+        """
+        Atributo do primeiro elemento que casa com o seletor CSS
+
+        Args:
+            selector: Seletor CSS
+            name: Nome do atributo (ex: "href")
+            default: Valor se nada for encontrado
+
+        Returns:
+            Valor do atributo ou default
+        """
+        elements = self.css(selector)
+        return elements[0].get(name, default) if elements else default
+
+    def body_text(self) -> str:
+        """Texto visível da página em minúsculas (equivalente ao innerText do body)"""
+        return self.root.text_content().lower()
+
+    def form(self, selector: str = "form") -> Tuple[str, str, Dict[str, str]]:
+        """
+        Lê um formulário: URL de envio, método e campos já preenchidos (inclusive hidden/CSRF)
+
+        Args:
+            selector: Seletor CSS do formulário
+
+        Returns:
+            Tupla (action absoluta, método, campos)
+
+        Raises:
+            FormNotFoundError: Se não houver formulário
+        """
+        forms = self.css(selector)
+        if not forms:
+            raise FormNotFoundError(f"Formulário não encontrado: {selector}")
+        form = forms[0]
+        fields = {
+            name: value or ""
+            for name, value in form.form_values()
+        }
+        action = str(httpx.URL(self.url).join(form.get("action") or self.url)) if self.url else form.get("action", "")
+        return action, (form.get("method") or "GET").upper(), fields
+
+
+class HttpSession:
+    """Sessão HTTP de uma conta em um portal (cookie jar próprio)"""
+
+    def __init__(self, portal: str, account: str):
+        self.id = uuid.uuid4().hex[:8]
+        self.portal = portal
+        self.account = account
+        self.cookies = httpx.Cookies()
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.logged_in = False
+        self.logged_in_at: Optional[float] = None
+        self.requests = 0
+        # Evita logins simultâneos na mesma conta
+        self.lock = asyncio.Lock()
+
+    def mark_logged_in(self, logged_in: bool) -> None:
+        self.logged_in = logged_in
+        self.logged_in_at = time.monotonic() if logged_in else None
+
+    def reset(self) -> None:
+        """Descarta cookies e estado de login"""
+        self.cookies.clear()
+        self.mark_logged_in(False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "id": self.id,
+            "portal": self.portal,
+            "account": self.account,
+            "logged_in": self.logged_in,
+            "age_seconds": round(now - self.created_at, 1),
+            "idle_seconds": round(now - self.last_used_at, 1),
+            "requests": self.requests,
+            "cookies": len(self.cookies.jar),
+        }
+
+
+class ScraperEngine:
+    """Cliente HTTP compartilhado + sessões por conta para handlers sem browser"""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.timeout = float(os.getenv("SCRAPER_TIMEOUT", "15"))
+        self.max_connections = int(os.getenv("SCRAPER_MAX_CONNECTIONS", "20"))
+        self.max_keepalive = int(os.getenv("SCRAPER_MAX_KEEPALIVE", "10"))
+        self.max_redirects = int(os.getenv("SCRAPER_MAX_REDIRECTS", "10"))
+        self.user_agent = os.getenv(
+            "SCRAPER_USER_AGENT",
+            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+        )
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._sessions: Dict[Tuple[str, str], HttpSession] = {}
+        self.requests_total = 0
+        self.errors_total = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Cliente httpx com keep-alive, criado no primeiro uso"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                transport=self._transport,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive
+                ),
+                headers={"User-Agent": self.user_agent},
+                # Cookies ficam no jar de cada sessão: o jar do cliente recusa tudo
+                cookies=CookieJar(policy=DefaultCookiePolicy(allowed_domains=[])),
+                follow_redirects=False
+            )
+        return self._client
+
+    def session(self, portal: str, account: str) -> HttpSession:
+        """
+        Retorna (ou cria) a sessão de uma conta em um portal
+
+        Args:
+            portal: Nome do portal/plano
+            account: Login da conta
+
+        Returns:
+            Sessão com cookie jar próprio
+        """
+        key = (portal, account)
+        if key not in self._sessions:
+            self._sessions[key] = HttpSession(portal, account)
+        return self._sessions[key]
+
+    async def request(
+        self,
+        session: HttpSession,
+        method: str,
+        url: str,
+        **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Faz uma requisição com os cookies da sessão, seguindo redirecionamentos
+
+        Os cookies de cada resposta (inclusive intermediárias) são gravados no jar da
+        sessão, o que cobre logins que setam cookie e redirecionam.
+
+        Args:
+            session: Sessão da conta
+            method: Método HTTP
+            url: URL absoluta
+            **kwargs: data, params, headers, json repassados ao httpx
+
+        Returns:
+            Resposta final
+        """
+        session.last_used_at = time.monotonic()
+        try:
+            for _ in range(self.max_redirects + 1):
+                request = self.client.build_request(method, url, **kwargs)
+                session.cookies.set_cookie_header(request)
+                response = await self.client.send(request)
+                session.cookies.extract_cookies(response)
+                session.requests += 1
+                self.requests_total += 1
+
+                if not response.is_redirect:
+                    return response
+
+                url = str(request.url.join(response.headers["location"]))
+                if response.status_code in (301, 302, 303) and method.upper() != "HEAD":
+                    method = "GET"
+                    kwargs = {k: v for k, v in kwargs.items() if k == "headers"}
+                else:
+                    kwargs.pop("params", None)
+
+            raise httpx.TooManyRedirects(f"Mais de {self.max_redirects} redirecionamentos", request=request)
+        except Exception:
+            self.errors_total += 1
+            metrics.inc("scraper_request_errors")
+            raise
+
+    async def get_document(self, session: HttpSession, url: str, **kwargs: Any) -> HtmlDocument:
+        """
+        GET e análise do HTML
+
+        Args:
+            session: Sessão da conta
+            url: URL absoluta
+            **kwargs: Repassados para request
+
+        Returns:
+            Documento analisado (url = URL final após redirecionamentos)
+        """
+        response = await self.request(session, "GET", url, **kwargs)
+        return HtmlDocument(response.text, str(response.url))
+
+    async def submit_form(
+        self,
+        session: HttpSession,
+        page_url: str,
+        values: Dict[str, str],
+        form_selector: str = "form"
+    ) -> httpx.Response:
+        """
+        Login por formulário: abre a página, mantém campos hidden (CSRF) e envia os valores
+
+        Args:
+            session: Sessão da conta
+            page_url: URL da página com o formulário
+            values: Campos preenchidos (ex: {"usuario": ..., "senha": ...})
+            form_selector: Seletor CSS do formulário
+
+        Returns:
+            Resposta do envio (após redirecionamentos)
+        """
+        document = await self.get_document(session, page_url)
+        action, method, fields = document.form(form_selector)
+        fields.update(values)
+
+        log_with_context(
+            logger,
+            "INFO",
+            "Enviando formulário sem browser",
+            portal=session.portal,
+            session_id=session.id,
+            action=action,
+            fields=sorted(fields)
+        )
+        if method == "POST":
+            return await self.request(session, "POST", action, data=fields)
+        return await self.request(session, "GET", action, params=fields)
+
+    async def close(self) -> None:
+        """Fecha o cliente HTTP e descarta as sessões"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "client_open": self._client is not None and not self._client.is_closed,
+            "requests_total": self.requests_total,
+            "errors_total": self.errors_total,
+            "sessions": [session.to_dict() for session in self._sessions.values()],
+        }
+
+
+# Instância global da engine HTTP
+scraper_engine = ScraperEngine()
+metrics.register_collector("scraper", scraper_engine.stats)
@@ -0,0 +1,89 @@
+"""
+Keep-alive das sessões logadas nos portais e estado de prontidão (/ready)
+"""
+import os
+import asyncio
+from typing import Any, Dict, Optional
+from app.utils.browser_pool import BrowserManager, browser_manager
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+class SessionKeeper:
+    """Valida sessões periodicamente e refaz login antes da expiração"""
+
+    def __init__(self, manager: BrowserManager = browser_manager):
+        self.manager = manager
+        self.interval = float(os.getenv("SESSION_KEEPALIVE_INTERVAL", "60"))
+        self.ping_after = float(os.getenv("SESSION_PING_AFTER", "240"))
+        self.relogin_after = float(os.getenv("SESSION_RELOGIN_AFTER", "1200"))
+        self._task: Optional[asyncio.Task] = None
+
+    async def tick(self) -> None:
+        """Executa uma rodada de keep-alive em todos os pools"""
+        for pool in list(self.manager.pools.values()):
+            counters = await pool.keepalive(self.relogin_after, self.ping_after)
+            for name, value in counters.items():
+                if value:
+                    metrics.inc(f"session_{name}", value)
+            if counters["ping_failures"] or counters["relogins"] or counters["discarded"]:
+                log_with_context(
+                    logger,
+                    "INFO",
+                    "Keep-alive de sessões executado",
+                    pool=pool.name,
+                    **counters
+                )
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_with_context(
+                    logger,
+                    "ERROR",
+                    f"Erro no keep-alive de sessões: {str(e)}",
+                    error_type=type(e).__name__
+                )
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Inicia o keep-alive em background no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Interrompe o keep-alive"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Verifica se há ao menos uma sessão aquecida por plano que exige sessões
+
+        Planos com min_sessions = 0 não bloqueiam a prontidão.
+
+        Returns:
+            Dicionário com "ready" e a quantidade de sessões aquecidas por plano
+        """
+        plans = {
+            name: pool.warm_sessions
+            for name, pool in self.manager.pools.items()
+            if pool.min_sessions > 0
+        }
+        return {
+            "ready": all(count > 0 for count in plans.values()),
+            "warm_sessions": plans,
+        }
+
+
+# Instância global do keep-alive
+session_keeper = SessionKeeper()
@@ -0,0 +1,50 @@
+"""
+Relatório de tempo de import/startup do micro-serviço
+"""
+import time
+from typing import Any, Dict
+from app.utils.metrics import metrics
+
+
+class StartupReport:
+    """Marca fases do startup e tempos de carregamento de handlers (em ms)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.handlers: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """
+        Registra o tempo decorrido desde o início do import até a fase
+
+        Args:
+            phase: Nome da fase (ex: "imports", "app_created", "lifespan_ready")
+
+        Returns:
+            Tempo decorrido em ms
+        """
+        elapsed = round((time.perf_counter() - self.started) * 1000, 1)
+        self.phases[phase] = elapsed
+        return elapsed
+
+    def record_handler(self, plan_name: str, elapsed_ms: float) -> None:
+        """
+        Registra o tempo de carregamento (import + instanciação) de um handler
+
+        Args:
+            plan_name: Nome do plano
+            elapsed_ms: Tempo de carregamento em ms
+        """
+        self.handlers[plan_name] = round(elapsed_ms, 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "phases_ms": dict(self.phases),
+            "handlers_load_ms": dict(self.handlers),
+        }
+
+
+# Instância global do relatório de startup
+startup_report = StartupReport()
+metrics.register_collector("startup", startup_report.snapshot)
@@ -0,0 +1,489 @@
+"""
+Estado compartilhado entre réplicas (cache, deduplicação, orçamento e sessões)
+
+O backend é escolhido por STATE_BACKEND_URL:
+
+- "memory://" (padrão): só o processo atual, como antes
+- "sqlite:///data/state.db": processos do mesmo nó (ex: uvicorn --workers N)
+- "redis://[:senha@]host:6379/0": réplicas em nós diferentes (Redis ou compatível, via RESP)
+
+A interface é assíncrona: o SQLite roda em threads (asyncio.to_thread) e o RESP usa
+streams do asyncio com prazo de STATE_TIMEOUT por operação. Um Redis lento ou fora do ar
+atrasa só quem espera a resposta, nunca o event loop (webhooks e streams SSE seguem).
+"""
+import os
+import time
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from app.utils.metrics import metrics
+
+
+class StateBackendError(Exception):
+    """Backend de estado indisponível ou com resposta inválida"""
+
+
+class StateBackend(ABC):
+    """
+    Armazenamento chave/valor com expiração
+
+    Valores são strings (quem usa serializa). Expirações usam o relógio de parede,
+    comum a todos os processos.
+    """
+
+    name = "base"
+    # Se outros processos enxergam o mesmo estado
+    shared = False
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self.operations = 0
+        self.errors = 0
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Valor da chave
+
+        Args:
+            key: Chave
+
+        Returns:
+            Valor ou None se ausente/expirado
+        """
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """
+        Grava o valor
+
+        Args:
+            key: Chave
+            value: Valor
+            ttl: Validade em segundos (None = sem expiração)
+        """
+
+    @abstractmethod
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """
+        Grava o valor só se a chave não existir (atômico entre processos)
+
+        Args:
+            key: Chave
+            value: Valor
+            ttl: Validade em segundos
+
+        Returns:
+            True se gravou
+        """
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Remove a chave"""
+
+    @abstractmethod
+    async def incr(self, key: str, ttl: float) -> int:
+        """
+        Incrementa um contador que expira ttl segundos após a criação (janelas de limite)
+
+        Args:
+            key: Chave do contador
+            ttl: Validade do contador
+
+        Returns:
+            Valor após o incremento
+        """
+
+    def close(self) -> None:
+        """Libera conexões"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "shared": self.shared,
+            "operations": self.operations,
+            "errors": self.errors,
+        }
+
+
+class MemoryBackend(StateBackend):
+    """Estado do processo atual (dict limitado, remove as chaves mais antigas; só no event loop)"""
+
+    name = "memory"
+
+    def __init__(self, prefix: str = "", max_entries: Optional[int] = None):
+        super().__init__(prefix)
+        self.max_entries = max_entries or int(os.getenv("STATE_MEMORY_MAX_ENTRIES", "100000"))
+        self._data: "OrderedDict[str, Tuple[Optional[float], str]]" = OrderedDict()
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= now:
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def _store(self, key: str, value: str, ttl: Optional[float], now: float) -> None:
+        self._data[key] = (now + ttl if ttl is not None else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        self.operations += 1
+        return self._live(self.prefix + key, time.time())
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.operations += 1
+        self._store(self.prefix + key, value, ttl, time.time())
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        self.operations += 1
+        now = time.time()
+        if self._live(self.prefix + key, now) is not None:
+            return False
+        self._store(self.prefix + key, value, ttl, now)
+        return True
+
+    async def delete(self, key: str) -> None:
+        self.operations += 1
+        self._data.pop(self.prefix + key, None)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        self.operations += 1
+        now = time.time()
+        key = self.prefix + key
+        current = self._live(key, now)
+        if current is None:
+            self._store(key, "1", ttl, now)
+            return 1
+        value = int(current) + 1
+        self._data[key] = (self._data[key][0], str(value))
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "entries": len(self._data), "max_entries": self.max_entries}
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+) WITHOUT ROWID
+"""
+
+
+class SQLiteBackend(StateBackend):
+    """Estado compartilhado pelos processos de um nó (SQLite em WAL, consultado em threads)"""
+
+    name = "sqlite"
+    shared = True
+
+    def __init__(self, path: str, prefix: str = ""):
+        super().__init__(prefix)
+        self.path = path
+        self.purge_every = int(os.getenv("STATE_PURGE_EVERY", "1000"))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes_since_purge = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(SQLITE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple) -> sqlite3.Cursor:
+        self.operations += 1
+        try:
+            return self._connection().execute(sql, params)
+        except sqlite3.Error as e:
+            self.errors += 1
+            raise StateBackendError(f"SQLite: {str(e)}") from e
+
+    def _wrote(self, now: float) -> None:
+        # Chaves expiradas são ignoradas nas leituras e removidas de tempos em tempos
+        self._writes_since_purge += 1
+        if self._writes_since_purge >= self.purge_every:
+            self._writes_since_purge = 0
+            self._execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (self.prefix + key, time.time())
+            ).fetchone()
+            return row[0] if row else None
+
+    def _set_sync(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.time()
+            self._execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+                (self.prefix + key, value, now + ttl if ttl is not None else None)
+            )
+            self._wrote(now)
+
+    def _add_sync(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        with self._lock:
+            now = time.time()
+            # Chave expirada (ainda não removida) conta como ausente
+            cursor = self._execute(
+                "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+                (self.prefix + key, value, now + ttl if ttl is not None else None, now)
+            )
+            self._wrote(now)
+            return cursor.rowcount == 1
+
+    def _delete_sync(self, key: str) -> None:
+        with self._lock:
+            self._execute("DELETE FROM state WHERE key = ?", (self.prefix + key,))
+
+    def _incr_sync(self, key: str, ttl: float) -> int:
+        with self._lock:
+            now = time.time()
+            row = self._execute(
+                "INSERT INTO state (key, value, expires_at) VALUES (?, '1', ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "value = CASE WHEN state.expires_at <= ? THEN '1' ELSE CAST(state.value AS INTEGER) + 1 END, "
+                "expires_at = CASE WHEN state.expires_at <= ? THEN excluded.expires_at ELSE state.expires_at END "
+                "RETURNING value",
+                (self.prefix + key, now + ttl, now, now)
+            ).fetchone()
+            self._wrote(now)
+            return int(row[0])
+
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        await asyncio.to_thread(self._set_sync, key, value, ttl)
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        return await asyncio.to_thread(self._add_sync, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await asyncio.to_thread(self._delete_sync, key)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        return await asyncio.to_thread(self._incr_sync, key, ttl)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RespBackend(StateBackend):
+    """Estado compartilhado entre nós via protocolo RESP (Redis ou compatível), com streams do asyncio"""
+
+    name = "redis"
+    shared = True
+
+    def __init__(
+        self,
+        host: str,
+        port: int = 6379,
+        db: int = 0,
+        password: Optional[str] = None,
+        username: Optional[str] = None,
+        prefix: str = ""
+    ):
+        super().__init__(prefix)
+        self.host = host
+        self.port = port
+        self.db = db
+        self._username = username
+        self._password = password
+        self.timeout = float(os.getenv("STATE_TIMEOUT", "2"))
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        # Uma conexão com um pipeline por vez: as respostas chegam na ordem dos comandos
+        self._lock = asyncio.Lock()
+        self.reconnects = 0
+        self.timeouts = 0
+
+    @staticmethod
+    def _encode(args: Tuple[Any, ...]) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            # Devolvido (não levantado) para que as demais respostas do pipeline sejam lidas
+            return StateBackendError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [await self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"Resposta RESP inválida: {line[:20]!r}")
+
+    async def _connect(self) -> None:
+        # O asyncio já abre conexões TCP com TCP_NODELAY
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self._password:
+            auth = ("AUTH", self._username, self._password) if self._username else ("AUTH", self._password)
+            await self._roundtrip([auth])
+        if self.db:
+            await self._roundtrip([("SELECT", self.db)])
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except (OSError, RuntimeError):
+                pass
+        self._reader = None
+        self._writer = None
+
+    async def _roundtrip(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        # Pipeline: envia todos os comandos e lê as respostas na ordem
+        self._writer.write(b"".join(self._encode(command) for command in commands))
+        await self._writer.drain()
+        replies = [await self._read_reply() for _ in commands]
+        for reply in replies:
+            if isinstance(reply, StateBackendError):
+                raise reply
+        return replies
+
+    async def _exchange(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        if self._writer is None:
+            await self._connect()
+        return await self._roundtrip(commands)
+
+    async def _pipeline(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        async with self._lock:
+            self.operations += 1
+            # Conexão persistente; uma reconexão se o servidor a derrubou (restart, idle timeout)
+            for attempt in (1, 2):
+                try:
+                    return await asyncio.wait_for(self._exchange(list(commands)), self.timeout)
+                except StateBackendError:
+                    self.errors += 1
+                    raise
+                except asyncio.TimeoutError as e:
+                    # Servidor lento: a conexão fica com respostas pendentes e é descartada, sem nova tentativa
+                    self._disconnect()
+                    self.errors += 1
+                    self.timeouts += 1
+                    raise StateBackendError(f"Backend de estado sem resposta em {self.timeout}s") from e
+                except (OSError, ConnectionError, EOFError, ValueError) as e:
+                    self._disconnect()
+                    if attempt == 2:
+                        self.errors += 1
+                        raise StateBackendError(f"Backend de estado indisponível: {str(e)}") from e
+                    self.reconnects += 1
+                except asyncio.CancelledError:
+                    # Resposta pela metade: a próxima operação abre outra conexão
+                    self._disconnect()
+                    raise
+
+    async def _command(self, *args: Any) -> Any:
+        return (await self._pipeline(args))[0]
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self._command("GET", self.prefix + key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        if ttl is None:
+            await self._command("SET", self.prefix + key, value)
+        else:
+            await self._command("SET", self.prefix + key, value, "PX", max(1, int(ttl * 1000)))
+
+    async def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        if ttl is None:
+            return await self._command("SET", self.prefix + key, value, "NX") == "OK"
+        return await self._command("SET", self.prefix + key, value, "PX", max(1, int(ttl * 1000)), "NX") == "OK"
+
+    async def delete(self, key: str) -> None:
+        await self._command("DEL", self.prefix + key)
+
+    async def incr(self, key: str, ttl: float) -> int:
+        # Cria o contador já com expiração: nunca fica um contador eterno
+        key = self.prefix + key
+        _, value = await self._pipeline(("SET", key, "0", "PX", max(1, int(ttl * 1000)), "NX"), ("INCR", key))
+        return value
+
+    def close(self) -> None:
+        self._disconnect()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "host": f"{self.host}:{self.port}",
+            "reconnects": self.reconnects,
+            "timeouts": self.timeouts,
+        }
+
+
+def create_backend(url: Optional[str] = None) -> StateBackend:
+    """
+    Cria o backend de estado a partir da URL
+
+    Args:
+        url: "memory://", "sqlite:///caminho.db" ou "redis://[:senha@]host:porta/db"
+             (padrão: STATE_BACKEND_URL)
+
+    Returns:
+        Backend configurado (conexões abertas no primeiro uso)
+
+    Raises:
+        ValueError: Se o esquema não for suportado
+    """
+    url = url or os.getenv("STATE_BACKEND_URL", "memory://")
+    prefix = os.getenv("STATE_PREFIX", "robo_veia:")
+    parts = urlsplit(url)
+    if parts.scheme == "memory":
+        return MemoryBackend(prefix)
+    if parts.scheme == "sqlite":
+        # sqlite:///relativo.db ou sqlite:////absoluto.db
+        path = unquote(parts.path[1:] if parts.path.startswith("/") else parts.path)
+        return SQLiteBackend(path or "data/state.db", prefix)
+    if parts.scheme in ("redis", "resp"):
+        return RespBackend(
+            parts.hostname or "localhost",
+            parts.port or 6379,
+            int(parts.path.lstrip("/") or 0),
+            unquote(parts.password) if parts.password else None,
+            unquote(parts.username) if parts.username else None,
+            prefix
+        )
+    raise ValueError(f"STATE_BACKEND_URL não suportada: {parts.scheme}://")
+
+
+# Instância global do backend de estado
+state_backend = create_backend()
+metrics.register_collector("state", state_backend.stats)
@@ -0,0 +1,363 @@
+"""
+Gravação e reprodução do tráfego dos portais (formato HAR simplificado)
+
+PORTAL_TRAFFIC_MODE=record grava as respostas de cada portal durante sessões reais, com
+credenciais e dados pessoais removidos. PORTAL_TRAFFIC_MODE=replay serve essas respostas
+às páginas via interceptação de rotas do Playwright, sem acessar o portal: o fluxo
+completo com browser roda de forma determinística em CI e em comparações de desempenho.
+"""
+import os
+import re
+import json
+import base64
+import hashlib
+from urllib.parse import quote, quote_plus
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.metrics import metrics
+from app.utils.logger import logger, log_with_context
+
+
+# Headers que nunca são gravados (credenciais ou inválidos após decodificar o corpo)
+DROPPED_HEADERS = frozenset({
+    "cookie", "set-cookie", "authorization", "proxy-authorization", "www-authenticate",
+    "x-auth-token", "x-access-token", "x-refresh-token", "x-api-key",
+    "x-csrf-token", "x-xsrf-token", "x-session-id", "x-amz-security-token",
+    "content-length", "content-encoding", "transfer-encoding",
+})
+
+# Headers próprios de cada portal com token no nome também ficam de fora
+DROPPED_HEADER_MARKERS = ("token", "secret", "session")
+
+TEXT_TYPES = ("text/", "json", "javascript", "xml", "x-www-form-urlencoded")
+
+# Dados pessoais reconhecíveis por padrão: CPF, e-mail e telefone
+DEFAULT_PII_PATTERNS = [
+    (re.compile(r"\b\d{3}\.?\d{3}\.?\d{3}-?\d{2}\b"), "<cpf>"),
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"\(?\b\d{2}\)?\s?9?\d{4}-\d{4}\b"), "<telefone>"),
+]
+
+
+class TrafficScrubber:
+    """Remove credenciais e dados pessoais de URLs e corpos gravados"""
+
+    def __init__(self, extra_patterns: Optional[List[str]] = None):
+        self._secrets: Dict[str, str] = {}
+        self._patterns = list(DEFAULT_PII_PATTERNS) + [
+            (re.compile(pattern), "<removido>") for pattern in (extra_patterns or [])
+        ]
+
+    @staticmethod
+    def pseudonym(value: str, kind: str) -> str:
+        """Pseudônimo estável: o mesmo valor sempre gera o mesmo marcador"""
+        return f"{kind}-{hashlib.sha256(value.encode()).hexdigest()[:10]}"
+
+    def add_secret(self, value: str, kind: str) -> None:
+        """
+        Registra um valor sensível conhecido (login, senha, carteirinha)
+
+        Credenciais viram marcadores fixos; carteirinhas viram pseudônimos estáveis, para
+        que a reprodução diferencie consultas de carteirinhas diferentes.
+
+        Args:
+            value: Valor a esconder
+            kind: "login", "password" ou "card"
+        """
+        if not value:
+            return
+        replacement = self.pseudonym(value, kind) if kind == "card" else f"<{kind}>"
+        # Formulários e JSON levam o valor codificado: "imc@2025" chega como "imc%402025"
+        escaped = "".join(c if c.isalnum() else f"\\u{ord(c):04x}" for c in value)
+        for form in (value, quote_plus(value), quote(value), json.dumps(value)[1:-1], escaped):
+            self._secrets[form] = replacement
+
+    def scrub(self, text: str) -> str:
+        """
+        Substitui segredos conhecidos e padrões de dados pessoais
+
+        Args:
+            text: URL ou corpo textual
+
+        Returns:
+            Texto sem dados sensíveis
+        """
+        # Valores maiores primeiro para não quebrar segredos que contêm outros
+        for secret in sorted(self._secrets, key=len, reverse=True):
+            text = text.replace(secret, self._secrets[secret])
+        for pattern, replacement in self._patterns:
+            text = pattern.sub(replacement, text)
+        return text
+
+
+def _is_dropped(header: str) -> bool:
+    name = header.lower()
+    return name in DROPPED_HEADERS or any(marker in name for marker in DROPPED_HEADER_MARKERS)
+
+
+def _is_text(content_type: str) -> bool:
+    return any(marker in content_type for marker in TEXT_TYPES)
+
+
+class TrafficRecording:
+    """Tráfego gravado de um portal, indexado por (método, URL sem dados sensíveis)"""
+
+    def __init__(self, portal: str, directory: Path, scrubber: TrafficScrubber):
+        self.portal = portal
+        self.path = directory / f"{portal}.har.json"
+        self.scrubber = scrubber
+        self.entries: List[Dict[str, Any]] = []
+        self._index: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._served: Dict[Tuple[str, str], int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, method: str, url: str) -> Tuple[str, str]:
+        return method.upper(), self.scrubber.scrub(url)
+
+    def add(
+        self,
+        method: str,
+        url: str,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        post_data: Optional[str] = None
+    ) -> None:
+        """
+        Grava uma resposta já removendo dados sensíveis
+
+        Args:
+            method: Método HTTP
+            url: URL da requisição
+            status: Status da resposta
+            headers: Headers da resposta
+            body: Corpo decodificado
+            post_data: Corpo da requisição (formulários de login são gravados sem credenciais)
+        """
+        content_type = headers.get("content-type", "")
+        if _is_text(content_type):
+            content = {"mimeType": content_type, "text": self.scrubber.scrub(body.decode("utf-8", "replace"))}
+        else:
+            content = {"mimeType": content_type, "text": base64.b64encode(body).decode(), "encoding": "base64"}
+
+        entry = {
+            "request": {
+                "method": method.upper(),
+                "url": self.scrubber.scrub(url),
+                "postData": {"text": self.scrubber.scrub(post_data)} if post_data else None,
+            },
+            "response": {
+                "status": status,
+                "headers": [
+                    {"name": name, "value": self.scrubber.scrub(value)}
+                    for name, value in headers.items() if not _is_dropped(name)
+                ],
+                "content": content,
+            },
+        }
+        self._append(entry)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        self.entries.append(entry)
+        request = entry["request"]
+        self._index.setdefault((request["method"], request["url"]), []).append(entry)
+
+    def lookup(self, method: str, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Resposta gravada para a requisição (repetidas são servidas em ordem; a última se repete)
+
+        Args:
+            method: Método HTTP
+            url: URL da requisição (com dados reais; é limpa antes da busca)
+
+        Returns:
+            Entrada gravada ou None
+        """
+        key = self.key(method, url)
+        candidates = self._index.get(key)
+        if not candidates:
+            self.misses += 1
+            return None
+        served = self._served.get(key, 0)
+        self._served[key] = served + 1
+        self.hits += 1
+        return candidates[min(served, len(candidates) - 1)]
+
+    def save(self) -> None:
+        """Grava o arquivo HAR do portal"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "log": {
+                "version": "1.2",
+                "creator": {"name": "robo_veia", "version": "1.0.0"},
+                "pages": [],
+                "entries": [
+                    {"startedDateTime": datetime.now(timezone.utc).isoformat(), "time": 0, **entry}
+                    for entry in self.entries
+                ],
+            }
+        }
+        self.path.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    def load(self) -> None:
+        """Carrega o arquivo HAR do portal"""
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        for entry in data["log"]["entries"]:
+            self._append({"request": entry["request"], "response": entry["response"]})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+
+class TrafficManager:
+    """Liga gravação ou reprodução às páginas dos portais conforme PORTAL_TRAFFIC_MODE"""
+
+    def __init__(self):
+        self.mode = os.getenv("PORTAL_TRAFFIC_MODE", "off").lower()
+        self.directory = Path(os.getenv("PORTAL_TRAFFIC_DIR", "recordings"))
+        # Em replay, requisições sem gravação são abortadas (abort) ou vão para a rede (continue)
+        self.on_miss = os.getenv("PORTAL_TRAFFIC_REPLAY_MISS", "abort").lower()
+        extra = os.getenv("PORTAL_TRAFFIC_SCRUB_PATTERNS")
+        self.extra_patterns = json.loads(extra) if extra else []
+        self._recordings: Dict[str, TrafficRecording] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("record", "replay")
+
+    def recording(self, portal: str) -> TrafficRecording:
+        """
+        Gravação do portal (carregada do disco em modo replay)
+
+        Args:
+            portal: Nome do portal
+
+        Returns:
+            Gravação do portal
+        """
+        if portal not in self._recordings:
+            recording = TrafficRecording(portal, self.directory, TrafficScrubber(self.extra_patterns))
+            if self.mode == "replay":
+                recording.load()
+            self._recordings[portal] = recording
+        return self._recordings[portal]
+
+    def add_secret(self, portal: str, value: str, kind: str) -> None:
+        """
+        Registra um valor sensível do portal (credenciais no login, carteirinha na consulta)
+
+        Args:
+            portal: Nome do portal
+            value: Valor sensível
+            kind: "login", "password" ou "card"
+        """
+        if self.enabled:
+            self.recording(portal).scrubber.add_secret(value, kind)
+
+    async def attach(self, page: Any, portal: str) -> None:
+        """
+        Liga a página à gravação ou reprodução do portal (nada acontece com o modo off)
+
+        Args:
+            page: Página do Playwright
+            portal: Nome do portal
+        """
+        if self.mode == "record":
+            recording = self.recording(portal)
+
+            async def on_response(response: Any) -> None:
+                await self._record(recording, response)
+
+            page.on("response", on_response)
+        elif self.mode == "replay":
+            recording = self.recording(portal)
+
+            async def on_route(route: Any) -> None:
+                await self._replay(recording, route)
+
+            await page.route("**/*", on_route)
+
+    async def _record(self, recording: TrafficRecording, response: Any) -> None:
+        request = response.request
+        try:
+            body = await response.body()
+        except Exception:
+            # Redirecionamentos e respostas descartadas não têm corpo
+            body = b""
+        try:
+            recording.add(
+                request.method,
+                request.url,
+                response.status,
+                await response.all_headers(),
+                body,
+                request.post_data
+            )
+            metrics.inc("traffic_recorded")
+        except Exception as e:
+            log_with_context(
+                logger,
+                "WARNING",
+                f"Falha ao gravar resposta do portal: {str(e)}",
+                portal=recording.portal,
+                error_type=type(e).__name__
+            )
+
+    async def _replay(self, recording: TrafficRecording, route: Any) -> None:
+        request = route.request
+        entry = recording.lookup(request.method, request.url)
+        if entry is None:
+            metrics.inc("traffic_replay_misses")
+            log_with_context(
+                logger,
+                "WARNING",
+                "Requisição sem gravação no replay",
+                portal=recording.portal,
+                method=request.method,
+                url=recording.scrubber.scrub(request.url),
+                on_miss=self.on_miss
+            )
+            if self.on_miss == "continue":
+                await route.continue_()
+            else:
+                await route.abort()
+            return
+
+        response = entry["response"]
+        content = response["content"]
+        if content.get("encoding") == "base64":
+            body = base64.b64decode(content["text"])
+        else:
+            body = content["text"].encode("utf-8")
+        await route.fulfill(
+            status=response["status"],
+            headers={header["name"]: header["value"] for header in response["headers"]},
+            body=body
+        )
+
+    def save(self) -> None:
+        """Grava em disco as gravações do modo record"""
+        if self.mode != "record":
+            return
+        for recording in self._recordings.values():
+            recording.save()
+            log_with_context(
+                logger,
+                "INFO",
+                f"Tráfego do portal gravado: {recording.portal}",
+                path=str(recording.path),
+                entries=len(recording.entries)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "portals": {name: recording.stats() for name, recording in self._recordings.items()},
+        }
+
+
+# Instância global de gravação/reprodução
+traffic = TrafficManager()
+metrics.register_collector("traffic", traffic.stats)
@@ -0,0 +1,7 @@
+"""
+Micro-benchmarks dos caminhos quentes em processo (logs, schemas, dispatch, callback e router)
+
+Uso:
+    python -m benchmarks              # mede e compara com benchmarks/baseline.json
+    python -m benchmarks --save       # grava uma nova baseline
+"""
@@ -0,0 +1,77 @@
+"""
+Linha de comando dos micro-benchmarks: sai com código 1 se algum regredir além da tolerância
+"""
+import sys
+import argparse
+from pathlib import Path
+from benchmarks import cases  # noqa: F401  (registra os benchmarks)
+from benchmarks.harness import BASELINE_PATH, CASES, build_baseline, compare, load_baseline, run, save_baseline
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("names", nargs="*", help="Benchmarks a executar (padrão: todos)")
+    parser.add_argument("--save", action="store_true", help="Grava os resultados como nova baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Arquivo da baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="Piora aceita (0.3 = 30%%)")
+    parser.add_argument("--rounds", type=int, default=7, help="Rodadas por benchmark")
+    parser.add_argument("--round-seconds", type=float, default=0.1, help="Duração mínima de cada rodada")
+    parser.add_argument("--retries", type=int, default=2, help="Novas medições antes de confirmar uma regressão")
+    parser.add_argument("--list", action="store_true", help="Lista os benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(CASES))
+        return 0
+    unknown = [name for name in args.names if name not in CASES]
+    if unknown:
+        parser.error(f"Benchmarks desconhecidos: {', '.join(unknown)}")
+
+    results = run(args.names or None, args.rounds, args.round_seconds)
+
+    if args.save:
+        data = build_baseline(results)
+        previous = load_baseline(args.baseline)
+        if previous is not None and args.names:
+            # Execução parcial: mantém os demais benchmarks da baseline anterior
+            for name, entry in previous["benchmarks"].items():
+                data["benchmarks"].setdefault(name, entry)
+        save_baseline(data, args.baseline)
+        for result in results:
+            print(f"{result.name:<34} {result.best_ns / 1000:>10.2f} µs")
+        print(f"Baseline gravada em {args.baseline}")
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"Baseline não encontrada ({args.baseline}); rode com --save", file=sys.stderr)
+        return 2
+
+    rows = compare(results, baseline, args.tolerance)
+    # Ruído da máquina: só é regressão se persistir em novas medições (vale a melhor)
+    for _ in range(args.retries):
+        suspects = [row["name"] for row in rows if row["regressed"]]
+        if not suspects:
+            break
+        retried = {result.name: result for result in run(suspects, args.rounds, args.round_seconds)}
+        results = [
+            retried[result.name] if result.name in retried and retried[result.name].relative < result.relative else result
+            for result in results
+        ]
+        rows = compare(results, baseline, args.tolerance)
+
+    print(f"{'benchmark':<34} {'atual':>10} {'razão':>8} {'limite':>8}")
+    for result, row in zip(results, rows):
+        ratio = "novo" if row["ratio"] is None else f"{row['ratio']:.2f}x"
+        flag = "  REGREDIU" if row["regressed"] else ""
+        print(f"{result.name:<34} {result.best_ns / 1000:>8.2f}µs {ratio:>8} {row['limit']:>7.2f}x{flag}")
+
+    regressions = [row["name"] for row in rows if row["regressed"]]
+    if regressions:
+        print(f"Regressões: {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Benchmarks dos caminhos quentes, com stubs no lugar de portais e do envio de callbacks
+"""
+import json
+import logging
+import itertools
+from contextlib import asynccontextmanager
+from typing import Optional
+from unittest.mock import patch
+import httpx
+from app.dispatch import HandlerRegistry
+from app.schemas import CallbackResponse, WebhookInRequest
+from app.utils.idempotency import IdempotencyStore
+from app.utils.logger import StructuredFormatter, log_with_context, logger
+from benchmarks.harness import case
+
+
+PAYLOAD = {
+    "numero_carterinha": "086955681",
+    "plan_name": "stub",
+    "numero": "5517992749450@s.whatsapp.net",
+}
+
+
+async def stub_handler(numero_carteirinha: str) -> str:
+    """Handler instantâneo: mede só o dispatch"""
+    return "elegivel"
+
+
+async def stub_callback(numero: str, status: str, callback_url: Optional[str] = None) -> bool:
+    """Callback sem rede: mede só o caminho do router"""
+    return True
+
+
+def stub_registry() -> HandlerRegistry:
+    registry = HandlerRegistry()
+    registry.register_handler("stub", stub_handler)
+    return registry
+
+
+@case("logger.log_with_context")
+@asynccontextmanager
+async def bench_log_with_context():
+    yield lambda: log_with_context(
+        logger,
+        "INFO",
+        "Processamento de elegibilidade concluído",
+        plan_name="amil",
+        numero_carteirinha="086955681",
+        result="elegivel"
+    )
+
+
+@case("logger.structured_formatter")
+@asynccontextmanager
+async def bench_structured_formatter():
+    formatter = StructuredFormatter()
+    record = logging.LogRecord("robo_veia", logging.INFO, __file__, 1, "Webhook recebido", None, None)
+    record.extra_data = PAYLOAD
+    yield lambda: formatter.format(record)
+
+
+@case("schemas.webhook_in_json")
+@asynccontextmanager
+async def bench_webhook_in_json():
+    body = json.dumps(PAYLOAD)
+    yield lambda: WebhookInRequest.model_validate_json(body)
+
+
+@case("schemas.webhook_in_dict")
+@asynccontextmanager
+async def bench_webhook_in_dict():
+    yield lambda: WebhookInRequest.model_validate(PAYLOAD)
+
+
+@case("dispatch.get_handler")
+@asynccontextmanager
+async def bench_get_handler():
+    registry = stub_registry()
+    yield lambda: registry.get_handler("stub")
+
+
+@case("dispatch.get_handler_generic")
+@asynccontextmanager
+async def bench_get_handler_generic():
+    registry = stub_registry()
+    yield lambda: registry.get_handler("plano qualquer")
+
+
+@case("dispatch.process_eligibility", is_async=True)
+@asynccontextmanager
+async def bench_process_eligibility():
+    registry = stub_registry()
+    yield lambda: registry.process_eligibility("stub", "086955681")
+
+
+@case("callback.serialize")
+@asynccontextmanager
+async def bench_callback_serialize():
+    yield lambda: json.dumps(CallbackResponse(numero=PAYLOAD["numero"], status="elegivel").model_dump())
+
+
+@case("router.webhook_in", is_async=True, tolerance=0.5)
+@asynccontextmanager
+async def bench_router_webhook_in():
+    # Importado aqui: carregar o app registra rotas, middlewares e coletores
+    from app.main import app
+
+    # Número de callback diferente a cada requisição: mede o caminho de um pedido novo,
+    # com o registro de idempotência, e não o de uma repetição
+    numeros = (f"55179{n:08d}@s.whatsapp.net" for n in itertools.count())
+    store = IdempotencyStore(":memory:")
+    with patch("app.router.handler_registry", stub_registry()), \
+            patch("app.router.send_callback", stub_callback), \
+            patch("app.router.idempotency_store", store):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            yield lambda: client.post("/webhook/in", json={**PAYLOAD, "numero": next(numeros)})
+        store.close()
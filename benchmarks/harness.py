@@ -0,0 +1,248 @@
+"""
+Medição, baseline e comparação dos micro-benchmarks
+"""
+import gc
+import json
+import time
+import asyncio
+import logging
+import platform
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncContextManager, Callable, Dict, Iterator, List, NamedTuple, Optional
+
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+
+class Case(NamedTuple):
+    """Benchmark registrado: setup (async context manager que entrega a operação) e opções"""
+    name: str
+    setup: Callable[[], AsyncContextManager[Callable[[], Any]]]
+    is_async: bool
+    tolerance: Optional[float]
+
+
+class Result(NamedTuple):
+    """Resultado de um benchmark (tempos por operação e da carga de referência, em ns)"""
+    name: str
+    best_ns: float
+    median_ns: float
+    iterations: int
+    rounds: int
+    calibration_ns: float
+    relative: float
+
+
+CASES: Dict[str, Case] = {}
+
+
+def case(name: str, is_async: bool = False, tolerance: Optional[float] = None):
+    """
+    Registra um benchmark
+
+    A função decorada é um async context manager que prepara os stubs e entrega a operação
+    medida (uma função sem argumentos; com is_async, ela retorna uma corrotina).
+
+    Args:
+        name: Nome único (ex: "schemas.webhook_in")
+        is_async: A operação deve ser aguardada
+        tolerance: Tolerância própria (benchmarks mais ruidosos)
+    """
+    def decorator(setup):
+        CASES[name] = Case(name, setup, is_async, tolerance)
+        return setup
+    return decorator
+
+
+def _reference_workload() -> int:
+    total = 0
+    for i in range(2000):
+        total += i * i % 7
+    return total
+
+
+def calibrate(rounds: int = 3) -> float:
+    """
+    Tempo (ns) da carga de referência em Python puro
+
+    A comparação usa os tempos relativos a essa carga, o que permite reaproveitar a
+    baseline em máquinas de velocidades diferentes.
+
+    Args:
+        rounds: Rodadas (vale a melhor)
+
+    Returns:
+        Tempo por execução em ns
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter_ns()
+        for _ in range(50):
+            _reference_workload()
+        best = min(best, (time.perf_counter_ns() - started) / 50)
+    return best
+
+
+class _NullStream:
+    """Stream que descarta tudo (sem acumular memória entre rodadas)"""
+
+    def write(self, text: str) -> int:
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+@contextmanager
+def quiet_logs() -> Iterator[None]:
+    """Descarta a saída dos loggers (a formatação continua sendo executada e medida)"""
+    handlers = [
+        handler
+        for name in [None, *logging.root.manager.loggerDict]
+        for handler in logging.getLogger(name).handlers
+        if type(handler) is logging.StreamHandler
+    ]
+    sink = _NullStream()
+    previous = [handler.setStream(sink) for handler in handlers]
+    try:
+        yield
+    finally:
+        for handler, stream in zip(handlers, previous):
+            handler.setStream(stream)
+
+
+async def _time(op: Callable[[], Any], is_async: bool, iterations: int) -> float:
+    started = time.perf_counter_ns()
+    if is_async:
+        for _ in range(iterations):
+            await op()
+    else:
+        for _ in range(iterations):
+            op()
+    return time.perf_counter_ns() - started
+
+
+async def measure(bench: Case, rounds: int = 7, round_seconds: float = 0.1) -> Result:
+    """
+    Mede um benchmark
+
+    O número de iterações dobra até uma rodada durar round_seconds; depois são feitas
+    `rounds` rodadas com o coletor de lixo desligado (como o timeit). Cada rodada é
+    precedida da carga de referência e o tempo relativo é a menor razão entre as duas:
+    variações de carga da máquina afetam ambas.
+
+    Args:
+        bench: Benchmark registrado
+        rounds: Rodadas medidas
+        round_seconds: Duração mínima de cada rodada
+
+    Returns:
+        Melhor tempo e mediana por operação
+    """
+    async with bench.setup() as op:
+        # Aquecimento: caches, imports e handlers carregados sob demanda
+        await _time(op, bench.is_async, 3)
+
+        iterations = 1
+        while await _time(op, bench.is_async, iterations) < round_seconds * 1e9 and iterations < 1 << 22:
+            iterations *= 2
+
+        per_op: List[float] = []
+        calibrations: List[float] = []
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for _ in range(rounds):
+                calibrations.append(calibrate())
+                per_op.append(await _time(op, bench.is_async, iterations) / iterations)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    relative = min(op_ns / calibration_ns for op_ns, calibration_ns in zip(per_op, calibrations))
+    per_op.sort()
+    return Result(bench.name, per_op[0], per_op[len(per_op) // 2], iterations, rounds, min(calibrations), relative)
+
+
+def run(names: Optional[List[str]] = None, rounds: int = 7, round_seconds: float = 0.1) -> List[Result]:
+    """
+    Executa os benchmarks (todos ou os nomes indicados)
+
+    Args:
+        names: Benchmarks a executar
+        rounds: Rodadas por benchmark
+        round_seconds: Duração mínima de cada rodada
+
+    Returns:
+        Resultados na ordem de registro
+    """
+    selected = [CASES[name] for name in (names or CASES)]
+
+    async def run_all() -> List[Result]:
+        return [await measure(bench, rounds, round_seconds) for bench in selected]
+
+    with quiet_logs():
+        return asyncio.run(run_all())
+
+
+def build_baseline(results: List[Result]) -> Dict[str, Any]:
+    """
+    Monta o conteúdo da baseline
+
+    Args:
+        results: Resultados medidos
+
+    Returns:
+        Dicionário serializável em JSON
+    """
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": {
+            result.name: {
+                "best_ns": round(result.best_ns, 1),
+                "calibration_ns": round(result.calibration_ns, 1),
+                "relative": round(result.relative, 6),
+            }
+            for result in results
+        },
+    }
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Optional[Dict[str, Any]]:
+    """Baseline gravada (ou None se não existir)"""
+    if not path.is_file():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_baseline(data: Dict[str, Any], path: Path = BASELINE_PATH) -> None:
+    """Grava a baseline (chaves ordenadas para diffs legíveis)"""
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def compare(results: List[Result], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """
+    Compara os resultados com a baseline (tempos relativos à calibração)
+
+    Args:
+        results: Resultados medidos
+        baseline: Baseline gravada
+        tolerance: Piora aceita (0.25 = até 25% mais lento)
+
+    Returns:
+        Uma linha por benchmark: razão atual/baseline, limite e se regrediu
+        (benchmarks sem baseline aparecem com ratio None)
+    """
+    rows = []
+    for result in results:
+        bench = CASES.get(result.name)
+        limit = 1 + (bench.tolerance if bench is not None and bench.tolerance is not None else tolerance)
+        reference = baseline.get("benchmarks", {}).get(result.name)
+        if reference is None:
+            rows.append({"name": result.name, "ratio": None, "limit": limit, "regressed": False})
+            continue
+        ratio = result.relative / reference["relative"]
+        rows.append({"name": result.name, "ratio": round(ratio, 3), "limit": limit, "regressed": ratio > limit})
+    return rows
@@ -0,0 +1,29 @@
+"""
+Fixtures compartilhadas pelos testes
+"""
+import pytest
+from app.utils.history import history_store
+from app.utils.idempotency import IdempotencyStore
+
+
+@pytest.fixture(autouse=True)
+def idempotency_db(tmp_path, monkeypatch):
+    """
+    Registro de idempotência isolado por teste (IDEMPOTENCY_DB no diretório temporário)
+
+    O global apontaria para data/idempotency.db: repetir a suíte dentro de
+    IDEMPOTENCY_WINDOW responderia os webhooks com o job da execução anterior.
+    """
+    monkeypatch.setenv("IDEMPOTENCY_DB", str(tmp_path / "idempotency.db"))
+    store = IdempotencyStore()
+    monkeypatch.setattr("app.router.idempotency_store", store)
+    monkeypatch.setattr("app.utils.drain.idempotency_store", store)
+    yield store
+    store.close()
+
+
+@pytest.fixture(autouse=True)
+def history_hash_key(tmp_path, monkeypatch):
+    """Chave do hash da carteirinha gerada no diretório temporário, não em data/history.key"""
+    monkeypatch.setattr(history_store, "hash_key_file", str(tmp_path / "history.key"))
+    monkeypatch.setattr(history_store, "_hash_key", None)
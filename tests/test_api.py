@@ -75,6 +75,19 @@ class TestHealthEndpoint:
         assert isinstance(data["supported_plans"], list)
 
 
+class TestReadyEndpoint:
+    """Testes para o endpoint /ready"""
+    
+    def test_ready_without_warm_sessions(self):
+        """Testa que o serviço não fica pronto sem sessões aquecidas"""
+        response = client.get("/ready")
+        
+        assert response.status_code == 503
+        data = response.json()
+        assert data["status"] == "warming_up"
+        assert data["warm_sessions"].get("amil", 0) == 0
+
+
 class TestPlansEndpoint:
     """Testes para o endpoint /plans"""
     
@@ -0,0 +1,163 @@
+"""
+Testes para a detecção automática do plano pela carteirinha
+"""
+import asyncio
+import pytest
+from app.dispatch import HandlerRegistry
+from app.plugins import CardFormat, HandlerManifest
+from app.utils.history import annotate_check, check_context, history_store
+from app.utils.state import MemoryBackend
+
+
+def portal(result, delay=0.0, calls=None, account=None):
+    """Handler de teste com resultado e atraso fixos"""
+    state = {"cancelled": False, "active": 0, "peak": 0}
+
+    async def handler(numero_carteirinha):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            if calls is not None:
+                calls.append(numero_carteirinha)
+            if account:
+                annotate_check(account=account)
+            await asyncio.sleep(delay)
+            return result
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+        finally:
+            state["active"] -= 1
+
+    handler.state = state
+    return handler
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Registry só com planos de teste (o Amil embutido fica fora da detecção)"""
+    monkeypatch.setenv("PLAN_AUTO_MAX_PARALLEL", "3")
+    registry = HandlerRegistry()
+    registry._manifests["amil"] = registry._manifests["amil"].model_copy(update={"auto_detect": False})
+
+    def add(name, handler, card_format=None, **fields):
+        registry.register_lazy_handler(
+            name, None, HandlerManifest(name=name, target="tests:handler", card_format=card_format, **fields)
+        )
+        registry.register_handler(name, handler)
+        return handler
+
+    registry.add = add
+    return registry
+
+
+class TestCandidates:
+    """Testes da escolha dos candidatos pelo formato"""
+
+    def test_format_hints(self, registry):
+        """Testa formatos compatíveis primeiro, sem formato depois e incompatíveis fora"""
+        registry.add("semformato", portal("nao_elegivel"))
+        registry.add("digitos", portal("nao_elegivel"), CardFormat(min_length=8, max_length=12))
+        registry.add("longo", portal("nao_elegivel"), CardFormat(min_length=16))
+        registry.add("desligado", portal("nao_elegivel"), auto_detect=False)
+
+        assert registry.auto_candidates("1234-5678-90") == ["digitos", "semformato"]
+
+    def test_auto_names(self, registry, monkeypatch):
+        """Testa "auto", plan_name vazio e nomes sem plano só com PLAN_AUTO_DETECT_UNMATCHED"""
+        assert registry.is_auto("AUTO") and registry.is_auto(" ")
+        assert not registry.is_auto("plano desconhecido")
+        assert not registry.is_auto("amil")
+
+        monkeypatch.setenv("PLAN_AUTO_DETECT_UNMATCHED", "true")
+        unmatched = HandlerRegistry()
+        assert unmatched.is_auto("plano desconhecido")
+        assert not unmatched.is_auto("amil")
+
+
+class TestDetection:
+    """Testes da consulta paralela, do cancelamento e da memória carteirinha -> plano"""
+
+    @pytest.mark.asyncio
+    async def test_first_eligible_wins_and_is_remembered(self, registry):
+        """Testa vencedor, cancelamento dos demais e consulta direta na próxima vez"""
+        calls = []
+        registry.add("errado", portal("nao_elegivel", calls=calls))
+        certo = registry.add("certo", portal("elegivel", delay=0.01, calls=calls))
+        lento = registry.add("lento", portal("elegivel", delay=10))
+
+        assert await registry.process_eligibility("auto", "70001") == "elegivel"
+        assert lento.state["cancelled"] is True
+        assert await registry.remembered_plan("70001") == "certo"
+
+        calls.clear()
+        assert await registry.process_eligibility("", "70001") == "elegivel"
+        assert calls == ["70001"] and certo.state["peak"] == 1
+        assert registry.stats()["auto_detect"]["remembered"] == 1
+
+    @pytest.mark.asyncio
+    async def test_inconclusive_not_remembered(self, registry):
+        """Testa que nenhum "elegivel" resulta em não elegível sem memória"""
+        registry.add("a", portal("nao_elegivel"))
+        registry.add("b", portal("nao_elegivel"))
+
+        assert await registry.process_eligibility("auto", "70002") == "nao_elegivel"
+        assert await registry.remembered_plan("70002") is None
+        assert registry.stats()["auto_detect"]["inconclusive"] == 1
+
+    @pytest.mark.asyncio
+    async def test_bounded_parallelism(self, registry, monkeypatch):
+        """Testa limite de candidatos consultados ao mesmo tempo"""
+        monkeypatch.setenv("PLAN_AUTO_MAX_PARALLEL", "2")
+        bounded = HandlerRegistry()
+        bounded._manifests["amil"] = bounded._manifests["amil"].model_copy(update={"auto_detect": False})
+        active = {"now": 0, "peak": 0}
+
+        async def handler(numero_carteirinha):
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+            await asyncio.sleep(0.01)
+            active["now"] -= 1
+            return "nao_elegivel"
+
+        for name in ("a", "b", "c", "d"):
+            bounded.register_lazy_handler(name, None, HandlerManifest(name=name, target="tests:handler"))
+            bounded.register_handler(name, handler)
+
+        assert await bounded.process_eligibility("auto", "70003") == "nao_elegivel"
+        assert active["peak"] == 2
+
+    @pytest.mark.asyncio
+    async def test_winner_annotations_and_cache(self, registry):
+        """Testa que o histórico recebe os campos do vencedor e o resultado vai para o cache"""
+        registry.add("errado", portal("nao_elegivel", account="conta-errada"))
+        registry.add("certo", portal("elegivel", delay=0.01, account="conta-certa"), cacheable=True, cache_ttl=60)
+
+        with check_context() as check:
+            assert await registry.process_eligibility("auto", "70004") == "elegivel"
+
+        assert check == {"plan": "certo", "account": "conta-certa"}
+        assert await registry._cache.get("certo", "70004") == "elegivel"
+
+    @pytest.mark.asyncio
+    async def test_no_compatible_plan(self, registry):
+        """Testa carteirinha recusada por todos os formatos"""
+        registry.add("digitos", portal("elegivel"), CardFormat(min_length=8))
+
+        with check_context() as check:
+            assert await registry.process_eligibility("auto", "ABC") == "nao_elegivel"
+        assert check["reason"] == "nenhum_plano_compativel"
+
+    def test_shared_memory_requires_hash_key(self, registry, monkeypatch):
+        """Testa erro na inicialização com backend compartilhado e chave gerada por host"""
+        shared = MemoryBackend()
+        shared.shared = True
+        monkeypatch.setattr("app.dispatch.state_backend", shared)
+        monkeypatch.setattr(history_store, "hash_key_configured", False)
+        assert registry.check_memory_key() is False
+
+        monkeypatch.setattr(history_store, "hash_key_configured", True)
+        assert registry.check_memory_key() is True
+        monkeypatch.setattr("app.dispatch.state_backend", MemoryBackend())
+        monkeypatch.setattr(history_store, "hash_key_configured", False)
+        assert registry.check_memory_key() is True
@@ -0,0 +1,81 @@
+"""
+Testes para a suíte de micro-benchmarks
+"""
+import pytest
+from benchmarks import cases  # noqa: F401
+from benchmarks.__main__ import main
+from benchmarks.harness import CASES, Result, build_baseline, compare, load_baseline, measure, save_baseline
+
+
+def result(name, relative):
+    return Result(name, relative * 1000, relative * 1000, 10, 3, 1000, relative)
+
+
+class TestHarness:
+    """Testes da medição e da comparação com a baseline"""
+
+    def test_cases_registered(self):
+        """Testa que os caminhos quentes têm benchmark"""
+        prefixes = {name.split(".")[0] for name in CASES}
+        assert prefixes == {"logger", "schemas", "dispatch", "callback", "router"}
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("name", sorted(CASES))
+    async def test_case_runs(self, name):
+        """Testa cada benchmark com medição mínima"""
+        measured = await measure(CASES[name], rounds=1, round_seconds=0.001)
+        assert measured.best_ns > 0
+        assert measured.relative > 0
+
+    def test_compare_flags_regression(self):
+        """Testa regressão além da tolerância e benchmark novo"""
+        baseline = build_baseline([result("schemas.webhook_in_dict", 1.0), result("dispatch.get_handler", 1.0)])
+        rows = compare(
+            [result("schemas.webhook_in_dict", 1.2), result("dispatch.get_handler", 1.5), result("novo", 1.0)],
+            baseline,
+            0.3
+        )
+
+        assert [row["regressed"] for row in rows] == [False, True, False]
+        assert rows[1]["ratio"] == 1.5
+        assert rows[2]["ratio"] is None
+
+    def test_case_tolerance_overrides(self):
+        """Testa tolerância própria do benchmark do router"""
+        baseline = build_baseline([result("router.webhook_in", 1.0)])
+        rows = compare([result("router.webhook_in", 1.4)], baseline, 0.3)
+
+        assert rows[0]["regressed"] is False
+        assert rows[0]["limit"] == 1.5
+
+    def test_baseline_roundtrip(self, tmp_path):
+        """Testa gravação e leitura da baseline"""
+        path = tmp_path / "baseline.json"
+        assert load_baseline(path) is None
+
+        save_baseline(build_baseline([result("callback.serialize", 0.5)]), path)
+        assert load_baseline(path)["benchmarks"]["callback.serialize"]["relative"] == 0.5
+
+
+class TestCommand:
+    """Testes da linha de comando"""
+
+    def test_save_then_check(self, tmp_path):
+        """Testa gravação da baseline e verificação sem regressão"""
+        path = tmp_path / "baseline.json"
+        options = ["schemas.webhook_in_dict", "--baseline", str(path), "--rounds", "1", "--round-seconds", "0.001"]
+
+        assert main([*options, "--save"]) == 0
+        assert main([*options, "--tolerance", "100"]) == 0
+
+    def test_check_fails_on_regression(self, tmp_path):
+        """Testa código de saída 1 quando a baseline é muito mais rápida"""
+        path = tmp_path / "baseline.json"
+        save_baseline(build_baseline([result("schemas.webhook_in_dict", 1e-5)]), path)
+
+        code = main(["schemas.webhook_in_dict", "--baseline", str(path), "--rounds", "1", "--round-seconds", "0.001", "--retries", "0"])
+        assert code == 1
+
+    def test_missing_baseline(self, tmp_path):
+        """Testa erro sem baseline"""
+        assert main(["--baseline", str(tmp_path / "nada.json"), "schemas.webhook_in_dict", "--rounds", "1"]) == 2
@@ -0,0 +1,326 @@
+"""
+Testes para o pool de sessões de browser, watchdog de memória, autoscaler e keep-alive
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.utils.browser_pool import BrowserPool, BrowserSession, LeaseRefusedError, SessionSetupError
+from app.utils.memory import MemoryWatchdog, sample_process_memory
+from app.utils.autoscaler import PoolAutoscaler
+from app.utils.session_keeper import SessionKeeper
+
+
+class FakeManager:
+    """Gerenciador falso que cria sessões sem Chromium"""
+
+    def __init__(self):
+        self.over_budget = False
+        self.pools = {}
+        self.browser_running = True
+        self.leased_count = 0
+        self.created = 0
+        self.close_browser = AsyncMock()
+
+    @property
+    def busy_count(self):
+        return sum(pool.busy for pool in self.pools.values())
+
+    async def new_session(self, pool_name):
+        self.created += 1
+        return BrowserSession(pool_name, AsyncMock(), AsyncMock())
+
+
+class TestBrowserPool:
+    """Testes para BrowserPool"""
+
+    @pytest.fixture
+    def manager(self):
+        return FakeManager()
+
+    @pytest.mark.asyncio
+    async def test_lease_reuses_session(self, manager):
+        """Testa que a sessão é reutilizada entre leases"""
+        setup = AsyncMock(return_value=True)
+        pool = BrowserPool(manager, "amil", setup=setup)
+
+        async with pool.lease() as first:
+            pass
+        async with pool.lease() as second:
+            pass
+
+        assert first is second
+        assert second.uses == 2
+        setup.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_setup_failure_raises(self, manager):
+        """Testa erro quando o login da sessão falha"""
+        pool = BrowserPool(manager, "amil", setup=AsyncMock(return_value=False))
+
+        with pytest.raises(SessionSetupError):
+            async with pool.lease():
+                pass
+
+        assert pool.size == 0
+
+    @pytest.mark.asyncio
+    async def test_session_recycled_after_max_uses(self, manager):
+        """Testa reciclagem da sessão ao atingir o limite de usos"""
+        pool = BrowserPool(manager, "amil")
+        pool.max_uses = 1
+
+        async with pool.lease() as first:
+            pass
+        async with pool.lease() as second:
+            pass
+
+        assert first is not second
+        assert pool.recycled == 2
+        first.page.close.assert_awaited()
+
+    @pytest.mark.asyncio
+    async def test_unhealthy_session_is_discarded(self, manager):
+        """Testa descarte de sessão que falhou durante o uso"""
+        pool = BrowserPool(manager, "amil")
+
+        with pytest.raises(RuntimeError):
+            async with pool.lease():
+                raise RuntimeError("página quebrada")
+
+        assert pool.stats()["idle"] == 0
+        assert pool.recycled == 1
+
+    @pytest.mark.asyncio
+    async def test_lease_refused_over_budget(self, manager):
+        """Testa recusa de novas sessões com memória acima do orçamento"""
+        pool = BrowserPool(manager, "amil")
+        pool.lease_timeout = 0.05
+        manager.over_budget = True
+
+        with pytest.raises(LeaseRefusedError):
+            async with pool.lease():
+                pass
+
+        assert pool.refused == 1
+        assert manager.created == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_prewarm_releases_slot(self, manager):
+        """Testa que cancelar o prewarm durante o login não deixa vaga presa"""
+        login_started = asyncio.Event()
+
+        async def slow_login(session):
+            login_started.set()
+            await asyncio.sleep(10)
+            return True
+
+        pool = BrowserPool(manager, "amil", setup=slow_login)
+        task = asyncio.create_task(pool.prewarm(1))
+        await login_started.wait()
+        task.cancel()
+
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert pool.size == 0
+        assert pool.stats()["creating"] == 0
+
+
+class TestMemoryWatchdog:
+    """Testes para MemoryWatchdog"""
+
+    def test_sample_process_memory(self):
+        """Testa amostragem de memória do processo atual"""
+        sample = sample_process_memory()
+        assert sample["python_rss_mb"] > 0
+        assert sample["total_rss_mb"] >= sample["python_rss_mb"]
+
+    @pytest.mark.asyncio
+    async def test_over_budget_recycles_idle_sessions(self):
+        """Testa que acima do orçamento as sessões ociosas são fechadas"""
+        manager = FakeManager()
+        pool = BrowserPool(manager, "amil")
+        manager.pools["amil"] = pool
+        async with pool.lease():
+            pass
+
+        watchdog = MemoryWatchdog(manager)
+        watchdog.total_budget_mb = 1
+
+        with patch("app.utils.memory.sample_process_memory", return_value={
+            "python_rss_mb": 100.0, "browser_rss_mb": 50.0, "browser_processes": 3, "total_rss_mb": 150.0
+        }):
+            await watchdog.check()
+
+        assert manager.over_budget is True
+        assert pool.stats()["idle"] == 0
+        assert watchdog.recycled_total == 1
+        manager.close_browser.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_browser_kept_while_session_is_logging_in(self):
+        """Testa que o Chromium não é fechado com login ou keep-alive em andamento"""
+        manager = FakeManager()
+        pool = BrowserPool(manager, "amil")
+        manager.pools["amil"] = pool
+        watchdog = MemoryWatchdog(manager)
+        watchdog.total_budget_mb = 1
+        sample = {"python_rss_mb": 100.0, "browser_rss_mb": 50.0, "browser_processes": 3, "total_rss_mb": 150.0}
+
+        with patch("app.utils.memory.sample_process_memory", return_value=sample):
+            pool._creating = 1
+            await watchdog.check()
+            pool._creating = 0
+            pool._maintaining[1] = BrowserSession("amil", AsyncMock(), AsyncMock())
+            await watchdog.check()
+
+        manager.close_browser.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_under_budget_keeps_sessions(self):
+        """Testa que abaixo do orçamento as sessões são mantidas"""
+        manager = FakeManager()
+        pool = BrowserPool(manager, "amil")
+        manager.pools["amil"] = pool
+        async with pool.lease():
+            pass
+
+        watchdog = MemoryWatchdog(manager)
+        watchdog.total_budget_mb = 10_000
+        watchdog.browser_limit_mb = 10_000
+
+        await watchdog.check()
+
+        assert manager.over_budget is False
+        assert pool.stats()["idle"] == 1
+
+
+class TestPoolAutoscaler:
+    """Testes para PoolAutoscaler"""
+
+    @pytest.fixture
+    def setup(self):
+        manager = FakeManager()
+        pool = BrowserPool(manager, "amil", max_sessions=4)
+        manager.pools["amil"] = pool
+        watchdog = MemoryWatchdog(manager)
+        autoscaler = PoolAutoscaler(manager, watchdog)
+        autoscaler.scale_down_delay = 0
+        return manager, pool, watchdog, autoscaler
+
+    def test_desired_size_follows_waiting_jobs(self, setup):
+        """Testa que a demanda pendente aumenta a capacidade desejada"""
+        _, pool, _, autoscaler = setup
+        pool.waiting = 3
+
+        assert autoscaler.desired_size(pool, elapsed=5) == 3
+
+        pool.waiting = 10
+        assert autoscaler.desired_size(pool, elapsed=5) == pool.max_sessions
+
+    def test_desired_size_limited_by_memory_headroom(self, setup):
+        """Testa que o headroom de memória limita o crescimento"""
+        _, pool, watchdog, autoscaler = setup
+        pool.waiting = 4
+        autoscaler.session_memory_mb = 100
+        watchdog.last_sample = {"total_rss_mb": watchdog.total_budget_mb - 150, "browser_rss_mb": 0}
+
+        assert autoscaler.desired_size(pool, elapsed=5) == 1
+
+    def test_desired_size_uses_latency_and_rate(self, setup):
+        """Testa estimativa pela lei de Little (taxa x latência)"""
+        _, pool, _, autoscaler = setup
+        autoscaler._last_leases["amil"] = 0
+        pool.leases_total = 10
+        pool.latency_ewma = 1.5
+
+        assert autoscaler.desired_size(pool, elapsed=5) == 3
+
+    @pytest.mark.asyncio
+    async def test_scale_up_and_down_with_hysteresis(self, setup):
+        """Testa aumento imediato e redução gradual da capacidade"""
+        _, pool, _, autoscaler = setup
+        pool.waiting = 3
+        await autoscaler.tick()
+        assert pool.capacity == 3
+        await asyncio.gather(*autoscaler._prewarm_tasks)
+        assert pool.stats()["idle"] == 3
+
+        pool.waiting = 0
+        autoscaler.scale_down_delay = 3600
+        await autoscaler.tick()
+        assert pool.capacity == 3
+
+        autoscaler.scale_down_delay = 0
+        await autoscaler.tick()
+        assert pool.capacity == 2
+        assert pool.stats()["idle"] == 2
+
+
+class TestSessionKeeper:
+    """Testes para keep-alive e readiness das sessões"""
+
+    @pytest.fixture
+    def manager(self):
+        return FakeManager()
+
+    async def _warm_pool(self, manager, **kwargs):
+        pool = BrowserPool(manager, "amil", setup=AsyncMock(side_effect=self._login), **kwargs)
+        manager.pools["amil"] = pool
+        async with pool.lease() as session:
+            pass
+        return pool, session
+
+    @staticmethod
+    async def _login(session):
+        session.logged_in = True
+        return True
+
+    @pytest.mark.asyncio
+    async def test_ping_keeps_valid_session(self, manager):
+        """Testa que uma sessão válida é mantida após o ping"""
+        validate = AsyncMock(return_value=True)
+        pool, session = await self._warm_pool(manager, validate=validate)
+
+        counters = await pool.keepalive(relogin_after=3600, ping_after=0)
+
+        assert counters["pings"] == 1
+        assert counters["relogins"] == 0
+        assert pool.sessions == [session]
+
+    @pytest.mark.asyncio
+    async def test_failed_ping_triggers_relogin(self, manager):
+        """Testa re-login quando o ping detecta sessão expirada"""
+        pool, session = await self._warm_pool(manager, validate=AsyncMock(return_value=False))
+
+        counters = await pool.keepalive(relogin_after=3600, ping_after=0)
+
+        assert counters["ping_failures"] == 1
+        assert counters["relogins"] == 1
+        assert session not in pool.sessions
+        assert pool.warm_sessions == 1
+
+    @pytest.mark.asyncio
+    async def test_proactive_relogin_before_expiry(self, manager):
+        """Testa re-login proativo quando o login é antigo"""
+        validate = AsyncMock(return_value=True)
+        pool, session = await self._warm_pool(manager, validate=validate)
+
+        counters = await pool.keepalive(relogin_after=0, ping_after=3600)
+
+        assert counters["relogins"] == 1
+        validate.assert_not_awaited()
+        assert session not in pool.sessions
+
+    @pytest.mark.asyncio
+    async def test_readiness_requires_warm_session(self, manager):
+        """Testa readiness só após sessão aquecida nos planos com mínimo"""
+        keeper = SessionKeeper(manager)
+        pool = BrowserPool(manager, "amil", setup=AsyncMock(side_effect=self._login), min_sessions=1)
+        manager.pools["amil"] = pool
+        manager.pools["outro"] = BrowserPool(manager, "outro")
+
+        assert keeper.readiness() == {"ready": False, "warm_sessions": {"amil": 0}}
+
+        await pool.prewarm(1)
+
+        assert keeper.readiness() == {"ready": True, "warm_sessions": {"amil": 1}}
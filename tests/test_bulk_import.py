@@ -0,0 +1,190 @@
+"""
+Testes para a importação em lote de carteirinhas
+"""
+import json
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.bulk_import import BulkImportError, BulkImportManager, BulkImportTooLarge, iter_rows
+
+
+CSV = (
+    "numero_carterinha;plan_name;numero\n"
+    "086955681;plano_qualquer;5511\n"
+    "   ;plano_qualquer;5512\n"
+    "123456789;;5513\n"
+    "abc;amil;5514\n"
+)
+
+
+async def chunks(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setenv("BULK_DIR", str(tmp_path))
+    monkeypatch.setenv("BULK_CONCURRENCY", "2")
+    monkeypatch.setenv("BULK_QUEUE_SIZE", "2")
+    return BulkImportManager()
+
+
+async def wait_done(manager, job):
+    for _ in range(200):
+        if job.status in ("done", "failed"):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"Importação não terminou: {job.status}")
+
+
+def results(job):
+    rows = {}
+    for line in job.results_path.read_text().splitlines():
+        if line.endswith("}"):
+            result = json.loads(line)
+            rows[result["row"]] = result
+    return rows
+
+
+class TestRows:
+    """Testes da leitura linha a linha"""
+
+    def test_csv_semicolon(self, tmp_path):
+        """Testa CSV com ponto e vírgula e espaços"""
+        path = tmp_path / "input.csv"
+        path.write_text(CSV)
+
+        rows = list(iter_rows(path, "csv"))
+        assert rows[0] == (0, {"numero_carterinha": "086955681", "plan_name": "plano_qualquer", "numero": "5511"})
+        assert len(rows) == 4
+
+    def test_ndjson_invalid_line(self, tmp_path):
+        """Testa linha NDJSON inválida sem interromper a leitura"""
+        path = tmp_path / "input.ndjson"
+        path.write_text('{"numero_carterinha": "1"}\n\n{quebrado\n[1]\n')
+
+        rows = list(iter_rows(path, "ndjson"))
+        assert rows[0] == (0, {"numero_carterinha": "1"})
+        assert [index for index, _ in rows] == [0, 2, 3]
+        assert all(isinstance(row, ValueError) for _, row in rows[1:])
+
+
+class TestBulkImportManager:
+    """Testes do processamento com backpressure e retomada"""
+
+    @pytest.mark.asyncio
+    async def test_process_csv(self, manager):
+        """Testa validação das linhas, consultas e contadores"""
+        handler = AsyncMock(return_value="elegivel")
+        with patch("app.utils.bulk_import.handler_registry.process_eligibility", handler):
+            job = await manager.create(chunks(CSV.encode()), "csv", plan_name="plano_padrao")
+            await wait_done(manager, job)
+
+        rows = results(job)
+        assert job.status == "done"
+        assert job.estimated_rows == 4
+        assert rows[0]["status"] == "elegivel"
+        assert rows[1]["status"] == "invalido"
+        assert rows[2]["plan_name"] == "plano_padrao"
+        assert rows[3] == {**rows[3], "status": "invalido", "error": "caracteres_invalidos"}
+        assert handler.await_count == 2
+        assert job.snapshot()["progress"] == 1.0
+
+    @pytest.mark.asyncio
+    async def test_backpressure(self, manager):
+        """Testa que o leitor não passa da capacidade da fila enquanto os workers estão ocupados"""
+        release = asyncio.Event()
+
+        async def slow(plan_name, numero_carteirinha):
+            await release.wait()
+            return "nao_elegivel"
+
+        data = "".join(json.dumps({"numero_carterinha": str(100000 + n), "plan_name": "x"}) + "\n" for n in range(50))
+        with patch("app.utils.bulk_import.handler_registry.process_eligibility", slow):
+            job = await manager.create(chunks(data.encode(), 64), "ndjson")
+            await asyncio.sleep(0.05)
+            # 2 workers ocupados + 2 na fila + 1 aguardando espaço
+            assert job.rows_read <= manager.concurrency + manager.queue_size + 1
+            release.set()
+            await wait_done(manager, job)
+
+        assert job.processed == 50
+
+    @pytest.mark.asyncio
+    async def test_resume_after_restart(self, manager, tmp_path):
+        """Testa retomada pulando as linhas que já têm resultado"""
+        handler = AsyncMock(return_value="elegivel")
+        data = "".join(json.dumps({"numero_carterinha": str(100000 + n), "plan_name": "x"}) + "\n" for n in range(10))
+        with patch("app.utils.bulk_import.handler_registry.process_eligibility", handler):
+            job = await manager.create(chunks(data.encode()), "ndjson")
+            await wait_done(manager, job)
+
+        # Simula queda no meio: só 4 resultados gravados, o último cortado
+        lines = job.results_path.read_text().splitlines()
+        job.results_path.write_text("\n".join(lines[:4]) + '\n{"row": 9, "sta')
+        job.status = "running"
+        job.save()
+
+        restarted = BulkImportManager()
+        handler.reset_mock()
+        with patch("app.utils.bulk_import.handler_registry.process_eligibility", handler):
+            await restarted.start()
+            resumed = restarted.get(job.id)
+            await wait_done(restarted, resumed)
+
+        assert handler.await_count == 6
+        assert sorted(results(resumed)) == list(range(10))
+
+    @pytest.mark.asyncio
+    async def test_upload_limits(self, manager):
+        """Testa arquivo vazio, formato desconhecido e limite de tamanho"""
+        with pytest.raises(BulkImportError):
+            await manager.create(chunks(b""), "csv")
+        with pytest.raises(BulkImportError):
+            await manager.create(chunks(b"a"), "xlsx")
+
+        manager.max_bytes = 10
+        with pytest.raises(BulkImportTooLarge):
+            await manager.create(chunks(b"x" * 20), "csv")
+        assert list(manager.directory.iterdir()) == []
+
+
+class TestBulkEndpoints:
+    """Testes dos endpoints /bulk"""
+
+    def test_upload_progress_and_download(self, manager, monkeypatch):
+        """Testa upload, progresso e download do CSV de resultados"""
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        headers = {"X-Admin-Token": "segredo"}
+        client = TestClient(app)
+        with patch("app.bulk.bulk_imports", manager), \
+                patch("app.utils.bulk_import.handler_registry.process_eligibility", AsyncMock(return_value="elegivel")):
+            created = client.post("/bulk/imports", content=CSV, headers={**headers, "Content-Type": "text/csv"})
+            assert created.status_code == 202
+            job_id = created.json()["id"]
+
+            for _ in range(100):
+                progress = client.get(f"/bulk/imports/{job_id}", headers=headers).json()
+                if progress["status"] == "done":
+                    break
+
+            download = client.get(f"/bulk/imports/{job_id}/results", headers=headers)
+
+        assert progress["status"] == "done"
+        assert progress["processed"] == 4
+        assert download.headers["content-type"].startswith("text/csv")
+        lines = download.text.splitlines()
+        assert lines[0] == "row,numero_carterinha,plan_name,numero,status,error"
+        assert len(lines) == 5
+
+    def test_requires_admin_and_format(self, monkeypatch):
+        """Testa token administrativo e formato obrigatório"""
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        client = TestClient(app)
+
+        assert client.post("/bulk/imports", content="a").status_code == 403
+        response = client.post("/bulk/imports", content="a", headers={"X-Admin-Token": "segredo"})
+        assert response.status_code == 415
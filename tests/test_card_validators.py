@@ -0,0 +1,116 @@
+"""
+Testes para a validação do número da carteirinha por plano
+"""
+import json
+import pytest
+from pydantic import ValidationError
+from unittest.mock import AsyncMock
+from fastapi.testclient import TestClient
+from app.dispatch import HandlerRegistry
+from app.main import app
+from app.plugins import CardFormat, HandlerManifest, load_directory_manifests
+from app.utils.card_validators import (
+    CardValidationError, luhn_valid, mod11_valid, normalize_card_number, validate_card
+)
+from app.utils.metrics import metrics
+
+
+class TestCardValidators:
+    """Testes para as regras de validação"""
+
+    def test_normalize_separators(self):
+        """Testa remoção de separadores"""
+        assert normalize_card_number(" 0869.5568-1 ") == "086955681"
+        assert normalize_card_number("12/34 56") == "123456"
+
+    def test_check_digits(self):
+        """Testa os algoritmos de dígito verificador"""
+        assert luhn_valid("79927398713") is True
+        assert luhn_valid("79927398710") is False
+        assert mod11_valid("123456789") is True
+        assert mod11_valid("123456780") is False
+
+    def test_validate_card(self):
+        """Testa tamanho, caracteres e dígito verificador"""
+        card_format = CardFormat(min_length=8, max_length=12, check_digit="mod11")
+
+        assert validate_card("1234.5678-9", card_format) == "123456789"
+
+        for numero, reason in [
+            ("12A45678", "caracteres_invalidos"),
+            ("1234", "muito_curto"),
+            ("1234567890123", "muito_longo"),
+            ("123456780", "digito_verificador_invalido"),
+        ]:
+            with pytest.raises(CardValidationError) as exc_info:
+                validate_card(numero, card_format)
+            assert exc_info.value.reason == reason
+
+    def test_unknown_check_digit_rejected(self, tmp_path):
+        """Testa que regra desconhecida recusa o manifest em vez de aceitar qualquer número"""
+        with pytest.raises(ValidationError):
+            CardFormat(check_digit="lunh")
+        manifest = {"name": "ruim", "target": "x:y", "card_format": {"check_digit": "lunh"}}
+        (tmp_path / "ruim.json").write_text(json.dumps(manifest))
+        assert load_directory_manifests(tmp_path, "directory") == []
+
+
+class TestDispatchShortCircuit:
+    """Testes do curto-circuito no dispatch"""
+
+    @pytest.fixture
+    def registry(self):
+        registry = HandlerRegistry()
+        registry.register_handler("unimed", AsyncMock(return_value="elegivel"))
+        registry._manifests["unimed"] = HandlerManifest(
+            name="unimed", target="x:y", card_format=CardFormat(min_length=6, max_length=6)
+        )
+        return registry
+
+    @pytest.mark.asyncio
+    async def test_invalid_card_skips_handler(self, registry):
+        """Testa que carteirinha inválida não chega ao handler"""
+        before = metrics.snapshot()["counters"].get("cards_short_circuited", 0)
+
+        assert await registry.process_eligibility("unimed", "12") == "nao_elegivel"
+
+        registry._handlers["unimed"].assert_not_awaited()
+        assert metrics.snapshot()["counters"]["cards_short_circuited"] == before + 1
+
+    @pytest.mark.asyncio
+    async def test_handler_receives_normalized_card(self, registry):
+        """Testa que o handler recebe o número sem separadores"""
+        assert await registry.process_eligibility("unimed", "123-456") == "elegivel"
+
+        registry._handlers["unimed"].assert_awaited_once_with("123456")
+
+    def test_plan_without_format_is_unchanged(self, registry):
+        """Testa que planos sem formato declarado não são validados"""
+        assert registry.validate_card("plano_qualquer", "abc-1") == "abc-1"
+
+
+class TestWebhookCardValidation:
+    """Testes da validação no endpoint /webhook/in"""
+
+    def test_invalid_amil_card_returns_422(self):
+        """Testa rejeição imediata de carteirinha inválida do Amil"""
+        client = TestClient(app)
+        response = client.post("/webhook/in", json={
+            "numero_carterinha": "abc",
+            "plan_name": "amil",
+            "numero": "5517992749450@s.whatsapp.net"
+        })
+
+        assert response.status_code == 422
+        assert response.json()["detail"]["reason"] == "caracteres_invalidos"
+
+    def test_blank_card_returns_422(self):
+        """Testa rejeição de carteirinha vazia"""
+        client = TestClient(app)
+        response = client.post("/webhook/in", json={
+            "numero_carterinha": "   ",
+            "plan_name": "plano_qualquer",
+            "numero": "5517992749450@s.whatsapp.net"
+        })
+
+        assert response.status_code == 422
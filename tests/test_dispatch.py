@@ -1,9 +1,16 @@
 """
 Testes para o sistema de dispatch
 """
+import asyncio
 import pytest
 from unittest.mock import AsyncMock, patch
 from app.dispatch import HandlerRegistry
+from app.plugins import HandlerManifest
+
+
+async def fake_lazy_handler(numero_carteirinha: str) -> str:
+    """Handler usado nos testes de carregamento lazy"""
+    return "elegivel"
 
 
 class TestHandlerRegistry:
@@ -11,9 +18,8 @@ class TestHandlerRegistry:
     
     @pytest.fixture
     def registry(self):
-        """Fixture para criar um registry fresh"""
-        with patch('app.dispatch.amil_handler'):
-            return HandlerRegistry()
+        """Fixture para criar um registry fresh (handlers lazy não são importados)"""
+        return HandlerRegistry()
     
     def test_list_supported_plans(self, registry):
         """Testa listagem de planos suportados"""
@@ -79,4 +85,51 @@ class TestHandlerRegistry:
         
         # Testa se o handler foi registrado corretamente
         handler = registry.get_handler("unimed")
-        assert handler == mock_handler 
\ No newline at end of file
+        assert handler == mock_handler 
+    
+    @pytest.mark.asyncio
+    async def test_load_handler_does_not_block_loop(self, registry):
+        """Testa que o primeiro uso espera o prewarm (_load_lock) fora do event loop"""
+        registry.register_lazy_handler("unimed", "tests.test_dispatch:fake_lazy_handler")
+        registry._load_lock.acquire()
+        try:
+            loading = asyncio.create_task(registry.load_handler("unimed"))
+            ticks = 0
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            assert ticks == 5 and not loading.done()
+        finally:
+            registry._load_lock.release()
+
+        assert await loading is fake_lazy_handler
+        assert "unimed" not in registry.pending_handlers()
+        assert await registry.load_handler("unimed") is fake_lazy_handler
+    
+    def test_lazy_handler_loaded_on_first_use(self, registry):
+        """Testa que handlers lazy só são importados no primeiro uso"""
+        registry.register_lazy_handler("unimed", "tests.test_dispatch:fake_lazy_handler")
+        
+        assert "unimed" in registry.list_supported_plans()
+        assert "unimed" in registry.pending_handlers()
+        
+        handler = registry.get_handler("unimed")
+        
+        assert handler is fake_lazy_handler
+        assert "unimed" not in registry.pending_handlers()
+    
+    @pytest.mark.asyncio
+    async def test_prewarm_loads_pending_handlers(self, registry):
+        """Testa pré-carregamento em background dos handlers pendentes"""
+        registry.register_lazy_handler("unimed", "tests.test_dispatch:fake_lazy_handler", HandlerManifest(
+            name="unimed", target="tests.test_dispatch:fake_lazy_handler", requires_session=True
+        ))
+        registry.register_lazy_handler("quebrado", "tests.modulo_inexistente:handler", HandlerManifest(
+            name="quebrado", target="tests.modulo_inexistente:handler", requires_session=True
+        ))
+        registry._lazy_handlers.pop("amil")
+        
+        await registry.prewarm()
+        
+        assert registry.pending_handlers() == ["quebrado"]
+        assert await registry.process_eligibility("unimed", "123456") == "elegivel"
@@ -0,0 +1,146 @@
+"""
+Testes para a drenagem no desligamento
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.router import resume_job
+from app.utils.drain import DrainController, PendingJob
+from app.utils.idempotency import IdempotencyStore, request_fingerprint
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "idempotency.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def controller(tmp_path, store, monkeypatch):
+    """Drenagem com prazo curto, registro de idempotência e callback de teste"""
+    monkeypatch.setenv("DRAIN_TIMEOUT_S", "0.05")
+    controller = DrainController(str(tmp_path / "pending.ndjson"))
+    callback = AsyncMock(return_value=True)
+    with patch("app.utils.drain.idempotency_store", store), patch("app.utils.drain.send_callback", callback):
+        controller.callback = callback
+        yield controller
+
+
+async def claimed(store, job):
+    fingerprint = request_fingerprint(job.plan_name, job.numero_carteirinha, job.numero)
+    record, _ = await store.claim(store.keys_for(None, fingerprint), fingerprint)
+    job.idempotency_key = record.key
+    return record
+
+
+async def run_tracked(controller, job, seconds, status=None):
+    with controller.track(job):
+        await asyncio.sleep(seconds)
+        job.status = status
+
+
+class TestDrainController:
+    """Testes da espera, do envio de callbacks e da persistência"""
+
+    @pytest.mark.asyncio
+    async def test_finishes_within_deadline(self, controller):
+        """Testa job que termina dentro do prazo"""
+        task = asyncio.create_task(run_tracked(controller, PendingJob("j1", "1", "amil", "5511"), 0.01))
+        await asyncio.sleep(0)
+
+        report = await controller.drain()
+        await task
+
+        assert report["completed"] == 1
+        assert report["persisted"] == 0
+        assert not controller.pending_file.exists()
+
+    @pytest.mark.asyncio
+    async def test_persists_unfinished_and_releases_key(self, controller, store):
+        """Testa job sem resultado no fim do prazo: guardado e chave liberada"""
+        job = PendingJob("j1", "086955681", "amil", "5511")
+        record = await claimed(store, job)
+        task = asyncio.create_task(run_tracked(controller, job, 10))
+        await asyncio.sleep(0)
+
+        report = await controller.drain()
+
+        assert task.cancelled()
+        assert report["interrupted"] == 1
+        assert report["persisted"] == 1
+        assert await store.get(record.key) is None
+        assert [pending.job_id for pending in controller.load_pending()] == ["j1"]
+        assert not controller.pending_file.exists()
+
+    @pytest.mark.asyncio
+    async def test_flushes_callback_of_known_result(self, controller, store):
+        """Testa job interrompido no callback: resultado enviado na drenagem"""
+        job = PendingJob("j1", "086955681", "amil", "5511", status="elegivel")
+        record = await claimed(store, job)
+        asyncio.create_task(run_tracked(controller, job, 10, status="elegivel"))
+        await asyncio.sleep(0)
+
+        report = await controller.drain()
+
+        controller.callback.assert_awaited_once_with("5511", "elegivel", callback_url=None)
+        assert report["callbacks_flushed"] == 1
+        assert report["persisted"] == 0
+        assert (await store.get(record.key)).callback_sent is True
+
+    @pytest.mark.asyncio
+    async def test_resume_runs_pending_jobs(self, controller, tmp_path):
+        """Testa retomada no próximo start"""
+        asyncio.create_task(run_tracked(controller, PendingJob("j1", "1", "amil", "5511"), 10))
+        await asyncio.sleep(0)
+        await controller.drain()
+
+        runner = AsyncMock()
+        restarted = DrainController(str(controller.pending_file))
+        assert restarted.resume(runner) == 1
+        await asyncio.sleep(0)
+
+        assert runner.await_args.args[0].job_id == "j1"
+
+
+class TestDrainEndpoints:
+    """Testes da admissão e da retomada pelo router"""
+
+    def test_webhook_and_ready_refuse_while_draining(self, tmp_path):
+        """Testa 503 com Retry-After no webhook e /ready fora do ar"""
+        controller = DrainController(str(tmp_path / "pending.ndjson"))
+        controller.begin()
+        client = TestClient(app)
+        with patch("app.router.drain_controller", controller):
+            response = client.post("/webhook/in", json={
+                "numero_carterinha": "086955681",
+                "plan_name": "amil",
+                "numero": "5511"
+            })
+            ready = client.get("/ready")
+
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        assert ready.status_code == 503
+        assert ready.json()["status"] == "draining"
+
+    @pytest.mark.asyncio
+    async def test_resume_job_skips_when_retry_was_served(self, store):
+        """Testa que a repetição atendida em outra réplica descarta a retomada"""
+        job = PendingJob("j1", "086955681", "amil", "5511")
+        await claimed(store, job)
+        handler = AsyncMock(return_value="elegivel")
+        callback = AsyncMock(return_value=True)
+        with patch("app.router.idempotency_store", store), \
+                patch("app.router.handler_registry.process_eligibility", handler), \
+                patch("app.router.send_callback", callback):
+            await resume_job(job)
+            assert handler.await_count == 0
+
+            await store.release(job.idempotency_key)
+            await resume_job(job)
+
+        assert handler.await_count == 1
+        assert callback.await_count == 1
@@ -0,0 +1,150 @@
+"""
+Testes para os eventos de progresso dos jobs (SSE e WebSocket)
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from app.main import app
+from app.streams import numero_token_valid
+from app.handlers.generic import GenericHandler
+from app.utils.events import EventHub, event_hub, job_context, report_progress
+from app.utils.idempotency import IdempotencyStore
+
+
+PAYLOAD = {
+    "numero_carterinha": "086955681",
+    "plan_name": "plano_qualquer",
+    "numero": "5517000000001@s.whatsapp.net"
+}
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Cliente com webhook de resultado imediato e sem callback HTTP"""
+    store = IdempotencyStore(str(tmp_path / "idempotency.db"))
+    with patch("app.router.idempotency_store", store), \
+            patch("app.router.handler_registry.process_eligibility", AsyncMock(return_value="elegivel")), \
+            patch("app.router.send_callback", AsyncMock(return_value=True)):
+        yield TestClient(app)
+    store.close()
+
+
+class TestEventHub:
+    """Testes da distribuição de eventos"""
+
+    @pytest.mark.asyncio
+    async def test_publish_to_job_and_numero(self):
+        """Testa entrega por job e por número"""
+        hub = EventHub()
+        by_job = hub.subscribe(job_id="j1")
+        by_numero = hub.subscribe(numero="5511")
+        other = hub.subscribe(job_id="j2")
+
+        hub.publish("j1", "5511", "queued")
+
+        assert (await by_job.next(0.1))["event"] == "queued"
+        assert (await by_numero.next(0.1))["job_id"] == "j1"
+        assert await other.next(0.01) is None
+
+    @pytest.mark.asyncio
+    async def test_late_subscriber_gets_history(self):
+        """Testa reenvio dos eventos anteriores do job"""
+        hub = EventHub()
+        hub.publish("j1", "5511", "queued")
+        hub.publish("j1", "5511", "done", status="elegivel")
+
+        subscription = hub.subscribe(job_id="j1")
+        assert (await subscription.next(0.1))["event"] == "queued"
+        assert (await subscription.next(0.1))["status"] == "elegivel"
+
+    def test_slow_subscriber_drops_oldest(self, monkeypatch):
+        """Testa fila limitada: o publicador nunca espera"""
+        monkeypatch.setenv("EVENTS_QUEUE_SIZE", "2")
+        hub = EventHub()
+        subscription = hub.subscribe(numero="5511")
+        for n in range(5):
+            hub.publish(f"j{n}", "5511", "queued")
+
+        assert subscription.dropped == 3
+        assert subscription.queue.get_nowait()["job_id"] == "j3"
+
+    def test_unsubscribe_cleans_topics(self):
+        """Testa que conexões encerradas não deixam tópicos vazios"""
+        hub = EventHub()
+        subscription = hub.subscribe(job_id="j1", numero="5511")
+        hub.unsubscribe(subscription)
+
+        assert hub.stats()["topics"] == 0
+
+    @pytest.mark.asyncio
+    async def test_report_progress_in_job_context(self):
+        """Testa eventos dos passos do simulador, sem repetições seguidas"""
+        handler = GenericHandler(latency="zero", seed=1)
+        handler.verbose = False
+        subscription = event_hub.subscribe(job_id="job-progresso")
+
+        report_progress("consulting")  # fora de um job: ignorado
+        with job_context("job-progresso", "5511"):
+            await handler.check_eligibility("086955681", "plano")
+
+        events = [subscription.queue.get_nowait()["event"] for _ in range(subscription.queue.qsize())]
+        event_hub.unsubscribe(subscription)
+        assert events == ["logging_in", "consulting"]
+
+
+class TestStreamEndpoints:
+    """Testes dos endpoints SSE e WebSocket"""
+
+    def test_sse_job_stream(self, client):
+        """Testa SSE de um job: eventos até "done" e fim do stream"""
+        job_id = client.post("/webhook/in", json=PAYLOAD).json()["job_id"]
+
+        with client.stream("GET", f"/events/jobs/{job_id}") as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            body = "".join(response.iter_text())
+
+        assert "event: queued" in body
+        assert "event: done" in body
+        assert '"status": "elegivel"' in body
+
+    def test_websocket_job(self, client):
+        """Testa WebSocket de um job: eventos e fechamento após "done\""""
+        job_id = client.post("/webhook/in", json={**PAYLOAD, "numero": "5517000000002@s.whatsapp.net"}).json()["job_id"]
+
+        with client.websocket_connect(f"/ws/events?job_id={job_id}") as websocket:
+            first = websocket.receive_json()
+            last = websocket.receive_json()
+            with pytest.raises(WebSocketDisconnect):
+                websocket.receive_json()
+
+        assert first["event"] == "queued"
+        assert last == {**last, "event": "done", "status": "elegivel", "job_id": job_id}
+
+    def test_websocket_requires_target(self, client):
+        """Testa recusa sem job_id nem numero"""
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect("/ws/events") as websocket:
+                websocket.receive_json()
+        assert exc_info.value.code == 1008
+
+    def test_numero_streams_require_token(self, client, monkeypatch):
+        """Testa que assinar por número exige EVENTS_TOKEN (o número não é segredo)"""
+        monkeypatch.setenv("EVENTS_TOKEN", "segredo")
+        numero = PAYLOAD["numero"]
+
+        assert client.get(f"/events/numeros/{numero}").status_code == 403
+        assert client.get(f"/events/numeros/{numero}", params={"token": "errado"}).status_code == 403
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            with client.websocket_connect(f"/ws/events?numero={numero}") as websocket:
+                websocket.receive_json()
+        assert exc_info.value.code == 1008
+        assert numero_token_valid("segredo") is True
+        assert numero_token_valid(None) is False
+
+    def test_numero_streams_disabled_without_token(self, client, monkeypatch):
+        """Testa assinatura por número desabilitada sem token configurado"""
+        monkeypatch.delenv("EVENTS_TOKEN", raising=False)
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        response = client.get("/events/numeros/5511", headers={"X-Events-Token": "qualquer"})
+        assert response.status_code == 403
@@ -0,0 +1,220 @@
+"""
+Testes para o arquivo de evidências das consultas
+"""
+import os
+import gzip
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from app.handlers.recipe import RecipeHandler
+from app.main import app
+from app.recipes import PortalRecipe, RecipePlan
+from app.utils.evidence import EvidenceArchive
+from tests.test_recipes import make_recipe
+
+
+PAGE = "<html><body><main>Contrato não encontrado</main></body></html>"
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    monkeypatch.setenv("EVIDENCE_ENABLED", "true")
+    archive = EvidenceArchive(str(tmp_path / "evidence"))
+    yield archive
+    archive.close()
+
+
+def snapshot(html=PAGE, text="Contrato não encontrado", screenshot=None):
+    return {"url": "https://portal.test/consulta?c=1", "html": html, "text": text, "screenshot": screenshot}
+
+
+def blob_files(archive):
+    return sorted(p for p in (archive.path / "objects").rglob("*") if p.is_file())
+
+
+class TestEvidenceArchive:
+    """Testes da gravação por conteúdo, do índice e da retenção"""
+
+    @pytest.mark.asyncio
+    async def test_capture_is_compressed_and_indexed(self, archive):
+        """Testa captura gravada comprimida e encontrada pela carteirinha"""
+        archive.submit("teste", "123", "nao_elegivel", snapshot(screenshot=b"\x89PNG"), "Encontrado indicador", "r")
+        await archive.flush()
+
+        [capture] = archive.find("123")
+        assert capture["result"] == "nao_elegivel"
+        assert capture["motivo"] == "Encontrado indicador"
+        assert capture["html"].endswith(".html.gz")
+        html, media_type = archive.read(capture["html"])
+        assert html.decode() == PAGE
+        assert media_type.startswith("text/html")
+        assert archive.read(capture["screenshot"]) == (b"\x89PNG", "image/png")
+        stored = next(p for p in blob_files(archive) if p.name == capture["html"])
+        assert gzip.decompress(stored.read_bytes()).decode() == PAGE
+        assert archive.find("999") == []
+
+    @pytest.mark.asyncio
+    async def test_identical_content_stored_once(self, archive):
+        """Testa deduplicação de páginas iguais"""
+        for card in ("1", "2", "3"):
+            archive.submit("teste", card, "nao_elegivel", snapshot())
+        await archive.flush()
+
+        assert len(blob_files(archive)) == 2
+        assert archive.deduplicated == 4
+        assert len(archive.find("2")) == 1
+
+    @pytest.mark.asyncio
+    async def test_retention_removes_oldest(self, archive):
+        """Testa limite de tamanho removendo capturas antigas e conteúdos sem referência"""
+        archive.max_bytes = 600
+        shared_text = "Contrato não encontrado"
+        for n in range(6):
+            html = f"<html>{os.urandom(400).hex()}</html>"
+            archive.submit("teste", str(n), "nao_elegivel", snapshot(html=html, text=shared_text))
+        await archive.flush()
+
+        stats = archive.stats()
+        assert stats["size_bytes"] <= 600
+        assert stats["pruned"] > 0
+        assert archive.find("0") == []
+        assert archive.find("5") != []
+        # Texto compartilhado segue existindo enquanto alguma captura o referencia
+        assert archive.read(archive.find("5")[0]["text"])[0].decode() == shared_text
+        assert len(blob_files(archive)) == 2 * len(archive._connection().execute("SELECT id FROM captures").fetchall())
+
+    @pytest.mark.asyncio
+    async def test_failed_write_removes_new_blobs(self, archive):
+        """Testa que a transação desfeita não deixa conteúdos novos no disco"""
+        archive.submit("teste", "1", "nao_elegivel", snapshot())
+        await archive.flush()
+        kept = blob_files(archive)
+        encode = archive._encode
+
+        def failing(value, compress):
+            if not compress:
+                raise OSError("disco cheio")
+            return encode(value, compress)
+
+        with patch.object(archive, "_encode", side_effect=failing):
+            archive.submit("teste", "2", "nao_elegivel", snapshot(html="<html>outra</html>", screenshot=b"\x89PNG"))
+            with pytest.raises(OSError):
+                await archive.flush()
+
+        assert blob_files(archive) == kept
+        assert archive.find("2") == []
+        assert archive.stats()["size_bytes"] == sum(p.stat().st_size for p in kept)
+
+    @pytest.mark.asyncio
+    async def test_failed_prune_rolls_back(self, archive):
+        """Testa que um erro na remoção desfaz a transação e as gravações seguintes continuam"""
+        archive.submit("teste", "1", "nao_elegivel", snapshot())
+        await archive.flush()
+        conn = archive._connection()
+        conn.execute("ALTER TABLE blobs RENAME TO blobs_old")
+        archive.max_bytes = 0
+
+        with pytest.raises(Exception):
+            archive._prune(conn)
+        assert not conn.in_transaction
+        assert archive.pruned == 0
+
+        conn.execute("ALTER TABLE blobs_old RENAME TO blobs")
+        archive.max_bytes = 10 ** 6
+        archive.submit("teste", "2", "nao_elegivel", snapshot(html="<html>outra</html>"))
+        await archive.flush()
+        assert len(archive.find("1")) == 1 and len(archive.find("2")) == 1
+
+    def test_queue_full_drops(self, archive):
+        """Testa que a captura é descartada com a fila cheia"""
+        archive._queue = archive._queue.__class__(maxsize=1)
+        assert archive.submit("teste", "1", "nao_elegivel", snapshot()) is True
+        assert archive.submit("teste", "2", "nao_elegivel", snapshot()) is False
+        assert archive.dropped == 1
+
+    def test_capture_policy_and_invalid_names(self, archive, monkeypatch):
+        """Testa desfechos capturados e nomes inválidos na leitura"""
+        assert archive.wants("nao_elegivel") and archive.wants("indeterminado")
+        assert not archive.wants("elegivel")
+        monkeypatch.setenv("EVIDENCE_ENABLED", "false")
+        assert not EvidenceArchive(str(archive.path)).wants("nao_elegivel")
+        assert archive.read("../index.db") is None
+        assert archive.read("0" * 64 + ".html.gz") is None
+
+
+class TestRecipeEvidence:
+    """Testes da captura no handler de receitas"""
+
+    def handler(self):
+        handler = RecipeHandler.__new__(RecipeHandler)
+        handler.plan = RecipePlan(PortalRecipe(**make_recipe()))
+        return handler
+
+    def session(self, probe_text):
+        session = MagicMock()
+        session.page.goto = AsyncMock()
+        session.page.url = "https://portal.test/consulta?c=123"
+        session.page.evaluate = AsyncMock(side_effect=[
+            {"text": probe_text, "found": [], "region": "body"},
+            {"html": PAGE, "text": probe_text},
+        ])
+        return session
+
+    @pytest.mark.asyncio
+    async def test_not_eligible_page_archived(self, archive):
+        """Testa página não elegível entregue ao arquivo sem alterar o resultado"""
+        with patch("app.handlers.recipe.evidence_archive", archive):
+            status = await self.handler()._consultar_carteirinha(self.session("Contrato não encontrado"), "123")
+        await archive.flush()
+
+        assert status == "nao_elegivel"
+        [capture] = archive.find("123")
+        assert capture["regra"] == "nao_elegivel:texto:não encontrado"
+        assert capture["url"] == "https://portal.test/consulta?c=123"
+
+    @pytest.mark.asyncio
+    async def test_eligible_page_not_archived(self, archive):
+        """Testa que desfechos fora de EVIDENCE_CAPTURE não leem a página"""
+        session = self.session("Beneficiário ativo")
+        with patch("app.handlers.recipe.evidence_archive", archive):
+            status = await self.handler()._consultar_carteirinha(session, "123")
+
+        assert status == "elegivel"
+        assert session.page.evaluate.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_snapshot_failure_keeps_result(self, archive):
+        """Testa que falha na captura não afeta a consulta"""
+        session = self.session("Contrato não encontrado")
+        session.page.evaluate.side_effect = [
+            {"text": "Contrato não encontrado", "found": [], "region": "body"},
+            RuntimeError("página fechada"),
+        ]
+        with patch("app.handlers.recipe.evidence_archive", archive):
+            status = await self.handler()._consultar_carteirinha(session, "123")
+
+        assert status == "nao_elegivel"
+        assert archive.stats()["queued"] == 0
+
+
+class TestEvidenceEndpoints:
+    """Testes da consulta das evidências pela API administrativa"""
+
+    @pytest.mark.asyncio
+    async def test_list_and_download(self, archive, monkeypatch):
+        """Testa busca pela carteirinha e download descomprimido"""
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        archive.submit("teste", "123", "nao_elegivel", snapshot())
+        await archive.flush()
+        client = TestClient(app)
+        headers = {"X-Admin-Token": "segredo"}
+
+        with patch("app.admin.evidence_archive", archive):
+            listing = client.get("/admin/evidence", params={"numero_carteirinha": "123"}, headers=headers)
+            name = listing.json()["captures"][0]["html"]
+            page = client.get(f"/admin/evidence/{name}", headers=headers)
+            missing = client.get("/admin/evidence/nada.html.gz", headers=headers)
+
+        assert listing.json()["total"] == 1
+        assert page.text == PAGE
+        assert missing.status_code == 404
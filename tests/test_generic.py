@@ -0,0 +1,81 @@
+"""
+Testes para o simulador do handler genérico
+"""
+import random
+import subprocess
+import sys
+import time
+import asyncio
+import pytest
+from app.handlers.generic import GenericHandler, SimulatedFailure, parse_latency, stable_fraction
+
+
+class TestLatencyDistributions:
+    """Testes para parse_latency"""
+
+    def test_distributions(self):
+        """Testa os formatos suportados"""
+        rng = random.Random(1)
+
+        assert parse_latency("zero", rng)() == 0.0
+        assert parse_latency("fixed:0.2", rng)() == 0.2
+        assert 1 <= parse_latency("uniform:1:2", rng)() <= 2
+        assert parse_latency("normal:0:0.001", rng)() >= 0
+        assert parse_latency("exponential:0.5", rng)() >= 0
+
+    def test_invalid_spec(self):
+        """Testa rejeição de especificação inválida"""
+        with pytest.raises(ValueError):
+            parse_latency("triangular:1", random.Random())
+
+
+class TestGenericSimulator:
+    """Testes para GenericHandler"""
+
+    def test_outcome_is_stable_across_processes(self):
+        """Testa que o sorteio não depende do hash randomizado do processo"""
+        code = "from app.handlers.generic import stable_fraction; print(stable_fraction('123456', 'resultado'))"
+        outputs = {
+            subprocess.run(
+                [sys.executable, "-c", code], capture_output=True, text=True,
+                env={"PYTHONHASHSEED": seed, "PATH": ""}, check=True
+            ).stdout.strip()
+            for seed in ("1", "2")
+        }
+
+        assert outputs == {str(stable_fraction("123456", "resultado"))}
+
+    @pytest.mark.asyncio
+    async def test_zero_latency_is_fast_and_deterministic(self):
+        """Testa milhares de consultas sem latência e resultados estáveis"""
+        handler = GenericHandler(latency="zero", seed=7)
+        handler.verbose = False
+        cards = [str(100000 + i) for i in range(2000)]
+
+        started = time.perf_counter()
+        first = await asyncio.gather(*(handler.check_eligibility(card) for card in cards))
+        elapsed = time.perf_counter() - started
+        second = await asyncio.gather(*(handler.check_eligibility(card) for card in cards))
+
+        assert first == second
+        assert elapsed < 2
+        assert 0.6 < first.count("elegivel") / len(cards) < 0.8
+
+    @pytest.mark.asyncio
+    async def test_special_card_always_eligible(self):
+        """Testa carteirinha especial"""
+        handler = GenericHandler(latency="zero", eligible_rate=0)
+
+        assert await handler.check_eligibility("086955681") == "elegivel"
+        assert await handler.check_eligibility("123") == "nao_elegivel"
+
+    @pytest.mark.asyncio
+    async def test_failures(self, monkeypatch):
+        """Testa falhas injetadas tratadas no handler ou propagadas"""
+        handler = GenericHandler(latency="zero", failure_rate=1)
+        assert await handler.check_eligibility("123") in ("elegivel", "nao_elegivel")
+
+        monkeypatch.setenv("GENERIC_FAILURE_MODE", "raise")
+        handler = GenericHandler(latency="zero", failure_rate=1)
+        with pytest.raises(SimulatedFailure):
+            await handler.check_eligibility("123")
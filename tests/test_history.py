@@ -0,0 +1,218 @@
+"""
+Testes para o histórico de consultas e os endpoints de analytics
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from app.dispatch import HandlerRegistry
+from app.main import app
+from app.plugins import HandlerManifest
+from app.router import process_eligibility_background
+from app.utils.history import HistoryStore, annotate_check, check_context
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setenv("HISTORY_BATCH_SIZE", "3")
+    store = HistoryStore(str(tmp_path / "history.db"))
+    yield store
+    store.close()
+
+
+def rows(store, columns="*"):
+    return store._query(f"SELECT {columns} FROM checks ORDER BY id", ())
+
+
+class TestHistoryStore:
+    """Testes da gravação em lotes e dos agregados"""
+
+    @pytest.mark.asyncio
+    async def test_flush_writes_batches(self, store):
+        """Testa gravação em lotes com carteirinha só como hash"""
+        for n in range(7):
+            store.record("Amil", f"00{n}", "elegivel", 120.0, {"account": "conta", "steps": {"lease": 5.0}})
+
+        assert await store.flush() == 7
+        assert store.stats()["batches"] == 3
+        plan, card_hash, account, steps = rows(store, "plan, card_hash, account, steps")[0]
+        assert plan == "amil"
+        assert card_hash == store.card_hash("000") and "000" not in card_hash
+        assert account == "conta"
+        assert json.loads(steps) == {"lease": 5.0}
+
+    @pytest.mark.asyncio
+    async def test_background_writer_and_stop(self, store):
+        """Testa gravação quando o lote enche e do resto na parada"""
+        store.start()
+        for n in range(3):
+            store.record("amil", str(n), "elegivel", 10.0)
+        for _ in range(50):
+            if store.written >= 3:
+                break
+            await asyncio.sleep(0.01)
+        assert store.written == 3
+
+        store.record("amil", "3", "elegivel", 10.0)
+        await store.stop()
+        assert store.written == 4
+
+    def test_hash_key_generated_and_persisted(self, store, monkeypatch):
+        """Testa chave gerada sem HISTORY_HASH_KEY, gravada em 0600 e reaproveitada"""
+        monkeypatch.delenv("HISTORY_HASH_KEY", raising=False)
+        first = store.card_hash("123456")
+        key_file = store.hash_key_file
+        assert os.stat(key_file).st_mode & 0o777 == 0o600
+        assert first != hashlib.blake2b(b"123456", digest_size=10).hexdigest()
+
+        reopened = HistoryStore(store.path)
+        assert reopened.card_hash("123456") == first
+
+        monkeypatch.setenv("HISTORY_HASH_KEY", "outra")
+        assert HistoryStore(store.path).card_hash("123456") != first
+
+    def test_queue_limit_drops(self, store):
+        """Testa que a fila cheia descarta em vez de crescer"""
+        store.queue_size = 2
+        for n in range(3):
+            store.record("amil", str(n), "elegivel", 10.0)
+        assert store.stats()["queued"] == 2
+        assert store.dropped == 1
+
+    @pytest.mark.asyncio
+    async def test_latency_percentiles(self, store):
+        """Testa percentis a partir do histograma agregado"""
+        for duration in range(1, 101):
+            store.record("amil", str(duration), "elegivel", duration * 100.0)
+        store.record("amil", "x", "elegivel", 1.0, {"source": "cache"})
+        await store.flush()
+
+        portal = store.latency(24, source="portal")["plans"]["amil"]
+        assert portal["count"] == 100
+        assert 5000 <= portal["p50"] <= 5000 * 1.15
+        assert 9900 <= portal["p99"] <= 9900 * 1.15
+        assert store.latency(24)["plans"]["amil"]["count"] == 101
+        assert store.latency(24, plan="unimed")["plans"] == {}
+
+    @pytest.mark.asyncio
+    async def test_eligibility_trend(self, store):
+        """Testa taxa de elegíveis por hora e por dia"""
+        for status in ("elegivel", "elegivel", "elegivel", "nao_elegivel"):
+            store.record("amil", "1", status, 10.0)
+        store.record("unimed", "1", "nao_elegivel", 10.0)
+        await store.flush()
+
+        daily = store.eligibility(24, "day")["plans"]
+        assert daily["amil"][0]["total"] == 4
+        assert daily["amil"][0]["rate"] == 0.75
+        assert daily["amil"][0]["start"] % 86400 == 0
+        assert daily["unimed"][0]["rate"] == 0.0
+        assert store.eligibility(24, "hour", plan="amil")["plans"]["amil"][0]["start"] % 3600 == 0
+
+    @pytest.mark.asyncio
+    async def test_error_breakdown(self, store):
+        """Testa erros por tipo, carteirinhas inválidas, callbacks falhos e motivos"""
+        store.record("amil", "1", "nao_elegivel", 10.0, {"error_type": "TimeoutError"}, 5.0, True)
+        store.record("amil", "2", "nao_elegivel", 10.0, {"source": "error", "error_type": "KeyError"}, None, False)
+        store.record("amil", "3", "nao_elegivel", 0.0, {"source": "invalid_card", "reason": "dígitos"}, 5.0, True)
+        store.record("amil", "4", "nao_elegivel", 10.0, {"reason": "Plano suspenso"}, 5.0, True)
+        store.record("amil", "5", "nao_elegivel", 10.0, {"reason": "Plano suspenso"}, 5.0, True)
+        await store.flush()
+
+        amil = store.errors(24)["plans"]["amil"]
+        assert amil["total"] == 5
+        assert amil["errors"] == 2
+        assert amil["by_type"] == {"TimeoutError": 1, "KeyError": 1}
+        assert amil["error_rate"] == 0.4
+        assert amil["invalid_card"] == 1
+        assert amil["callback_failed"] == 1
+        assert list(amil["reasons"].items())[0] == ("Plano suspenso", 2)
+
+    @pytest.mark.asyncio
+    async def test_retention(self, store):
+        """Testa remoção do histórico bruto fora da retenção"""
+        store.record("amil", "1", "elegivel", 10.0)
+        await store.flush()
+        store._conn.execute("UPDATE checks SET ts = ?", (time.time() - 100 * 86400,))
+        store._last_purge = 0.0
+
+        store.record("amil", "2", "elegivel", 10.0)
+        await store.flush()
+        assert len(rows(store)) == 1
+
+
+class TestCheckAnnotations:
+    """Testes dos campos anotados pelo dispatch e pelos handlers"""
+
+    @pytest.mark.asyncio
+    async def test_dispatch_marks_cache_and_plan(self):
+        """Testa plano resolvido e resultado servido do cache"""
+        registry = HandlerRegistry()
+        registry.register_lazy_handler(
+            "portal", None, HandlerManifest(name="portal", target="tests:handler", cacheable=True, cache_ttl=60)
+        )
+        registry.register_handler("portal", AsyncMock(return_value="elegivel"))
+
+        with check_context() as first:
+            await registry.process_eligibility("Portal", "111")
+        with check_context() as second:
+            await registry.process_eligibility("Portal", "111")
+
+        assert first == {"plan": "portal"}
+        assert second == {"plan": "portal", "source": "cache"}
+
+    def test_annotate_outside_context(self):
+        """Testa que anotar fora de uma consulta não tem efeito"""
+        annotate_check(account="conta")
+
+    @pytest.mark.asyncio
+    async def test_background_job_recorded(self, store):
+        """Testa registro do job com campos do handler e desfecho do callback"""
+        async def handler(plan_name, numero_carteirinha):
+            annotate_check(account="conta", reason="Ativo")
+            return "elegivel"
+
+        with patch("app.router.history_store", store), \
+                patch("app.router.handler_registry.process_eligibility", handler), \
+                patch("app.router.send_callback", AsyncMock(return_value=False)):
+            await process_eligibility_background("086955681", "amil", "5511")
+        await store.flush()
+
+        result, account, reason, callback_sent, callback_ms = rows(
+            store, "result, account, reason, callback_sent, callback_ms"
+        )[0]
+        assert (result, account, reason, callback_sent) == ("elegivel", "conta", "Ativo", 0)
+        assert callback_ms is not None
+
+
+class TestAnalyticsEndpoints:
+    """Testes dos endpoints de analytics"""
+
+    def test_requires_admin_token(self, monkeypatch):
+        """Testa 403 sem token"""
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        assert TestClient(app).get("/analytics/latency").status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_endpoints(self, store, monkeypatch):
+        """Testa as três consultas pela API"""
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        store.record("amil", "1", "elegivel", 200.0)
+        await store.flush()
+        client = TestClient(app)
+        headers = {"X-Admin-Token": "segredo"}
+
+        with patch("app.analytics.history_store", store):
+            latency = client.get("/analytics/latency", params={"plan": "amil"}, headers=headers)
+            trend = client.get("/analytics/eligibility", params={"interval": "hour"}, headers=headers)
+            errors = client.get("/analytics/errors", headers=headers)
+            invalid = client.get("/analytics/eligibility", params={"interval": "week"}, headers=headers)
+
+        assert latency.json()["plans"]["amil"]["count"] == 1
+        assert trend.json()["plans"]["amil"][0]["rate"] == 1.0
+        assert errors.json()["plans"]["amil"]["errors"] == 0
+        assert invalid.status_code == 422
@@ -0,0 +1,206 @@
+"""
+Testes para as chaves de idempotência do /webhook/in
+"""
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.idempotency import IdempotencyConflict, IdempotencyStore, request_fingerprint
+from app.utils.state import MemoryBackend
+
+
+PAYLOAD = {
+    "numero_carterinha": "086955681",
+    "plan_name": "plano_qualquer",
+    "numero": "5517992749450@s.whatsapp.net"
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "idempotency.db"))
+    yield store
+    store.close()
+
+
+class TestIdempotencyStore:
+    """Testes do registro de jobs em SQLite"""
+
+    @pytest.mark.asyncio
+    async def test_claim_and_repeat(self, store):
+        """Testa que a repetição devolve o job original"""
+        fingerprint = request_fingerprint("amil", "086955681", "5511")
+        keys = store.keys_for(None, fingerprint)
+
+        record, created = await store.claim(keys, fingerprint)
+        repeated, created_again = await store.claim(keys, fingerprint)
+
+        assert created is True
+        assert created_again is False
+        assert repeated.job_id == record.job_id
+        assert store.stats()["duplicates"] == 1
+
+    @pytest.mark.asyncio
+    async def test_previous_window_is_checked(self, store):
+        """Testa repetição logo após a virada da janela de tempo"""
+        fingerprint = request_fingerprint("amil", "086955681", "5511")
+        record, _ = await store.claim(store.keys_for(None, fingerprint, now=store.window * 10 - 1), fingerprint)
+
+        repeated, created = await store.claim(store.keys_for(None, fingerprint, now=store.window * 10 + 1), fingerprint)
+
+        assert created is False
+        assert repeated.job_id == record.job_id
+
+    @pytest.mark.asyncio
+    async def test_header_key_conflict(self, store):
+        """Testa chave do cliente reutilizada com outro payload"""
+        first = request_fingerprint("amil", "086955681", "5511")
+        second = request_fingerprint("amil", "999999999", "5511")
+        await store.claim(store.keys_for("chave-1", first), first)
+
+        with pytest.raises(IdempotencyConflict):
+            await store.claim(store.keys_for("chave-1", second), second)
+
+    @pytest.mark.asyncio
+    async def test_complete_and_release(self, store):
+        """Testa gravação do resultado e liberação da chave"""
+        fingerprint = request_fingerprint("amil", "086955681", "5511")
+        keys = store.keys_for("chave-2", fingerprint)
+        record, _ = await store.claim(keys, fingerprint)
+
+        await store.complete(record.key, "elegivel", callback_sent=True)
+        repeated, _ = await store.claim(keys, fingerprint)
+        assert repeated.status == "elegivel"
+        assert repeated.callback_sent is True
+
+        await store.release(record.key)
+        _, created = await store.claim(keys, fingerprint)
+        assert created is True
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("shared", [False, True])
+    async def test_single_resend_per_result(self, tmp_path, shared):
+        """Testa que repetições simultâneas reservam um único reenvio do callback"""
+        backend = MemoryBackend()
+        backend.shared = shared
+        store = IdempotencyStore(str(tmp_path / "idempotency.db"), backend=backend)
+        fingerprint = request_fingerprint("amil", "086955681", "5511")
+        record, _ = await store.claim(store.keys_for("chave-5", fingerprint), fingerprint)
+        assert await store.claim_resend(record.key) is False
+
+        await store.complete(record.key, "elegivel", callback_sent=False)
+        winners = await asyncio.gather(*(store.claim_resend(record.key) for _ in range(5)))
+        assert winners.count(True) == 1
+
+        # Reenvio falhou: a próxima repetição pode tentar de novo
+        await store.complete(record.key, "elegivel", callback_sent=False)
+        assert await store.claim_resend(record.key) is True
+        await store.complete(record.key, "elegivel", callback_sent=True)
+        assert await store.claim_resend(record.key) is False
+        store.close()
+
+    @pytest.mark.asyncio
+    async def test_persistent_and_expiring(self, tmp_path, monkeypatch):
+        """Testa persistência entre instâncias e expiração pelo TTL"""
+        path = str(tmp_path / "idempotency.db")
+        fingerprint = request_fingerprint("amil", "086955681", "5511")
+        first = IdempotencyStore(path)
+        record, _ = await first.claim(first.keys_for("chave-3", fingerprint), fingerprint)
+        first.close()
+
+        second = IdempotencyStore(path)
+        repeated, created = await second.claim(second.keys_for("chave-3", fingerprint), fingerprint)
+        assert created is False
+        assert repeated.job_id == record.job_id
+        second.close()
+
+        monkeypatch.setenv("IDEMPOTENCY_TTL", "0")
+        expiring = IdempotencyStore(path)
+        await expiring.claim(expiring.keys_for("chave-4", fingerprint), fingerprint)
+        assert expiring.purge() >= 1
+        _, created = await expiring.claim(expiring.keys_for("chave-4", fingerprint), fingerprint)
+        assert created is True
+        expiring.close()
+
+
+class TestWebhookIdempotency:
+    """Testes das repetições no endpoint /webhook/in"""
+
+    def test_repeat_does_not_reprocess(self, store):
+        """Testa que a repetição não agenda novo processamento"""
+        client = TestClient(app)
+        background = AsyncMock()
+        with patch("app.router.idempotency_store", store), \
+                patch("app.router.process_eligibility_background", background):
+            first = client.post("/webhook/in", json=PAYLOAD).json()
+            second = client.post("/webhook/in", json=PAYLOAD).json()
+
+        assert background.await_count == 1
+        assert first["duplicate"] is False
+        assert second["duplicate"] is True
+        assert second["job_id"] == first["job_id"]
+
+    def test_repeat_returns_result(self, store):
+        """Testa que a repetição de um job concluído devolve o resultado sem novo callback"""
+        client = TestClient(app)
+        handler = AsyncMock(return_value="elegivel")
+        callback = AsyncMock(return_value=True)
+        with patch("app.router.idempotency_store", store), \
+                patch("app.router.handler_registry.process_eligibility", handler), \
+                patch("app.router.send_callback", callback):
+            client.post("/webhook/in", json=PAYLOAD)
+            repeated = client.post("/webhook/in", json=PAYLOAD).json()
+
+        assert handler.await_count == 1
+        assert callback.await_count == 1
+        assert repeated["status"] == "elegivel"
+
+    def test_repeat_resends_failed_callback(self, store):
+        """Testa reenvio só do callback quando a entrega original falhou"""
+        client = TestClient(app)
+        handler = AsyncMock(return_value="nao_elegivel")
+        callback = AsyncMock(side_effect=[False, True])
+        with patch("app.router.idempotency_store", store), \
+                patch("app.router.handler_registry.process_eligibility", handler), \
+                patch("app.router.send_callback", callback):
+            client.post("/webhook/in", json=PAYLOAD)
+            client.post("/webhook/in", json=PAYLOAD)
+            client.post("/webhook/in", json=PAYLOAD)
+
+        assert handler.await_count == 1
+        assert callback.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_repeats_resend_once(self, store):
+        """Testa que repetições simultâneas de um job sem callback reenviam uma vez só"""
+        from app.router import resend_result
+        fingerprint = request_fingerprint("amil", "086955681", "5511")
+        record, _ = await store.claim(store.keys_for("chave-6", fingerprint), fingerprint)
+        await store.complete(record.key, "elegivel", callback_sent=False)
+        callback = AsyncMock(return_value=True)
+        with patch("app.router.idempotency_store", store), patch("app.router.send_callback", callback):
+            await asyncio.gather(*(resend_result("5511", "elegivel", record.key) for _ in range(3)))
+
+        assert callback.await_count == 1
+        assert (await store.get(record.key)).callback_sent is True
+
+    def test_header_key_conflict_returns_409(self, store):
+        """Testa 409 para Idempotency-Key reutilizada com outro payload"""
+        client = TestClient(app)
+        with patch("app.router.idempotency_store", store), \
+                patch("app.router.process_eligibility_background", AsyncMock()):
+            client.post("/webhook/in", json=PAYLOAD, headers={"Idempotency-Key": "abc"})
+            response = client.post(
+                "/webhook/in",
+                json={**PAYLOAD, "numero_carterinha": "123456789"},
+                headers={"Idempotency-Key": "abc"}
+            )
+
+        assert response.status_code == 409
+
+    def test_app_store_is_isolated(self, tmp_path):
+        """Testa que os testes do webhook não gravam em data/idempotency.db"""
+        from app import router
+
+        assert router.idempotency_store.path == str(tmp_path / "idempotency.db")
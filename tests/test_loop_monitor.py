@@ -0,0 +1,107 @@
+"""
+Testes para o monitor do event loop e histogramas de latência
+"""
+import time
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.metrics import Histogram, MetricsRegistry
+from app.utils.loop_monitor import LoopMonitor
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    monkeypatch.setenv("LOOP_MONITOR_INTERVAL_MS", "20")
+    monkeypatch.setenv("LOOP_BLOCK_THRESHOLD_MS", "100")
+    return LoopMonitor()
+
+
+def bloqueio_sincrono(seconds):
+    time.sleep(seconds)
+
+
+class TestHistogram:
+    """Testes do histograma de buckets fixos"""
+
+    def test_quantiles(self):
+        """Testa quantis aproximados pelos limites dos buckets"""
+        histogram = Histogram((10, 100, 1000))
+        for value in [5] * 90 + [50] * 9 + [5000]:
+            histogram.observe(value)
+
+        assert histogram.quantile(0.5) == 10
+        assert histogram.quantile(0.95) == 100
+        assert histogram.quantile(1.0) == 5000
+
+    def test_snapshot(self):
+        """Testa buckets cumulativos e resumo"""
+        histogram = Histogram((10, 100))
+        for value in (1, 20, 200):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        assert snapshot["count"] == 3
+        assert snapshot["max"] == 200
+        assert snapshot["buckets"] == {"10": 1, "100": 2, "+Inf": 3}
+
+    def test_registry_observe(self):
+        """Testa histogramas no snapshot do registro de métricas"""
+        registry = MetricsRegistry()
+        registry.observe("latencia", 3)
+        registry.observe("latencia", 7)
+
+        histograms = registry.snapshot()["histograms"]
+        assert histograms["latencia"]["count"] == 2
+        assert histograms["latencia"]["sum"] == 10
+
+
+class TestLoopMonitor:
+    """Testes do monitor de lag e bloqueios do event loop"""
+
+    @pytest.mark.asyncio
+    async def test_records_lag(self, monitor):
+        """Testa registro contínuo do lag"""
+        monitor.start()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+        assert monitor.snapshot()["blocked_total"] == 0
+        assert monitor.last_lag_ms >= 0
+
+    @pytest.mark.asyncio
+    async def test_detects_blocking_call(self, monitor):
+        """Testa detecção de chamada bloqueante com a pilha do culpado"""
+        monitor.start()
+        await asyncio.sleep(0.05)
+        bloqueio_sincrono(0.4)
+        await asyncio.sleep(0.05)
+        await monitor.stop()
+
+        assert monitor.blocked_total == 1
+        block = monitor.blocks[0]
+        assert block["blocked_ms"] >= 100
+        assert any("bloqueio_sincrono" in line for line in block["stack"])
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, monkeypatch):
+        """Testa que o monitor desligado não cria tasks"""
+        monkeypatch.setenv("LOOP_MONITOR_ENABLED", "false")
+        monitor = LoopMonitor()
+        monitor.start()
+
+        assert monitor._task is None
+        await monitor.stop()
+
+
+class TestLatencyMetrics:
+    """Testes dos histogramas expostos em /metrics"""
+
+    def test_endpoint_latency_histogram(self):
+        """Testa histograma de latência por endpoint"""
+        client = TestClient(app)
+        client.get("/health")
+
+        data = client.get("/metrics").json()
+        assert data["histograms"]["http_latency_ms GET /health"]["count"] >= 1
+        assert "event_loop" in data
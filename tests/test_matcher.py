@@ -0,0 +1,30 @@
+"""
+Testes para o autômato de Aho-Corasick
+"""
+from app.utils.matcher import AhoCorasick
+
+
+class TestAhoCorasick:
+    """Testes para AhoCorasick"""
+
+    def test_overlapping_patterns(self):
+        """Testa padrões sobrepostos e sufixos de outros padrões"""
+        matcher = AhoCorasick([("he", 1), ("she", 2), ("his", 3), ("hers", 4)])
+
+        matches = [(start, pattern) for start, pattern, _ in matcher.finditer("ushers")]
+
+        assert matches == [(1, "she"), (2, "he"), (2, "hers")]
+
+    def test_labels_keep_first_pattern(self):
+        """Testa rótulos encontrados com o primeiro padrão de cada rótulo"""
+        matcher = AhoCorasick([("não elegível", "nao"), ("elegível", "sim"), ("bloqueado", "nao")])
+
+        assert matcher.labels("cliente não elegível, bloqueado") == {"nao": "não elegível", "sim": "elegível"}
+        assert matcher.first("nada aqui") is None
+
+    def test_empty_patterns_are_ignored(self):
+        """Testa que padrões vazios não casam com tudo"""
+        matcher = AhoCorasick([("", 1), ("a", 2)])
+
+        assert matcher.size == 1
+        assert list(matcher.finditer("bbb")) == []
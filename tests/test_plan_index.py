@@ -0,0 +1,85 @@
+"""
+Testes para o índice de normalização de nomes de plano
+"""
+import pytest
+from unittest.mock import AsyncMock
+from app.dispatch import HandlerRegistry
+from app.utils.plan_index import PlanIndex, normalize_plan_name
+
+
+class TestNormalizePlanName:
+    """Testes para normalize_plan_name"""
+
+    def test_strips_accents_case_and_separators(self):
+        """Testa remoção de acentos, caixa e separadores"""
+        assert normalize_plan_name("Amil-Saúde  S750") == "amil saude s750"
+        assert normalize_plan_name("  SULAMÉRICA_saúde ") == "sulamerica saude"
+
+
+class TestPlanIndex:
+    """Testes para PlanIndex"""
+
+    @pytest.fixture
+    def index(self):
+        index = PlanIndex()
+        index.build(
+            [("amil", ["amil one"]), ("sulamerica", ["sul america"]), ("porto seguro", [])],
+            {"one health": "amil", "inexistente": "plano_fantasma"}
+        )
+        return index
+
+    @pytest.mark.parametrize("plan_name", ["AMIL S750", "Amil 400 QC", "amil-saude", "Amíl", "amill", "One Health"])
+    def test_resolves_amil_variants(self, index, plan_name):
+        """Testa variações comuns de nomes do Amil"""
+        assert index.resolve(plan_name) == "amil"
+
+    def test_multi_token_plans(self, index):
+        """Testa planos com mais de uma palavra e forma compacta"""
+        assert index.resolve("Sul América Saúde") == "sulamerica"
+        assert index.resolve("PORTO-SEGURO saude") == "porto seguro"
+        assert index.resolve("portoseguro") == "porto seguro"
+
+    def test_unknown_plan(self, index):
+        """Testa que nomes desconhecidos não resolvem"""
+        assert index.resolve("plano_inexistente") is None
+        assert index.resolve("plano_fantasma") is None
+
+    def test_fuzzy_cutoff_limits_short_typos(self, index):
+        """Testa que transposição em nome curto fica abaixo do corte padrão"""
+        assert index.resolve("amli") is None
+        lenient = PlanIndex(fuzzy_cutoff=0.75)
+        lenient.build([("amil", [])], {})
+        assert lenient.resolve("amli") == "amil"
+        assert PlanIndex(fuzzy_cutoff=0.0).fuzzy_cutoff == 0.0
+
+    def test_resolutions_are_cached(self, index):
+        """Testa cache das resoluções"""
+        index.resolve("AMIL S750")
+        index._phrases.clear()
+
+        assert index.resolve("AMIL S750") == "amil"
+
+
+class TestRegistryPlanResolution:
+    """Testes da resolução de nomes no HandlerRegistry"""
+
+    @pytest.fixture
+    def registry(self):
+        return HandlerRegistry()
+
+    @pytest.mark.asyncio
+    async def test_variants_use_specific_handler(self, registry):
+        """Testa que variações do nome usam o handler específico"""
+        handler = AsyncMock(return_value="elegivel")
+        registry.register_handler("unimed", handler)
+
+        assert await registry.process_eligibility("UNIMED Nacional", "123") == "elegivel"
+        handler.assert_awaited_once_with("123")
+
+    def test_generic_wrapper_is_reused_and_unmatched_reported(self, registry):
+        """Testa reaproveitamento do wrapper genérico e relatório de nomes não reconhecidos"""
+        first = registry.get_handler("Plano Desconhecido")
+        second = registry.get_handler("Plano Desconhecido")
+
+        assert first is second
+        assert registry.unmatched_plans() == [{"plan_name": "Plano Desconhecido", "count": 2}]
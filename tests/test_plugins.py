@@ -0,0 +1,120 @@
+"""
+Testes para descoberta de handlers como plugins e uso dos manifests no dispatch
+"""
+import json
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.dispatch import HandlerRegistry
+from app.plugins import HandlerManifest, discover_manifests, load_directory_manifests
+
+
+class TestManifestDiscovery:
+    """Testes para descoberta de manifests"""
+
+    def test_builtin_amil_manifest(self):
+        """Testa que o manifest embutido do Amil é descoberto"""
+        manifests = discover_manifests()
+
+        assert "amil" in manifests
+        assert manifests["amil"].target == "app.handlers.amil:amil_handler"
+        assert manifests["amil"].requires_session is True
+
+    def test_directory_plugin_is_lazy(self, tmp_path, monkeypatch):
+        """Testa plugin em diretório: manifest lido sem importar o módulo"""
+        (tmp_path / "unimed_plugin.py").write_text(
+            "async def check(numero):\n    return 'elegivel'\n"
+        )
+        (tmp_path / "unimed.json").write_text(json.dumps({
+            "name": "Unimed",
+            "target": "unimed_plugin:check",
+            "max_concurrency": 2
+        }))
+        (tmp_path / "quebrado.json").write_text("{nao é json")
+        monkeypatch.setenv("HANDLERS_PLUGIN_DIR", str(tmp_path))
+
+        registry = HandlerRegistry()
+
+        assert "unimed" in registry.pending_handlers()
+        assert registry.get_manifest("unimed").source == "directory"
+        assert "quebrado" not in registry.list_supported_plans()
+
+        handler = registry.get_handler("unimed")
+        assert asyncio.run(handler("123")) == "elegivel"
+
+    def test_invalid_manifest_is_skipped(self, tmp_path):
+        """Testa que manifests inválidos são ignorados"""
+        (tmp_path / "ruim.json").write_text(json.dumps({"name": "ruim", "max_concurrency": 0}))
+
+        assert load_directory_manifests(tmp_path, "directory") == []
+
+    def test_entry_point_manifest(self):
+        """Testa manifest publicado via entry point"""
+        ep = MagicMock()
+        ep.name = "bradesco"
+        ep.load.return_value = {"target": "bradesco_plugin:handler", "cacheable": True, "cache_ttl": 60}
+
+        with patch("app.plugins.entry_points", return_value=[ep]):
+            manifests = discover_manifests()
+
+        assert manifests["bradesco"].cacheable is True
+        assert manifests["bradesco"].source == "entry_point:bradesco"
+
+
+class TestManifestScheduling:
+    """Testes para o uso do manifest pelo dispatch"""
+
+    @pytest.fixture
+    def registry(self):
+        return HandlerRegistry()
+
+    @pytest.mark.asyncio
+    async def test_max_concurrency_is_enforced(self, registry):
+        """Testa limite de consultas simultâneas declarado no manifest"""
+        running = 0
+        peak = 0
+
+        async def slow_handler(numero_carteirinha):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "elegivel"
+
+        registry.register_handler("unimed", slow_handler)
+        registry._manifests["unimed"] = HandlerManifest(name="unimed", target="x:y", max_concurrency=2)
+
+        await asyncio.gather(*(registry.process_eligibility("unimed", str(i)) for i in range(6)))
+
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_cacheable_results(self, registry):
+        """Testa cache de resultados elegíveis e não elegíveis conforme TTLs"""
+        handler = AsyncMock(side_effect=["elegivel", "nao_elegivel", "nao_elegivel"])
+        registry.register_handler("unimed", handler)
+        registry._manifests["unimed"] = HandlerManifest(
+            name="unimed", target="x:y", cacheable=True, cache_ttl=60, negative_cache_ttl=0
+        )
+
+        assert await registry.process_eligibility("unimed", "111") == "elegivel"
+        assert await registry.process_eligibility("unimed", "111") == "elegivel"
+        assert await registry.process_eligibility("unimed", "222") == "nao_elegivel"
+        assert await registry.process_eligibility("unimed", "222") == "nao_elegivel"
+
+        assert handler.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_prewarm_only_session_handlers(self, registry):
+        """Testa que o pré-carregamento ignora handlers sem sessão"""
+        registry.register_lazy_handler(
+            "unimed", "tests.test_dispatch:fake_lazy_handler",
+            HandlerManifest(name="unimed", target="tests.test_dispatch:fake_lazy_handler")
+        )
+        registry._lazy_handlers.pop("amil")
+
+        await registry.prewarm()
+
+        assert registry.pending_handlers() == ["unimed"]
+        assert registry.pending_handlers(session_only=True) == []
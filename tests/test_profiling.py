@@ -0,0 +1,159 @@
+"""
+Testes para profiling sob demanda e captura de consultas lentas
+"""
+import json
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.profiling import ProfileDirectory, SamplingProfiler, SlowCheckCapture, dump_tasks
+
+
+@pytest.fixture
+def directory(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_DIR_MAX_FILES", "3")
+    return ProfileDirectory()
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+class TestProfiler:
+    """Testes do profiler de CPU e das pilhas de tasks"""
+
+    @pytest.mark.asyncio
+    async def test_cpu_sampling(self, directory):
+        """Testa amostragem enquanto o loop executa trabalho síncrono"""
+        profiler = SamplingProfiler(directory)
+
+        async def work():
+            for _ in range(20):
+                busy(50000)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(work())
+        summary = await profiler.run(0.3)
+        await task
+
+        assert summary["samples"] > 0
+        assert (directory.path / summary["file"]).exists()
+
+    @pytest.mark.asyncio
+    async def test_dump_tasks(self):
+        """Testa pilhas das tasks em execução"""
+        async def sleeper():
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(sleeper(), name="sleeper-test")
+        await asyncio.sleep(0)
+        try:
+            tasks = {item["name"]: item for item in dump_tasks()}
+            assert "sleeper-test" in tasks
+            assert any("sleeper" in frame for frame in tasks["sleeper-test"]["stack"])
+        finally:
+            task.cancel()
+
+    def test_directory_is_bounded(self, directory):
+        """Testa remoção dos arquivos mais antigos"""
+        for i in range(5):
+            directory.new_path(f"f{i}", ".txt").write_text("x")
+
+        assert directory.prune() == 2
+        assert len(directory.files()) == 3
+        assert directory.resolve("../etc/passwd") is None
+
+
+class TestSlowCheckCapture:
+    """Testes da captura de consultas lentas"""
+
+    @pytest.mark.asyncio
+    async def test_slow_check_writes_trace_and_timings(self, directory, monkeypatch):
+        """Testa gravação de trace e tempos acima do limite"""
+        monkeypatch.setenv("SLOW_CHECK_THRESHOLD_MS", "0")
+        monkeypatch.setenv("SLOW_CHECK_TRACE", "true")
+        capture = SlowCheckCapture(directory)
+        session = MagicMock()
+        session.tracing = False
+        session.context.tracing = AsyncMock()
+
+        tracker = capture.track("amil")
+        await tracker.begin_trace(session)
+        tracker.mark("navegacao")
+        summary = await tracker.finish()
+
+        session.context.tracing.start.assert_awaited_once()
+        assert session.tracing is True
+        assert "path" in session.context.tracing.stop_chunk.await_args.kwargs
+        assert "navegacao" in summary["steps_ms"]
+        saved = [p for p in directory.files() if p.suffix == ".json"]
+        assert json.loads(saved[0].read_text())["portal"] == "amil"
+
+    @pytest.mark.asyncio
+    async def test_trace_off_by_default(self, directory, monkeypatch):
+        """Testa que, sem SLOW_CHECK_TRACE, só os tempos da consulta lenta são gravados"""
+        monkeypatch.setenv("SLOW_CHECK_THRESHOLD_MS", "0")
+        monkeypatch.delenv("SLOW_CHECK_TRACE", raising=False)
+        capture = SlowCheckCapture(directory)
+        session = MagicMock()
+        session.tracing = False
+        session.context.tracing = AsyncMock()
+
+        tracker = capture.track("amil")
+        await tracker.begin_trace(session)
+        summary = await tracker.finish()
+
+        session.context.tracing.start.assert_not_awaited()
+        assert summary["trace_file"] is None
+        assert [p.suffix for p in directory.files()] == [".json"]
+
+    @pytest.mark.asyncio
+    async def test_fast_check_discards_trace(self, directory, monkeypatch):
+        """Testa descarte do trace de consultas rápidas"""
+        monkeypatch.setenv("SLOW_CHECK_THRESHOLD_MS", "60000")
+        monkeypatch.setenv("SLOW_CHECK_TRACE", "true")
+        capture = SlowCheckCapture(directory)
+        session = MagicMock()
+        session.tracing = True
+        session.context.tracing = AsyncMock()
+
+        tracker = capture.track("amil")
+        await tracker.begin_trace(session)
+
+        assert await tracker.finish() is None
+        session.context.tracing.start.assert_not_awaited()
+        assert session.context.tracing.stop_chunk.await_args.kwargs == {}
+        assert directory.files() == []
+
+
+class TestAdminEndpoints:
+    """Testes dos endpoints administrativos"""
+
+    def test_requires_token(self, monkeypatch):
+        """Testa bloqueio sem token e acesso com token"""
+        client = TestClient(app)
+        monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+        assert client.get("/admin/tasks").status_code == 403
+
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        assert client.get("/admin/tasks", headers={"X-Admin-Token": "errado"}).status_code == 403
+
+        response = client.get("/admin/tasks", headers={"X-Admin-Token": "segredo"})
+        assert response.status_code == 200
+        assert response.json()["total"] >= 1
+
+    def test_cpu_profile_endpoint(self, directory, monkeypatch):
+        """Testa profiling de CPU via API"""
+        monkeypatch.setenv("ADMIN_TOKEN", "segredo")
+        monkeypatch.setattr("app.admin.cpu_profiler", SamplingProfiler(directory))
+        monkeypatch.setattr("app.admin.profile_directory", directory)
+        client = TestClient(app)
+
+        response = client.post("/admin/profile/cpu?seconds=0.2", headers={"X-Admin-Token": "segredo"})
+        assert response.status_code == 200
+
+        name = response.json()["file"]
+        download = client.get(f"/admin/profiles/{name}", headers={"X-Admin-Token": "segredo"})
+        assert download.status_code == 200
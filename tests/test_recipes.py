@@ -0,0 +1,149 @@
+"""
+Testes para receitas declarativas de portais
+"""
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.dispatch import HandlerRegistry
+from app.handlers.recipe import RECIPES_DIR, RecipeHandler
+from app.recipes import PortalRecipe, RecipeError, RecipePlan, load_recipe
+from app.utils.browser_pool import browser_manager
+
+
+def make_recipe(**overrides):
+    data = {
+        "name": "teste",
+        "base_url": "https://portal.test/",
+        "login": {
+            "steps": [
+                {"action": "click", "selector": "#cookies", "optional": True},
+                {"action": "fill", "selector": "#user", "value": "{login}"},
+                {"action": "fill", "selector": "#pass", "value": "{password}"},
+                {"action": "click", "selector": "#entrar"}
+            ],
+            "success_url_contains": ["/home"]
+        },
+        "consulta": {"url_template": "/consulta?c={card}"},
+        "indicators": {
+            "eligible": ["Beneficiário Ativo"],
+            "not_eligible": ["não encontrado"],
+            "eligible_selectors": [".ok"],
+            "not_eligible_selectors": [".erro"]
+        }
+    }
+    data.update(overrides)
+    return data
+
+
+class TestRecipeCompilation:
+    """Testes de validação e compilação"""
+
+    def test_builtin_amil_recipe(self):
+        """Testa que a receita do Amil compila"""
+        plan = load_recipe(RECIPES_DIR / "amil.json")
+
+        assert plan.consulta_url("086955681") == (
+            "https://credenciado.amil.com.br/pedidos-autorizacao;numeroAssociado=086955681"
+        )
+        assert load_recipe(RECIPES_DIR / "amil.json") is plan
+
+    def test_invalid_placeholders(self):
+        """Testa rejeição de placeholders desconhecidos"""
+        with pytest.raises(RecipeError):
+            RecipePlan(PortalRecipe(**make_recipe(consulta={"url_template": "/consulta?c={numero}"})))
+
+        bad_login = make_recipe()
+        bad_login["login"]["steps"][1]["value"] = "{cpf}"
+        with pytest.raises(RecipeError):
+            RecipePlan(PortalRecipe(**bad_login))
+
+    def test_step_requires_fields(self):
+        """Testa que passos incompletos são rejeitados na validação"""
+        bad_step = make_recipe()
+        bad_step["login"]["steps"].append({"action": "fill", "selector": "#x"})
+
+        with pytest.raises(ValueError):
+            PortalRecipe(**bad_step)
+
+    def test_classify(self):
+        """Testa a classificação por indicadores e a regra registrada"""
+        plan = RecipePlan(PortalRecipe(**make_recipe()))
+
+        result = plan.classify("BENEFICIÁRIO ATIVO", [])
+        assert result.elegivel is True
+        assert result.regra == "elegivel:texto:beneficiário ativo"
+
+        assert plan.classify("Contrato não encontrado", [".ok"]).elegivel is False
+        assert plan.classify("", [".ok"]).regra == "elegivel:seletor:.ok"
+        assert plan.classify("", [".erro"]).elegivel is False
+        assert plan.classify("nada", []).elegivel is None
+
+    def test_eligible_indicator_has_priority(self):
+        """Testa que indicador elegível vence mesmo aparecendo depois no texto"""
+        plan = RecipePlan(PortalRecipe(**make_recipe()))
+
+        assert plan.classify("dependente não encontrado; titular beneficiário ativo", []).elegivel is True
+
+
+class TestRecipeExecution:
+    """Testes de execução da receita em uma página fake"""
+
+    @pytest.mark.asyncio
+    async def test_login_and_consulta(self):
+        """Testa login com passo opcional falhando e consulta classificada"""
+        plan = RecipePlan(PortalRecipe(**make_recipe()))
+        page = MagicMock()
+        page.goto = AsyncMock()
+        page.fill = AsyncMock()
+        page.click = AsyncMock(side_effect=[TimeoutError("sem banner"), None])
+        page.url = "https://portal.test/home"
+        page.evaluate = AsyncMock(return_value={"text": "Beneficiário ativo", "found": [], "region": "main"})
+
+        assert await plan.login(page, "usuario", "senha") is True
+        page.fill.assert_any_await("#pass", "senha", timeout=None)
+
+        result = await plan.consultar(page, "123")
+        assert result.elegivel is True
+        assert result.regiao == "main"
+        page.goto.assert_awaited_with("https://portal.test/consulta?c=123", wait_until="networkidle")
+
+    @pytest.mark.asyncio
+    async def test_falls_back_to_body(self):
+        """Testa leitura do body quando a região do resultado não permite classificar"""
+        plan = RecipePlan(PortalRecipe(**make_recipe(
+            consulta={"url_template": "/consulta?c={card}", "result_selectors": ["#resultado"]}
+        )))
+        page = MagicMock()
+        page.goto = AsyncMock()
+        page.evaluate = AsyncMock(side_effect=[
+            {"text": "carregando", "found": [], "region": "#resultado"},
+            "Contrato não encontrado"
+        ])
+
+        result = await plan.consultar(page, "123")
+
+        assert result.elegivel is False
+        assert result.regiao == "body"
+        assert page.evaluate.await_args_list[0].args[1]["regions"] == ["#resultado"]
+
+
+class TestRecipeManifest:
+    """Testes de handlers declarados só com receita"""
+
+    def test_manifest_with_recipe(self, tmp_path, monkeypatch):
+        """Testa plano adicionado apenas com manifest + receita"""
+        (tmp_path / "unimed_recipe.json").write_text(json.dumps(make_recipe(name="unimed")))
+        (tmp_path / "unimed.json").write_text(json.dumps({"name": "unimed", "recipe": "unimed_recipe.json"}))
+        monkeypatch.setenv("HANDLERS_PLUGIN_DIR", str(tmp_path))
+        monkeypatch.setenv("UNIMED_LOGIN", "user")
+        monkeypatch.setenv("UNIMED_PASSWORD", "pass")
+        monkeypatch.setenv("UNIMED_MIN_SESSIONS", "0")
+
+        registry = HandlerRegistry()
+        try:
+            handler = registry.get_handler("unimed")
+
+            assert isinstance(handler.__self__, RecipeHandler)
+            assert handler.__self__.plan.name == "unimed"
+        finally:
+            browser_manager.pools.pop("unimed", None)
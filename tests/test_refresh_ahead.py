@@ -0,0 +1,138 @@
+"""
+Testes para a popularidade das carteirinhas e o refresh antecipado do cache
+"""
+import asyncio
+import pytest
+from datetime import datetime, time
+from app.dispatch import HandlerRegistry
+from app.plugins import HandlerManifest
+from app.utils.popularity import PopularityTracker
+from app.utils.refresh_ahead import RefreshAheadScheduler, in_windows, parse_windows
+
+
+OFF_PEAK = datetime(2026, 1, 5, 3, 0)
+PEAK = datetime(2026, 1, 5, 10, 0)
+
+
+@pytest.fixture
+def registry():
+    """Registry com um plano em cache (TTL de 1800s para elegível) e handler contado"""
+    registry = HandlerRegistry()
+    calls = []
+
+    async def handler(numero_carteirinha):
+        calls.append(numero_carteirinha)
+        return "elegivel"
+
+    registry.register_lazy_handler(
+        "portal",
+        None,
+        HandlerManifest(name="portal", target="tests:handler", cacheable=True, cache_ttl=1800, max_concurrency=1)
+    )
+    registry.register_handler("portal", handler)
+    registry.calls = calls
+    return registry
+
+
+@pytest.fixture
+def scheduler(registry, monkeypatch):
+    monkeypatch.setenv("REFRESH_AHEAD_WINDOWS", "01:00-06:00")
+    monkeypatch.setenv("REFRESH_AHEAD_MIN_SCORE", "2")
+    monkeypatch.setenv("REFRESH_AHEAD_BUDGET_PER_HOUR", "2")
+    return RefreshAheadScheduler(registry)
+
+
+class TestPopularity:
+    """Testes da pontuação com decaimento"""
+
+    def test_decay_and_top(self):
+        """Testa que consultas antigas valem menos"""
+        tracker = PopularityTracker(half_life_s=100)
+        for _ in range(4):
+            tracker.record("amil", "111", "elegivel", now=0)
+        tracker.record("amil", "222", now=0)
+
+        assert tracker.score("amil", "111", now=100) == pytest.approx(2.0)
+        top = tracker.top(10, min_score=1.5, now=100)
+        assert [card.numero_carteirinha for card in top] == ["111"]
+        assert top[0].last_status == "elegivel"
+
+    def test_eviction(self):
+        """Testa remoção das mais frias ao atingir o limite"""
+        tracker = PopularityTracker(half_life_s=100, max_entries=10)
+        for n in range(10):
+            for _ in range(n + 1):
+                tracker.record("amil", str(n), now=0)
+        tracker.record("amil", "novo", now=0)
+
+        assert tracker.score("amil", "0", now=0) == 0.0
+        assert tracker.score("amil", "9", now=0) == 10
+
+
+class TestWindows:
+    """Testes das janelas fora do pico"""
+
+    def test_windows(self):
+        """Testa janelas normais e cruzando a meia-noite"""
+        windows = parse_windows("22:00-02:00, 13:00-14:00")
+
+        assert in_windows(windows, time(23, 30))
+        assert in_windows(windows, time(1, 59))
+        assert in_windows(windows, time(13, 0))
+        assert not in_windows(windows, time(14, 0))
+        assert in_windows([], time(10, 0))
+
+
+class TestRefreshAhead:
+    """Testes do agendador de renovação"""
+
+    @pytest.mark.asyncio
+    async def test_refreshes_hot_cards_off_peak(self, registry, scheduler):
+        """Testa renovação só fora do pico e só de carteirinhas quentes sem cache válido"""
+        for _ in range(3):
+            registry._popularity.record("portal", "111", "elegivel")
+        registry._popularity.record("portal", "222", "elegivel")
+
+        assert await scheduler.run_once(PEAK) == 0
+        assert await scheduler.run_once(OFF_PEAK) == 1
+        assert registry.calls == ["111"]
+
+        # Resultado renovado: servido do cache sem nova consulta
+        assert await registry.process_eligibility("portal", "111") == "elegivel"
+        assert registry.calls == ["111"]
+        assert await scheduler.run_once(OFF_PEAK) == 0
+
+    @pytest.mark.asyncio
+    async def test_budget(self, registry, scheduler):
+        """Testa o limite de consultas por hora"""
+        for card in ("111", "222", "333"):
+            for _ in range(3):
+                registry._popularity.record("portal", card, "elegivel")
+
+        assert await scheduler.run_once(OFF_PEAK) == 2
+        assert await scheduler.run_once(OFF_PEAK) == 0
+        assert scheduler.snapshot()["refreshed"] == 2
+
+    @pytest.mark.asyncio
+    async def test_skips_busy_plan_and_uncached_results(self, registry, scheduler):
+        """Testa que plano ocupado e resultados sem cache não são renovados"""
+        for _ in range(3):
+            registry._popularity.record("portal", "111", "elegivel")
+            registry._popularity.record("portal", "222", "nao_elegivel")
+
+        limiter = registry._limiter("portal", registry._manifests["portal"])
+        async with limiter:
+            assert await scheduler.run_once(OFF_PEAK) == 0
+        assert scheduler.skipped_busy == 1
+
+        assert await scheduler.run_once(OFF_PEAK) == 1
+        assert registry.calls == ["111"]
+
+    @pytest.mark.asyncio
+    async def test_process_eligibility_records_demand(self, registry):
+        """Testa que as consultas (inclusive do cache) contam como demanda"""
+        await registry.process_eligibility("portal", "111")
+        await registry.process_eligibility("portal", "111")
+
+        assert registry._popularity.score("portal", "111") == pytest.approx(2.0, abs=0.01)
+        assert registry.calls == ["111"]
@@ -0,0 +1,141 @@
+"""
+Testes para a engine HTTP sem browser e a base de handlers HTTP
+"""
+import httpx
+import pytest
+from app.handlers.http_portal import HttpPortalHandler, SessionExpiredError
+from app.utils.scraper import FormNotFoundError, HtmlDocument, ScraperEngine
+
+
+LOGIN_PAGE = """
+<html><body>
+  <form id="login" action="/auth" method="post">
+    <input type="hidden" name="csrf" value="tok123">
+    <input type="text" name="usuario">
+    <input type="password" name="senha">
+  </form>
+</body></html>
+"""
+
+
+def portal_app(request: httpx.Request) -> httpx.Response:
+    """Portal fake: login com CSRF, cookie por conta e redirecionamento"""
+    if request.url.path == "/login":
+        return httpx.Response(200, html=LOGIN_PAGE)
+    if request.url.path == "/auth":
+        form = dict(httpx.QueryParams(request.content.decode()))
+        assert form["csrf"] == "tok123"
+        return httpx.Response(302, headers={
+            "location": "/home",
+            "set-cookie": f"sid={form['usuario']}; Path=/"
+        })
+    if request.url.path == "/home":
+        return httpx.Response(200, html="<p>Bem-vindo</p>")
+    if request.url.path == "/consulta":
+        sid = request.headers.get("cookie", "")
+        if "sid=" not in sid:
+            return httpx.Response(302, headers={"location": "/login"})
+        numero = request.url.params["numero"]
+        status = "Beneficiário ativo" if numero.endswith("1") else "Contrato não encontrado"
+        return httpx.Response(200, html=f'<div class="status">{status}</div><span data-sid="{sid}"></span>')
+    return httpx.Response(404)
+
+
+@pytest.fixture
+def engine():
+    return ScraperEngine(transport=httpx.MockTransport(portal_app))
+
+
+class FakePortalHandler(HttpPortalHandler):
+    portal = "fake"
+    base_url = "https://portal.test"
+
+    def __init__(self, engine, state=None):
+        super().__init__("conta1", "segredo", engine, state)
+        self.logins = 0
+
+    async def fazer_login(self, session):
+        self.logins += 1
+        response = await self.engine.submit_form(
+            session, f"{self.base_url}/login", {"usuario": self.login, "senha": self.password}, "form#login"
+        )
+        return response.url.path == "/home"
+
+    async def consultar(self, session, numero_carteirinha):
+        document = await self.engine.get_document(
+            session, f"{self.base_url}/consulta", params={"numero": numero_carteirinha}
+        )
+        if "/login" in document.url:
+            raise SessionExpiredError()
+        return "elegivel" if "ativo" in (document.text("div.status") or "") else "nao_elegivel"
+
+
+class TestHtmlDocument:
+    """Testes de extração CSS/XPath"""
+
+    def test_css_xpath_and_form(self):
+        """Testa extração por CSS, XPath e leitura de formulário"""
+        document = HtmlDocument(LOGIN_PAGE.replace("</body>", '<a class="x" href="/y">Link</a></body>'), "https://portal.test/login")
+
+        assert document.attr("a.x", "href") == "/y"
+        assert document.xpath("//input[@name='csrf']/@value") == ["tok123"]
+
+        action, method, fields = document.form("form#login")
+        assert action == "https://portal.test/auth"
+        assert method == "POST"
+        assert fields["csrf"] == "tok123"
+
+        with pytest.raises(FormNotFoundError):
+            document.form("form#inexistente")
+
+
+class TestScraperEngine:
+    """Testes da engine HTTP"""
+
+    @pytest.mark.asyncio
+    async def test_cookie_jar_per_account(self, engine):
+        """Testa que cada conta mantém seus próprios cookies"""
+        first = engine.session("fake", "a")
+        second = engine.session("fake", "b")
+
+        await engine.submit_form(first, "https://portal.test/login", {"usuario": "a"})
+        await engine.submit_form(second, "https://portal.test/login", {"usuario": "b"})
+
+        document = await engine.get_document(first, "https://portal.test/consulta", params={"numero": "1"})
+        assert document.attr("span", "data-sid") == "sid=a"
+        assert engine.session("fake", "a") is first
+        assert len(engine.client.cookies.jar) == 0
+
+        await engine.close()
+
+
+class TestHttpPortalHandler:
+    """Testes da base de handlers HTTP"""
+
+    def test_incomplete_subclass_rejected(self, engine):
+        """Testa que subclasse sem consultar falha ao ser criada, não na primeira consulta"""
+        class SemConsulta(HttpPortalHandler):
+            async def fazer_login(self, session):
+                return True
+
+        with pytest.raises(TypeError):
+            SemConsulta("conta", "senha", engine)
+
+    @pytest.mark.asyncio
+    async def test_login_once_and_check(self, engine):
+        """Testa login sob demanda reaproveitado entre consultas"""
+        handler = FakePortalHandler(engine)
+
+        assert await handler.check_eligibility("001") == "elegivel"
+        assert await handler.check_eligibility("002") == "nao_elegivel"
+        assert handler.logins == 1
+
+    @pytest.mark.asyncio
+    async def test_relogin_when_session_expires(self, engine):
+        """Testa re-login quando o portal perde a sessão"""
+        handler = FakePortalHandler(engine)
+        await handler.check_eligibility("001")
+        handler.session.cookies.clear()
+
+        assert await handler.check_eligibility("001") == "elegivel"
+        assert handler.logins == 2
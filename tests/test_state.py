@@ -0,0 +1,346 @@
+"""
+Testes para o backend de estado compartilhado (memória, SQLite e RESP)
+"""
+import time
+import socket
+import asyncio
+import threading
+import socketserver
+import pytest
+import httpx
+from app.utils.cache import ResultCache
+from app.utils.idempotency import IdempotencyStore, request_fingerprint
+from app.utils.refresh_ahead import RefreshAheadScheduler
+from app.utils.scraper import ScraperEngine
+from app.utils.state import (
+    MemoryBackend,
+    RespBackend,
+    SQLiteBackend,
+    StateBackend,
+    StateBackendError,
+    create_backend,
+)
+from tests.test_scraper import FakePortalHandler, portal_app
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+    """Uma conexão do servidor RESP de teste"""
+
+    def handle(self):
+        self.server.connections.append(self.connection)
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            self.wfile.write(self.server.execute(args))
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """Servidor local que fala o subconjunto do protocolo Redis usado pelo backend"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), RespHandler)
+        self.data = {}
+        self.commands = []
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        command = args[0].upper()
+        with self.lock:
+            self.commands.append(command)
+            if command in ("PING",):
+                return b"+PONG\r\n"
+            if command in ("AUTH", "SELECT"):
+                return b"+OK\r\n"
+            if command == "GET":
+                entry = self._live(args[1])
+                return b"$-1\r\n" if entry is None else b"$%d\r\n%s\r\n" % (len(entry[1]), entry[1].encode())
+            if command == "SET":
+                options = [arg.upper() for arg in args[3:]]
+                expires_at = None
+                if "PX" in options:
+                    expires_at = time.time() + int(args[3 + options.index("PX") + 1]) / 1000
+                if "NX" in options and self._live(args[1]) is not None:
+                    return b"$-1\r\n"
+                self.data[args[1]] = (expires_at, args[2])
+                return b"+OK\r\n"
+            if command == "DEL":
+                return b":%d\r\n" % (self.data.pop(args[1], None) is not None)
+            if command == "INCR":
+                entry = self._live(args[1]) or (None, "0")
+                value = int(entry[1]) + 1
+                self.data[args[1]] = (entry[0], str(value))
+                return b":%d\r\n" % value
+            return b"-ERR unknown command\r\n"
+
+    def drop_connections(self):
+        """Derruba as conexões abertas (restart do servidor)"""
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.connections.clear()
+
+
+@pytest.fixture
+def resp_server():
+    server = RespStandIn()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    """Cada implementação do backend"""
+    if request.param == "memory":
+        yield MemoryBackend("t:")
+    elif request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "state.db"), "t:")
+        yield backend
+        backend.close()
+    else:
+        server = request.getfixturevalue("resp_server")
+        backend = RespBackend("127.0.0.1", server.server_address[1], prefix="t:")
+        yield backend
+        backend.close()
+
+
+@pytest.fixture
+def shared(tmp_path):
+    """Backend compartilhado por várias "réplicas" do teste"""
+    backend = SQLiteBackend(str(tmp_path / "shared.db"))
+    yield backend
+    backend.close()
+
+
+class TestBackends:
+    """Comportamento comum às implementações"""
+
+    @pytest.mark.asyncio
+    async def test_get_set_delete(self, backend):
+        """Testa leitura, escrita e remoção"""
+        assert await backend.get("a") is None
+        await backend.set("a", "1")
+        assert await backend.get("a") == "1"
+        await backend.delete("a")
+        assert await backend.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_expiration(self, backend):
+        """Testa expiração por TTL"""
+        await backend.set("a", "1", ttl=0.05)
+        assert await backend.get("a") == "1"
+        await asyncio.sleep(0.08)
+        assert await backend.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_add_only_if_absent(self, backend):
+        """Testa gravação condicional (base da deduplicação)"""
+        assert await backend.add("a", "1", ttl=0.05) is True
+        assert await backend.add("a", "2", ttl=0.05) is False
+        assert await backend.get("a") == "1"
+        await asyncio.sleep(0.08)
+        assert await backend.add("a", "3") is True
+
+    @pytest.mark.asyncio
+    async def test_incr_window(self, backend):
+        """Testa contador que expira (janela de limite)"""
+        assert [await backend.incr("c", 0.05) for _ in range(3)] == [1, 2, 3]
+        await asyncio.sleep(0.08)
+        assert await backend.incr("c", 0.05) == 1
+
+
+class TestBackendSelection:
+    """Testes da criação por URL e da conexão RESP"""
+
+    def test_create_backend(self):
+        """Testa os esquemas suportados"""
+        assert isinstance(create_backend("memory://"), MemoryBackend)
+        assert create_backend("sqlite:///data/x.db").path == "data/x.db"
+        assert create_backend("sqlite:////tmp/x.db").path == "/tmp/x.db"
+        redis = create_backend("redis://:senha@cache.internal:6380/2")
+        assert (redis.host, redis.port, redis.db, redis._password) == ("cache.internal", 6380, 2, "senha")
+        with pytest.raises(ValueError):
+            create_backend("mongodb://x")
+
+    @pytest.mark.asyncio
+    async def test_processes_share_sqlite_state(self, shared, tmp_path):
+        """Testa duas conexões ao mesmo arquivo (dois workers no nó)"""
+        other = SQLiteBackend(shared.path)
+        await shared.set("a", "1")
+        assert await other.get("a") == "1"
+        assert await other.add("a", "2") is False
+        other.close()
+
+    @pytest.mark.asyncio
+    async def test_resp_reconnects_and_pipelines(self, resp_server):
+        """Testa reconexão após queda e AUTH/SELECT na conexão"""
+        backend = RespBackend("127.0.0.1", resp_server.server_address[1], db=1, password="x")
+        await backend.set("a", "1")
+        resp_server.drop_connections()
+
+        assert await backend.get("a") == "1"
+        assert backend.reconnects == 1
+        assert resp_server.commands.count("AUTH") == 2
+        backend.close()
+
+    @pytest.mark.asyncio
+    async def test_resp_unavailable(self, resp_server):
+        """Testa erro explícito quando o servidor não responde"""
+        port = resp_server.server_address[1]
+        resp_server.shutdown()
+        resp_server.server_close()
+        backend = RespBackend("127.0.0.1", port)
+
+        with pytest.raises(StateBackendError):
+            await backend.get("a")
+
+    @pytest.mark.asyncio
+    async def test_resp_slow_server_does_not_block_loop(self, monkeypatch):
+        """Testa que um servidor que não responde só atrasa quem espera, não o event loop"""
+        monkeypatch.setenv("STATE_TIMEOUT", "0.2")
+        silent = socket.socket()
+        silent.bind(("127.0.0.1", 0))
+        silent.listen()
+        backend = RespBackend("127.0.0.1", silent.getsockname()[1])
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        with pytest.raises(StateBackendError):
+            await backend.get("a")
+        task.cancel()
+        backend.close()
+        silent.close()
+
+        assert ticks >= 10
+        assert backend.stats()["timeouts"] == 1
+
+    def test_incomplete_backend_rejected(self):
+        """Testa que um backend sem todas as operações falha ao ser criado"""
+        class SemIncr(StateBackend):
+            async def get(self, key):
+                return None
+
+        with pytest.raises(TypeError):
+            SemIncr()
+
+
+class TestSharedConsumers:
+    """Cache, deduplicação, orçamento e sessões entre réplicas"""
+
+    @pytest.mark.asyncio
+    async def test_result_cache_between_replicas(self, shared):
+        """Testa resultado obtido por uma réplica servindo a outra"""
+        first = ResultCache(backend=shared)
+        second = ResultCache(backend=shared)
+        await first.set("amil", "123", "elegivel", 60)
+
+        assert await second.get("amil", "123") == "elegivel"
+        assert second.stats()["shared_hits"] == 1
+        assert 0 < await second.expires_in("amil", "123") <= 60
+        # Agora no nível local
+        assert await second.get("amil", "123") == "elegivel"
+        assert second.stats()["shared_hits"] == 1
+
+    def test_memory_backend_stays_local(self):
+        """Testa que o backend padrão não adiciona o segundo nível"""
+        assert ResultCache(backend=MemoryBackend()).stats()["shared"] is False
+
+    @pytest.mark.asyncio
+    async def test_result_cache_survives_backend_outage(self, resp_server):
+        """Testa cache local funcionando com o backend fora do ar"""
+        backend = RespBackend("127.0.0.1", resp_server.server_address[1])
+        cache = ResultCache(backend=backend)
+        resp_server.shutdown()
+        resp_server.server_close()
+        resp_server.drop_connections()
+
+        await cache.set("amil", "123", "elegivel", 60)
+        assert await cache.get("amil", "123") == "elegivel"
+        assert await cache.get("amil", "999") is None
+        assert cache.stats()["shared_errors"] == 2
+
+    @pytest.mark.asyncio
+    async def test_dedupe_between_replicas(self, shared, tmp_path):
+        """Testa repetição recebida por outra réplica"""
+        first = IdempotencyStore(str(tmp_path / "a.db"), backend=shared)
+        second = IdempotencyStore(str(tmp_path / "b.db"), backend=shared)
+        fingerprint = request_fingerprint("amil", "123", "5511")
+
+        record, created = await first.claim(first.keys_for(None, fingerprint), fingerprint)
+        await first.complete(record.key, "elegivel", True)
+        repeated, created_again = await second.claim(second.keys_for(None, fingerprint), fingerprint)
+
+        assert created is True
+        assert created_again is False
+        assert repeated.job_id == record.job_id
+        assert repeated.status == "elegivel"
+        assert repeated.callback_sent is True
+        assert second.stats()["backend"] == "sqlite"
+
+        await second.release(record.key)
+        _, created_after_release = await first.claim(first.keys_for(None, fingerprint), fingerprint)
+        assert created_after_release is True
+
+    @pytest.mark.asyncio
+    async def test_refresh_budget_between_replicas(self, shared, monkeypatch):
+        """Testa carteirinha renovada por uma réplica só e orçamento comum"""
+        monkeypatch.setenv("REFRESH_AHEAD_BUDGET_PER_HOUR", "2")
+        first = RefreshAheadScheduler(registry=object(), backend=shared)
+        second = RefreshAheadScheduler(registry=object(), backend=shared)
+
+        assert await first._claim_shared("amil", "1") is True
+        assert await second._claim_shared("amil", "1") is False
+        assert await second._claim_shared("amil", "2") is True
+        assert await first._claim_shared("amil", "3") is False
+
+    @pytest.mark.asyncio
+    async def test_portal_login_shared_between_replicas(self, shared):
+        """Testa que só a primeira réplica faz login no portal"""
+        replicas = []
+        for _ in range(2):
+            handler = FakePortalHandler(ScraperEngine(transport=httpx.MockTransport(portal_app)))
+            handler._shared = shared
+            replicas.append(handler)
+
+        assert await replicas[0].check_eligibility("001") == "elegivel"
+        assert await replicas[1].check_eligibility("001") == "elegivel"
+        assert [handler.logins for handler in replicas] == [1, 0]
+
+        # Sessão recusada pelo portal: a réplica loga de novo e republica
+        replicas[1].session.cookies.clear()
+        replicas[1].session.mark_logged_in(True)
+        assert await replicas[1].check_eligibility("001") == "elegivel"
+        assert replicas[1].logins == 1
+        for handler in replicas:
+            await handler.engine.close()
+
+    def test_handler_defaults_to_local_sessions(self):
+        """Testa que sem backend compartilhado nada é publicado"""
+        handler = FakePortalHandler(None, state=MemoryBackend())
+        assert handler._shared is None
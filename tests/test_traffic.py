@@ -0,0 +1,150 @@
+"""
+Testes para gravação e reprodução do tráfego dos portais
+"""
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.utils.traffic import TrafficManager, TrafficScrubber
+
+
+def fake_response(method, url, status, headers, body, post_data=None):
+    response = MagicMock()
+    response.request.method = method
+    response.request.url = url
+    response.request.post_data = post_data
+    response.status = status
+    response.body = AsyncMock(return_value=body)
+    response.all_headers = AsyncMock(return_value=headers)
+    return response
+
+
+def fake_route(method, url):
+    route = MagicMock()
+    route.request.method = method
+    route.request.url = url
+    route.fulfill = AsyncMock()
+    route.abort = AsyncMock()
+    route.continue_ = AsyncMock()
+    return route
+
+
+class TestTrafficScrubber:
+    """Testes para remoção de dados sensíveis"""
+
+    def test_scrub_secrets_and_pii(self):
+        """Testa remoção de credenciais, carteirinha e padrões de dados pessoais"""
+        scrubber = TrafficScrubber()
+        scrubber.add_secret("10354263", "login")
+        scrubber.add_secret("imc@2025", "password")
+        scrubber.add_secret("086955681", "card")
+
+        text = scrubber.scrub("usuario=10354263&senha=imc@2025 cart=086955681 cpf 123.456.789-09 a@b.com")
+
+        assert "10354263" not in text and "imc@2025" not in text and "086955681" not in text
+        assert "<login>" in text and "<password>" in text and "<cpf>" in text and "<email>" in text
+        assert TrafficScrubber.pseudonym("086955681", "card") in text
+
+
+class TestRecordAndReplay:
+    """Testes do ciclo gravação -> arquivo -> reprodução"""
+
+    @pytest.mark.asyncio
+    async def test_round_trip(self, tmp_path, monkeypatch):
+        """Testa que respostas gravadas são servidas no replay sem dados sensíveis no arquivo"""
+        monkeypatch.setenv("PORTAL_TRAFFIC_DIR", str(tmp_path))
+        monkeypatch.setenv("PORTAL_TRAFFIC_MODE", "record")
+        recorder = TrafficManager()
+        page = MagicMock()
+        recorder.add_secret("amil", "10354263", "login")
+        recorder.add_secret("amil", "imc@2025", "password")
+        await recorder.attach(page, "amil")
+        on_response = page.on.call_args.args[1]
+
+        await on_response(fake_response(
+            "POST", "https://portal.test/login", 302,
+            {"location": "/home", "set-cookie": "sid=abc"}, b"",
+            post_data="usuario=10354263&senha=imc@2025"
+        ))
+        recorder.add_secret("amil", "086955681", "card")
+        await on_response(fake_response(
+            "GET", "https://portal.test/consulta;numeroAssociado=086955681", 200,
+            {"content-type": "text/html"}, "<p>Cliente elegível 086955681</p>".encode()
+        ))
+        await on_response(fake_response(
+            "GET", "https://portal.test/logo.png", 200, {"content-type": "image/png"}, b"\x89PNG"
+        ))
+        recorder.save()
+
+        raw = (tmp_path / "amil.har.json").read_text()
+        assert "10354263" not in raw and "imc@2025" not in raw and "086955681" not in raw
+        assert "sid=abc" not in raw
+
+        monkeypatch.setenv("PORTAL_TRAFFIC_MODE", "replay")
+        replayer = TrafficManager()
+        replay_page = MagicMock()
+        replay_page.route = AsyncMock()
+        await replayer.attach(replay_page, "amil")
+        on_route = replay_page.route.call_args.args[1]
+
+        replayer.add_secret("amil", "086955681", "card")
+        route = fake_route("GET", "https://portal.test/consulta;numeroAssociado=086955681")
+        await on_route(route)
+        kwargs = route.fulfill.await_args.kwargs
+        assert kwargs["status"] == 200
+        assert b"Cliente eleg" in kwargs["body"]
+
+        image = fake_route("GET", "https://portal.test/logo.png")
+        await on_route(image)
+        assert image.fulfill.await_args.kwargs["body"] == b"\x89PNG"
+
+        missing = fake_route("GET", "https://portal.test/consulta;numeroAssociado=999999")
+        await on_route(missing)
+        missing.abort.assert_awaited_once()
+        assert replayer.stats()["portals"]["amil"]["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_encoded_secrets_and_headers_scrubbed(self, tmp_path, monkeypatch):
+        """Testa login em formulário codificado, JSON com escape e headers de resposta"""
+        monkeypatch.setenv("PORTAL_TRAFFIC_DIR", str(tmp_path))
+        monkeypatch.setenv("PORTAL_TRAFFIC_MODE", "record")
+        recorder = TrafficManager()
+        page = MagicMock()
+        recorder.add_secret("amil", "10354263", "login")
+        recorder.add_secret("amil", "imc@2025", "password")
+        recorder.add_secret("amil", "123456789", "card")
+        await recorder.attach(page, "amil")
+        on_response = page.on.call_args.args[1]
+
+        await on_response(fake_response(
+            "POST", "https://portal.test/login", 302,
+            {"location": "/res?carteirinha=123456789", "x-auth-token": "tok-abc", "x-portal-session": "s-1"},
+            b"", post_data="usuario=10354263&senha=imc%402025"
+        ))
+        await on_response(fake_response(
+            "POST", "https://portal.test/api/login", 200, {"content-type": "application/json"},
+            b'{"ok": true}', post_data='{"login": "10354263", "senha": "imc\\u00402025"}'
+        ))
+        recorder.save()
+
+        raw = (tmp_path / "amil.har.json").read_text()
+        for leaked in ("imc%402025", "imc\\u00402025", "imc@2025", "123456789", "tok-abc", "s-1"):
+            assert leaked not in raw
+        entry, api = json.loads(raw)["log"]["entries"]
+        assert entry["request"]["postData"]["text"] == "usuario=<login>&senha=<password>"
+        assert api["request"]["postData"]["text"] == '{"login": "<login>", "senha": "<password>"}'
+        assert entry["response"]["headers"] == [
+            {"name": "location", "value": "/res?carteirinha=" + TrafficScrubber.pseudonym("123456789", "card")}
+        ]
+
+    @pytest.mark.asyncio
+    async def test_off_mode_does_nothing(self, monkeypatch):
+        """Testa que o modo padrão não intercepta a página"""
+        monkeypatch.delenv("PORTAL_TRAFFIC_MODE", raising=False)
+        manager = TrafficManager()
+        page = MagicMock()
+        page.route = AsyncMock()
+
+        await manager.attach(page, "amil")
+
+        page.on.assert_not_called()
+        page.route.assert_not_awaited()